@@ -190,6 +190,9 @@ setuptools.setup(name='pylo',
                      'miniKanren',
                      'z3-solver'
                  ],
+                 extras_require={
+                     'numpy': ['numpy']
+                 },
                  python_requires=">=3.6",
                  classifiers=[
                      'Development Status :: 3 - Alpha',
@@ -5,9 +5,11 @@
 #include <pybind11/pybind11.h>
 //#include "language.h"
 #include "gprolog.h"
-//#include <vector>
+#include <vector>
+#include <string>
+#include <stdexcept>
 
-//#include <pybind11/stl.h>
+#include <pybind11/stl.h>
 //#include <unordered_map>
 
 using namespace std;
@@ -47,6 +49,334 @@ py::list read_list(PlTerm term) {
 
 
 
+// Compact encoding of terms handed over to python (decoded by _decode_pygp in GnuProlog.py)
+//      integers, floats -> python numbers
+//      atoms            -> python strings
+//      variables        -> (DECODE_VAR, index of the variable within the decoded terms)
+//      proper lists     -> (DECODE_LIST, [elements])
+//      pairs            -> (DECODE_PAIR, head, tail)
+//      compounds        -> (DECODE_COMPOUND, name, arg1, ..., argN)
+enum DecodeTag {
+    DECODE_VAR = 0,
+    DECODE_LIST = 2,
+    DECODE_PAIR = 3,
+    DECODE_COMPOUND = 4
+};
+
+py::object decode_term(PlTerm term, vector<PlTerm> &seen_vars);
+
+py::object decode_variable(PlTerm term, vector<PlTerm> &seen_vars) {
+    for (size_t i = 0; i < seen_vars.size(); i++) {
+        if (Pl_Builtin_Term_Eq(term, seen_vars[i])) {
+            return py::make_tuple((int) DECODE_VAR, i);
+        }
+    }
+    seen_vars.push_back(term);
+    return py::make_tuple((int) DECODE_VAR, seen_vars.size() - 1);
+}
+
+py::object decode_list(PlTerm term, vector<PlTerm> &seen_vars) {
+    py::list elements;
+    PlTerm tail = term;
+
+    while (Pl_Type_Of_Term(tail) == PL_LST) {
+        PlTerm *head_tail = Pl_Rd_List(tail);
+        elements.append(decode_term(head_tail[0], seen_vars));
+        tail = head_tail[1];
+    }
+
+    if (Pl_Type_Of_Term(tail) == PL_ATM && Pl_Rd_Atom(tail) == Pl_Atom_Nil()) {
+        return py::make_tuple((int) DECODE_LIST, elements);
+    }
+
+    // partial list [e1, ..., eN | Tail] is a chain of pairs
+    py::object decoded = decode_term(tail, seen_vars);
+    for (ssize_t i = (ssize_t) elements.size() - 1; i >= 0; i--) {
+        decoded = py::make_tuple((int) DECODE_PAIR, elements[i], decoded);
+    }
+    return decoded;
+}
+
+py::object decode_compound(PlTerm term, vector<PlTerm> &seen_vars) {
+    int functor;
+    int arity;
+    PlTerm *args = Pl_Rd_Compound(term, &functor, &arity);
+
+    py::tuple decoded(arity + 2);
+    decoded[0] = py::int_((int) DECODE_COMPOUND);
+    decoded[1] = py::str(Pl_Atom_Name(functor));
+
+    for (int i = 0; i < arity; i++) {
+        decoded[i + 2] = decode_term(args[i], seen_vars);
+    }
+
+    return decoded;
+}
+
+py::object decode_term(PlTerm term, vector<PlTerm> &seen_vars) {
+    switch (Pl_Type_Of_Term(term)) {
+        case PL_PLV:
+        case PL_FDV:
+            return decode_variable(term, seen_vars);
+        case PL_INT:
+            return py::int_(Pl_Rd_Integer(term));
+        case PL_FLT:
+            return py::float_(Pl_Rd_Float(term));
+        case PL_ATM: {
+            int atom = Pl_Rd_Atom(term);
+            if (atom == Pl_Atom_Nil()) {
+                return py::make_tuple((int) DECODE_LIST, py::list());
+            }
+            return py::str(Pl_Atom_Name(atom));
+        }
+        case PL_LST:
+            return decode_list(term, seen_vars);
+        default:
+            return decode_compound(term, seen_vars);
+    }
+}
+
+py::tuple decode_solution(const PlTerm *terms, int n) {
+    vector<PlTerm> seen_vars;
+    py::tuple decoded(n);
+
+    for (int i = 0; i < n; i++) {
+        decoded[i] = decode_term(terms[i], seen_vars);
+    }
+
+    return decoded;
+}
+
+py::tuple decode_terms(const py::list &terms) {
+    vector<PlTerm> to_decode;
+    for (auto t: terms) {
+        to_decode.push_back(t.cast<PlTerm>());
+    }
+
+    return decode_solution(to_decode.data(), (int) to_decode.size());
+}
+
+
+// Flattened (preorder) description of terms built in a single call (written by TermWriter in prolog_utils.py)
+//      OP_ATOM, atom index
+//      OP_INT, value
+//      OP_FLOAT, float index
+//      OP_VAR, variable index
+//      OP_COMPOUND, atom index, arity, arg1, ..., argN
+//      OP_LIST, length, elem1, ..., elemN
+//      OP_PAIR, head, tail
+enum BuildOp {
+    OP_ATOM = 0,
+    OP_INT = 1,
+    OP_FLOAT = 2,
+    OP_VAR = 3,
+    OP_COMPOUND = 4,
+    OP_LIST = 5,
+    OP_PAIR = 6
+};
+
+struct BuildState {
+    const vector<int64_t> &ops;
+    const vector<int> &atoms;
+    const vector<double> &floats;
+    const vector<PlTerm> &vars;
+    size_t pc;
+};
+
+PlTerm build_term(BuildState &st) {
+    switch (st.ops.at(st.pc++)) {
+        case OP_ATOM:
+            return Pl_Mk_Atom(st.atoms.at(st.ops.at(st.pc++)));
+        case OP_INT:
+            return Pl_Mk_Integer((PlLong) st.ops.at(st.pc++));
+        case OP_FLOAT:
+            return Pl_Mk_Float(st.floats.at(st.ops.at(st.pc++)));
+        case OP_VAR:
+            return st.vars.at(st.ops.at(st.pc++));
+        case OP_COMPOUND: {
+            int functor = st.atoms.at(st.ops.at(st.pc++));
+            int arity = (int) st.ops.at(st.pc++);
+            vector<PlTerm> args(arity);
+            for (int i = 0; i < arity; i++) {
+                args[i] = build_term(st);
+            }
+            return Pl_Mk_Compound(functor, arity, args.data());
+        }
+        case OP_LIST: {
+            int64_t length = st.ops.at(st.pc++);
+            vector<PlTerm> elements(length);
+            for (int64_t i = 0; i < length; i++) {
+                elements[i] = build_term(st);
+            }
+            // lists are built from the back
+            PlTerm list = Pl_Mk_Atom(Pl_Atom_Nil());
+            for (int64_t i = length - 1; i >= 0; i--) {
+                PlTerm headTail[2] = {elements[i], list};
+                list = Pl_Mk_List(headTail);
+            }
+            return list;
+        }
+        case OP_PAIR: {
+            PlTerm headTail[2];
+            headTail[0] = build_term(st);
+            headTail[1] = build_term(st);
+            return Pl_Mk_List(headTail);
+        }
+        default:
+            throw runtime_error("unknown term opcode");
+    }
+}
+
+py::tuple build_terms(int n, int n_vars, const vector<int64_t> &ops, const vector<int> &atoms, const vector<double> &floats) {
+    vector<PlTerm> vars(n_vars);
+    for (int i = 0; i < n_vars; i++) {
+        vars[i] = Pl_Mk_Variable();
+    }
+
+    BuildState st{ops, atoms, floats, vars, 0};
+    py::list terms;
+    for (int i = 0; i < n; i++) {
+        terms.append(build_term(st));
+    }
+
+    py::list var_terms;
+    for (PlTerm v: vars) {
+        var_terms.append(v);
+    }
+
+    return py::make_tuple(terms, var_terms);
+}
+
+
+int assertz_terms(int n, int n_vars, const vector<int64_t> &ops, const vector<int> &atoms, const vector<double> &floats) {
+    int assertz_atom = Pl_Create_Allocate_Atom("assertz");
+
+    // the clauses are copied into the database, so the heap used to build them is recovered at the end
+    Pl_Query_Begin(PL_TRUE);
+
+    vector<PlTerm> vars(n_vars);
+    for (int i = 0; i < n_vars; i++) {
+        vars[i] = Pl_Mk_Variable();
+    }
+
+    BuildState st{ops, atoms, floats, vars, 0};
+    int asserted = 0;
+
+    try {
+        for (int i = 0; i < n; i++) {
+            PlTerm clause = build_term(st);
+            if (Pl_Query_Call(assertz_atom, 1, &clause) != PL_SUCCESS) {
+                break;
+            }
+            asserted++;
+        }
+    } catch (...) {
+        Pl_Query_End(PL_RECOVER);
+        throw;
+    }
+
+    Pl_Query_End(PL_RECOVER);
+
+    if (asserted < n) {
+        throw runtime_error("could not assert clause " + to_string(asserted + 1) + " of the chunk");
+    }
+
+    return asserted;
+}
+
+
+py::list run_prepared(int pred, int arity, const vector<int64_t> &goal_ops, const vector<int> &goal_atoms,
+                      const vector<double> &goal_floats, int n_decode, const vector<int> &slots, int n_vars,
+                      const vector<int64_t> &ops, const vector<int> &atoms, const vector<double> &floats,
+                      int max_solutions) {
+    py::list solutions;
+    Pl_Query_Begin(PL_TRUE);
+
+    try {
+        vector<PlTerm> vars(n_vars);
+        for (int i = 0; i < n_vars; i++) {
+            vars[i] = Pl_Mk_Variable();
+        }
+
+        // the values of the parameters take the place of their variables in the goal
+        BuildState values{ops, atoms, floats, vars, 0};
+        vector<PlTerm> built(slots.size());
+        for (size_t i = 0; i < slots.size(); i++) {
+            built[i] = build_term(values);
+        }
+        for (size_t i = 0; i < slots.size(); i++) {
+            vars.at(slots[i]) = built[i];
+        }
+
+        BuildState goal{goal_ops, goal_atoms, goal_floats, vars, 0};
+        vector<PlTerm> args(arity);
+        for (int i = 0; i < arity; i++) {
+            args[i] = build_term(goal);
+        }
+
+        int res = Pl_Query_Call(pred, arity, args.data());
+        while (res == PL_SUCCESS && max_solutions != 0) {
+            solutions.append(decode_solution(vars.data(), n_decode));
+            max_solutions -= 1;
+            if (max_solutions != 0) {
+                res = Pl_Query_Next_Solution();
+            }
+        }
+    } catch (...) {
+        Pl_Query_End(PL_RECOVER);
+        throw;
+    }
+
+    Pl_Query_End(PL_RECOVER);
+
+    return solutions;
+}
+
+
+py::list solve_many(int n, int n_vars, const vector<int64_t> &ops, const vector<int> &atoms,
+                    const vector<double> &floats, const vector<int> &var_starts, const vector<int> &var_counts,
+                    int max_solutions) {
+    int call_atom = Pl_Create_Allocate_Atom("call");
+
+    vector<PlTerm> vars(n_vars);
+    BuildState st{ops, atoms, floats, vars, 0};
+    py::list results;
+
+    for (int i = 0; i < n; i++) {
+        py::list solutions;
+        int remaining = max_solutions;
+
+        // every goal is built within its own query, which recovers the heap it used when it ends
+        Pl_Query_Begin(PL_TRUE);
+        try {
+            // variables of the goal occupy the slots from its start to the start of the next goal
+            int last = i + 1 < (int) var_starts.size() ? var_starts[i + 1] : n_vars;
+            for (int v = var_starts.at(i); v < last; v++) {
+                vars[v] = Pl_Mk_Variable();
+            }
+
+            PlTerm goal = build_term(st);
+            int res = Pl_Query_Call(call_atom, 1, &goal);
+            while (res == PL_SUCCESS && remaining != 0) {
+                solutions.append(decode_solution(vars.data() + var_starts[i], var_counts.at(i)));
+                remaining -= 1;
+                if (remaining != 0) {
+                    res = Pl_Query_Next_Solution();
+                }
+            }
+        } catch (...) {
+            Pl_Query_End(PL_RECOVER);
+            throw;
+        }
+        Pl_Query_End(PL_RECOVER);
+
+        results.append(solutions);
+    }
+
+    return results;
+}
+
+
 PYBIND11_MODULE(pygprolog, m) {
     // basic data structures
 
@@ -86,6 +416,17 @@ PYBIND11_MODULE(pygprolog, m) {
     m.def("pygp_Rd_String", &Pl_Rd_String, "read the string from the term");
     m.def("pygp_Rd_List", &read_list, "read the elements of the list");
 
+    // decoding entire terms and solutions in one call
+    m.attr("DECODE_VAR") = (int) DECODE_VAR;
+    m.attr("DECODE_LIST") = (int) DECODE_LIST;
+    m.attr("DECODE_PAIR") = (int) DECODE_PAIR;
+    m.attr("DECODE_COMPOUND") = (int) DECODE_COMPOUND;
+    m.def("pygp_Read_Term", [](PlTerm term) {
+        vector<PlTerm> seen_vars;
+        return decode_term(term, seen_vars);
+    }, "decodes the entire term into nested python tuples");
+    m.def("pygp_Read_Terms", &decode_terms, "decodes a list of terms (one solution)");
+
 
     // unification
     m.def("pygp_Unif", &Pl_Unif, "Performs unification of two terms");
@@ -122,6 +463,8 @@ PYBIND11_MODULE(pygprolog, m) {
 
 //        return Pl_Mk_List(argsToUse);
         }, "creates list from an array of args");
+    m.def("pygp_Build_Terms", &build_terms, "builds n terms from their flattened description; returns the list of terms and the list of n_vars variables");
+    m.def("pygp_Assertz_Terms", &assertz_terms, "builds n clauses from their flattened description and asserts them at the end; returns the number of asserted clauses");
     m.def("pygp_Mk_Compound", [](int functor, int arity, const py::list &args) {
             PlTerm argsToUse[arity];
 
@@ -209,9 +552,25 @@ PYBIND11_MODULE(pygprolog, m) {
             return Pl_Query_Start(func, arity, argsToUse, PL_TRUE);
         }, "opens and calls the query");
     m.def("pygp_Query_Next_Solution", &Pl_Query_Next_Solution, "next solution");
-    m.def("pygp_Query_End", []() {
-            Pl_Query_End(PL_TRUE);
-        }, "end the query");
+    m.def("pygp_Next_Solutions", [](const py::list &terms, int max_solutions) {
+        py::list solutions;
+
+        while (max_solutions != 0 && Pl_Query_Next_Solution() == PL_SUCCESS) {
+            solutions.append(decode_terms(terms));
+            max_solutions -= 1;
+        }
+
+        return solutions;
+    }, "fetches at most max_solutions (all if negative) next solutions and decodes the given terms for each");
+    m.def("pygp_Run_Prepared", &run_prepared, "builds the prepared goal with the given parameter values, poses it and decodes the first n_decode variables of at most max_solutions (all if negative) solutions");
+    m.def("pygp_Solve_Many", &solve_many, "builds and solves n goals one after another; returns, for every goal, at most max_solutions (all if negative) solutions decoding var_counts[i] variables starting at slot var_starts[i]");
+    m.attr("PL_RECOVER") = PL_RECOVER;
+    m.attr("PL_CUT") = PL_CUT;
+    m.attr("PL_KEEP_FOR_PROLOG") = PL_KEEP_FOR_PROLOG;
+    m.def("pygp_Query_End", [](int op) {
+            Pl_Query_End(op);
+        }, "end the query; PL_RECOVER also recovers the heap used by the terms built since the query began",
+        py::arg("op") = (int) PL_CUT);
 
 
     // managing the prolog engine
@@ -4,9 +4,12 @@
 
 #include <pybind11/pybind11.h>  // has to be the first include, otherwise it doesn't compile
 #include <pybind11/functional.h>
+#include <pybind11/stl.h>
 #include "SWI-Prolog.h"
 #include <string.h>
 #include <iostream>
+#include <vector>
+#include <string>
 
 
 using namespace std;
@@ -19,6 +22,376 @@ foreign_t hello(term_t arg, int arity) {
     return TRUE;
 }
 
+// Compact encoding of terms handed over to python (decoded by _decode_swipy in SWIProlog.py)
+//      integers, floats -> python numbers
+//      atoms            -> python strings
+//      variables        -> (DECODE_VAR, index of the variable within the decoded terms)
+//      strings          -> (DECODE_STRING, text)
+//      proper lists     -> (DECODE_LIST, [elements])
+//      pairs            -> (DECODE_PAIR, head, tail)
+//      compounds        -> (DECODE_COMPOUND, name, arg1, ..., argN)
+enum DecodeTag {
+    DECODE_VAR = 0,
+    DECODE_STRING = 1,
+    DECODE_LIST = 2,
+    DECODE_PAIR = 3,
+    DECODE_COMPOUND = 4
+};
+
+py::object decode_term(term_t t, vector<term_t> &seen_vars);
+
+py::str decode_text(term_t t) {
+    char *text;
+    size_t len;
+    if (!PL_get_nchars(t, &len, &text, CVT_ATOM|CVT_STRING|REP_UTF8|BUF_DISCARDABLE)) {
+        throw py::value_error("cannot read the text of a term");
+    }
+    return py::str(text, len);
+}
+
+py::object decode_variable(term_t t, vector<term_t> &seen_vars) {
+    for (size_t i = 0; i < seen_vars.size(); i++) {
+        if (PL_compare(t, seen_vars[i]) == 0) {
+            return py::make_tuple((int) DECODE_VAR, i);
+        }
+    }
+    seen_vars.push_back(PL_copy_term_ref(t));
+    return py::make_tuple((int) DECODE_VAR, seen_vars.size() - 1);
+}
+
+py::object decode_list(term_t t, vector<term_t> &seen_vars) {
+    py::list elements;
+    term_t tail = PL_copy_term_ref(t);
+    term_t head = PL_new_term_ref();
+
+    while (PL_get_list(tail, head, tail)) {
+        elements.append(decode_term(head, seen_vars));
+    }
+
+    if (PL_get_nil(tail)) {
+        return py::make_tuple((int) DECODE_LIST, elements);
+    }
+
+    // partial list [e1, ..., eN | Tail] is a chain of pairs
+    py::object decoded = decode_term(tail, seen_vars);
+    for (ssize_t i = (ssize_t) elements.size() - 1; i >= 0; i--) {
+        decoded = py::make_tuple((int) DECODE_PAIR, elements[i], decoded);
+    }
+    return decoded;
+}
+
+py::object decode_compound(term_t t, vector<term_t> &seen_vars) {
+    atom_t name;
+    size_t arity;
+    PL_get_compound_name_arity_sz(t, &name, &arity);
+
+    char *name_text;
+    size_t name_len;
+    PL_atom_mbchars(name, &name_len, &name_text, REP_UTF8);
+
+    py::tuple decoded(arity + 2);
+    decoded[0] = py::int_((int) DECODE_COMPOUND);
+    decoded[1] = py::str(name_text, name_len);
+
+    term_t arg = PL_new_term_ref();
+    for (size_t i = 1; i <= arity; i++) {
+        _PL_get_arg_sz(i, t, arg);
+        decoded[i + 1] = decode_term(arg, seen_vars);
+    }
+
+    return decoded;
+}
+
+py::object decode_term(term_t t, vector<term_t> &seen_vars) {
+    switch (PL_term_type(t)) {
+        case PL_VARIABLE:
+            return decode_variable(t, seen_vars);
+        case PL_ATOM:
+        case PL_BLOB:
+            return decode_text(t);
+        case PL_NIL:
+            return py::make_tuple((int) DECODE_LIST, py::list());
+        case PL_INTEGER: {
+            int64_t value;
+            if (PL_get_int64(t, &value)) {
+                return py::int_(value);
+            }
+            // unbounded integer
+            char *digits;
+            size_t len;
+            PL_get_nchars(t, &len, &digits, CVT_INTEGER|BUF_DISCARDABLE);
+            return py::int_(py::str(digits, len));
+        }
+        case PL_FLOAT: {
+            double value;
+            PL_get_float(t, &value);
+            return py::float_(value);
+        }
+        case PL_STRING:
+            return py::make_tuple((int) DECODE_STRING, decode_text(t));
+        case PL_LIST_PAIR:
+            return decode_list(t, seen_vars);
+        case PL_TERM:
+            return decode_compound(t, seen_vars);
+        default:
+            throw py::value_error("cannot decode term of type " + to_string(PL_term_type(t)));
+    }
+}
+
+py::tuple decode_terms(term_t first, int n) {
+    // term refs created while decoding are released when the frame is closed
+    fid_t fid = PL_open_foreign_frame();
+    vector<term_t> seen_vars;
+    py::tuple decoded(n);
+
+    try {
+        for (int i = 0; i < n; i++) {
+            decoded[i] = decode_term(first + i, seen_vars);
+        }
+    } catch (...) {
+        PL_close_foreign_frame(fid);
+        throw;
+    }
+
+    PL_close_foreign_frame(fid);
+
+    return decoded;
+}
+
+// Opcodes of the flattened (preorder) description of terms (see TermWriter in engines/prolog/prolog_utils.py)
+enum BuildOp {
+    OP_ATOM = 0,        // OP_ATOM, atom index
+    OP_INT = 1,         // OP_INT, value
+    OP_FLOAT = 2,       // OP_FLOAT, float index
+    OP_VAR = 3,         // OP_VAR, variable index
+    OP_COMPOUND = 4,    // OP_COMPOUND, atom index, arity, arg_1, ..., arg_N
+    OP_LIST = 5,        // OP_LIST, length, elem_1, ..., elem_N
+    OP_PAIR = 6         // OP_PAIR, head, tail
+};
+
+struct BuildState {
+    const vector<int64_t> &ops;
+    const vector<atom_t> &atoms;
+    const vector<double> &floats;
+    term_t vars;
+    size_t pc;
+};
+
+int build_term(term_t t, BuildState &st) {
+    if (st.pc >= st.ops.size()) {
+        throw py::value_error("incomplete term description");
+    }
+
+    switch (st.ops[st.pc++]) {
+        case OP_ATOM:
+            return PL_put_atom(t, st.atoms.at(st.ops[st.pc++]));
+        case OP_INT:
+            return PL_put_int64(t, st.ops[st.pc++]);
+        case OP_FLOAT:
+            return PL_put_float(t, st.floats.at(st.ops[st.pc++]));
+        case OP_VAR:
+            return PL_put_term(t, st.vars + st.ops[st.pc++]);
+        case OP_COMPOUND: {
+            atom_t name = st.atoms.at(st.ops[st.pc++]);
+            int arity = (int) st.ops[st.pc++];
+            term_t args = PL_new_term_refs(arity);
+            for (int i = 0; i < arity; i++) {
+                if (!build_term(args + i, st)) {
+                    return FALSE;
+                }
+            }
+            return PL_cons_functor_v(t, PL_new_functor(name, arity), args);
+        }
+        case OP_LIST: {
+            int length = (int) st.ops[st.pc++];
+            if (length == 0) {
+                return PL_put_nil(t);
+            }
+            term_t elements = PL_new_term_refs(length);
+            for (int i = 0; i < length; i++) {
+                if (!build_term(elements + i, st)) {
+                    return FALSE;
+                }
+            }
+            PL_put_nil(t);
+            for (int i = length - 1; i >= 0; i--) {
+                if (!PL_cons_list(t, elements + i, t)) {
+                    return FALSE;
+                }
+            }
+            return TRUE;
+        }
+        case OP_PAIR: {
+            term_t head_tail = PL_new_term_refs(2);
+            if (!build_term(head_tail, st) || !build_term(head_tail + 1, st)) {
+                return FALSE;
+            }
+            return PL_cons_list(t, head_tail, head_tail + 1);
+        }
+        default:
+            throw py::value_error("unknown opcode in term description");
+    }
+}
+
+py::tuple build_terms(int n, int n_vars, const vector<int64_t> &ops, const vector<atom_t> &atoms,
+                      const vector<double> &floats) {
+    // targets and variables live outside of the frame, everything else is released when it closes
+    term_t terms = n > 0 ? PL_new_term_refs(n) : 0;
+    term_t vars = n_vars > 0 ? PL_new_term_refs(n_vars) : 0;
+
+    fid_t fid = PL_open_foreign_frame();
+    BuildState st{ops, atoms, floats, vars, 0};
+    int ok = TRUE;
+
+    try {
+        for (int i = 0; i < n && ok; i++) {
+            ok = build_term(terms + i, st);
+        }
+    } catch (...) {
+        PL_close_foreign_frame(fid);
+        throw;
+    }
+
+    PL_close_foreign_frame(fid);
+
+    if (!ok) {
+        throw runtime_error("could not build the terms (out of stack?)");
+    }
+
+    return py::make_tuple(terms, vars);
+}
+
+int assertz_terms(int n, int n_vars, const vector<int64_t> &ops, const vector<atom_t> &atoms,
+                  const vector<double> &floats) {
+    // the clauses are copied into the database, so everything built here is discarded afterwards
+    fid_t fid = PL_open_foreign_frame();
+    term_t terms = n > 0 ? PL_new_term_refs(n) : 0;
+    term_t vars = n_vars > 0 ? PL_new_term_refs(n_vars) : 0;
+
+    BuildState st{ops, atoms, floats, vars, 0};
+    int asserted = 0;
+    int built = TRUE;
+    int ok = TRUE;
+
+    try {
+        for (int i = 0; i < n && built; i++) {
+            built = build_term(terms + i, st);
+        }
+        for (int i = 0; i < n && built && ok; i++) {
+            ok = PL_assert(terms + i, NULL, PL_ASSERTZ);
+            asserted += ok ? 1 : 0;
+        }
+    } catch (...) {
+        PL_discard_foreign_frame(fid);
+        throw;
+    }
+
+    PL_discard_foreign_frame(fid);
+
+    if (!built) {
+        throw runtime_error("could not build the clauses (out of stack?)");
+    }
+    if (!ok) {
+        throw runtime_error("could not assert clause " + to_string(asserted + 1) + " of the chunk");
+    }
+
+    return asserted;
+}
+
+py::list run_prepared(predicate_t pred, term_t args, term_t vars, int n_goal_vars, int n_decode, const vector<int> &slots,
+                      int n_vars, const vector<int64_t> &ops, const vector<atom_t> &atoms,
+                      const vector<double> &floats, int max_solutions) {
+    // the parameters are bound within the frame; discarding it restores the prepared goal
+    fid_t fid = PL_open_foreign_frame();
+
+    // variables of the values: the variables of the goal, followed by the fresh ones
+    term_t value_vars = n_vars > 0 ? PL_new_term_refs(n_vars) : 0;
+    for (int i = 0; i < n_goal_vars && i < n_vars; i++) {
+        PL_put_term(value_vars + i, vars + i);
+    }
+    term_t values = slots.empty() ? 0 : PL_new_term_refs((int) slots.size());
+
+    BuildState st{ops, atoms, floats, value_vars, 0};
+    py::list solutions;
+    qid_t query = 0;
+
+    try {
+        int ok = TRUE;
+        for (size_t i = 0; i < slots.size() && ok; i++) {
+            ok = build_term(values + i, st) && PL_unify(vars + slots[i], values + i);
+        }
+
+        // a parameter value that does not unify leaves the query without solutions
+        if (ok) {
+            query = PL_open_query(NULL, PL_Q_NORMAL, pred, args);
+            while (max_solutions != 0 && PL_next_solution(query)) {
+                solutions.append(decode_terms(vars, n_decode));
+                max_solutions -= 1;
+            }
+            PL_close_query(query);
+            query = 0;
+        }
+    } catch (...) {
+        if (query) PL_close_query(query);
+        PL_discard_foreign_frame(fid);
+        throw;
+    }
+
+    PL_discard_foreign_frame(fid);
+
+    return solutions;
+}
+
+py::list solve_many(int n, int n_vars, const vector<int64_t> &ops, const vector<atom_t> &atoms,
+                    const vector<double> &floats, const vector<int> &var_starts, const vector<int> &var_counts,
+                    int max_solutions) {
+    static predicate_t call_pred = PL_predicate("call", 1, "user");
+
+    // the goals and everything created while solving them are discarded at the end
+    fid_t fid = PL_open_foreign_frame();
+    term_t goals = n > 0 ? PL_new_term_refs(n) : 0;
+    term_t vars = n_vars > 0 ? PL_new_term_refs(n_vars) : 0;
+
+    BuildState st{ops, atoms, floats, vars, 0};
+    py::list results;
+    qid_t query = 0;
+    int ok = TRUE;
+
+    try {
+        for (int i = 0; i < n && ok; i++) {
+            ok = build_term(goals + i, st);
+        }
+
+        for (int i = 0; i < n && ok; i++) {
+            py::list solutions;
+            int remaining = max_solutions;
+
+            // closing the query undoes its bindings, so the next goal starts from unbound variables
+            query = PL_open_query(NULL, PL_Q_NORMAL, call_pred, goals + i);
+            while (remaining != 0 && PL_next_solution(query)) {
+                solutions.append(decode_terms(vars + var_starts.at(i), var_counts.at(i)));
+                remaining -= 1;
+            }
+            PL_close_query(query);
+            query = 0;
+
+            results.append(solutions);
+        }
+    } catch (...) {
+        if (query) PL_close_query(query);
+        PL_discard_foreign_frame(fid);
+        throw;
+    }
+
+    PL_discard_foreign_frame(fid);
+
+    if (!ok) {
+        throw runtime_error("could not build the goals (out of stack?)");
+    }
+
+    return results;
+}
+
 PYBIND11_MODULE(swipy, m)
 {
     m.attr("VARIABLE") = PL_VARIABLE;
@@ -50,6 +423,11 @@ PYBIND11_MODULE(swipy, m)
 
     //atoms and functors
     m.def("swipy_new_atom", &PL_new_atom, "creates new atom");
+    m.def("swipy_new_atom_utf8", [](const string &name) {
+        return PL_new_atom_mbchars(REP_UTF8, name.size(), name.c_str());
+    }, "creates new atom from a (utf-8) name; the atom is registered until unregistered");
+    m.def("swipy_register_atom", &PL_register_atom, "keeps the atom alive");
+    m.def("swipy_unregister_atom", &PL_unregister_atom, "releases the atom");
     m.def("swipy_put_nil", &PL_put_nil, "puts nil in term");
     m.def("swipy_unify_nil", &PL_unify_nil, "unify term with nil");
     m.def("swipy_atom_chars", &PL_atom_chars, "returns the name of the atom");
@@ -137,8 +515,35 @@ PYBIND11_MODULE(swipy, m)
     m.def("swipy_get_tail", &PL_get_tail, "get tail of a list");
     m.def("swipy_get_nil", &PL_get_nil, "get nil");
 
+    // decoding entire terms and solutions in one call
+    m.attr("DECODE_VAR") = (int) DECODE_VAR;
+    m.attr("DECODE_STRING") = (int) DECODE_STRING;
+    m.attr("DECODE_LIST") = (int) DECODE_LIST;
+    m.attr("DECODE_PAIR") = (int) DECODE_PAIR;
+    m.attr("DECODE_COMPOUND") = (int) DECODE_COMPOUND;
+    m.def("swipy_read_term", [](term_t t) {
+        return decode_terms(t, 1)[0];
+    }, "decodes the entire term into nested python tuples");
+    m.def("swipy_read_terms", &decode_terms, "decodes n consecutive term references (one solution)");
+    m.def("swipy_next_solutions", [](qid_t query, term_t first, int n, int max_solutions) {
+        py::list solutions;
+
+        while (max_solutions != 0 && PL_next_solution(query)) {
+            solutions.append(decode_terms(first, n));
+            max_solutions -= 1;
+        }
+
+        return solutions;
+    }, "fetches at most max_solutions (all if negative) solutions and decodes n consecutive term references for each");
+
 
     // constructing terms
+    // foreign frames: scope the term refs (and bindings) created within them
+    m.def("swipy_open_foreign_frame", &PL_open_foreign_frame, "opens a foreign frame");
+    m.def("swipy_close_foreign_frame", &PL_close_foreign_frame, "closes the frame, releasing its term refs but keeping the bindings");
+    m.def("swipy_discard_foreign_frame", &PL_discard_foreign_frame, "discards the frame, releasing its term refs and undoing the bindings");
+    m.def("swipy_rewind_foreign_frame", &PL_rewind_foreign_frame, "undoes the bindings and releases the term refs created since the frame was opened; the frame stays open");
+
     m.def("swipy_new_term_ref", &PL_new_term_ref, "new term ref");
     m.def("swipy_new_term_refs", &PL_new_term_refs, "new term references");
     m.def("swipy_put_variable", &PL_put_variable, "put variable into term reference");
@@ -155,6 +560,8 @@ PYBIND11_MODULE(swipy, m)
         return PL_cons_functor_v(t, fnc, args);
     }, "constructs a term from a functor and arguments");
     m.def("swipy_cons_list", &PL_cons_list, "constructs list from head and tail");
+    m.def("swipy_build_terms", &build_terms, "builds n terms from their flattened description; returns the first of n consecutive term refs and the first of n_vars variables");
+    m.def("swipy_assertz_terms", &assertz_terms, "builds n clauses from their flattened description and asserts them at the end; returns the number of asserted clauses");
     m.def("swipy_copy_term_ref", &PL_copy_term_ref, "copies a given term");
 
     // unification
@@ -177,6 +584,8 @@ PYBIND11_MODULE(swipy, m)
         return PL_open_query(NULL, PL_Q_NORMAL, p, t);
     }, "opens a query");
     m.def("swipy_next_solution", &PL_next_solution, "go to the next solution");
+    m.def("swipy_run_prepared", &run_prepared, "binds the parameter slots of a prepared goal, poses it and decodes the first n_decode variables of at most max_solutions (all if negative) solutions");
+    m.def("swipy_solve_many", &solve_many, "builds n goals from their flattened description and solves them one after another; returns, for every goal, at most max_solutions (all if negative) solutions decoding var_counts[i] variables starting at slot var_starts[i]");
     m.def("swipy_cut_query", &PL_cut_query, "cut the query");
     m.def("swipy_close_query", &PL_close_query, "close the query");
 
@@ -5,11 +5,345 @@
 #include "cinterf.h"
 #include <string.h>
 #include <iostream>
+#include <vector>
+#include <string>
+#include <algorithm>
+
+#include <pybind11/stl.h>
 
 
 using namespace std;
 namespace py = pybind11;
 
+
+// Compact encoding of terms handed over to python (decoded by _decode_pyxsb in XSBProlog.py)
+//      integers, floats -> python numbers
+//      atoms            -> python strings
+//      variables        -> (DECODE_VAR, index of the variable within the decoded terms)
+//      proper lists     -> (DECODE_LIST, [elements])
+//      pairs            -> (DECODE_PAIR, head, tail)
+//      compounds        -> (DECODE_COMPOUND, name, arg1, ..., argN)
+enum DecodeTag {
+    DECODE_VAR = 0,
+    DECODE_LIST = 2,
+    DECODE_PAIR = 3,
+    DECODE_COMPOUND = 4
+};
+
+py::object decode_term(prolog_term term, vector<prolog_term> &seen_vars);
+
+py::object decode_variable(prolog_term term, vector<prolog_term> &seen_vars) {
+    // unbound variables are the same variable iff they dereference to the same cell
+    prolog_term var = p2p_deref(term);
+    for (size_t i = 0; i < seen_vars.size(); i++) {
+        if (seen_vars[i] == var) {
+            return py::make_tuple((int) DECODE_VAR, i);
+        }
+    }
+    seen_vars.push_back(var);
+    return py::make_tuple((int) DECODE_VAR, seen_vars.size() - 1);
+}
+
+py::object decode_list(prolog_term term, vector<prolog_term> &seen_vars) {
+    py::list elements;
+    prolog_term tail = term;
+
+    while (is_list(tail)) {
+        elements.append(decode_term(p2p_car(tail), seen_vars));
+        tail = p2p_cdr(tail);
+    }
+
+    if (is_nil(tail)) {
+        return py::make_tuple((int) DECODE_LIST, elements);
+    }
+
+    // partial list [e1, ..., eN | Tail] is a chain of pairs
+    py::object decoded = decode_term(tail, seen_vars);
+    for (ssize_t i = (ssize_t) elements.size() - 1; i >= 0; i--) {
+        decoded = py::make_tuple((int) DECODE_PAIR, elements[i], decoded);
+    }
+    return decoded;
+}
+
+py::object decode_compound(prolog_term term, vector<prolog_term> &seen_vars) {
+    int arity = p2c_arity(term);
+
+    py::tuple decoded(arity + 2);
+    decoded[0] = py::int_((int) DECODE_COMPOUND);
+    decoded[1] = py::str(p2c_functor(term));
+
+    for (int i = 1; i <= arity; i++) {
+        decoded[i + 1] = decode_term(p2p_arg(term, i), seen_vars);
+    }
+
+    return decoded;
+}
+
+py::object decode_term(prolog_term term, vector<prolog_term> &seen_vars) {
+    if (is_var(term)) {
+        return decode_variable(term, seen_vars);
+    } else if (is_int(term)) {
+        return py::int_(p2c_int(term));
+    } else if (is_float(term)) {
+        return py::float_(p2c_float(term));
+    } else if (is_nil(term)) {
+        // [] is an atom for XSB as well, check it before the other atoms
+        return py::make_tuple((int) DECODE_LIST, py::list());
+    } else if (is_string(term)) {
+        return py::str(p2c_string(term));
+    } else if (is_list(term)) {
+        return decode_list(term, seen_vars);
+    } else if (is_functor(term)) {
+        return decode_compound(term, seen_vars);
+    } else {
+        throw py::value_error("cannot decode XSB term");
+    }
+}
+
+
+// Flattened (preorder) description of terms built in a single call (written by TermWriter in prolog_utils.py)
+//      OP_ATOM, atom index
+//      OP_INT, value
+//      OP_FLOAT, float index
+//      OP_VAR, variable index
+//      OP_COMPOUND, atom index, arity, arg1, ..., argN
+//      OP_LIST, length, elem1, ..., elemN
+//      OP_PAIR, head, tail
+// XSB creates atoms from their names, so the atom table holds the names of the atoms
+enum BuildOp {
+    OP_ATOM = 0,
+    OP_INT = 1,
+    OP_FLOAT = 2,
+    OP_VAR = 3,
+    OP_COMPOUND = 4,
+    OP_LIST = 5,
+    OP_PAIR = 6
+};
+
+struct BuildState {
+    const vector<int64_t> &ops;
+    const vector<string> &atoms;
+    const vector<double> &floats;
+    // cells holding the variables built so far (0 if the variable is not built yet)
+    vector<prolog_term> &vars;
+    size_t pc;
+};
+
+void build_var(prolog_term target, BuildState &st, size_t slot) {
+    if (st.vars.at(slot) == 0) {
+        // first occurrence: the (unbound) target cell becomes the variable
+        st.vars[slot] = target;
+    } else {
+        p2p_unify(target, st.vars[slot]);
+    }
+}
+
+// builds the next term of the description into target, which has to be an unbound variable
+void build_term(prolog_term target, BuildState &st) {
+    switch (st.ops.at(st.pc++)) {
+        case OP_ATOM:
+            c2p_string(const_cast<char *>(st.atoms.at(st.ops.at(st.pc++)).c_str()), target);
+            break;
+        case OP_INT:
+            c2p_int((prolog_int) st.ops.at(st.pc++), target);
+            break;
+        case OP_FLOAT:
+            c2p_float(st.floats.at(st.ops.at(st.pc++)), target);
+            break;
+        case OP_VAR:
+            build_var(target, st, st.ops.at(st.pc++));
+            break;
+        case OP_COMPOUND: {
+            const string &functor = st.atoms.at(st.ops.at(st.pc++));
+            int arity = (int) st.ops.at(st.pc++);
+            c2p_functor(const_cast<char *>(functor.c_str()), arity, target);
+            for (int i = 1; i <= arity; i++) {
+                build_term(p2p_arg(target, i), st);
+            }
+            break;
+        }
+        case OP_LIST: {
+            int64_t length = st.ops.at(st.pc++);
+            prolog_term tail = target;
+            for (int64_t i = 0; i < length; i++) {
+                c2p_list(tail);
+                build_term(p2p_car(tail), st);
+                tail = p2p_cdr(tail);
+            }
+            c2p_nil(tail);
+            break;
+        }
+        case OP_PAIR:
+            c2p_list(target);
+            build_term(p2p_car(target), st);
+            build_term(p2p_cdr(target), st);
+            break;
+        default:
+            throw py::value_error("unknown build op " + to_string(st.ops.at(st.pc - 1)));
+    }
+}
+
+void print_xsb_error(const char *what) {
+    cout << what << ": " << xsb_get_error_type() << " | " << xsb_get_error_message() << "\n";
+}
+
+
+// Commands and queries are posed through register 1.
+// A query is posed as ','(Goal, '=='(Vars, Vars)), where Vars is the list of its variables of interest;
+// the answers are read from the instantiated query that XSB leaves in register 1.
+
+// whether a query posed by open_query/solve_many is still open in the engine
+static bool query_open = false;
+
+void end_query() {
+    if (query_open) {
+        xsb_close_query();
+        query_open = false;
+    }
+}
+
+int open_goal(BuildState &st, int first_var, int n_answer) {
+    end_query();
+
+    prolog_term query = reg_term(1);
+    c2p_functor(const_cast<char *>(","), 2, query);
+    build_term(p2p_arg(query, 1), st);
+
+    prolog_term answer = p2p_arg(query, 2);
+    c2p_functor(const_cast<char *>("=="), 2, answer);
+    for (int side = 1; side <= 2; side++) {
+        prolog_term tail = p2p_arg(answer, side);
+        for (int i = 0; i < n_answer; i++) {
+            c2p_list(tail);
+            build_var(p2p_car(tail), st, first_var + i);
+            tail = p2p_cdr(tail);
+        }
+        c2p_nil(tail);
+    }
+
+    int rc = xsb_query();
+    if (rc == XSB_ERROR) {
+        print_xsb_error("Query error");
+    }
+    query_open = rc == XSB_SUCCESS;
+
+    return rc;
+}
+
+py::tuple read_answer(int n) {
+    vector<prolog_term> seen_vars;
+    py::tuple decoded(n);
+
+    prolog_term vars = p2p_arg(p2p_arg(reg_term(1), 2), 1);
+    for (int i = 0; i < n; i++) {
+        decoded[i] = decode_term(p2p_car(vars), seen_vars);
+        vars = p2p_cdr(vars);
+    }
+
+    return decoded;
+}
+
+int open_query(int n_vars, const vector<int64_t> &ops, const vector<string> &atoms, const vector<double> &floats,
+               int n_answer) {
+    vector<prolog_term> vars(n_vars, 0);
+    BuildState st{ops, atoms, floats, vars, 0};
+
+    return open_goal(st, 0, n_answer);
+}
+
+py::list next_solutions(int n, int max_solutions) {
+    py::list solutions;
+
+    while (query_open && max_solutions != 0) {
+        int rc = xsb_next();
+        if (rc != XSB_SUCCESS) {
+            // XSB closes the query once it has no more answers
+            query_open = false;
+            if (rc == XSB_ERROR) {
+                print_xsb_error("Query error");
+            }
+            break;
+        }
+        solutions.append(read_answer(n));
+        max_solutions -= 1;
+    }
+
+    return solutions;
+}
+
+int command_terms(int n_vars, const vector<int64_t> &ops, const vector<string> &atoms,
+                  const vector<double> &floats) {
+    end_query();
+
+    vector<prolog_term> vars(n_vars, 0);
+    BuildState st{ops, atoms, floats, vars, 0};
+    build_term(reg_term(1), st);
+
+    int rc = xsb_command();
+    if (rc == XSB_ERROR) {
+        print_xsb_error("Command error");
+    }
+
+    return rc;
+}
+
+int assertz_terms(int n, int n_vars, const vector<int64_t> &ops, const vector<string> &atoms,
+                  const vector<double> &floats) {
+    end_query();
+
+    vector<prolog_term> vars(n_vars, 0);
+    BuildState st{ops, atoms, floats, vars, 0};
+    int asserted = 0;
+
+    for (int i = 0; i < n; i++) {
+        // the heap of the previous command is gone, variables of every clause are built anew
+        fill(vars.begin(), vars.end(), 0);
+
+        prolog_term command = reg_term(1);
+        c2p_functor(const_cast<char *>("assertz"), 1, command);
+        build_term(p2p_arg(command, 1), st);
+
+        int rc = xsb_command();
+        if (rc != XSB_SUCCESS) {
+            if (rc == XSB_ERROR) {
+                print_xsb_error("Command error");
+            }
+            break;
+        }
+        asserted += 1;
+    }
+
+    return asserted;
+}
+
+py::list solve_many(int n, int n_vars, const vector<int64_t> &ops, const vector<string> &atoms,
+                    const vector<double> &floats, const vector<int> &var_starts, const vector<int> &var_counts,
+                    int max_solutions) {
+    vector<prolog_term> vars(n_vars, 0);
+    BuildState st{ops, atoms, floats, vars, 0};
+    py::list results;
+
+    for (int i = 0; i < n; i++) {
+        py::list solutions;
+
+        // goals do not share variables; variables of the goal occupy the slots from its start to the next start
+        fill(vars.begin(), vars.end(), 0);
+
+        int rc = open_goal(st, var_starts.at(i), var_counts.at(i));
+        if (rc == XSB_SUCCESS && max_solutions != 0) {
+            solutions.append(read_answer(var_counts[i]));
+            for (auto solution: next_solutions(var_counts[i], max_solutions < 0 ? -1 : max_solutions - 1)) {
+                solutions.append(solution);
+            }
+        }
+        end_query();
+
+        results.append(solutions);
+    }
+
+    return results;
+}
+
 PYBIND11_MODULE(pyxsb, m)
 {
     m.attr("SUCCESS") = XSB_SUCCESS;
@@ -97,4 +431,17 @@ PYBIND11_MODULE(pyxsb, m)
         }, "goes to the next solution");
     m.def("pyxsb_close_query", &xsb_close_query, "closes the current query");
 
+    // structured interface: terms are built from their flattened description and answers are decoded
+    m.attr("DECODE_VAR") = (int) DECODE_VAR;
+    m.attr("DECODE_LIST") = (int) DECODE_LIST;
+    m.attr("DECODE_PAIR") = (int) DECODE_PAIR;
+    m.attr("DECODE_COMPOUND") = (int) DECODE_COMPOUND;
+    m.def("pyxsb_command_terms", &command_terms, "builds the described term in register 1 and runs it as a command");
+    m.def("pyxsb_assertz_terms", &assertz_terms, "builds and asserts n clauses one after another; returns the number of asserted clauses");
+    m.def("pyxsb_open_query", &open_query, "builds the described goal and poses it as a query; the first n_answer variable slots are the variables of interest");
+    m.def("pyxsb_read_answer", &read_answer, "decodes the n variables of interest of the current answer");
+    m.def("pyxsb_next_solutions", &next_solutions, "fetches and decodes at most max_solutions (all if negative) next answers of the open query");
+    m.def("pyxsb_end_query", &end_query, "closes the query opened by pyxsb_open_query, if it is still open");
+    m.def("pyxsb_solve_many", &solve_many, "builds and solves n goals one after another; returns, for every goal, at most max_solutions (all if negative) solutions decoding var_counts[i] variables starting at slot var_starts[i]");
+
 }
@@ -27,6 +27,9 @@ except Exception:
 from pylo.engines.kanren import MiniKanren
 engines += ['MiniKanren']
 
+from pylo.engines.native import FactEngine, SLDEngine
+engines += ['FactEngine', 'SLDEngine']
+
 # __all__ = engines
 # __all__ = [
 #     'GNUProlog',
@@ -1,7 +1,9 @@
 from .muz import MuZ
+from .seminaive import SemiNaive
 #from .datalogsolver import DatalogSolver
 
 __all__ = [
     'MuZ',
+    'SemiNaive',
     #'DatalogSolver'
 ]
\ No newline at end of file
@@ -1,8 +1,10 @@
+import ctypes
 from functools import reduce
 from math import log, ceil
 from typing import Union
 
 from z3 import (
+    Z3_fixedpoint_add_fact,
     Fixedpoint,
     BitVecSort,
     Const,
@@ -12,6 +14,7 @@ from z3 import (
     is_and,
     is_or,
     is_false,
+    Not as Z3Not,
 )
 
 from pylo.language import MUZ
@@ -24,7 +27,8 @@ from pylo.language.datalog import (
     Atom,
     Clause,
     c_id_to_const,
-    Not
+    Not,
+    FactTable
 )
 from .datalogsolver import DatalogSolver
 
@@ -33,6 +37,12 @@ class MuZ(DatalogSolver):
     """
     Z3's muZ (datalog engine)
 
+    Constants are bit-vectors, the sort of a type is sized when the type is first used (with room for as many
+        constants again). When a constant does not fit anymore, the fixedpoint is built again, with sorts sized for
+        the constants of the types at that time: the engine keeps the facts and rules it was given to assert them
+        again. The z3 objects of the symbols are kept by the engine, so engines sharing a context size their sorts
+        independently.
+
     Arguments:
         knowledge_base (default: None): facts to use
                                         Not supported yet
@@ -46,40 +56,107 @@ class MuZ(DatalogSolver):
     ):
         self._solver = Fixedpoint()
         self._solver.set(engine="datalog")
+        # z3 objects of the symbols (types, constants, variables, predicates) declared in this engine
+        self._z3 = {}
+        # z3 reports the values of an answer in the order the variables were declared in
+        self._var_order = {}
+        # facts, fact tables and rules in the order they were asserted, to rebuild the fixedpoint with larger sorts
+        self._asserted = []
         super().__init__(MUZ, knowledge_base, background_knowledge, ctx)
 
+    def _rebuild(self) -> None:
+        """
+        Builds the fixedpoint again, declaring the symbols with sorts sized for the constants of the types now
+        """
+        self._solver = Fixedpoint()
+        self._solver.set(engine="datalog")
+        self._z3 = {}
+        declared = list(self._declared)
+        for t in [x for x in declared if isinstance(x, Type)]:
+            self.declare_type(t)
+        for c in [x for x in declared if isinstance(x, Constant)]:
+            self.declare_constant(c)
+        variables = sorted([x for x in declared if isinstance(x, Variable)], key=lambda x: self._var_order[x])
+        self._var_order = {}
+        for v in variables:
+            self.declare_variable(v)
+        for p in [x for x in declared if isinstance(x, Predicate)]:
+            self.declare_predicate(p)
+
+        for kind, item in self._asserted:
+            if kind == "fact":
+                self._solver.fact(self._as_muz(item))
+            elif kind == "facts":
+                self._add_facts(item)
+            else:
+                self._solver.rule(self._as_muz(item.get_head()), [self._as_muz(x) for x in item.get_literals()])
+
+    def _as_muz(self, literal: Union[Atom, Not]):
+        """
+        Translates the literal into z3, with the objects of the symbols declared in this engine
+        """
+        if isinstance(literal, Not):
+            return Z3Not(self._as_muz(literal.get_atom()))
+        return self._z3[literal.get_predicate()](*[self._z3[x] for x in literal.get_arguments()])
+
     def declare_type(self, elem_type: Type):
-        len_elem_type = len(elem_type)
-        if len_elem_type > 0:
-            s = BitVecSort(ceil(log(len(elem_type), 2)))
-            elem_type.add_engine_object(s)
+        # types are declared when first used, so the sort leaves room for as many constants again
+        self._z3[elem_type] = BitVecSort(max(ceil(log(2 * max(len(elem_type), 1), 2)), 1))
 
     def declare_constant(self, elem_constant: Constant):
-        s = elem_constant.get_type().get_engine_obj(self._name)
-        c = BitVecVal(elem_constant.id(), s)
-        elem_constant.add_engine_object(c)
+        s = self._z3[elem_constant.get_type()]
+        if elem_constant.id() >= 2 ** s.size():
+            # the type has more constants than its sort has room for
+            self._rebuild()
+            s = self._z3[elem_constant.get_type()]
+        self._z3[elem_constant] = BitVecVal(elem_constant.id(), s)
 
     def declare_variable(self, elem_variable: Variable):
-        s = elem_variable.get_type().get_engine_obj(self._name)
-        v = Const(elem_variable.name, s)
+        v = Const(elem_variable.name, self._z3[elem_variable.get_type()])
         self._solver.declare_var(v)
-        elem_variable.add_engine_object(v)
+        self._var_order[elem_variable] = len(self._var_order)
+        self._z3[elem_variable] = v
 
     def declare_predicate(self, elem_predicate: Predicate):
         arg_types = [
-            x.get_engine_obj(self._name) for x in elem_predicate.get_arg_types()
+            self._z3[x] for x in elem_predicate.get_arg_types()
         ]
         arg_types += [BoolSort()]
         rel = Function(elem_predicate.get_name(), *arg_types)
         self._solver.register_relation(rel)
-        elem_predicate.add_engine_object(rel)
+        self._z3[elem_predicate] = rel
 
     def assert_fact(self, fact: Atom):
-        self._solver.fact(fact.as_muz())
+        self._declare_symbols(fact)
+        self._solver.fact(self._as_muz(fact))
+        self._asserted.append(("fact", fact))
+
+    def assert_facts(self, table: FactTable):
+        # the ids of the constants are the values of the bit-vectors, so the rows are added as they are
+        predicate = table.get_predicate()
+        self._declare_symbol(predicate)
+        for ind, t in enumerate(predicate.get_arg_types()):
+            column = table.column(ind)
+            if len(column) and column.max() >= 2 ** self._z3[t].size():
+                # the ids of the table come from the context, the sorts are sized for them after a rebuild
+                self._rebuild()
+                break
+
+        self._add_facts(table)
+        self._asserted.append(("facts", table))
+
+    def _add_facts(self, table: FactTable):
+        predicate = table.get_predicate()
+        rel = self._z3[predicate]
+        ctx = self._solver.ctx.ref()
+        arity = predicate.get_arity()
+        for row in table.codes().tolist():
+            Z3_fixedpoint_add_fact(ctx, self._solver.fixedpoint, rel.ast, arity, (ctypes.c_uint * arity)(*row))
 
     def assert_rule(self, rule: Clause):
-        cl_muz = rule.as_muz()
-        self._solver.rule(cl_muz[0], cl_muz[1])
+        self._declare_symbols(rule)
+        self._solver.rule(self._as_muz(rule.get_head()), [self._as_muz(x) for x in rule.get_literals()])
+        self._asserted.append(("rule", rule))
 
     def asserta(self, clause: Union[Atom, Clause]):
         if isinstance(clause, Atom):
@@ -91,7 +168,8 @@ class MuZ(DatalogSolver):
         self.asserta(clause)
 
     def has_solution(self, *query: Union[Atom, Not]):
-        body_atms = [x.as_muz() for x in query]
+        self._declare_symbols(*query)
+        body_atms = [self._as_muz(x) for x in query]
         res = self._solver.query(*body_atms)
         return True if res.r == 1 else False
 
@@ -101,7 +179,8 @@ class MuZ(DatalogSolver):
         else:
             max_solutions = -1
 
-        body_atms = [x.as_muz() for x in query]
+        self._declare_symbols(*query)
+        body_atms = [self._as_muz(x) for x in query]
         self._solver.query(*body_atms)
 
         ans = self._solver.get_answer()
@@ -117,7 +196,7 @@ class MuZ(DatalogSolver):
             val = int(ans.children()[1].as_long())
             #varb = query.get_variables()[0]
             varb = query_vars[0]
-            return [{varb: c_id_to_const(val, varb.get_type())}]
+            return [{varb: c_id_to_const(val, varb.get_type(), self._ctx)}]
         elif is_or(ans) and not (
                 is_and(ans.children()[0]) or is_or(ans.children()[0])
         ):
@@ -127,7 +206,7 @@ class MuZ(DatalogSolver):
             varbs = query_vars[0]
             varbs = [varbs] * len(vals)
             return [
-                {k: c_id_to_const(v, varbs[0].get_type())}
+                {k: c_id_to_const(v, varbs[0].get_type(), self._ctx)}
                 for k, v in zip(varbs, vals)
             ]
         elif is_and(ans):
@@ -143,13 +222,12 @@ class MuZ(DatalogSolver):
         else:
             raise Exception(f"don't know how to parse {ans}")
 
-        tmp_args = [v for x in query for v in x.get_variables()]
-        args = reduce(lambda x, y: x + [y] if y not in x else x, tmp_args, [])
+        args = sorted(query_vars, key=lambda x: self._var_order[x])
 
         answer = [
             dict(
                 [
-                    (v, c_id_to_const(c, v.get_type().name))
+                    (v, c_id_to_const(c, v.get_type().name, self._ctx))
                     for v, c in zip(args, x)
                 ]
             )
@@ -0,0 +1,271 @@
+"""
+Parallel semi-naive evaluation of a recursive component, in processes
+
+Every process owns a partition of every relation of the component: the rows whose value in the partition column of
+    the predicate hashes to the process. An iteration, in every process:
+        - evaluates the recursive rules with its partition of the delta, joining with its partition of the other
+          relations (the rows with the value of the join variable that hashes to the process) when the literal
+          has the join variable, and with the whole relation otherwise,
+        - sends every derived row to the process owning it, and receives the rows it owns from the others,
+        - keeps the received rows it does not have yet as its next delta.
+    Relations of the lower components do not change during the evaluation: they are in shared memory, every process
+    takes its partitions from there. Relations of the component used in bodies next to the delta (non-linear rules)
+    are replicated, every process sends its new delta to all the others.
+
+Termination is detected without a coordinator: the messages of an iteration carry the size of the delta of their
+    sender, so all processes learn the total size of the delta of the iteration at the same time, and stop together
+    when it is zero (nothing was derived).
+"""
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+from typing import Dict, Sequence, List, Tuple
+
+import numpy as np
+
+from pylo.language.commons import Predicate, Variable, Atom, Not, Clause
+
+from .seminaive import _Relation, _fire, _unique, _difference, _is_positive
+
+
+def evaluate_in_processes(component: frozenset, recursive: Sequence[Clause], model: Dict[Predicate, _Relation],
+                          base: int, processes: int) -> None:
+    """
+    Adds the facts derived by the recursive rules of the component to the model
+        (the model holds everything derived by the other rules of the component, which is the first delta)
+
+    Arguments:
+        component: predicates of the component
+        recursive: rules of the component with a positive literal of the component in the body
+        model: relations of the predicates of the lower components and of the component
+        base: base of the keys
+        processes: number of processes
+    """
+    columns = _partition_columns(component, recursive)
+    replicated = any([len([x for x in r.get_literals() if _is_positive(x) and x.get_predicate() in component]) > 1
+                      for r in recursive])
+
+    # the relations of the lower components the rules use, in shared memory
+    static = set([(x.get_atom() if isinstance(x, Not) else x).get_predicate() for r in recursive
+                  for x in r.get_literals()]).difference(component)
+    segments = []
+    shared = {}
+    for p in static:
+        if p in model and len(model[p]):
+            segment, relation = _share(model[p])
+            segments.append(segment)
+            shared[p] = relation
+
+    # messages refer to the predicates by their position (unpickled predicates are not the ones of the context)
+    predicates = sorted(component, key=str)
+    context = multiprocessing.get_context("fork")
+    inboxes = [context.Queue() for _ in range(processes)]
+    results = context.Queue()
+    workers = [context.Process(target=_work, args=(ind, processes, predicates, recursive, columns, replicated, base,
+                                                   shared, model, inboxes, results))
+               for ind in range(processes)]
+    try:
+        for w in workers:
+            w.start()
+
+        partitions = dict([(p, []) for p in component])
+        done = 0
+        while done < processes:
+            try:
+                ind, owned = results.get(timeout=1)
+            except queue.Empty:
+                if any([w.exitcode not in (None, 0) for w in workers]):
+                    raise Exception("a process of the parallel evaluation stopped without results")
+                continue
+            done += 1
+            if isinstance(owned, str):
+                raise Exception(f"evaluation failed in process {ind}: {owned}")
+            for p, rows in owned.items():
+                partitions[predicates[p]].append(rows)
+
+        for p in component:
+            model[p] = _Relation([np.concatenate([x[i] for x in partitions[p]]) for i in range(p.get_arity())],
+                                 p.get_arity())
+    finally:
+        # the views of the segments need to be gone before they are closed
+        shared.clear()
+        for w in workers:
+            w.join(timeout=1)
+            if w.is_alive():
+                w.terminate()
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+def _partition_columns(component: frozenset, recursive: Sequence[Clause]) -> Dict[Predicate, int]:
+    """
+    Returns the column every predicate of the component is partitioned on: the argument joining with the other
+        literals most often, when the predicate is the delta
+    """
+    scores = dict([(p, [0] * p.get_arity()) for p in component])
+    for r in recursive:
+        for ind, lit in enumerate(r.get_literals()):
+            if _is_positive(lit) and lit.get_predicate() in component:
+                others = set([v for j, x in enumerate(r.get_literals()) if j != ind for v in x.get_variables()])
+                for pos, arg in enumerate(lit.get_arguments()):
+                    if isinstance(arg, Variable) and arg in others:
+                        scores[lit.get_predicate()][pos] += 1
+
+    return dict([(p, max(range(p.get_arity()), key=lambda x: (s[x], -x)) if p.get_arity() else 0)
+                 for p, s in scores.items()])
+
+
+def _owner(column, processes: int):
+    # the process owning every value (a multiplicative hash, the ids are dense)
+    return ((column.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)) % np.uint64(processes)
+
+
+def _share(relation: _Relation) -> Tuple[shared_memory.SharedMemory, _Relation]:
+    # copies the relation to a shared memory segment (the processes inherit the mapping)
+    segment = shared_memory.SharedMemory(create=True, size=max(8 * relation.arity * len(relation), 1))
+    rows = np.ndarray((relation.arity, len(relation)), dtype=np.int64, buffer=segment.buf)
+    for ind, column in enumerate(relation.columns):
+        rows[ind] = column
+    return segment, _Relation(list(rows), relation.arity)
+
+
+def _take(relation: _Relation, rows) -> _Relation:
+    return _Relation([x[rows] for x in relation.columns], relation.arity)
+
+
+class _Messages:
+    """
+    Exchange of the rows of an iteration between the processes, through their inboxes
+    """
+
+    def __init__(self, ind: int, processes: int, inboxes: Sequence):
+        self._ind = ind
+        self._processes = processes
+        self._inboxes = inboxes
+        # messages of later steps (sent by processes that are ahead)
+        self._early: Dict[Tuple[int, str], List] = {}
+
+    def exchange(self, step: Tuple[int, str], outgoing: Sequence, size: int) -> Tuple[List, int]:
+        """
+        Sends outgoing[i] to process i, and receives the messages of all other processes
+
+        Return:
+            the received messages (with the own outgoing message) and the total size over the processes
+        """
+        for ind, message in enumerate(outgoing):
+            if ind != self._ind:
+                self._inboxes[ind].put((step, size, message))
+
+        received = [(size, outgoing[self._ind])] + self._early.pop(step, [])
+        while len(received) < self._processes:
+            other_step, other_size, message = self._inboxes[self._ind].get()
+            if other_step == step:
+                received.append((other_size, message))
+            else:
+                self._early.setdefault(other_step, []).append((other_size, message))
+
+        return [x[1] for x in received], sum([x[0] for x in received])
+
+
+def _work(ind: int, processes: int, predicates: Sequence[Predicate], recursive: Sequence[Clause],
+          columns: Dict[Predicate, int], replicated: bool, base: int, shared: Dict[Predicate, _Relation],
+          model: Dict[Predicate, _Relation], inboxes: Sequence, results) -> None:
+    try:
+        owned = _evaluate_partition(ind, processes, predicates, recursive, columns, replicated, base, shared, model,
+                                    inboxes)
+        results.put((ind, dict([(i, owned[p].columns) for i, p in enumerate(predicates)])))
+    except Exception as e:
+        results.put((ind, repr(e)))
+
+
+def _evaluate_partition(ind: int, processes: int, predicates: Sequence[Predicate], recursive: Sequence[Clause],
+                        columns: Dict[Predicate, int], replicated: bool, base: int, shared: Dict[Predicate, _Relation],
+                        model: Dict[Predicate, _Relation], inboxes: Sequence) -> Dict[Predicate, _Relation]:
+    component = frozenset(predicates)
+    messages = _Messages(ind, processes, inboxes)
+    owned = {}
+    for p in component:
+        owned[p] = _take(model[p], np.flatnonzero(_owner(model[p].columns[columns[p]], processes) == ind))
+        owned[p].index_rows(base)
+    full = dict([(p, model[p]) for p in component]) if replicated else {}
+    delta = dict(owned)
+
+    # partitions of the relations of the lower components, on the argument joining with the delta
+    partitions = {}
+
+    def _static(predicate: Predicate, position: int = None) -> _Relation:
+        relation = shared[predicate] if predicate in shared else _Relation.empty(predicate.get_arity())
+        if position is None:
+            return relation
+        if (predicate, position) not in partitions:
+            partitions[(predicate, position)] = _take(relation, np.flatnonzero(
+                _owner(relation.columns[position], processes) == ind))
+        return partitions[(predicate, position)]
+
+    step = 0
+    while True:
+        derived = dict([(p, []) for p in component])
+        for r in recursive:
+            for pos, lit in enumerate(r.get_literals()):
+                if _is_positive(lit) and lit.get_predicate() in component and len(delta[lit.get_predicate()]):
+                    key = lit.get_arguments()[columns[lit.get_predicate()]]
+                    derived[r.get_head().get_predicate()].append(
+                        _fire(r, _partition_relations(pos, delta[lit.get_predicate()], key, component, full,
+                                                      _static), base, pos))
+
+        # every derived row goes to the process owning it
+        outgoing = [{} for _ in range(processes)]
+        for i, p in enumerate(predicates):
+            relations = derived[p]
+            if not relations:
+                continue
+            rows = [np.concatenate([x.columns[i] for x in relations]) for i in range(p.get_arity())]
+            owners = _owner(rows[columns[p]], processes)
+            for other in range(processes):
+                selected = np.flatnonzero(owners == other)
+                if len(selected):
+                    outgoing[other][i] = [x[selected] for x in rows]
+
+        received, total = messages.exchange((step, "rows"), outgoing, sum([len(x) for x in delta.values()]))
+        if total == 0:
+            # no process had a delta, nothing was derived
+            return owned
+
+        delta = {}
+        for i, p in enumerate(predicates):
+            chunks = [x[i] for x in received if i in x]
+            if not chunks:
+                delta[p] = _Relation.empty(p.get_arity())
+                continue
+            new = _unique(_Relation([np.concatenate([x[i] for x in chunks]) for i in range(p.get_arity())],
+                                    p.get_arity()), base)
+            delta[p] = _difference(new, owned[p], base)
+            if len(delta[p]):
+                owned[p] = owned[p].union(delta[p], base)
+
+        if replicated:
+            received, _ = messages.exchange((step, "delta"), [dict([(i, delta[p].columns)
+                                                                    for i, p in enumerate(predicates)])] * processes, 0)
+            for i, p in enumerate(predicates):
+                chunks = [x[i] for x in received if len(x[i][0])]
+                if chunks:
+                    full[p] = full[p].union(_Relation([np.concatenate([x[i] for x in chunks])
+                                                       for i in range(p.get_arity())], p.get_arity()), base)
+        step += 1
+
+
+def _partition_relations(delta_position: int, delta: _Relation, key, component: frozenset,
+                         full: Dict[Predicate, _Relation], static):
+    # the relations of the literals of a rule evaluated on the partition of the delta at delta_position
+    def _relation(pos: int, atom: Atom) -> _Relation:
+        if pos == delta_position:
+            return delta
+        if atom.get_predicate() in component:
+            return full[atom.get_predicate()]
+        arguments = atom.get_arguments()
+        if isinstance(key, Variable) and key in arguments:
+            return static(atom.get_predicate(), arguments.index(key))
+        return static(atom.get_predicate())
+
+    return _relation
@@ -0,0 +1,615 @@
+from typing import Union, Sequence, Dict, List, Tuple, Optional, Callable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from pylo.language.commons import Context, PredicateIndex
+from pylo.language.datalog import (
+    Type,
+    Constant,
+    Variable,
+    Predicate,
+    Atom,
+    Clause,
+    Not,
+    FactTable
+)
+from .datalogsolver import DatalogSolver
+
+SEMINAIVE = "seminaive"
+
+# rows are keyed by a single integer (the ids of the row in base `base`) as long as the keys fit
+_MAX_KEY = 2 ** 62
+
+
+class _Relation:
+    """
+    Set of rows of integer codes (the ids of the constants), stored column-wise
+
+    Sorted keys over (a subset of) the columns are computed when a join first needs them, and kept with the relation:
+        relations are not modified, a union is a new relation (which reuses the spare capacity of the columns).
+    The keys of whole rows (to test whether rows are in the relation) are kept as sorted runs of decreasing sizes,
+        so that a union sorts the added rows only, and merges runs only when they are of similar sizes.
+    A relation of arity 0 has no columns, its size (0 or 1: false or true) is given.
+    """
+    __slots__ = ("columns", "arity", "_size", "_buffers", "_sorted", "_runs")
+
+    def __init__(self, columns: Sequence, arity: int, buffers: Sequence = None, size: int = 0):
+        self.columns = [np.asarray(x, dtype=np.int64) for x in columns]
+        self.arity = arity
+        self._size = len(self.columns[0]) if arity else min(size, 1)
+        # the columns are the beginning of the buffers, a union appends to them while they have room
+        self._buffers = buffers
+        # (positions, constants, repeated positions) -> (order of the selected rows by key, sorted keys)
+        self._sorted = {}
+        self._runs = None
+
+    @classmethod
+    def empty(cls, arity: int) -> "_Relation":
+        return cls([np.zeros(0, dtype=np.int64) for _ in range(arity)], arity)
+
+    def __len__(self):
+        return self._size
+
+    def sorted_keys(self, positions: Tuple[int, ...], constants: Tuple[Tuple[int, int], ...],
+                    equal: Tuple[Tuple[int, int], ...], base: int) -> Optional[Tuple]:
+        """
+        Returns the rows agreeing with the constants (position, id) and the equalities of positions, as the indices of
+            the rows sorted by their key on the positions, together with the sorted keys
+            (None if the keys do not fit an integer)
+        """
+        cache_key = (positions, constants, equal)
+        if cache_key not in self._sorted:
+            selected = _select(self, constants, equal)
+            keys = _keys([self.columns[x] if selected is None else self.columns[x][selected] for x in positions], base)
+            if keys is None:
+                return None
+            order = np.argsort(keys, kind="stable")
+            keys = keys[order]
+            if selected is not None:
+                order = selected[order]
+            self._sorted[cache_key] = (order, keys)
+        return self._sorted[cache_key]
+
+    def contains(self, keys) -> Optional[object]:
+        """
+        Checks which of the keys (of whole rows) are keys of rows of the relation
+
+        Return:
+            boolean array, None if the keys do not fit an integer
+        """
+        if self._runs is None:
+            return None
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self._runs:
+            positions = np.searchsorted(run, keys).clip(max=len(run) - 1)
+            found |= run[positions] == keys
+        return found
+
+    def index_rows(self, base: int) -> None:
+        """
+        Sorts the keys of the rows (if not done already), for contains(...)
+        """
+        if self._runs is None and len(self):
+            keys = _keys(self.columns, base)
+            if keys is not None:
+                self._runs = [np.sort(keys)]
+
+    def union(self, other: "_Relation", base: int) -> "_Relation":
+        """
+        Adds rows that are not in the relation yet (keeps the keys of the rows)
+        """
+        size, added = len(self), len(other)
+        buffers = self._buffers
+        if buffers is None or len(buffers[0]) < size + added:
+            # room for as many rows again, so that repeated unions copy the rows a constant number of times
+            buffers = [np.empty(2 * (size + added), dtype=np.int64) for _ in range(self.arity)]
+            for buffer, column in zip(buffers, self.columns):
+                buffer[:size] = column
+        for buffer, column in zip(buffers, other.columns):
+            buffer[size:size + added] = column
+        # the spare capacity now belongs to the union
+        self._buffers = None
+        union = _Relation([x[:size + added] for x in buffers], self.arity, buffers, size + added)
+
+        other_keys = _keys(other.columns, base)
+        if self._runs is not None and other_keys is not None:
+            runs = self._runs + ([np.sort(other_keys)] if added else [])
+            while len(runs) > 1 and len(runs[-2]) <= 2 * len(runs[-1]):
+                # a stable sort merges the two sorted runs in linear time
+                runs[-2:] = [np.sort(np.concatenate(runs[-2:]), kind="stable")]
+            union._runs = runs
+        return union
+
+
+class SemiNaive(DatalogSolver):
+    """
+    Bottom-up datalog engine, in numpy
+
+    Constants are coded by their ids (see Context.encode_constants), relations are integer arrays.
+    The model of the program is computed when first queried (and again after an assert): the rules are evaluated
+        per strongly connected component of the predicate dependency graph, lower components first, with
+        semi-naive iteration within a recursive component (a recursive rule joins with the facts derived in the
+        previous iteration only).
+    Rule bodies are evaluated as sort-merge joins of whole relations; negation needs a stratified program.
+    With more than one process, the recursive rules of a component are evaluated in parallel, on hash partitions of
+        the relations (see pylo.engines.datalog.parallel; needs the fork start method), except in components with
+        predicates of arity 0.
+
+    Needs numpy (pip install pylo[numpy]).
+
+    Arguments:
+        knowledge_base (default: None): facts to use
+                                        Not supported yet
+        background_knowledge (default: None): background knowledge (clauses)
+                                              Not supported yet
+        ctx [Context] (default: global context): context to use
+        processes (default: 1): number of processes evaluating the recursive rules
+    """
+
+    def __init__(self, knowledge_base=None, background_knowledge=None, ctx: Context = None, processes: int = 1):
+        if np is None:
+            raise Exception("SemiNaive needs numpy (pip install pylo[numpy])")
+        super().__init__(SEMINAIVE, knowledge_base, background_knowledge, ctx)
+        self._processes = processes
+        # facts are kept as they are asserted (rows of ids, or code arrays) until the model is computed
+        self._rows: Dict[Predicate, List[Tuple[int, ...]]] = {}
+        self._tables: Dict[Predicate, List] = {}
+        # the relations of the facts (with their sorted keys) are kept across models, until facts are added
+        self._fact_relations: Dict[Predicate, _Relation] = {}
+        self._rules = PredicateIndex()
+        self._model: Optional[Dict[Predicate, _Relation]] = None
+        self._base = 1
+
+    def declare_type(self, elem_type: Type) -> None:
+        # nothing to declare, constants are used by their ids
+        pass
+
+    def declare_constant(self, elem_constant: Constant) -> None:
+        pass
+
+    def declare_variable(self, elem_variable: Variable) -> None:
+        pass
+
+    def declare_predicate(self, elem_predicate: Predicate) -> None:
+        pass
+
+    def assert_fact(self, fact: Atom) -> None:
+        if not all([isinstance(x, Constant) for x in fact.get_arguments()]):
+            raise Exception(f"{SEMINAIVE} supports facts with constants only: {fact}")
+        self._rows.setdefault(fact.get_predicate(), []).append(tuple([x.id() for x in fact.get_arguments()]))
+        self._fact_relations.pop(fact.get_predicate(), None)
+        self._model = None
+
+    def assert_facts(self, table: FactTable) -> None:
+        if table.get_context() is not self._ctx:
+            raise Exception("the fact table needs to be in the context of the engine")
+        self._tables.setdefault(table.get_predicate(), []).append(table.codes())
+        self._fact_relations.pop(table.get_predicate(), None)
+        self._model = None
+
+    def assert_rule(self, rule: Union[Clause, Sequence[Clause]]) -> None:
+        rules = [rule] if isinstance(rule, Clause) else list(rule)
+        for r in rules:
+            _check_safety(r.get_literals(), [r.get_head()], r)
+        for r in rules:
+            self._rules.add(r)
+        self._model = None
+
+    def asserta(self, clause: Union[Atom, Clause]):
+        if isinstance(clause, Atom):
+            self.assert_fact(clause)
+        else:
+            self.assert_rule(clause)
+
+    def assertz(self, clause: Union[Atom, Clause]):
+        self.asserta(clause)
+
+    def _facts(self, predicate: Predicate) -> _Relation:
+        if predicate in self._fact_relations:
+            return self._fact_relations[predicate]
+
+        chunks = self._tables.get(predicate, [])
+        if predicate.get_arity() == 0:
+            # true when any fact was asserted
+            relation = _Relation([], 0, size=len(self._rows.get(predicate, [])) + sum([len(x) for x in chunks]))
+            self._fact_relations[predicate] = relation
+            return relation
+        if predicate in self._rows:
+            chunks = chunks + [np.array(self._rows[predicate], dtype=np.int64).reshape(-1, predicate.get_arity())]
+        if not chunks:
+            return _Relation.empty(predicate.get_arity())
+        rows = np.concatenate(chunks).astype(np.int64)
+        relation = _unique(_Relation(rows.T, predicate.get_arity()), self._base)
+        self._fact_relations[predicate] = relation
+        return relation
+
+    def _compute_base(self) -> int:
+        # every id is below the base: the ids of all types in the facts and the rules
+        types = set([t for p in list(self._rows) + list(self._tables) + list(self._rules.get_predicates())
+                     for t in p.get_arg_types()])
+        return max([len(t) for t in types] + [1])
+
+    def _get_model(self) -> Dict[Predicate, _Relation]:
+        """
+        Computes the model of the program (if the knowledge base changed since it was last computed)
+
+        Return:
+            the relation of every predicate with facts or rules
+        """
+        if self._model is not None:
+            return self._model
+
+        # raises if the program is not stratified
+        self._rules.strata()
+        base = self._compute_base()
+        if base != self._base:
+            # the keys depend on the base
+            self._fact_relations = {}
+            self._base = base
+        model = dict([(p, self._facts(p)) for p in set(self._rows).union(self._tables)])
+
+        for component in self._rules.components():
+            rules = [x for x in self._rules.defining(component) if isinstance(x, Clause)]
+            if rules:
+                self._evaluate_component(component, rules, model)
+
+        self._model = model
+        return model
+
+    def _evaluate_component(self, component: frozenset, rules: Sequence[Clause],
+                            model: Dict[Predicate, _Relation]) -> None:
+        """
+        Adds the facts derived by the rules of a component to the model
+        """
+        for p in component:
+            if p not in model:
+                model[p] = _Relation.empty(p.get_arity())
+
+        is_recursive = [any([_is_positive(x) and x.get_predicate() in component for x in r.get_literals()])
+                        for r in rules]
+        recursive = [r for r, rec in zip(rules, is_recursive) if rec]
+        derived = {}
+        for r, rec in zip(rules, is_recursive):
+            if not rec:
+                derived.setdefault(r.get_head().get_predicate(), []).append(self._fire(r, model))
+        for p, rows in derived.items():
+            model[p] = model[p].union(_difference(_concatenate(rows, p.get_arity(), self._base), model[p],
+                                                  self._base), self._base)
+
+        if self._processes > 1 and recursive and all([p.get_arity() for p in component]):
+            # imported here, the parallel evaluation builds on this module
+            from .parallel import evaluate_in_processes
+            evaluate_in_processes(component, recursive, model, self._base, self._processes)
+            return
+
+        # the first iteration joins the recursive rules with everything derived so far
+        delta = dict([(p, model[p]) for p in component])
+        while any([len(x) for x in delta.values()]):
+            derived = {}
+            for r in recursive:
+                for ind, lit in enumerate(r.get_literals()):
+                    if _is_positive(lit) and lit.get_predicate() in component and len(delta[lit.get_predicate()]):
+                        derived.setdefault(r.get_head().get_predicate(), []) \
+                            .append(self._fire(r, model, (ind, delta[lit.get_predicate()])))
+
+            delta = {}
+            for p in component:
+                new = _difference(_concatenate(derived.get(p, []), p.get_arity(), self._base), model[p], self._base)
+                if len(new):
+                    model[p] = model[p].union(new, self._base)
+                delta[p] = new
+
+    def _fire(self, rule: Clause, model: Dict[Predicate, _Relation],
+              delta: Tuple[int, _Relation] = None) -> _Relation:
+        """
+        Evaluates the body of the rule, the literal at position delta[0] (if given) on the relation delta[1]
+
+        Return:
+            the head facts of the rule
+        """
+        return _fire(rule, _model_relations(model, delta), self._base, None if delta is None else delta[0])
+
+    def _solve(self, query: Sequence[Union[Atom, Not]]) -> Tuple[Dict[Variable, object], int]:
+        _check_safety(query, [], query)
+        return _evaluate(query, _model_relations(self._get_model()), self._base)
+
+    def has_solution(self, *query: Union[Atom, Not]):
+        return self._solve(query)[1] > 0
+
+    def query(self, *query, **kwargs):
+        if 'max_solutions' in kwargs:
+            max_solutions = kwargs['max_solutions']
+        else:
+            max_solutions = 0
+
+        bindings, count = self._solve(query)
+        if count == 0:
+            return []
+
+        # the type of a variable is the type of the argument it appears in
+        types = {}
+        for lit in query:
+            if _is_positive(lit):
+                for v, t in zip(lit.get_arguments(), lit.get_predicate().get_arg_types()):
+                    if isinstance(v, Variable):
+                        types.setdefault(v, t)
+
+        query_vars = list(types)
+        if not query_vars:
+            return [{}]
+
+        rows = _unique(_Relation([bindings[v] for v in query_vars], len(query_vars)), self._base)
+        columns = [x if max_solutions <= 0 else x[:max_solutions] for x in rows.columns]
+        decoded = []
+        for v, column in zip(query_vars, columns):
+            values = np.unique(column)
+            constants = dict([(x, self._ctx.constant_by_id(x, types[v])) for x in values.tolist()])
+            decoded.append([constants[x] for x in column.tolist()])
+
+        return [dict(zip(query_vars, x)) for x in zip(*decoded)]
+
+
+def _is_positive(literal: Union[Atom, Not]) -> bool:
+    return not isinstance(literal, Not)
+
+
+def _model_relations(model: Dict[Predicate, _Relation],
+                     delta: Tuple[int, _Relation] = None) -> Callable[[int, Atom], _Relation]:
+    # the relations of the literals: the delta for the literal at position delta[0], the model for the others
+    def _relation(ind: int, atom: Atom) -> _Relation:
+        if delta is not None and delta[0] == ind:
+            return delta[1]
+        if atom.get_predicate() in model:
+            return model[atom.get_predicate()]
+        return _Relation.empty(atom.get_predicate().get_arity())
+
+    return _relation
+
+
+def _fire(rule: Clause, relations: Callable[[int, Atom], _Relation], base: int, first: int = None) -> _Relation:
+    """
+    Evaluates the body of the rule
+
+    Arguments:
+        rule: rule to evaluate
+        relations: returns the relation of a body literal (given its position and its atom)
+        base: base of the keys
+        first (optional): position of the literal to evaluate first
+
+    Return:
+        the head facts of the rule
+    """
+    bindings, count = _evaluate(rule.get_literals(), relations, base, first)
+    head = rule.get_head()
+    columns = [bindings[x] if isinstance(x, Variable) else np.full(count, x.id(), dtype=np.int64)
+               for x in head.get_arguments()]
+    return _Relation(columns, head.get_predicate().get_arity(), size=count)
+
+
+def _evaluate(literals: Sequence[Union[Atom, Not]], relations: Callable[[int, Atom], _Relation], base: int,
+              first: int = None) -> Tuple[Dict[Variable, object], int]:
+    """
+    Joins the literals (with the relations given by relations(position, atom))
+
+    Return:
+        the values of the variables (one array per variable) and the number of solutions
+    """
+    remaining = list(enumerate(literals))
+    # the delta goes first: it is the smallest relation
+    if first is not None:
+        remaining.insert(0, remaining.pop(first))
+
+    bindings = None
+    count = 1
+    while remaining:
+        bound = set() if bindings is None else set(bindings)
+        ready = [x for x in remaining if not _is_positive(x[1])
+                 and all([v in bound for v in x[1].get_atom().get_variables()])]
+        if ready:
+            chosen = ready[0]
+        else:
+            positive = [x for x in remaining if _is_positive(x[1])]
+            if bindings is None or (first is not None and positive[0][0] == first):
+                chosen = positive[0]
+            else:
+                # prefer literals joining on more variables, then smaller relations
+                chosen = min(positive, key=lambda x: (-len(bound.intersection(x[1].get_variables())),
+                                                      len(relations(*x))))
+        remaining.remove(chosen)
+
+        ind, lit = chosen
+        if _is_positive(lit):
+            bindings, count = _join(bindings, count, lit, relations(ind, lit), base)
+        else:
+            bindings, count = _anti_join(bindings, count, lit.get_atom(), relations(ind, lit.get_atom()), base)
+        if count == 0:
+            # no solution: every variable of the literals has no value
+            empty = np.empty(0, dtype=np.int64)
+            return dict([(v, empty) for x in literals
+                         for v in (x.get_atom() if isinstance(x, Not) else x).get_variables()]), 0
+
+    return (bindings or {}), count
+
+
+def _check_safety(literals: Sequence[Union[Atom, Not]], head: Sequence[Atom], item) -> None:
+    # every variable needs a value from a positive literal, and only constants and variables are supported
+    positive = set()
+    for lit in list(head) + list(literals):
+        atom = lit.get_atom() if isinstance(lit, Not) else lit
+        if not all([isinstance(x, (Constant, Variable)) for x in atom.get_arguments()]):
+            raise Exception(f"{SEMINAIVE} supports constants and variables only: {item}")
+    for lit in literals:
+        if _is_positive(lit):
+            positive.update(lit.get_variables())
+
+    unsafe = [x for atom in head for x in atom.get_variables() if x not in positive]
+    unsafe += [x for lit in literals if not _is_positive(lit)
+               for x in lit.get_atom().get_variables() if x not in positive]
+    if unsafe:
+        raise Exception(f"variables {unsafe} of {item} need to appear in a positive literal")
+
+
+def _keys(columns: Sequence, base: int):
+    """
+    Returns the key of every row (the values of a row as the digits of a number in the base),
+        None if the keys do not fit an integer
+    """
+    if not columns:
+        return None
+    if base ** len(columns) >= _MAX_KEY:
+        return None
+    keys = columns[0].astype(np.int64)
+    for c in columns[1:]:
+        keys = keys * base + c
+    return keys
+
+
+def _dense_keys(left: Sequence, right: Sequence) -> Tuple:
+    # keys that are consistent between both sides, for rows whose keys would not fit an integer
+    _, inverse = np.unique(np.concatenate([np.stack(left, axis=1), np.stack(right, axis=1)]), axis=0,
+                           return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return inverse[:len(left[0])], inverse[len(left[0]):]
+
+
+def _select(relation: _Relation, constants: Tuple[Tuple[int, int], ...],
+            equal: Tuple[Tuple[int, int], ...]):
+    """
+    Returns the indices of the rows with the constants (position, id) and the equal positions (None for all rows)
+    """
+    if not constants and not equal:
+        return None
+    mask = np.ones(len(relation), dtype=bool)
+    for pos, value in constants:
+        mask &= relation.columns[pos] == value
+    for pos1, pos2 in equal:
+        mask &= relation.columns[pos1] == relation.columns[pos2]
+    return np.flatnonzero(mask)
+
+
+def _pattern(atom: Atom, base: int) -> Tuple[Tuple, Tuple, Dict[Variable, int]]:
+    """
+    Returns the constants (position, id), the repeated variables (pairs of positions) and the first position
+        of every variable of the atom
+    """
+    constants = []
+    equal = []
+    first = {}
+    for pos, arg in enumerate(atom.get_arguments()):
+        if isinstance(arg, Variable):
+            if arg in first:
+                equal.append((first[arg], pos))
+            else:
+                first[arg] = pos
+        else:
+            # a constant beyond the base is in no relation
+            constants.append((pos, arg.id() if arg.id() < base else -1))
+    return tuple(constants), tuple(equal), first
+
+
+def _matches(left: Sequence, relation: _Relation, positions: Tuple[int, ...], constants: Tuple,
+             equal: Tuple, base: int) -> Tuple:
+    """
+    Sort-merge join of the left columns with the relation on the positions
+
+    Return:
+        for every match, the index of the left row and the index of the relation row
+    """
+    sorted_rel = relation.sorted_keys(positions, constants, equal, base)
+    if sorted_rel is None:
+        selected = _select(relation, constants, equal)
+        selected = np.arange(len(relation)) if selected is None else selected
+        left_keys, right_keys = _dense_keys(left, [relation.columns[x][selected] for x in positions])
+        order = np.argsort(right_keys, kind="stable")
+        sorted_rel = (selected[order], right_keys[order])
+    else:
+        # values beyond the base are in no relation (and would make the keys ambiguous)
+        left_keys = _keys(left, base)
+        for column in left:
+            left_keys = np.where(column < base, left_keys, -1)
+
+    order, keys = sorted_rel
+    lo = np.searchsorted(keys, left_keys, side="left")
+    hi = np.searchsorted(keys, left_keys, side="right")
+    counts = hi - lo
+    left_ind = np.repeat(np.arange(len(left_keys)), counts)
+    starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+    return left_ind, order[starts + np.arange(len(left_ind))]
+
+
+def _join(bindings: Optional[Dict[Variable, object]], count: int, atom: Atom, relation: _Relation,
+          base: int) -> Tuple[Dict[Variable, object], int]:
+    constants, equal, first = _pattern(atom, base)
+    shared = [v for v in first if bindings is not None and v in bindings]
+    new = [v for v in first if v not in shared]
+
+    if shared:
+        left_ind, right_ind = _matches([bindings[v] for v in shared], relation,
+                                       tuple([first[v] for v in shared]), constants, equal, base)
+    else:
+        right = _select(relation, constants, equal)
+        right = np.arange(len(relation)) if right is None else right
+        # a cross product (of a single row, for the first literal)
+        left_ind = np.repeat(np.arange(count), len(right))
+        right_ind = np.tile(right, count)
+
+    result = dict([(v, c[left_ind]) for v, c in bindings.items()]) if bindings is not None else {}
+    for v in new:
+        result[v] = relation.columns[first[v]][right_ind]
+    return result, len(left_ind)
+
+
+def _anti_join(bindings: Optional[Dict[Variable, object]], count: int, atom: Atom, relation: _Relation,
+               base: int) -> Tuple[Dict[Variable, object], int]:
+    constants, equal, first = _pattern(atom, base)
+    if not first:
+        # a ground literal keeps all or nothing
+        keep = len(_select(relation, constants, equal) if constants or equal else relation) == 0
+        return bindings, count if keep else 0
+
+    left_ind, _ = _matches([bindings[v] for v in first], relation, tuple(first.values()), constants, equal, base)
+    keep = np.ones(count, dtype=bool)
+    keep[left_ind] = False
+    return dict([(v, c[keep]) for v, c in bindings.items()]), int(keep.sum())
+
+
+def _concatenate(relations: Sequence[_Relation], arity: int, base: int) -> _Relation:
+    if not relations:
+        return _Relation.empty(arity)
+    return _unique(_Relation([np.concatenate([x.columns[i] for x in relations]) for i in range(arity)], arity,
+                             size=sum([len(x) for x in relations])), base)
+
+
+def _unique(relation: _Relation, base: int) -> _Relation:
+    if len(relation) == 0 or relation.arity == 0:
+        return relation
+    keys = _keys(relation.columns, base)
+    if keys is None:
+        rows = np.unique(np.stack(relation.columns, axis=1), axis=0)
+        return _Relation(rows.T, relation.arity)
+    _, first = np.unique(keys, return_index=True)
+    return _Relation([x[first] for x in relation.columns], relation.arity)
+
+
+def _difference(relation: _Relation, other: _Relation, base: int) -> _Relation:
+    """
+    Returns the rows of the relation that are not in the other one
+    """
+    if len(relation) == 0 or len(other) == 0:
+        return relation
+    if relation.arity == 0:
+        # the single (empty) row is in the other relation
+        return _Relation.empty(0)
+    other.index_rows(base)
+    keys = _keys(relation.columns, base)
+    found = other.contains(keys) if keys is not None else None
+    if found is not None:
+        return _Relation([x[~found] for x in relation.columns], relation.arity)
+
+    left_ind, _ = _matches(relation.columns, other, tuple(range(other.arity)), (), (), base)
+    keep = np.ones(len(relation), dtype=bool)
+    keep[left_ind] = False
+    return _Relation([x[keep] for x in relation.columns], relation.arity)
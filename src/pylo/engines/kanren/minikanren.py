@@ -30,6 +30,7 @@ class MiniKanren(LPSolver):
         pass
 
     def assert_fact(self, fact: Atom) -> None:
+        self._declare_symbols(fact)
         try:
             fact.get_predicate().get_engine_obj(KANREN_LOGPY)
         except Exception:
@@ -41,6 +42,7 @@ class MiniKanren(LPSolver):
 
     def assert_rule(self, rule: Union[Clause, Sequence[Clause]]) -> None:
         # only needs to add a miniKanren object to the predicate in the head
+        self._declare_symbols(rule)
         if isinstance(rule, Clause):
             if rule.is_recursive():
                 raise Exception(f"recursive rule needs to be added together with the base base: {rule}")
@@ -63,6 +65,7 @@ class MiniKanren(LPSolver):
         self.asserta(clause)
 
     def _query(self, num_solutions, *atoms: Atom):
+        self._declare_symbols(*atoms)
         # find variables
         vars = {}
         for atom in atoms:
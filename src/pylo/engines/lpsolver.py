@@ -1,8 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import Union
+from typing import Union, Sequence, List, Dict
 
-from ..language.commons import Atom, Clause, Context, global_context
-from ..language.lp import Predicate, Type, Constant, Variable, Not
+from ..language.commons import Atom, Clause, Context, Literal, global_context
+from ..language.lp import Predicate, Type, Constant, Variable, Not, FactTable
 
 
 class LPSolver(ABC):
@@ -26,19 +26,71 @@ class LPSolver(ABC):
         #self._solver = None
         if ctx is None:
             ctx = global_context
-        self._create_objects(ctx)
-
-    def _create_objects(self, ctx: Context):
-        """
-        Translates the objects from the context to engine-specific objects
+        self._ctx = ctx
+        # symbols are declared in the engine when they first appear in an assert or a query;
+        #     the cursor marks the symbols of the context already seen by sync()
+        self._declared = set()
+        self._cursor = 0
+
+    def _declare_symbol(self, symbol: Union[Type, Constant, Variable, Predicate]) -> None:
+        """
+        Declares the symbol in the engine, unless it has been declared already
+            (together with the types it depends on)
+        """
+        if symbol in self._declared:
+            return
+
+        if isinstance(symbol, Type):
+            self.declare_type(symbol)
+        elif isinstance(symbol, Constant):
+            self._declare_symbol(symbol.get_type())
+            self.declare_constant(symbol)
+        elif isinstance(symbol, Variable):
+            self._declare_symbol(symbol.get_type())
+            self.declare_variable(symbol)
+        elif isinstance(symbol, Predicate):
+            for t in symbol.get_arg_types():
+                self._declare_symbol(t)
+            self.declare_predicate(symbol)
+        else:
+            # functors and structures are not declared in engines
+            return
+
+        self._declared.add(symbol)
+
+    def _declare_symbols(self, *items: Union[Atom, Not, Clause, Sequence]) -> None:
+        """
+        Declares the symbols appearing in literals and clauses that are not declared in the engine yet
 
         Arguments:
-            ctx [Context]: context to use
-        """
-        [self.declare_type(t) for t in ctx.get_types()]
-        [self.declare_constant(c) for c in ctx.get_constants()]
-        [self.declare_predicate(p) for p in ctx.get_predicates()]
-        [self.declare_variable(v) for v in ctx.get_variables()]
+            items: literals, clauses or lists of them
+        """
+        for item in items:
+            if isinstance(item, Clause):
+                literals = [item.get_head()] + list(item.get_literals())
+            elif isinstance(item, Not):
+                literals = [item.get_atom()]
+            elif isinstance(item, Atom):
+                literals = [item]
+            else:
+                self._declare_symbols(*item)
+                continue
+
+            for lit in literals:
+                lit = lit.get_atom() if isinstance(lit, Not) else lit
+                self._declare_symbol(lit.get_predicate())
+                for t in lit.get_arguments():
+                    if isinstance(t, (Constant, Variable)):
+                        self._declare_symbol(t)
+
+    def sync(self) -> None:
+        """
+        Declares all symbols created in the context since the last sync
+            (not needed for asserts and queries, which declare the symbols they use)
+        """
+        symbols, self._cursor = self._ctx.changes(self._cursor)
+        for s in symbols:
+            self._declare_symbol(s)
 
     def get_name(self) -> str:
         """
@@ -100,6 +152,17 @@ class LPSolver(ABC):
         """
         raise NotImplementedError()
 
+    def assert_facts(self, table: FactTable) -> None:
+        """
+        Asserts all facts of the fact table to the solvers knowledge base
+            (engines with a bulk path load them from the columns, without materializing the atoms)
+
+        Arguments:
+            table [FactTable]: facts to assert
+        """
+        for fact in table:
+            self.assert_fact(fact)
+
     @abstractmethod
     def assert_rule(self, rule: Clause) -> None:
         """
@@ -136,3 +199,27 @@ class LPSolver(ABC):
                 """
         raise NotImplementedError()
 
+    def has_solution_many(self, queries: Sequence) -> List[bool]:
+        """
+        Checks whether each of the queries can be satisfied by the knowledge base
+
+        Arguments:
+            queries: literals or lists of literals (interpreted as conjunctions)
+
+        Return:
+            True/False for every query
+        """
+        return [self.has_solution(*([x] if isinstance(x, Literal) else x)) for x in queries]
+
+    def query_many(self, queries: Sequence, **kwargs) -> List[List[Dict]]:
+        """
+        Finds the solutions of each of the queries
+
+        Arguments:
+            queries: literals or lists of literals (interpreted as conjunctions)
+            kwargs: arguments of query(...), e.g., max_solutions
+
+        Return:
+            list of solutions (as in query(...)) for every query
+        """
+        return [self.query(*([x] if isinstance(x, Literal) else x), **kwargs) for x in queries]
@@ -0,0 +1,7 @@
+from .factengine import FactEngine
+from .sld import SLDEngine
+
+__all__ = [
+    'FactEngine',
+    'SLDEngine'
+]
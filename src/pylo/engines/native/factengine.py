@@ -0,0 +1,300 @@
+from typing import Union, Sequence, Dict, Tuple, Iterator, List
+
+from pylo.language.commons import Context, PredicateIndex, _literal_variables, _match_term
+from pylo.language.lp import Type, Constant, Variable, Predicate, Structure, Atom, Not, Clause, Literal, FactTable
+from pylo.language.lp.lp import _substitute_term
+from ..lpsolver import LPSolver
+
+FACTS = "facts"
+
+
+class _Relation:
+    """
+    Set of ground rows of a predicate, with hash indexes on combinations of argument positions
+
+    An index is built the first time a lookup binds its positions, and kept up to date as rows are added or removed.
+    """
+    __slots__ = ("rows", "indexes")
+
+    def __init__(self, rows: Sequence[Tuple] = ()):
+        self.rows: Dict[Tuple, None] = dict.fromkeys(rows)
+        # bound positions -> values at the positions -> rows
+        self.indexes: Dict[Tuple[int, ...], Dict[Tuple, Dict[Tuple, None]]] = {}
+
+    def add(self, row: Tuple) -> bool:
+        if row in self.rows:
+            return False
+        self.rows[row] = None
+        for positions, index in self.indexes.items():
+            index.setdefault(tuple([row[x] for x in positions]), {})[row] = None
+        return True
+
+    def remove(self, row: Tuple) -> bool:
+        if row not in self.rows:
+            return False
+        del self.rows[row]
+        for positions, index in self.indexes.items():
+            key = tuple([row[x] for x in positions])
+            bucket = index[key]
+            del bucket[row]
+            if not bucket:
+                del index[key]
+        return True
+
+    def index(self, positions: Tuple[int, ...]) -> Dict[Tuple, Dict[Tuple, None]]:
+        index = self.indexes.get(positions)
+        if index is None:
+            index = {}
+            for row in self.rows:
+                index.setdefault(tuple([row[x] for x in positions]), {})[row] = None
+            self.indexes[positions] = index
+        return index
+
+    def lookup(self, positions: Tuple[int, ...], key: Tuple) -> Sequence[Tuple]:
+        if not positions:
+            return self.rows
+        if len(positions) == len(key) and len(positions) == len(next(iter(self.rows), ())):
+            # all positions are bound: a membership test
+            return (key,) if key in self.rows else ()
+        return self.index(positions).get(key, ())
+
+    def matches_per_key(self, positions: Tuple[int, ...]) -> float:
+        """
+        Returns the expected number of rows matching a lookup on the positions
+        """
+        if not positions or not self.rows:
+            return len(self.rows)
+        return len(self.rows) / len(self.index(positions))
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class FactEngine(LPSolver):
+    """
+    In-memory engine for facts and conjunctive queries, in pure Python
+
+    Facts are kept per predicate as sets of rows, with a hash index for every combination of bound arguments
+        a query uses (built at the first such query, then maintained as facts are asserted and retracted).
+    A conjunction is evaluated as a pipeline of index lookups (hash joins with the indexed relations); the literals
+        are ordered greedily, the literal expected to match the fewest rows (given the variables bound so far) first.
+        Negative literals are evaluated as soon as their variables are bound.
+    Rules are supported if they are not recursive: the relation of a predicate with rules is computed when it is
+        first queried, and kept until the next assert or retract.
+
+    Facts have set semantics: asserting a fact twice has no effect, and all solutions of a query are distinct.
+
+    Arguments:
+        knowledge_base (default: None): facts to use
+                                        Not supported yet
+        background_knowledge (default: None): background knowledge (clauses)
+                                              Not supported yet
+        ctx [Context] (default: global context): context to use
+    """
+
+    def __init__(self, knowledge_base=None, background_knowledge=None, ctx: Context = None):
+        super().__init__(FACTS, knowledge_base, background_knowledge, ctx)
+        self._facts: Dict[Predicate, _Relation] = {}
+        self._rules = PredicateIndex()
+        # predicate -> relation of facts and rules, valid until the knowledge base changes
+        self._derived: Dict[Predicate, _Relation] = {}
+
+    def declare_type(self, elem_type: Type) -> None:
+        # nothing to declare, the engine works on pylo terms
+        pass
+
+    def declare_constant(self, elem_constant: Constant) -> None:
+        pass
+
+    def declare_variable(self, elem_variable: Variable) -> None:
+        pass
+
+    def declare_predicate(self, elem_predicate: Predicate) -> None:
+        pass
+
+    def _changed(self) -> None:
+        if self._derived:
+            self._derived = {}
+
+    def assert_fact(self, fact: Atom) -> None:
+        row = tuple(fact.get_arguments())
+        if not all([_is_ground(x) for x in row]):
+            raise Exception(f"facts need to be ground: {fact}")
+
+        relation = self._facts.get(fact.get_predicate())
+        if relation is None:
+            relation = _Relation()
+            self._facts[fact.get_predicate()] = relation
+        if relation.add(row):
+            self._changed()
+
+    def assert_facts(self, table: FactTable) -> None:
+        # the constants are materialized once per distinct id of every column
+        columns = []
+        for ind, arg_type in enumerate(table.get_predicate().get_arg_types()):
+            codes = table.column(ind).tolist()
+            constants = dict([(x, table.get_context().constant_by_id(x, arg_type)) for x in set(codes)])
+            columns.append([constants[x] for x in codes])
+
+        relation = self._facts.setdefault(table.get_predicate(), _Relation())
+        for row in zip(*columns):
+            relation.add(row)
+        self._changed()
+
+    def assert_rule(self, rule: Union[Clause, Sequence[Clause]]) -> None:
+        rules = [rule] if isinstance(rule, Clause) else list(rule)
+        for r in rules:
+            self._rules.add(r)
+
+        recursive = [r for r in rules if self._rules.is_recursive(r.get_head().get_predicate())]
+        if recursive:
+            for r in rules:
+                self._rules.remove(r)
+            raise Exception(f"{FACTS} does not support recursive rules: {recursive[0]}")
+        self._changed()
+
+    def asserta(self, clause: Union[Atom, Clause]):
+        if isinstance(clause, Atom):
+            self.assert_fact(clause)
+        else:
+            self.assert_rule(clause)
+
+    def assertz(self, clause: Union[Atom, Clause]):
+        self.asserta(clause)
+
+    def retract(self, clause: Union[Atom, Clause]) -> bool:
+        """
+        Removes the rule, or the first fact matching the atom
+
+        Return:
+            True if a fact or a rule was removed
+        """
+        if isinstance(clause, Clause):
+            if clause not in self._rules:
+                return False
+            self._rules.remove(clause)
+            self._changed()
+            return True
+
+        relation = self._facts.get(clause.get_predicate())
+        if relation is None:
+            return False
+        for binding in self._solve(self._plan([clause], set(), facts_only=True), 0, {}):
+            relation.remove(tuple([_substitute_term(x, binding, walk=False) for x in clause.get_arguments()]))
+            self._changed()
+            return True
+        return False
+
+    def _relation(self, predicate: Predicate, facts_only: bool = False) -> _Relation:
+        if facts_only or not self._rules.defining(predicate):
+            return self._facts.get(predicate, _EMPTY)
+
+        relation = self._derived.get(predicate)
+        if relation is None:
+            relation = _Relation(self._facts.get(predicate, _EMPTY).rows)
+            for rule in self._rules.defining(predicate):
+                head = rule.get_head().get_arguments()
+                for binding in self._solve(self._plan(rule.get_literals(), set()), 0, {}):
+                    row = tuple([_substitute_term(x, binding, walk=False) for x in head])
+                    if not all([_is_ground(x) for x in row]):
+                        raise Exception(f"rule is not range restricted: {rule}")
+                    relation.add(row)
+            self._derived[predicate] = relation
+        return relation
+
+    def _plan(self, literals: Sequence[Literal], bound: set,
+              facts_only: bool = False) -> List[Tuple[Literal, _Relation, Tuple[int, ...]]]:
+        """
+        Orders the literals of a conjunction for evaluation
+
+        Return:
+            literals with their relation and the argument positions bound when they are evaluated
+        """
+        bound = set(bound)
+        remaining = list(literals)
+        plan = []
+        while remaining:
+            # negative literals filter as soon as they can
+            ready = [x for x in remaining if isinstance(x, Not) and all([v in bound for v in _literal_variables(x)])]
+            if ready:
+                chosen = ready[0]
+            else:
+                positive = [x for x in remaining if not isinstance(x, Not)]
+                if not positive:
+                    raise Exception(f"variables of negative literals need to be bound by positive ones: {remaining}")
+                chosen = min(positive, key=lambda x: self._relation(x.get_predicate(), facts_only)
+                             .matches_per_key(_bound_positions(x, bound)))
+
+            atom = chosen.get_atom() if isinstance(chosen, Not) else chosen
+            plan.append((chosen, self._relation(atom.get_predicate(), facts_only), _bound_positions(atom, bound)))
+            bound.update(_literal_variables(chosen))
+            remaining.remove(chosen)
+
+        return plan
+
+    def _solve(self, plan: List[Tuple[Literal, _Relation, Tuple[int, ...]]], ind: int,
+               binding: Dict[Variable, object]) -> Iterator[Dict[Variable, object]]:
+        if ind == len(plan):
+            yield binding
+            return
+
+        literal, relation, positions = plan[ind]
+        if isinstance(literal, Not):
+            row = tuple([_substitute_term(x, binding, walk=False) for x in literal.get_atom().get_arguments()])
+            if row not in relation.rows:
+                yield from self._solve(plan, ind + 1, binding)
+            return
+
+        args = literal.get_arguments()
+        key = tuple([_substitute_term(args[x], binding, walk=False) for x in positions])
+        free = [x for x in range(len(args)) if x not in positions]
+        for row in relation.lookup(positions, key):
+            extended = dict(binding)
+            if all([_match_term(args[x], row[x], extended) for x in free]):
+                yield from self._solve(plan, ind + 1, extended)
+
+    def _solutions(self, query: Sequence[Literal]) -> Iterator[Dict[Variable, object]]:
+        return self._solve(self._plan(query, set()), 0, {})
+
+    def has_solution(self, *query: Union[Atom, Not]):
+        for _ in self._solutions(query):
+            return True
+        return False
+
+    def query(self, *query, **kwargs):
+        if 'max_solutions' in kwargs:
+            max_solutions = kwargs['max_solutions']
+        else:
+            max_solutions = 0
+
+        query_vars = list(dict.fromkeys([v for x in query for v in _literal_variables(x)]))
+        answers = []
+        for binding in self._solutions(query):
+            answers.append(dict([(v, binding[v]) for v in query_vars]))
+            if len(answers) == max_solutions:
+                break
+
+        return answers
+
+
+_EMPTY = _Relation()
+
+
+def _is_ground(term) -> bool:
+    if isinstance(term, Variable):
+        return False
+    elif isinstance(term, Structure):
+        return all([_is_ground(x) for x in term.get_arguments()])
+    return True
+
+
+def _bound_positions(atom: Atom, bound: set) -> Tuple[int, ...]:
+    # positions whose value is known once the bound variables have values
+    def _known(term):
+        if isinstance(term, Variable):
+            return term in bound
+        elif isinstance(term, Structure):
+            return all([_known(x) for x in term.get_arguments()])
+        return True
+
+    return tuple([ind for ind, x in enumerate(atom.get_arguments()) if _known(x)])
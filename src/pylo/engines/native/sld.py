@@ -0,0 +1,639 @@
+"""
+Top-down (SLD) resolution on pylo terms, in pure Python
+
+Terms are compiled once, when a clause is asserted: variables become numbered slots of the clause, structures
+    become tuples (key, functor, arguments), lists and pairs become cons cells. Clauses are never copied at
+    resolution: a clause used in a resolution step gets a frame of fresh cells (one per variable of the clause), and a
+    bound cell holds a (term, frame) pair, i.e., a term of a clause together with the frame its variables live in
+    (structure sharing). Every binding is recorded on a trail, backtracking unbinds the cells bound since the choice
+    point and drops the frames created since then.
+
+The resolution loop is iterative (an explicit continuation of goals and a stack of choice points), so deep recursion
+    does not use the Python stack. A choice point is only created when more than one clause applies: the clauses of a
+    predicate are selected through a hash index on an argument bound in the call (the first argument when it
+    discriminates the clauses, else the most selective bound argument), built the first time a call binds it.
+
+Tabled predicates are answered from tables of answers, one per call variant (the call up to variable renaming).
+    A table is computed by evaluating the clauses of the call repeatedly, until no new answer is found; variant calls
+    met during the evaluation consume the answers found so far instead of evaluating the clauses again, which makes
+    left recursion terminate. Tables depending on each other are completed together, by the oldest of them. The
+    evaluation of a table is itself a sequence of goals and choice points of the resolution loop, so nested tables
+    do not use the Python stack either.
+"""
+from typing import Union, Sequence, Dict, Tuple, Iterator, List, Optional
+
+from pylo.language.commons import Context, _literal_variables
+from pylo.language.lp import (Type, Constant, Variable, Predicate, Structure, List as LPList, Pair, Atom, Not,
+                              Clause, Literal)
+from ..lpsolver import LPSolver
+
+SLD = "sld"
+
+
+class _Ref:
+    """
+    Variable of a compiled clause: the slot of the variable in the frames of the clause
+    """
+    __slots__ = ("slot",)
+
+    def __init__(self, slot: int):
+        self.slot = slot
+
+    def __repr__(self):
+        return f"_{self.slot}"
+
+
+# one reference per slot, so that compiled terms compare (and hash) by identity of their references
+_REFS: List[_Ref] = []
+
+
+def _ref(slot: int) -> _Ref:
+    while len(_REFS) <= slot:
+        _REFS.append(_Ref(len(_REFS)))
+    return _REFS[slot]
+
+
+# key of the cons cells, and the empty list
+_CONS = ("[|]", 2)
+_NIL = ("[]", 0, ())
+
+# how a goal is resolved
+_CALL = 0
+_NOT = 1
+_CLAUSES = 2  # with the clauses of the predicate, also when the predicate is tabled
+_COLLECT = 3  # adds the solution of an evaluation to the table
+
+# number of clauses from which a predicate is indexed
+_INDEX_MIN = 8
+
+
+class _Clause:
+    """
+    Compiled clause: the arguments of the head, the body goals (in reverse order) and the number of variables
+    """
+    __slots__ = ("head", "body", "size", "source")
+
+    def __init__(self, head: Tuple, body: Tuple, size: int, source: Union[Atom, Clause, None]):
+        self.head = head
+        self.body = body
+        self.size = size
+        self.source = source
+
+
+class _Procedure:
+    """
+    Clauses of a predicate, with hash indexes on argument positions built on demand
+    """
+    __slots__ = ("clauses", "indexes")
+
+    def __init__(self):
+        self.clauses: List[_Clause] = []
+        # position -> (key of the argument -> clauses, clauses with a variable at the position)
+        self.indexes: Dict[int, Tuple[Dict[object, List[_Clause]], List[_Clause]]] = {}
+
+    def add(self, clause: _Clause, first: bool = False) -> None:
+        if first:
+            self.clauses.insert(0, clause)
+        else:
+            self.clauses.append(clause)
+        self.indexes = {}
+
+    def remove(self, clause: _Clause) -> None:
+        self.clauses.remove(clause)
+        self.indexes = {}
+
+    def index(self, position: int) -> Tuple[Dict[object, List[_Clause]], List[_Clause]]:
+        index = self.indexes.get(position)
+        if index is None:
+            # clauses with a variable at the position belong to every key, in their order
+            keys = {}
+            variable = []
+            for cl in self.clauses:
+                arg = cl.head[position]
+                if type(arg) is _Ref:
+                    for x in keys.values():
+                        x.append(cl)
+                    variable.append(cl)
+                else:
+                    key = _index_key(arg)
+                    if key not in keys:
+                        keys[key] = list(variable)
+                    keys[key].append(cl)
+            index = (keys, variable)
+            self.indexes[position] = index
+        return index
+
+    def candidates(self, args: Tuple, env: int, cells: List) -> Sequence[_Clause]:
+        """
+        Returns the clauses whose head can match the arguments of a call, in order
+        """
+        if len(self.clauses) < _INDEX_MIN:
+            return self.clauses
+
+        best = None
+        for position, arg in enumerate(args):
+            frame = env
+            while type(arg) is _Ref:
+                cell = cells[frame + arg.slot]
+                if cell is None:
+                    break
+                arg, frame = cell
+            if type(arg) is _Ref:
+                continue
+            keys, variable = self.index(position)
+            if best is None or len(keys) > len(best[0]):
+                best = (keys, variable, _index_key(arg))
+            if position == 0 and len(keys) > 1:
+                # the first argument discriminates the clauses
+                break
+        if best is None:
+            return self.clauses
+        return best[0].get(best[2], best[1])
+
+
+class _Table:
+    """
+    Answers of a call variant of a tabled predicate
+    """
+    __slots__ = ("answers", "keys", "complete", "depth", "leader")
+
+    def __init__(self):
+        self.answers = _Procedure()
+        self.keys = set()
+        self.complete = False
+        # position on the stack of tables being evaluated (None when not being evaluated),
+        #     and the lowest position of a table it depends on
+        self.depth: Optional[int] = None
+        self.leader: Optional[int] = None
+
+
+class SLDEngine(LPSolver):
+    """
+    Top-down engine for definite programs with negation as failure, in pure Python (SLD resolution, depth first,
+        clauses in order, as Prolog)
+
+    Bindings share the structure of the clauses (a binding is a term of a clause and the frame of its variables)
+        and are undone on backtracking through a trail. The clauses of a predicate are selected through hash indexes
+        on the arguments bound by the call (the first argument if it discriminates), built on demand; no choice point
+        is left when a single clause applies.
+
+    Predicates marked with table(...) are tabled: their answers are computed per call variant, to a fixpoint, and
+        reused by later calls until the program changes. Left-recursive tabled predicates terminate, and every answer
+        is returned once.
+
+    Negative literals are evaluated by negation as failure, they should be ground when called.
+
+    Arguments:
+        knowledge_base (default: None): facts to use
+                                        Not supported yet
+        background_knowledge (default: None): background knowledge (clauses)
+                                              Not supported yet
+        ctx [Context] (default: global context): context to use (for the variables of non-ground answers)
+    """
+
+    def __init__(self, knowledge_base=None, background_knowledge=None, ctx: Context = None):
+        super().__init__(SLD, knowledge_base, background_knowledge, ctx)
+        self._procedures: Dict[Predicate, _Procedure] = {}
+        self._tabled = set()
+        # (predicate, compiled call) -> answers, valid until the program changes
+        self._tables: Dict[Tuple, _Table] = {}
+        # tables being evaluated, and the tables evaluated but not complete yet
+        self._stack: List[_Table] = []
+        self._evaluated: List[_Table] = []
+        # the answer count tells whether an iteration of a table found anything new, the count of uses of answers
+        #     of tables that are not complete whether it can find more in another iteration
+        self._count = 0
+        self._consumed = 0
+        self._cells: List = []
+        self._trail: List[int] = []
+
+    def declare_type(self, elem_type: Type) -> None:
+        # nothing to declare, the engine works on pylo terms
+        pass
+
+    def declare_constant(self, elem_constant: Constant) -> None:
+        pass
+
+    def declare_variable(self, elem_variable: Variable) -> None:
+        pass
+
+    def declare_predicate(self, elem_predicate: Predicate) -> None:
+        pass
+
+    def table(self, *predicates: Predicate) -> None:
+        """
+        Marks the predicates as tabled
+
+        Tabling pays off for left-recursive predicates and programs with cycles, which do not terminate otherwise. It
+            is costly on right recursion: each call variant gets a table holding all of its answers, so
+            reach(n0, Y) :- e(n0, Z), reach(Z, Y) on a chain of n nodes builds n tables and about n^2 / 2 answers
+            (a chain of 2000 nodes takes over ten seconds, where the untabled predicate takes under a second on 30000
+            nodes). Do not table predicates that terminate without it.
+
+        Arguments:
+            predicates [Predicate]: predicates to table
+        """
+        self._tabled.update(predicates)
+        self._tables = {}
+
+    def _changed(self) -> None:
+        if self._tables:
+            self._tables = {}
+
+    def _add(self, clause: Union[Atom, Clause], first: bool = False) -> None:
+        if isinstance(clause, Clause):
+            head, body = clause.get_head(), clause.get_literals()
+        elif isinstance(clause, Atom):
+            head, body = clause, []
+        else:
+            raise Exception(f"{SLD} supports clauses and facts only: {clause}")
+
+        variables = {}
+        compiled = _Clause(tuple([_compile(x, variables) for x in head.get_arguments()]),
+                           tuple(reversed([_compile_goal(x, variables) for x in body])), 0, clause)
+        compiled.size = len(variables)
+        self._procedures.setdefault(head.get_predicate(), _Procedure()).add(compiled, first)
+        self._changed()
+
+    def assert_fact(self, fact: Atom) -> None:
+        self._add(fact)
+
+    def assert_rule(self, rule: Union[Clause, Sequence[Clause]]) -> None:
+        for r in ([rule] if isinstance(rule, Clause) else rule):
+            self._add(r)
+
+    def asserta(self, clause: Union[Atom, Clause]):
+        self._add(clause, first=True)
+
+    def assertz(self, clause: Union[Atom, Clause]):
+        self._add(clause)
+
+    def retract(self, clause: Union[Atom, Clause]) -> bool:
+        """
+        Removes the clause, or the first fact matching the atom
+
+        Return:
+            True if a clause was removed
+        """
+        head = clause.get_head() if isinstance(clause, Clause) else clause
+        procedure = self._procedures.get(head.get_predicate())
+        if procedure is None:
+            return False
+
+        for cl in procedure.clauses:
+            if isinstance(clause, Clause):
+                found = cl.source is clause or (isinstance(cl.source, Clause) and cl.source == clause)
+            elif cl.body:
+                found = False
+            else:
+                variables = {}
+                args = tuple([_compile(x, variables) for x in clause.get_arguments()])
+                self._cells = [None] * (cl.size + len(variables))
+                self._trail = []
+                found = self._unify([(x, 0, y, cl.size) for x, y in zip(cl.head, args)])
+            if found:
+                procedure.remove(cl)
+                self._changed()
+                return True
+        return False
+
+    def _undo(self, trail_mark: int, height: int) -> None:
+        cells = self._cells
+        trail = self._trail
+        while len(trail) > trail_mark:
+            cells[trail.pop()] = None
+        del cells[height:]
+
+    def _unify(self, pairs: List[Tuple]) -> bool:
+        """
+        Unifies the pairs of terms (a, frame of a, b, frame of b), recording the bindings on the trail
+        """
+        cells = self._cells
+        trail = self._trail
+        while pairs:
+            a, ea, b, eb = pairs.pop()
+            while type(a) is _Ref:
+                cell = cells[ea + a.slot]
+                if cell is None:
+                    break
+                a, ea = cell
+            while type(b) is _Ref:
+                cell = cells[eb + b.slot]
+                if cell is None:
+                    break
+                b, eb = cell
+
+            if type(a) is _Ref:
+                ia = ea + a.slot
+                if type(b) is _Ref:
+                    ib = eb + b.slot
+                    if ia == ib:
+                        continue
+                    # the younger cell points to the older one
+                    if ia < ib:
+                        cells[ib] = (a, ea)
+                        trail.append(ib)
+                        continue
+                cells[ia] = (b, eb)
+                trail.append(ia)
+            elif type(b) is _Ref:
+                ib = eb + b.slot
+                cells[ib] = (a, ea)
+                trail.append(ib)
+            elif type(a) is tuple:
+                if type(b) is not tuple or a[0] != b[0]:
+                    return False
+                for x, y in zip(a[2], b[2]):
+                    pairs.append((x, ea, y, eb))
+            elif a is not b and (type(b) is tuple or a != b):
+                return False
+        return True
+
+    def _solve(self, goals: Optional[Tuple]) -> Iterator[None]:
+        """
+        Enumerates the solutions of the goals (a linked list of (goal, frame, rest)), leaving the bindings of every
+            solution in the cells while it is yielded
+        """
+        cells = self._cells
+        trail = self._trail
+        # choice points: (goals, alternatives, next alternative, live, trail mark, height), and for the evaluation
+        #     of a table (goals, table, counts at the start of the iteration, (call, size, position), ...)
+        choices = []
+        while True:
+            alternatives = ()
+            start = 0
+            # answers of a table being evaluated, which can grow while they are used
+            live = False
+            if goals is None:
+                yield
+            else:
+                goal, env, rest = goals
+                predicate, args, mode = goal
+                if mode == _NOT:
+                    if not self._succeeds(predicate, args, env):
+                        goals = rest
+                        continue
+                elif mode == _COLLECT:
+                    # the end of an evaluation of the table (in place of the predicate): the next solution
+                    self._collect(predicate, args, env)
+                elif mode == _CALL and predicate in self._tabled:
+                    table, call, size = self._table(predicate, args, env)
+                    if table.complete or table.depth is not None:
+                        alternatives, live = self._answers(table, args, env)
+                    else:
+                        # the table is evaluated first, in this loop; the goal consumes its answers after that
+                        position = self._begin(table)
+                        choices.append((goals, table, (self._count, self._consumed), (call, size, position),
+                                        len(trail), len(cells)))
+                        goals = self._evaluation(table, predicate, call, size)
+                        continue
+                else:
+                    procedure = self._procedures.get(predicate)
+                    if procedure is not None:
+                        alternatives = procedure.candidates(args, env, cells)
+                trail_mark = len(trail)
+                height = len(cells)
+
+            # the first alternative applying, else the next alternative of the last choice point
+            while True:
+                applied = False
+                count = len(alternatives)
+                while start < count:
+                    clause = alternatives[start]
+                    start += 1
+                    frame = len(cells)
+                    if clause.size:
+                        cells.extend([None] * clause.size)
+                    if self._unify([(x, frame, y, env) for x, y in zip(clause.head, args)]):
+                        if start < count or live:
+                            choices.append((goals, alternatives, start, live, trail_mark, height))
+                        goals = rest
+                        for g in clause.body:
+                            goals = (g, frame, goals)
+                        applied = True
+                        break
+                    self._undo(trail_mark, height)
+
+                if applied:
+                    break
+                if not choices:
+                    return
+                goals, alternatives, start, live, trail_mark, height = choices.pop()
+                self._undo(trail_mark, height)
+                (predicate, args, _), env, rest = goals
+
+                if type(alternatives) is _Table:
+                    # an iteration of the evaluation of the table is over
+                    table, (count, consumed), (call, size, position) = alternatives, start, live
+                    if self._count != count and self._consumed != consumed and table.leader == table.depth:
+                        # new answers, found with answers of tables that were not complete (which may have more
+                        #     answers now), and no dependency on a table evaluated before: another iteration
+                        choices.append((goals, table, (self._count, self._consumed), live, trail_mark, height))
+                        goals = self._evaluation(table, predicate, call, size)
+                        break
+                    self._end(table, position)
+                    alternatives, live = self._answers(table, args, env)
+                    start = 0
+
+    def _succeeds(self, predicate: Predicate, args: Tuple, env: int) -> bool:
+        # whether the goal has a solution, leaving no binding
+        trail_mark = len(self._trail)
+        height = len(self._cells)
+        solutions = self._solve(((predicate, args, _CALL), env, None))
+        found = False
+        for _ in solutions:
+            found = True
+            break
+        solutions.close()
+        self._undo(trail_mark, height)
+        return found
+
+    def _resolve(self, term, env: int, variables: Dict[int, _Ref]):
+        # the term with its bindings substituted, the unbound cells renumbered in order of appearance
+        cells = self._cells
+        while type(term) is _Ref:
+            cell = cells[env + term.slot]
+            if cell is None:
+                ref = variables.get(env + term.slot)
+                if ref is None:
+                    ref = _ref(len(variables))
+                    variables[env + term.slot] = ref
+                return ref
+            term, env = cell
+        if type(term) is tuple and term[2]:
+            return term[0], term[1], tuple([self._resolve(x, env, variables) for x in term[2]])
+        return term
+
+    def _table(self, predicate: Predicate, args: Tuple, env: int) -> Tuple[_Table, Tuple, int]:
+        """
+        Returns the table of the call of a tabled predicate (created if needed), the call with its variables
+            renumbered, and the number of its variables
+        """
+        variables = {}
+        call = tuple([self._resolve(x, env, variables) for x in args])
+        table = self._tables.get((predicate, call))
+        if table is None:
+            table = _Table()
+            self._tables[(predicate, call)] = table
+        return table, call, len(variables)
+
+    def _answers(self, table: _Table, args: Tuple, env: int) -> Tuple[Sequence[_Clause], bool]:
+        """
+        Returns the answers of a table (as facts) for a call
+
+        Return:
+            the answers, and whether more answers can be added to them (the table is not complete)
+        """
+        if table.complete:
+            return table.answers.candidates(args, env, self._cells), False
+
+        if table.depth is not None:
+            # a variant of a call being evaluated: the answers found so far, the tables evaluated since then
+            #     are completed with it
+            for t in self._stack[table.depth + 1:]:
+                t.leader = min(t.leader, table.depth)
+        self._consumed += 1
+        return table.answers.clauses, True
+
+    def _begin(self, table: _Table) -> int:
+        # the table is being evaluated; returns its position in the tables evaluated and not complete
+        table.depth = len(self._stack)
+        table.leader = table.depth
+        self._stack.append(table)
+        self._evaluated.append(table)
+        return len(self._evaluated) - 1
+
+    def _evaluation(self, table: _Table, predicate: Predicate, call: Tuple, size: int) -> Tuple:
+        # the goals of an iteration of the evaluation of the table: the call with the clauses of the predicate,
+        #     then the collection of the answer
+        frame = len(self._cells)
+        self._cells.extend([None] * size)
+        return (predicate, call, _CLAUSES), frame, ((table, call, _COLLECT), frame, None)
+
+    def _collect(self, table: _Table, call: Tuple, env: int) -> None:
+        variables = {}
+        answer = tuple([self._resolve(x, env, variables) for x in call])
+        if answer not in table.keys:
+            table.keys.add(answer)
+            table.answers.clauses.append(_Clause(answer, (), len(variables), None))
+            self._count += 1
+
+    def _end(self, table: _Table, position: int) -> None:
+        # the evaluation of the table is over: a table depending on a table evaluated before is evaluated again by
+        #     the iterations of that one, else the tables evaluated since are complete
+        self._stack.pop()
+        table.depth = None
+        if table.leader == len(self._stack):
+            for t in self._evaluated[position:]:
+                t.complete = True
+            del self._evaluated[position:]
+
+    def _solutions(self, query: Sequence[Literal]) -> Iterator[Dict[Variable, object]]:
+        variables = {}
+        goals = None
+        for literal in reversed([_compile_goal(x, variables) for x in query]):
+            goals = (literal, 0, goals)
+
+        self._cells = [None] * len(variables)
+        self._trail = []
+        try:
+            for _ in self._solve(goals):
+                fresh = {}
+                yield dict([(v, self._decode(_ref(slot), 0, fresh)) for v, slot in variables.items()])
+        except Exception:
+            # the tables being evaluated are not valid
+            self._tables = {}
+            self._stack = []
+            self._evaluated = []
+            raise
+
+    def _decode(self, term, env: int, fresh: Dict[int, Variable]):
+        # the pylo term of a compiled term in a frame
+        cells = self._cells
+        while type(term) is _Ref:
+            cell = cells[env + term.slot]
+            if cell is None:
+                if env + term.slot not in fresh:
+                    fresh[env + term.slot] = self._ctx.fresh_variable()
+                return fresh[env + term.slot]
+            term, env = cell
+
+        if type(term) is not tuple:
+            return term
+        elif term is _NIL:
+            return LPList([])
+        elif term[0] != _CONS:
+            return Structure(term[1], [self._decode(x, env, fresh) for x in term[2]])
+
+        # the elements of a list, iteratively
+        elements = []
+        while type(term) is tuple and term[0] == _CONS:
+            elements.append(self._decode(term[2][0], env, fresh))
+            term, env = term[2][1], env
+            while type(term) is _Ref:
+                cell = cells[env + term.slot]
+                if cell is None:
+                    break
+                term, env = cell
+        if term is _NIL:
+            return LPList(elements)
+        tail = self._decode(term, env, fresh)
+        for x in reversed(elements):
+            tail = Pair(x, tail)
+        return tail
+
+    def has_solution(self, *query: Union[Atom, Not]):
+        for _ in self._solutions(query):
+            return True
+        return False
+
+    def query(self, *query, **kwargs):
+        if 'max_solutions' in kwargs:
+            max_solutions = kwargs['max_solutions']
+        else:
+            max_solutions = 0
+
+        query_vars = list(dict.fromkeys([v for x in query for v in _literal_variables(x)]))
+        answers = []
+        for binding in self._solutions(query):
+            answers.append(dict([(v, binding[v]) for v in query_vars]))
+            if len(answers) == max_solutions:
+                break
+
+        return answers
+
+
+def _compile(term, variables: Dict[Variable, int]):
+    # the compiled term, numbering the new variables
+    if isinstance(term, Variable):
+        if term not in variables:
+            variables[term] = len(variables)
+        return _ref(variables[term])
+    elif isinstance(term, Pair):
+        left, right = term.get_arguments()
+        return _CONS, None, (_compile(left, variables), _compile(right, variables))
+    elif isinstance(term, LPList):
+        compiled = _NIL
+        for x in reversed([_compile(x, variables) for x in term.get_arguments()]):
+            compiled = (_CONS, None, (x, compiled))
+        return compiled
+    elif isinstance(term, Structure):
+        functor = term.get_functor()
+        return ((functor.get_name(), functor.get_arity()), functor,
+                tuple([_compile(x, variables) for x in term.get_arguments()]))
+    return term
+
+
+def _compile_goal(literal: Literal, variables: Dict[Variable, int]) -> Tuple:
+    if isinstance(literal, Not):
+        atom, mode = literal.get_atom(), _NOT
+    elif isinstance(literal, Atom):
+        atom, mode = literal, _CALL
+    else:
+        raise Exception(f"{SLD} supports atoms and negated atoms only: {literal}")
+    return atom.get_predicate(), tuple([_compile(x, variables) for x in atom.get_arguments()]), mode
+
+
+def _index_key(term):
+    # structures are indexed on their functor
+    return term[0] if type(term) is tuple else term
@@ -2,129 +2,36 @@
 # from src.pylo.language.lp import Constant, Variable, Functor, Structure, List, Atom, Not, Clause, \
 #    c_const, c_pred, c_var, c_functor, c_symbol
 
-from pylo.engines.prolog.prologsolver import Prolog
-from pylo.language.lp import Constant, Variable, Functor, Structure, List, Atom, Not, Clause, \
-    c_const, c_pred, c_var, c_functor, c_symbol, Pair
+from pylo.engines.prolog.prologsolver import Prolog, PreparedQuery
+from pylo.language.commons import Context
+from pylo.engines.prolog.prolog_utils import TermWriter, SymbolHandles, decode_term
+from pylo.language.lp import Variable, Structure, List, Atom, Not, Clause, \
+    c_const, c_pred, c_var, c_functor, c_symbol, Pair, FactTable
 
 import sys
 sys.path.append("../../../build")
 
 import pygprolog
-from typing import Union, Dict
+from typing import Union, Dict, Sequence
 from functools import reduce
 
 
-def _const_to_pygp(c: Constant):
-    return pygprolog.pygp_Mk_Atom(
-        pygprolog.pygp_Create_Allocate_Atom(c.get_name())
-    )
+def _build_pygp(writer: TermWriter, n: int):
+    """
+    Builds the n terms written to the writer in a single call
 
+    Return:
+        the list of built terms and the list of variables they use
+    """
+    return pygprolog.pygp_Build_Terms(n, writer.num_vars(), writer.ops, writer.atoms, writer.floats)
 
-def _var_to_pygp(v: Variable, lit_var_store: Dict[Variable, int]):
-    if v in lit_var_store:
-        return lit_var_store[v]
-    else:
-        tmpV = pygprolog.pygp_Mk_Variable()
-        lit_var_store[v] = tmpV
-        return tmpV
-
-
-def _num_to_pygp(value: Union[int, float]):
-    if isinstance(value, int):
-        return pygprolog.pygp_Mk_Integer(value)
-    else:
-        return pygprolog.pygp_Mk_Float(value)
-
-
-def _functor_to_pygp(func: Functor):
-    intKey = pygprolog.pygp_Find_Atom(func.get_name())
-
-    if intKey == -1:
-        return pygprolog.pygp_Mk_Atom(func.get_name())
-    else:
-        return intKey
-
-
-def _to_pygp(item, lit_var_store: Dict[Variable, int]):
-    if isinstance(item, Constant):
-        return _const_to_pygp(item)
-    elif isinstance(item, Variable):
-        return _var_to_pygp(item, lit_var_store)
-    elif isinstance(item, (int, float)):
-        return _num_to_pygp(item)
-    elif isinstance(item, List):
-        return _list_to_pygp(item, lit_var_store)
-    elif isinstance(item, Pair):
-        return _pair_to_pygp(item, lit_var_store)
-    elif isinstance(item, Structure):
-        return _structure_to_pygp(item, lit_var_store)
-    else:
-        raise Exception(f"don't know how to turn {item} ({type(item)}) to pygp")
-
-
-def _list_to_pygp(ll: List, lit_var_store: Dict[Variable, int]):
-    args = [_to_pygp(x, lit_var_store) for x in ll.get_arguments()]
-
-    return pygprolog.pygp_Mk_List(args)
-
-
-def _pair_to_pygp(p: Pair, lit_var_store: Dict[Variable, int]):
-    left = _to_pygp(p.get_left(), lit_var_store)
-    right = _to_pygp(p.get_right(), lit_var_store)
-
-    functor = pygprolog.pygp_Find_Atom('.')
-    if functor < 0:
-        functor = pygprolog.pygp_Create_Allocate_Atom('.')
-
-    args = [left, right]
-    return pygprolog.pygp_Mk_Compound(functor, 2, args)
-
-
-def _structure_to_pygp(struct: Structure, lit_var_store: Dict[Variable, int]):
-    func = _functor_to_pygp(struct.get_functor())
-    args = [_to_pygp(x, lit_var_store) for x in struct.get_arguments()]
-
-    return pygprolog.pygp_Mk_Compound(func, struct.get_functor().get_arity(), args)
-
-
-def _lit_to_pygp(literal: Atom, var_store=None):
-    if var_store is None:
-        var_store = {}
-    pred = pygprolog.pygp_Find_Atom(literal.get_predicate().get_name())
-    if pred < 0:
-        pred = pygprolog.pygp_Create_Allocate_Atom(literal.get_predicate().get_name())
-    args = [_to_pygp(x, var_store) for x in literal.get_arguments()]
-
-    return pygprolog.pygp_Mk_Compound(pred, literal.get_predicate().get_arity(), args)
 
+def _pygp_atom(name: str):
+    atom = pygprolog.pygp_Find_Atom(name)
+    if atom < 0:
+        atom = pygprolog.pygp_Create_Allocate_Atom(name)
 
-def _neg_to_pygp(negation: Not, var_store=None):
-    if var_store is None:
-        var_store = {}
-    inner = _lit_to_pygp(negation.get_atom(), var_store)
-
-    ng_f = pygprolog.pygp_Find_Atom("\\+")
-    return pygprolog.pygp_Mk_Compound(ng_f, 1, [inner])
-
-
-def _conjoin_lits(pyg_literals):
-    conj_f = pygprolog.pygp_Find_Atom(",")
-    return reduce(lambda x, y: pygprolog.pygp_Mk_Compound(conj_f, 2, [x, y]), pyg_literals)
-
-
-def _cl_to_pygp(clause: Clause):
-    var_store = {}
-    head_pygp = _lit_to_pygp(clause.get_head(), var_store)
-    body_pygp = [
-        _lit_to_pygp(x, var_store) if isinstance(x, Atom) else _neg_to_pygp(x, var_store)
-        for x in clause.get_body().get_literals()
-    ]
-    # conj_f = pygprolog.pygp_Find_Atom(",")
-    # body_pygp = reduce(lambda x, y: pygprolog.pygp_Mk_Compound(conj_f, 2, [x, y]), body_pygp)
-    body_pygp = _conjoin_lits(body_pygp)
-    cl_f = pygprolog.pygp_Find_Atom(":-")
-
-    return pygprolog.pygp_Mk_Compound(cl_f, 2, [head_pygp, body_pygp])
+    return atom
 
 
 def _pygp_to_const(term):
@@ -196,14 +103,66 @@ def _read_pygp(term, pygp_term_to_var={}):
         return _pygp_to_structure(term)
 
 
+# number of solutions fetched from the engine in a single call by query()
+QUERY_BATCH_SIZE = 256
+
+
+def _decode_pygp(encoded, decoded_vars: Dict[int, Variable], ctx: Context = None):
+    # see decode_term, with the tags of binding_gprolog.cpp
+    return decode_term(encoded, decoded_vars, pygprolog, ctx)
+
+
+class GNUPreparedQuery(PreparedQuery):
+    """
+    Query written once, with the atoms it uses resolved in the engine;
+    every call builds the goal with the parameter values in place of their variables in a single call
+    """
+
+    def __init__(self, solver: "GNUProlog", *query, **kwargs):
+        super().__init__(solver, *query, **kwargs)
+        writer = TermWriter(solver._handles, dict([(v, ind) for ind, v in enumerate(self._variables)]))
+        self._pred, self._arity = solver._write_query(writer, *query)
+
+        self._ops = writer.ops
+        self._atoms = writer.atoms
+        self._floats = writer.floats
+        self._var_index: Dict[Variable, int] = writer.var_index
+
+    def _solutions(self, bindings, n_decode: int, max_solutions: int):
+        writer = TermWriter(self._solver._handles, self._var_index)
+        slots = writer.parameters(bindings)
+
+        return pygprolog.pygp_Run_Prepared(self._pred, self._arity, self._ops, self._atoms, self._floats, n_decode,
+                                           slots, writer.num_vars(), writer.ops, writer.atoms, writer.floats,
+                                           max_solutions)
+
+    def run(self, bindings: Dict[Variable, object] = None, **kwargs):
+        bindings = {} if bindings is None else bindings
+        solutions = self._solutions(bindings, len(self._variables), self._max_solutions(kwargs))
+
+        result = []
+        for solution in solutions:
+            decoded_vars = {}
+            result.append(dict([(v, _decode_pygp(x, decoded_vars, self._solver._ctx))
+                                for v, x in zip(self._variables, solution) if v not in bindings]))
+
+        return result
+
+    def exists(self, bindings: Dict[Variable, object] = None):
+        return len(self._solutions({} if bindings is None else bindings, 0, 1)) > 0
+
+
 class GNUProlog(Prolog):
 
-    def __init__(self):
+    def __init__(self, ctx: Context = None):
         pygprolog.pygp_Start_Prolog()
-        super().__init__()
+        # engine atoms, valid until the engine is released
+        self._handles = SymbolHandles(_pygp_atom)
+        super().__init__(ctx)
 
     def release(self):
         if not self.is_released:
+            self._handles.invalidate()
             pygprolog.pygp_Stop_Prolog()
             self.is_released: bool = True
 
@@ -211,131 +170,152 @@ class GNUProlog(Prolog):
         self.release()
 
     def consult(self, filename):
-        consult = pygprolog.pygp_Find_Atom("consult")
-        arg = pygprolog.pygp_Mk_String(filename)
+        consult = self._handles.name("consult")
 
         pygprolog.pygp_Query_Begin()
+        arg = pygprolog.pygp_Mk_String(filename)
         q_Var1 = pygprolog.pygp_Query_Call(consult, 1, [arg])
-        pygprolog.pygp_Query_End()
+        pygprolog.pygp_Query_End(pygprolog.PL_RECOVER)
 
         return q_Var1
 
     def use_module(self, module: str, **kwargs):
         raise Exception(f"GNUProlog does not have modules.")
 
-    def _asserta_lit(self, literal: Atom):
-        pl = _lit_to_pygp(literal)
-        asa_p = pygprolog.pygp_Find_Atom("asserta")
+    def _call_with_clause(self, predicate_name: str, clause: Union[Atom, Clause]):
+        writer = TermWriter(self._handles)
+        writer.clause(clause)
 
+        # the clause is copied into the database; the heap used to build it is recovered when the query ends
         pygprolog.pygp_Query_Begin()
-        q_Var1 = pygprolog.pygp_Query_Call(asa_p, 1, [pl])
-        pygprolog.pygp_Query_End()
-
-        return q_Var1
-
-    def _asserta_cl(self, clause: Clause):
-        clp = _cl_to_pygp(clause)
-
-        asa_p = pygprolog.pygp_Find_Atom("asserta")
-
-        pygprolog.pygp_Query_Begin()
-        q_Var1 = pygprolog.pygp_Query_Call(asa_p, 1, [clp])
-        pygprolog.pygp_Query_End()
+        terms, _ = _build_pygp(writer, 1)
+        q_Var1 = pygprolog.pygp_Query_Call(self._handles.name(predicate_name), 1, terms)
+        pygprolog.pygp_Query_End(pygprolog.PL_RECOVER)
 
         return q_Var1
 
     def asserta(self, clause: Union[Atom, Clause]):
-        if isinstance(clause, Atom):
-            return self._asserta_lit(clause)
-        else:
-            return self._asserta_cl(clause)
-
-    def _assertz_lit(self, literal: Atom):
-        pl = _lit_to_pygp(literal)
-        asa_p = pygprolog.pygp_Find_Atom("assertz")
-
-        pygprolog.pygp_Query_Begin()
-        q_Var1 = pygprolog.pygp_Query_Call(asa_p, 1, [pl])
-        pygprolog.pygp_Query_End()
+        return self._call_with_clause("asserta", clause)
 
-        return q_Var1
-
-    def _assertz_cl(self, clause: Clause):
-        clp = _cl_to_pygp(clause)
-
-        asa_p = pygprolog.pygp_Find_Atom("assertz")
+    def assertz(self, clause: Union[Atom, Clause]):
+        return self._call_with_clause("assertz", clause)
 
-        pygprolog.pygp_Query_Begin()
-        q_Var1 = pygprolog.pygp_Query_Call(asa_p, 1, [clp])
-        pygprolog.pygp_Query_End()
+    def retract(self, clause: Union[Atom, Clause]):
+        return self._call_with_clause("retract", clause)
+
+    def _assertz_chunk(self, clauses: Sequence[Union[Atom, Clause]]):
+        # the whole chunk is built and asserted in a single call
+        writer = TermWriter(self._handles)
+        for clause in clauses:
+            writer.clause(clause)
+
+        return pygprolog.pygp_Assertz_Terms(len(clauses), writer.num_vars(), writer.ops, writer.atoms, writer.floats)
+
+    def _assertz_table_chunk(self, table: FactTable, start: int, end: int):
+        writer = TermWriter(self._handles)
+        writer.fact_table(table, start, end)
+
+        return pygprolog.pygp_Assertz_Terms(end - start, writer.num_vars(), writer.ops, writer.atoms, writer.floats)
+
+    def _write_query(self, writer: TermWriter, *query: Union[Atom, Not]):
+        """
+        Writes the arguments of the goal to pose for the query
+
+        Arguments:
+            writer: term writer to use; variables of interest should already be indexed in it
+            query: literals to query
+
+        Return:
+            atom and arity of the predicate to call
+        """
+        if len(query) == 1 and isinstance(query[0], Atom):
+            # call the predicate directly with the arguments of the literal
+            for arg in query[0].get_arguments():
+                writer.term(arg)
+            return self._handles.symbol(query[0].get_predicate()), query[0].get_predicate().get_arity()
+        elif len(query) == 1:
+            writer.literal(query[0].get_atom())
+            return self._handles.name("\\+"), 1
+        else:
+            writer.literal(query[0])
+            writer.conjunction(query[1:])
+            return self._handles.name(","), 2
 
-        return q_Var1
+    def _prepare_query(self, writer: TermWriter, *query: Union[Atom, Not]):
+        """
+        Writes the query and builds it in the engine
 
-    def assertz(self, clause: Union[Atom, Clause]):
-        if isinstance(clause, Atom):
-            return self._assertz_lit(clause)
-        else:
-            return self._assertz_cl(clause)
+        Return:
+            predicate atom, arity, list of argument terms, list of variable terms
+        """
+        pred, arity = self._write_query(writer, *query)
+        args, var_terms = _build_pygp(writer, arity)
 
-    def _retract_lit(self, literal: Atom):
-        pl = _lit_to_pygp(literal)
-        asa_p = pygprolog.pygp_Find_Atom("retract")
+        return pred, arity, args, var_terms
 
+    def has_solution(self, *query: Union[Atom, Not]):
         pygprolog.pygp_Query_Begin()
-        q_Var1 = pygprolog.pygp_Query_Call(asa_p, 1, [pl])
-        pygprolog.pygp_Query_End()
+        pred, arity, args, _ = self._prepare_query(TermWriter(self._handles), *query)
+        q_Var = pygprolog.pygp_Query_Call(pred, arity, args)
+        pygprolog.pygp_Query_End(pygprolog.PL_RECOVER)
 
-        return q_Var1
+        return True if q_Var == 1 else False
 
-    def _retract_cl(self, clause: Clause):
-        clp = _cl_to_pygp(clause)
+    def query(self, *query, **kwargs):
+        return [x for x in self.query_iter(*query, batch_size=QUERY_BATCH_SIZE, **kwargs)]
 
-        asa_p = pygprolog.pygp_Find_Atom("retract")
+    def _solve_many(self, queries, decode: bool, max_solutions: int):
+        # all goals are built and solved in a single call
+        writer = TermWriter(self._handles)
+        var_starts, variables = writer.goals(queries)
+        var_counts = [len(x) for x in variables] if decode else [0] * len(variables)
 
-        pygprolog.pygp_Query_Begin()
-        q_Var1 = pygprolog.pygp_Query_Call(asa_p, 1, [clp])
-        pygprolog.pygp_Query_End()
+        return pygprolog.pygp_Solve_Many(len(variables), writer.num_vars(), writer.ops, writer.atoms, writer.floats,
+                                         var_starts, var_counts, max_solutions), variables
 
-        return q_Var1
+    def has_solution_many(self, queries):
+        results, _ = self._solve_many(queries, False, 1)
 
-    def retract(self, clause: Union[Atom, Clause]):
-        if isinstance(clause, Atom):
-            return self._retract_lit(clause)
-        if isinstance(clause, Clause):
-            return self._retract_cl(clause)
+        return [len(x) > 0 for x in results]
 
-    def has_solution(self, *query: Union[Atom, Not]):
-        var_store = {}
-
-        if len(query) == 1:
-            query = query[0]
-            args = [_to_pygp(x, var_store) for x in query.get_arguments()]
-            func = pygprolog.pygp_Find_Atom(query.get_predicate().get_name())
+    def query_many(self, queries, **kwargs):
+        if 'max_solutions' in kwargs:
+            max_solutions = kwargs['max_solutions']
+        else:
+            max_solutions = -1
 
-            pygprolog.pygp_Query_Begin()
-            q_Var1 = pygprolog.pygp_Query_Call(func, query.get_predicate().get_arity(), args)
-            pygprolog.pygp_Query_End()
+        results, variables = self._solve_many(queries, True, max_solutions)
 
-            return True if q_Var1 == 1 else False
+        answers = []
+        for solutions, vars_of_interest in zip(results, variables):
+            answer = []
+            for solution in solutions:
+                decoded_vars = {}
+                answer.append(dict([(v, _decode_pygp(x, decoded_vars, self._ctx))
+                                    for v, x in zip(vars_of_interest, solution)]))
+            answers.append(answer)
 
-        else:
-            first_elem = _lit_to_pygp(query[0], var_store)
-            rest = [
-                _lit_to_pygp(x, var_store) if isinstance(x, Atom) else _neg_to_pygp(x, var_store)
-                for x in query[1:]
-            ]
-            rest = _conjoin_lits(rest)
+        return answers
 
-            pygprolog.pygp_Query_Begin()
-            conjf = pygprolog.pygp_Find_Atom(",")
+    def prepare(self, *query, **kwargs):
+        return GNUPreparedQuery(self, *query, **kwargs)
 
-            q_Var = pygprolog.pygp_Query_Call(conjf, 2, [first_elem, rest])
+    def query_iter(self, *query, batch_size=1, **kwargs):
+        """
+        Lazily enumerates the solutions of the query
 
-            pygprolog.pygp_Query_End()
+        The query stays open in the engine while the solutions are consumed.
+        It is closed when the generator is exhausted, closed or garbage collected.
+        GNU Prolog allows only one open query at a time: close the generator before posing the next query.
 
-            return True if q_Var == 1 else False
+        Arguments:
+            query: literals to query
+            batch_size (int, default 1): number of solutions fetched and decoded in one call to the engine
+            max_solutions (int, optional): maximal number of solutions to enumerate
 
-    def query(self, *query, **kwargs):
+        Return:
+            generator of dictionaries mapping the query variables to their values
+        """
         if 'max_solutions' in kwargs:
             max_solutions = kwargs['max_solutions']
         else:
@@ -344,41 +324,38 @@ class GNUProlog(Prolog):
         vars_of_interest = [[y for y in x.get_arguments() if isinstance(y, Variable)] for x in query]
         vars_of_interest = reduce(lambda x, y: x + y, vars_of_interest, [])
         vars_of_interest = reduce(lambda x, y: x + [y] if y not in x else x, vars_of_interest, [])
-        var_store = dict([(x, pygprolog.pygp_Mk_Variable()) for x in vars_of_interest])
+        # variables of interest take the first variable slots
+        writer = TermWriter(self._handles, dict([(v, ind) for ind, v in enumerate(vars_of_interest)]))
 
         pygprolog.pygp_Query_Begin()
 
-        if len(query) == 1:
-            query = query[0]
-            f = pygprolog.pygp_Find_Atom(query.get_predicate().get_name())
-            args = [_to_pygp(x, var_store) for x in query.get_arguments()]
-            res = pygprolog.pygp_Query_Call(f, len(args), args)
-        else:
-            first = _lit_to_pygp(query[0], var_store)
-            rest = [
-                _lit_to_pygp(x, var_store) if isinstance(x, Atom) else _neg_to_pygp(x, var_store)
-                for x in query[1:]
-            ]
-            rest = _conjoin_lits(rest)
-            conjf = pygprolog.pygp_Find_Atom(",")
-
-            res = pygprolog.pygp_Query_Call(conjf, 2, [first, rest])
-
-        # discover all solutions
-        all_solutions = []
-
-        while res and max_solutions != 0:
-            tmp_solution = {}
-            for vn in var_store:
-                tmp_solution[vn] = _read_pygp(var_store[vn])
-
-            res = pygprolog.pygp_Query_Next_Solution()
-            max_solutions -= 1
-            all_solutions.append(tmp_solution)
-
-        pygprolog.pygp_Query_End()
-
-        return all_solutions
+        try:
+            pred, arity, args, var_terms = self._prepare_query(writer, *query)
+            var_terms = var_terms[:len(vars_of_interest)]
+            res = pygprolog.pygp_Query_Call(pred, arity, args)
+
+            # the first solution is found by the call itself, the rest is fetched in batches
+            solutions = [pygprolog.pygp_Read_Terms(var_terms)] if res == 1 else []
+            to_fetch = 1
+
+            while solutions and max_solutions != 0:
+                for solution in solutions[:max_solutions] if max_solutions > 0 else solutions:
+                    decoded_vars = {}
+                    yield dict([(v, _decode_pygp(x, decoded_vars, self._ctx))
+                                for v, x in zip(vars_of_interest, solution)])
+
+                if max_solutions > 0:
+                    max_solutions = max(max_solutions - len(solutions), 0)
+
+                if len(solutions) < to_fetch or max_solutions == 0:
+                    # no more solutions in the engine
+                    break
+
+                to_fetch = batch_size if max_solutions < 0 else min(batch_size, max_solutions)
+                solutions = pygprolog.pygp_Next_Solutions(var_terms, to_fetch)
+        finally:
+            # solutions are already decoded, so the heap used by the query can be recovered
+            pygprolog.pygp_Query_End(pygprolog.PL_RECOVER)
 
     def register_foreign(self, pyfunction, arity):
         raise Exception("support for foreign predicate not implemented yet")
@@ -1,256 +1,44 @@
 from pylo.engines.prolog.prologsolver import (
-    Prolog
+    Prolog, PreparedQuery
 )
-from pylo.language.lp import Constant, Variable, Functor, Structure, List, Predicate, Atom, Not, Clause, \
-    c_pred, c_const, c_var, c_functor, Pair
+from pylo.language.commons import Context
+from pylo.engines.prolog.prolog_utils import TermWriter, SymbolHandles, decode_term
+from pylo.language.lp import Variable, List, Predicate, Atom, Not, Clause, \
+    c_pred, c_const, c_var, c_functor, Pair, FactTable
 # from .prologsolver import Prolog
 # from pylo.language.lp import Constant, Variable, Functor, Structure, Predicate, List, Atom, Not, Clause, \
 #     list_func, Literal, c_pred, c_const, c_var, c_functor
-import typing
 import sys
 
 sys.path.append("../../../build")
 
 import swipy
-from typing import Union, Dict, Sequence
+from typing import Union, Dict, Sequence, Tuple
 from functools import reduce
+from contextlib import contextmanager
 import ctypes
 
 
-def _const_to_swipy(const: Union[Constant, Predicate]):
-    c = swipy.swipy_new_term_ref()
-    swipy.swipy_put_atom_chars(c, const.get_name())
-    return c
+@contextmanager
+def _foreign_frame():
+    """
+    Scopes the term refs created within it: they are released, and their bindings undone, when it exits
+    """
+    frame = swipy.swipy_open_foreign_frame()
+    try:
+        yield frame
+    finally:
+        swipy.swipy_discard_foreign_frame(frame)
 
 
-def _const_to_swipy_ref(const: Constant, swipy_ref):
-    swipy.swipy_put_atom_chars(swipy_ref, const.get_name())
+def _build_swipy(writer: TermWriter, n: int):
+    """
+    Builds the n terms written to the writer in a single call
 
-
-def _var_to_swipy(var: Variable, lit_var_store: Dict[Variable, int]):
-    if var in lit_var_store:
-        return lit_var_store[var]
-    else:
-        tmpV = swipy.swipy_new_term_ref()
-        swipy.swipy_put_variable(tmpV)
-        lit_var_store[var] = tmpV
-        return tmpV
-
-
-def _var_to_swipy_ref(var: Variable, swipy_ref, lit_var_store: Dict[Variable, int]):
-    if var in lit_var_store:
-        swipy.swipy_put_term(swipy_ref, lit_var_store[var])
-    else:
-        swipy.swipy_put_variable(swipy_ref)
-        lit_var_store[var] = swipy_ref
-
-
-def _num_to_swipy(num: Union[int, float]):
-    n = swipy.swipy_new_term_ref()
-    if isinstance(num, int):
-        swipy.swipy_put_integer(n, num)
-    else:
-        swipy.swipy_put_float(n, num)
-
-    return n
-
-
-def _num_to_swipy_ref(num: Union[int, float], swipy_ref):
-    if isinstance(num, int):
-        swipy.swipy_put_integer(swipy_ref, num)
-    else:
-        swipy.swipy_put_float(swipy_ref, num)
-
-
-def _functor_to_swipy(functor: Union[Functor, Predicate]):
-    func_atm = swipy.swipy_new_atom(functor.get_name())
-    func = swipy.swipy_new_functor(func_atm, functor.get_arity())
-    return func
-
-
-def _to_swipy(item, lit_var_store: Dict[Variable, int]):
-    if isinstance(item, Constant):
-        return _const_to_swipy(item)
-    elif isinstance(item, Variable):
-        return _var_to_swipy(item, lit_var_store)
-    elif isinstance(item, (int, float)):
-        return _num_to_swipy(item)
-    elif isinstance(item, List):
-        return _list_to_swipy(item, lit_var_store)
-    elif isinstance(item, Pair):
-        return _pair_to_swipy(item, lit_var_store)
-    elif isinstance(item, Structure):
-        return _structure_to_swipy(item, lit_var_store)
-    else:
-        raise Exception(f"don't know how to turn item {item} ({type(item)}) into swipy")
-
-
-def _to_swipy_ref(item, swipy_ref, lit_var_store: Dict[Variable, int]):
-    if isinstance(item, Constant):
-        return _const_to_swipy_ref(item, swipy_ref)
-    elif isinstance(item, Variable):
-        return _var_to_swipy_ref(item, swipy_ref, lit_var_store)
-    elif isinstance(item, (int, float)):
-        return _num_to_swipy_ref(item, swipy_ref)
-    elif isinstance(item, List):
-        return _list_to_swipy_ref(item, swipy_ref, lit_var_store)
-    elif isinstance(item, Pair):
-        return _pair_to_swipy_ref(item, swipy_ref, lit_var_store)
-    elif isinstance(item, Structure):
-        return _structure_to_swipy_ref(item, swipy_ref, lit_var_store)
-    else:
-        raise Exception(f"don't know how to turn item {item} ({type(item)}) into swipy")
-
-
-def _structure_to_swipy(item: Structure, lit_var_store: Dict[Variable, int]):
-    func = _functor_to_swipy(item.get_functor())
-    compound_arg = swipy.swipy_new_term_refs(item.get_functor().get_arity())
-    struct_args = item.get_arguments()
-    _to_swipy_ref(struct_args[0], compound_arg, lit_var_store)
-    for i in range(1, item.get_functor().get_arity()):
-        _to_swipy_ref(struct_args[i], compound_arg + i, lit_var_store)
-
-    structure = swipy.swipy_new_term_ref()
-    swipy.swipy_cons_functor(structure, func, compound_arg)
-
-    return structure
-
-
-def _structure_to_swipy_ref(item: Structure, swipy_ref, lit_var_store: Dict[Variable, int]):
-    func = _functor_to_swipy(item.get_functor())
-    compound_arg = swipy.swipy_new_term_refs(item.get_functor().get_arity())
-    struct_args = item.get_arguments()
-    _to_swipy_ref(struct_args[0], compound_arg, lit_var_store)
-    for i in range(1, item.get_functor().get_arity()):
-        _to_swipy_ref(struct_args[i], compound_arg + i, lit_var_store)
-
-    swipy.swipy_cons_functor(swipy_ref, func, compound_arg)
-
-
-def _list_to_swipy(item: List, lit_var_store: Dict[Variable, int]):
-    list_term = swipy.swipy_new_term_ref()
-
-    if len(item.get_arguments()) == 0:
-        # if empty list
-        swipy.swipy_put_nil(list_term)
-    else:
-        # if non-empty list
-        clist_term = swipy.swipy_new_term_ref()
-
-        swipy.swipy_put_nil(list_term)
-        args = item.get_arguments()
-        for ind in range(len(args) - 1, -1, -1):
-            _to_swipy_ref(args[ind], clist_term, lit_var_store)
-            swipy.swipy_cons_list(list_term, clist_term, list_term)
-
-    return list_term
-
-
-def _list_to_swipy_ref(item: List, swipy_ref, lit_var_store: Dict[Variable, int]):
-    if len(item.get_arguments()) == 0:
-        # if empty
-        swipy.swipy_put_nil(swipy_ref)
-    else:
-        # if not empty
-        clist_term = swipy.swipy_new_term_ref()
-
-        swipy.swipy_put_nil(swipy_ref)
-        args = item.get_arguments()
-        for ind in range(len(args) - 1, -1, -1):
-            _to_swipy_ref(args[ind], clist_term, lit_var_store)
-            swipy.swipy_cons_list(swipy_ref, clist_term, swipy_ref)
-
-
-def _pair_to_swipy(item: Pair, lit_var_store: Dict[Variable, int]):
-    list_term = swipy.swipy_new_term_ref()
-    head = swipy.swipy_new_term_ref()
-    tail = swipy.swipy_new_term_ref()
-
-    _to_swipy_ref(item.get_left(), head, lit_var_store)
-    _to_swipy_ref(item.get_right(), tail, lit_var_store)
-
-    swipy.swipy_cons_list(list_term, head, tail)
-
-    return list_term
-
-
-def _pair_to_swipy_ref(item: Pair, swipy_ref, lit_var_store: Dict[Variable, int]):
-    head = swipy.swipy_new_term_ref()
-    tail = swipy.swipy_new_term_ref()
-
-    _to_swipy_ref(item.get_left(), head, lit_var_store)
-    _to_swipy_ref(item.get_right(), tail, lit_var_store)
-
-    swipy.swipy_cons_list(swipy_ref, head, tail)
-
-
-def _lit_to_swipy(clause: Atom, lit_var_store: Dict[Variable, int]):
-    if clause.get_predicate().get_arity() == 0:
-        functor = _const_to_swipy(clause.get_predicate())
-        return functor
-    else:
-        functor = _functor_to_swipy(clause.get_predicate())
-        compound_arg = swipy.swipy_new_term_refs(clause.get_predicate().get_arity())
-        args = clause.get_arguments()
-        _to_swipy_ref(args[0], compound_arg, lit_var_store)
-        for i in range(1, clause.get_predicate().get_arity()):
-            _to_swipy_ref(args[i], compound_arg+i, lit_var_store)
-
-        literal = swipy.swipy_new_term_ref()
-        swipy.swipy_cons_functor(literal, functor, compound_arg)
-
-        return literal
-
-
-def _neg_to_swipy(clause: Not, lit_var_store: Dict[Variable, int]):
-    lit = _lit_to_swipy(clause.get_atom(), lit_var_store)
-    neg_atom = swipy.swipy_new_atom("\\+")
-    neg_functor = swipy.swipy_new_functor(neg_atom, 1)
-
-    entire_negation = swipy.swipy_new_term_ref()
-    swipy.swipy_cons_functor(entire_negation, neg_functor, lit)
-
-    return entire_negation
-
-
-def _conjoin_literals(lits: Sequence[int]):
-    if len(lits) == 1:
-        return lits[0]
-    else:
-        f_atm = swipy.swipy_new_atom(",")
-        conj_functor = swipy.swipy_new_functor(f_atm, 2)
-
-        compound_arg = swipy.swipy_new_term_refs(2)
-        conj = swipy.swipy_new_term_ref()
-        swipy.swipy_put_term(compound_arg, lits[0])
-        swipy.swipy_put_term(compound_arg + 1, _conjoin_literals(lits[1:]))
-        swipy.swipy_cons_functor(conj, conj_functor, compound_arg)
-
-        return conj
-
-
-def _cl_to_swipy(clause: Clause, lit_var_store: Dict[Variable, int]):
-    body: typing.Sequence[Union[Atom, Not]] = clause.get_body().get_literals()
-    head: Atom = clause.get_head()
-
-    body: typing.List[int] = [_lit_to_swipy(x, lit_var_store)
-                              if isinstance(x, Atom)
-                              else _neg_to_swipy(x, lit_var_store)
-                              for x in body]
-
-    head = _lit_to_swipy(head, lit_var_store)
-    body = _conjoin_literals(body)
-
-    clause_atom = swipy.swipy_new_atom(":-")
-    clause_functor = swipy.swipy_new_functor(clause_atom, 2)
-
-    entire_clause = swipy.swipy_new_term_ref()
-    compound_arg = swipy.swipy_new_term_refs(2)
-    swipy.swipy_put_term(compound_arg, head)
-    swipy.swipy_put_term(compound_arg + 1, body)
-    swipy.swipy_cons_functor(entire_clause, clause_functor, compound_arg)
-
-    return entire_clause
+    Return:
+        the first of n consecutive term refs holding the terms, and the first of the term refs holding the variables
+    """
+    return swipy.swipy_build_terms(n, writer.num_vars(), writer.ops, writer.atoms, writer.floats)
 
 
 def _swipy_to_const(term):
@@ -343,19 +131,75 @@ def _read_swipy(term, swipy_term_to_var={}):
         raise Exception(f"Unknown term type {swipy.swipy_term_type(term)}")
 
 
+def _decode_swipy(encoded, decoded_vars: Dict[int, Variable], ctx: Context = None):
+    # see decode_term, with the tags of binding_swipl.cpp
+    return decode_term(encoded, decoded_vars, swipy, ctx)
+
+
+# number of solutions fetched from the engine in a single call by query()
+QUERY_BATCH_SIZE = 256
+
+
+class SWIPreparedQuery(PreparedQuery):
+    """
+    Query built in the engine once; every call only binds the parameter slots and poses the goal
+
+    Resource limits (time_limit, depth_limit, inference_limit) are part of the prepared goal.
+    The goal is kept outside of any foreign frame for the lifetime of the engine:
+    do not prepare queries while a query_iter generator is open.
+    """
+
+    def __init__(self, solver: "SWIProlog", *query, **kwargs):
+        super().__init__(solver, *query, **kwargs)
+        writer = TermWriter(solver._handles, dict([(v, ind) for ind, v in enumerate(self._variables)]))
+        self._pred, self._args, self._first_var = solver._prepare_query(writer, *query,
+                                                                         max_time=kwargs.get('time_limit'),
+                                                                         max_depth=kwargs.get('depth_limit'),
+                                                                         max_inference=kwargs.get('inference_limit'))
+        self._var_index: Dict[Variable, int] = writer.var_index
+        self._num_vars = writer.num_vars()
+
+    def _solutions(self, bindings, n_decode: int, max_solutions: int):
+        writer = TermWriter(self._solver._handles, self._var_index)
+        slots = writer.parameters(bindings)
+
+        return swipy.swipy_run_prepared(self._pred, self._args, self._first_var, self._num_vars, n_decode, slots,
+                                        writer.num_vars(), writer.ops, writer.atoms, writer.floats, max_solutions)
+
+    def run(self, bindings: Dict[Variable, object] = None, **kwargs):
+        bindings = {} if bindings is None else bindings
+        solutions = self._solutions(bindings, len(self._variables), self._max_solutions(kwargs))
+
+        result = []
+        for solution in solutions:
+            decoded_vars = {}
+            result.append(dict([(v, _decode_swipy(x, decoded_vars, self._solver._ctx))
+                                for v, x in zip(self._variables, solution) if v not in bindings]))
+
+        return result
+
+    def exists(self, bindings: Dict[Variable, object] = None):
+        return len(self._solutions({} if bindings is None else bindings, 0, 1)) > 0
+
+
 class SWIProlog(Prolog):
 
-    def __init__(self, exec_path=None):
+    def __init__(self, exec_path=None, ctx: Context = None):
         if exec_path is None:
             exec_path = "/usr/local/bin/swipl"
         swipy.swipy_init(exec_path)
         self._callback_arities = {}
         self._wrapped_functions = {}
         self._wrap_refs_to_keep = []
-        super(SWIProlog, self).__init__()
+        # engine handles of atoms and predicates, valid until the engine is released
+        self._handles = SymbolHandles(swipy.swipy_new_atom_utf8, swipy.swipy_unregister_atom)
+        self._predicate_handles = {}
+        super(SWIProlog, self).__init__(ctx)
 
     def release(self):
         if not self.is_released:
+            self._handles.invalidate()
+            self._predicate_handles = {}
             #swipy.swipy_cleanup(1)
             swipy.swipy_halt(1)
             self.is_released: bool = True
@@ -365,13 +209,14 @@ class SWIProlog(Prolog):
 
 
     def consult(self, filename: str):
-        string_term = swipy.swipy_new_term_ref()
-        swipy.swipy_put_string_chars(string_term, filename)
+        with _foreign_frame():
+            string_term = swipy.swipy_new_term_ref()
+            swipy.swipy_put_string_chars(string_term, filename)
 
-        consult_pred = swipy.swipy_predicate("consult", 1, None)
-        query = swipy.swipy_open_query(consult_pred, string_term)
-        r = swipy.swipy_next_solution(query)
-        swipy.swipy_close_query(query)
+            consult_pred = self._predicate(("consult", 1))
+            query = swipy.swipy_open_query(consult_pred, string_term)
+            r = swipy.swipy_next_solution(query)
+            swipy.swipy_close_query(query)
 
         if r == 0:
             raise Exception(f"something wrong when consulting file {filename}")
@@ -379,227 +224,204 @@ class SWIProlog(Prolog):
         return r
 
     def use_module(self, module_name: str, **kwargs):
-        if module_name.startswith('library'):
-            # create library functor
-            library_term = swipy.swipy_new_atom("library")
-            library_funct = swipy.swipy_new_functor(library_term, 1)
-
-            # create inner module name: library([name])
-            module_inner_name = module_name[:-1].replace('library(', '')
-            inner_name = swipy.swipy_new_term_ref()
-            swipy.swipy_put_atom_chars(inner_name, module_inner_name)
-
-            # construct library(name)
-            full_module = swipy.swipy_new_term_ref()
-            swipy.swipy_cons_functor(full_module, library_funct, inner_name)
-        else:
-            full_module = swipy.swipy_new_term_ref()
-            swipy.swipy_put_atom_chars(full_module, module_name)
+        with _foreign_frame():
+            if module_name.startswith('library'):
+                # create library functor
+                library_term = swipy.swipy_new_atom("library")
+                library_funct = swipy.swipy_new_functor(library_term, 1)
+
+                # create inner module name: library([name])
+                module_inner_name = module_name[:-1].replace('library(', '')
+                inner_name = swipy.swipy_new_term_ref()
+                swipy.swipy_put_atom_chars(inner_name, module_inner_name)
+
+                # construct library(name)
+                full_module = swipy.swipy_new_term_ref()
+                swipy.swipy_cons_functor(full_module, library_funct, inner_name)
+            else:
+                full_module = swipy.swipy_new_term_ref()
+                swipy.swipy_put_atom_chars(full_module, module_name)
 
-        # load module
-        use_module = swipy.swipy_predicate("use_module", 1, None)
-        query = swipy.swipy_open_query(use_module, full_module)
-        r = swipy.swipy_next_solution(query)
-        swipy.swipy_close_query(query)
+            # load module
+            use_module = self._predicate(("use_module", 1))
+            query = swipy.swipy_open_query(use_module, full_module)
+            r = swipy.swipy_next_solution(query)
+            swipy.swipy_close_query(query)
 
         if r == 0:
             raise Exception(f"could not load module {module_name}")
 
         return r
 
-    def asserta(self, clause):
-        var_store = {}
-        if isinstance(clause, Atom):
-            swipl_object = _lit_to_swipy(clause, var_store)
-        else:
-            swipl_object = _cl_to_swipy(clause, var_store)
-
-        asserta = swipy.swipy_predicate("asserta", 1, None)
-        query = swipy.swipy_open_query(asserta, swipl_object)
-        r = swipy.swipy_next_solution(query)
-        swipy.swipy_close_query(query)
+    def _predicate(self, predicate: Union[Predicate, Tuple[str, int]]):
+        """
+        Returns the (cached) engine handle of the predicate, given as a pylo predicate or as (name, arity)
+        """
+        handle = self._predicate_handles.get(predicate)
+        if handle is None:
+            name, arity = predicate.signature() if isinstance(predicate, Predicate) else predicate
+            handle = swipy.swipy_predicate(name, arity, None)
+            self._predicate_handles[predicate] = handle
+        return handle
+
+    def _call_with_clause(self, predicate_name: str, clause: Union[Atom, Clause]):
+        writer = TermWriter(self._handles)
+        writer.clause(clause)
+
+        with _foreign_frame():
+            swipl_object, _ = _build_swipy(writer, 1)
+
+            predicate = self._predicate((predicate_name, 1))
+            query = swipy.swipy_open_query(predicate, swipl_object)
+            r = swipy.swipy_next_solution(query)
+            swipy.swipy_close_query(query)
 
         return r
 
+    def asserta(self, clause: Union[Atom, Clause]):
+        if not isinstance(clause, (Atom, Clause)):
+            raise Exception(f"can only asserta atoms or clauses (got {clause})")
+
+        return self._call_with_clause("asserta", clause)
+
     def assertz(self, clause: Union[Atom, Clause]):
-        var_store = {}
-        if isinstance(clause, Atom):
-            swipl_object = _lit_to_swipy(clause, var_store)
-        elif isinstance(clause, Clause):
-            swipl_object = _cl_to_swipy(clause, var_store)
-        else:
+        if not isinstance(clause, (Atom, Clause)):
             raise Exception(f"can only assertz atoms or clauses (got {clause})")
 
-        asserta = swipy.swipy_predicate("assertz", 1, None)
-        query = swipy.swipy_open_query(asserta, swipl_object)
-        r = swipy.swipy_next_solution(query)
-        swipy.swipy_close_query(query)
-
-        return r
+        return self._call_with_clause("assertz", clause)
 
     def retract(self, clause: Union[Atom, Clause]):
-        if isinstance(clause, Atom):
-            lit = _lit_to_swipy(clause, {})
-        else:
-            lit = _cl_to_swipy(clause, {})
+        return self._call_with_clause("retract", clause)
 
-        retract = swipy.swipy_predicate("retract", 1, None)
-        query = swipy.swipy_open_query(retract, lit)
-        r = swipy.swipy_next_solution(query)
-        swipy.swipy_close_query(query)
+    def _assertz_chunk(self, clauses: Sequence[Union[Atom, Clause]]):
+        # the whole chunk is built and asserted (PL_assert) in a single call
+        writer = TermWriter(self._handles)
+        for clause in clauses:
+            writer.clause(clause)
 
-        return r
+        return swipy.swipy_assertz_terms(len(clauses), writer.num_vars(), writer.ops, writer.atoms, writer.floats)
 
-    def has_solution(self, *query: Union[Atom, Not]):
-        var_store = {}
+    def _assertz_table_chunk(self, table: FactTable, start: int, end: int):
+        writer = TermWriter(self._handles)
+        writer.fact_table(table, start, end)
 
-        if len(query) == 1:
-            query = query[0]
-            predicate_name = query.get_predicate().get_name()
-            query_args = swipy.swipy_new_term_refs(query.get_predicate().get_arity())
+        return swipy.swipy_assertz_terms(end - start, writer.num_vars(), writer.ops, writer.atoms, writer.floats)
 
-            for ind, arg in enumerate(query.get_arguments()):
-                _to_swipy_ref(arg, query_args + ind, var_store)
+    def has_solution(self, *query: Union[Atom, Not]):
+        with _foreign_frame():
+            pred, query_args, _ = self._prepare_query(TermWriter(self._handles), *query)
 
-            pred = swipy.swipy_predicate(predicate_name, query.get_predicate().get_arity(), None)
             query = swipy.swipy_open_query(pred, query_args)
             r = swipy.swipy_next_solution(query)
             swipy.swipy_close_query(query)
 
-            return True if r else False
-        else:
-            swipy_objs = [_lit_to_swipy(x, var_store) if isinstance(x, Atom) else _neg_to_swipy(x, var_store) for x
-                          in query]
-            first = swipy_objs[0]
-            rest = _conjoin_literals(swipy_objs[1:])
-
-            compound_arg = swipy.swipy_new_term_refs(2)
-            swipy.swipy_put_term(compound_arg, first)
-            swipy.swipy_put_term(compound_arg + 1, rest)
-
-            predicate = swipy.swipy_predicate(",", 2, None)
-            query = swipy.swipy_open_query(predicate, compound_arg)
-            r = swipy.swipy_next_solution(query)
-            swipy.swipy_close_query(query)
-
-            return True if r else False
-
-    def _wrap_in_call_time(self, query, time):
-        """
-        Wraps the query in call_with_time_limit. Assumes that query is already translated to swipy
-        :param query:
-        :param time:
-        :return:
-        """
-        func_atm = swipy.swipy_new_atom("call_with_time_limit")
-        func = swipy.swipy_new_functor(func_atm, 2)
-
-        compound_arg = swipy.swipy_new_term_refs(2)
-        _num_to_swipy_ref(time, compound_arg)
-        swipy.swipy_put_term(compound_arg + 1, query)
-
-        final_term = swipy.swipy_new_term_ref()
-        swipy.swipy_cons_functor(final_term, func, compound_arg)
+        return True if r else False
 
-        return final_term
-
-    def _prepare_query(self, var_store, *query, max_time=None, max_depth=None, max_inference=None):
+    def _prepare_query(self, writer: TermWriter, *query, max_time=None, max_depth=None, max_inference=None):
         """
         Prepares the query
 
-        Return swipl-transformed predicate and arguments needed to posed the query to the engine
-
-        :param var_store:
-        :param query:
-        :param max_time:
-        :param max_depth:
-        :param max_inference:
-        :return:
-        """
-        if len(query) == 1:
-            query = query[0]
-
-            if not (max_time or max_depth or max_inference):
-                predicate_name = query.get_predicate().get_name()
-                query_args = swipy.swipy_new_term_refs(query.get_predicate().get_arity())
+        Writes the query (wrapped in the resource limits) and builds it in the engine
 
-                for ind, arg in enumerate(query.get_arguments()):
-                    _to_swipy_ref(arg, query_args + ind, var_store)
+        Arguments:
+            writer: term writer to use; variables of interest should already be indexed in it
+            query: literals to query
+            max_time, max_depth, max_inference: resource limits
 
-                pred = swipy.swipy_predicate(predicate_name, query.get_predicate().get_arity(), None)
-
-                return pred, query_args
+        Return:
+            swipl predicate, the first of its argument term refs and the first variable term ref
+        """
+        if not (max_time or max_depth or max_inference):
+            if len(query) == 1 and isinstance(query[0], Atom):
+                # call the predicate directly with the arguments of the literal
+                for arg in query[0].get_arguments():
+                    writer.term(arg)
+                predicate = query[0].get_predicate()
+            elif len(query) == 1:
+                writer.literal(query[0].get_atom())
+                predicate = ("\\+", 1)
             else:
-                query_term = _lit_to_swipy(query, var_store)
+                writer.literal(query[0])
+                writer.conjunction(query[1:])
+                predicate = (",", 2)
+        elif max_time:
+            # if time limit should be imposed on the query; exceeding it ends the query
+            writer.compound("call_with_time_limit", 2)
+            writer.term(max_time)
+            writer.conjunction(query)
+            writer.atom("time_limit_exceeded")
+            writer.atom("fail")
+            predicate = ("catch", 3)
+        else:
+            writer.conjunction(query)
+            writer.term(max_depth if max_depth else max_inference)
+            writer.fresh_var()
+            predicate = ("call_with_depth_limit", 3) if max_depth else ("call_with_inference_limit", 3)
+
+        arity = predicate.get_arity() if isinstance(predicate, Predicate) else predicate[1]
+        query_args, first_var = _build_swipy(writer, arity)
+        pred = self._predicate(predicate)
 
-                if max_time:
-                    # if time limit should be imposed on the query
+        return pred, query_args, first_var
 
-                    pred = swipy.swipy_predicate("call_with_time_limit", 2, None)
-                    query_args = swipy.swipy_new_term_refs(2)
+    def query(self, *query, **kwargs):
+        return [x for x in self.query_iter(*query, batch_size=QUERY_BATCH_SIZE, **kwargs)]
 
-                    swipy.swipy_put_integer(query_args, max_time)
-                    swipy.swipy_put_term(query_args+1, query_term)
+    def _solve_many(self, queries, decode: bool, max_solutions: int):
+        # all goals are built and solved in a single call
+        writer = TermWriter(self._handles)
+        var_starts, variables = writer.goals(queries)
+        var_counts = [len(x) for x in variables] if decode else [0] * len(variables)
 
-                    return pred, query_args
-                elif max_depth or max_inference:
-                    pred = swipy.swipy_predicate("call_with_depth_limit", 3, None) if max_depth else swipy.swipy_predicate("call_with_inference_limit", 3, None)
-                    query_args = swipy.swipy_new_term_refs(3)
-                    swipy.swipy_put_term(query_args, query_term)
+        return swipy.swipy_solve_many(len(variables), writer.num_vars(), writer.ops, writer.atoms, writer.floats,
+                                      var_starts, var_counts, max_solutions), variables
 
-                    if max_depth:
-                        _num_to_swipy_ref(max_depth, query_args + 1)
-                    else:
-                        _num_to_swipy_ref(max_inference, query_args + 1)
-                    swipy.swipy_put_variable(query_args + 2)
+    def has_solution_many(self, queries):
+        results, _ = self._solve_many(queries, False, 1)
 
-                    return pred, query_args
+        return [len(x) > 0 for x in results]
 
+    def query_many(self, queries, **kwargs):
+        if 'max_solutions' in kwargs:
+            max_solutions = kwargs['max_solutions']
         else:
-            swipy_objs = [_lit_to_swipy(x, var_store) if isinstance(x, Atom) else _neg_to_swipy(x, var_store) for x
-                          in query]
+            max_solutions = -1
 
-            if not (max_time or max_depth or max_inference):
-                first = swipy_objs[0]
-                rest = _conjoin_literals(swipy_objs[1:])
+        results, variables = self._solve_many(queries, True, max_solutions)
 
-                compound_arg = swipy.swipy_new_term_refs(2)
-                swipy.swipy_put_term(compound_arg, first)
-                swipy.swipy_put_term(compound_arg + 1, rest)
+        answers = []
+        for solutions, vars_of_interest in zip(results, variables):
+            answer = []
+            for solution in solutions:
+                decoded_vars = {}
+                answer.append(dict([(v, _decode_swipy(x, decoded_vars, self._ctx))
+                                    for v, x in zip(vars_of_interest, solution)]))
+            answers.append(answer)
 
-                predicate = swipy.swipy_predicate(",", 2, None)
+        return answers
 
-                return predicate, compound_arg
-            else:
-                query_term = _conjoin_literals(swipy_objs)
-
-                if max_time:
-                    # if time limit should be imposed on the query
-                    wrapped_term = self._wrap_in_call_time(query_term, max_time)
-                    exception = swipy.swipy_new_atom('time_limit_exceeded')
-                    fail = swipy.swipy_new_atom('fail')
-
-                    pred = swipy.swipy_predicate("catch", 3, None)
-                    query_args = swipy.swipy_new_term_refs(3)
-                    swipy.swipy_put_term(query_args, wrapped_term)
-                    swipy.swipy_put_term(query_args + 1, exception)
-                    swipy.swipy_put_term(query_args + 2, fail)
-
-                    return pred, query_args
-                elif max_depth or max_inference:
-                    pred = swipy.swipy_predicate("call_with_depth_limit", 3, None) if max_depth else swipy.swipy_predicate("call_with_inference_limit", 3, None)
-                    query_args = swipy.swipy_new_term_refs(3)
-                    swipy.swipy_put_term(query_args, query_term)
-
-                    if max_depth:
-                        _num_to_swipy_ref(max_depth, query_args + 1)
-                    else:
-                        _num_to_swipy_ref(max_inference, query_args + 1)
-                    swipy.swipy_put_variable(query_args + 2)
-
-                    return pred, query_args
+    def prepare(self, *query, **kwargs):
+        return SWIPreparedQuery(self, *query, **kwargs)
 
-    def query(self, *query, **kwargs):
+    def query_iter(self, *query, batch_size=1, **kwargs):
+        """
+        Lazily enumerates the solutions of the query
+
+        The query stays open in the engine while the solutions are consumed.
+        It is closed when the generator is exhausted, closed or garbage collected.
+        SWIPL allows only one open query at a time: close the generator before posing the next query.
+
+        Arguments:
+            query: literals to query
+            batch_size (int, default 1): number of solutions fetched and decoded in one call to the engine
+            max_solutions (int, optional): maximal number of solutions to enumerate
+            time_limit (int, optional): time limit for the query
+            depth_limit (int, optional): depth limit for the query
+            inference_limit (int, optional): inference limit for the query
+
+        Return:
+            generator of dictionaries mapping the query variables to their values
+        """
         if 'max_solutions' in kwargs:
             max_solutions = kwargs['max_solutions']
         else:
@@ -623,56 +445,31 @@ class SWIProlog(Prolog):
         vars_of_interest = [[y for y in x.get_arguments() if isinstance(y, Variable)] for x in query]
         vars_of_interest = reduce(lambda x, y: x + y, vars_of_interest, [])
         vars_of_interest = reduce(lambda x, y: x + [y] if y not in x else x, vars_of_interest, [])
-        var_store = {}
-        for v in vars_of_interest:
-            tmp_v = swipy.swipy_new_term_ref()
-            swipy.swipy_put_variable(tmp_v)
-            var_store[v] = tmp_v
-
-        # if len(query) == 1:
-        #     query = query[0]
-        #     predicate_name = query.get_predicate().get_name()
-        #     query_args = swipy.swipy_new_term_refs(query.get_predicate().get_arity())
-        #
-        #     for ind, arg in enumerate(query.get_arguments()):
-        #         _to_swipy_ref(arg, query_args + ind, var_store)
-        #
-        #     pred = swipy.swipy_predicate(predicate_name, query.get_predicate().get_arity(), None)
-        #     query = swipy.swipy_open_query(pred, query_args)
-        # else:
-        #     swipy_objs = [_lit_to_swipy(x, var_store) if isinstance(x, Atom) else _neg_to_swipy(x, var_store) for x
-        #                   in query]
-        #     first = swipy_objs[0]
-        #     rest = _conjoin_literals(swipy_objs[1:])
-        #
-        #     compound_arg = swipy.swipy_new_term_refs(2)
-        #     swipy.swipy_put_term(compound_arg, first)
-        #     swipy.swipy_put_term(compound_arg + 1, rest)
-        #
-        #     predicate = swipy.swipy_predicate(",", 2, None)
-        #     query = swipy.swipy_open_query(predicate, compound_arg)
-
-        pred, compound_arg = self._prepare_query(var_store, *query, max_time=time_limit, max_depth=inference_limit, max_inference=inference_limit)
-        query = swipy.swipy_open_query(pred, compound_arg)
-
-        r = swipy.swipy_next_solution(query)
-
-        all_solutions = []
-        var_index_var = dict([(var_store[v], v) for v in var_store])
-
-        while r and max_solutions != 0:
-            max_solutions -= 1
-
-            tmp_solution = {}
-            for var in var_store:
-                tmp_solution[var] = _read_swipy(var_store[var], swipy_term_to_var=var_index_var)
-
-            all_solutions.append(tmp_solution)
-            r = swipy.swipy_next_solution(query)
-
-        swipy.swipy_close_query(query)
 
-        return all_solutions
+        # variables of interest take the first variable slots so that a solution is decoded in a single call
+        writer = TermWriter(self._handles, dict([(v, ind) for ind, v in enumerate(vars_of_interest)]))
+
+        # the frame releases the term refs of the query once the query is closed
+        with _foreign_frame():
+            pred, compound_arg, first_var = self._prepare_query(writer, *query, max_time=time_limit, max_depth=depth_limit, max_inference=inference_limit)
+            query = swipy.swipy_open_query(pred, compound_arg)
+
+            try:
+                while max_solutions != 0:
+                    to_fetch = batch_size if max_solutions < 0 else min(batch_size, max_solutions)
+                    solutions = swipy.swipy_next_solutions(query, first_var, len(vars_of_interest), to_fetch)
+
+                    for solution in solutions:
+                        decoded_vars = {}
+                        yield dict([(v, _decode_swipy(x, decoded_vars, self._ctx))
+                                    for v, x in zip(vars_of_interest, solution)])
+
+                    if len(solutions) < to_fetch:
+                        break
+                    elif max_solutions > 0:
+                        max_solutions -= len(solutions)
+            finally:
+                swipy.swipy_close_query(query)
 
     def _callback(self, arity):
         res = self._callback_arities.get(arity)
@@ -1,9 +1,11 @@
 # from src.pylo import (
 #     Prolog
 # )
-from pylo.language.lp import Constant, Variable, Functor, Structure, List, Predicate, Atom, Not, Clause, \
-    c_var, c_pred, c_functor, c_const, c_symbol, Pair
+from pylo.language.lp import Variable, List, Predicate, Atom, Not, Clause, \
+    c_var, c_pred, c_functor, Pair, FactTable
 from pylo.engines.prolog.prologsolver import Prolog
+from pylo.language.commons import Context
+from pylo.engines.prolog.prolog_utils import TermWriter, SymbolHandles, decode_term
 #from pylo.language.lp import Variable, Structure, List, Atom, Clause, c_var, c_pred, c_functor, c_const, c_symbol
 import sys
 
@@ -13,97 +15,33 @@ wrap_path = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(wrap_path + "/../../../build")
 
 import pyxsb
-from typing import Union
+from typing import Union, Sequence, Dict
 from functools import reduce
 
 
-def _is_list(term: str):
-    return term.startswith('[')
+# number of solutions fetched from the engine in a single call by query()
+QUERY_BATCH_SIZE = 256
 
 
-def _is_structure(term: str):
-    first_bracket = term.find('(')
-
-    if first_bracket == -1:
-        return False
-    else:
-        tmp = term[:first_bracket]
-        return all([x.isalnum() for x in tmp]) and tmp[0].isalpha()
-
-
-def _pyxsb_string_to_const_or_var(term: str):
-    if term[0].islower():
-        return c_const(term)
-    elif term.isnumeric():
-        if '.' in term:
-            return float(term)
-        else:
-            return int(term)
-    else:
-        return c_var(term)
-
-
-def _extract_arguments_from_compound(term: str):
-    if _is_list(term):
-        term = term[1:-1]  # remove '[' and ']'
-    else:
-        first_bracket = term.find('(')
-        term = term[first_bracket+1:-1] # remove outer brackets
-
-    args = []
-    open_brackets = 0
-    last_open_char = 0
-    for i in range(len(term)):
-        char = term[i]
-        if term[i] in ['(', '[']:
-            open_brackets += 1
-        elif term[i] in [')', ']']:
-            open_brackets -= 1
-        elif term[i] == ',' and open_brackets == 0:
-            args.append(term[last_open_char:i])
-            last_open_char = i + 1
-        elif i == len(term) - 1:
-            args.append(term[last_open_char:])
-        else:
-            pass
-
-    return args
-
-
-def _pyxsb_string_to_structure(term: str):
-    first_bracket = term.find('(')
-    functor = term[:first_bracket]
-    args = [_pyxsb_string_to_pylo(x) for x in _extract_arguments_from_compound(term)]
-    functor = c_symbol(functor, arity=len(args))
-
-    return Structure(functor, args)
-
-
-def _pyxsb_string_to_list(term: str):
-    args = [_pyxsb_string_to_pylo(x) for x in _extract_arguments_from_compound(term)]
-    return List(args)
-
-
-def _pyxsb_string_to_pylo(term: str):
-    if _is_list(term):
-        return _pyxsb_string_to_list(term)
-    elif _is_structure(term):
-        return _pyxsb_string_to_structure(term)
-    else:
-        return _pyxsb_string_to_const_or_var(term)
+def _decode_pyxsb(encoded, decoded_vars: Dict[int, Variable], ctx: Context = None):
+    # see decode_term, with the tags of binding_xsbprolog.cpp
+    return decode_term(encoded, decoded_vars, pyxsb, ctx)
 
 
 class XSBProlog(Prolog):
 
-    def __init__(self, exec_path=None):
+    def __init__(self, exec_path=None, ctx: Context = None):
         if exec_path is None:
             exec_path = os.getenv('XSB_HOME', None)
             raise Exception(f"Cannot find XSB_HOME environment variable")
         pyxsb.pyxsb_init_string(exec_path)
-        super().__init__()
+        # XSB creates atoms from their names, so the handle of an atom is its name
+        self._handles = SymbolHandles(str)
+        super().__init__(ctx)
 
     def release(self):
         if not self.is_released:
+            self._handles.invalidate()
             pyxsb.pyxsb_close()
             self.is_released: bool = True
 
@@ -119,39 +57,73 @@ class XSBProlog(Prolog):
         command = f"use_module({module},[{','.join([x.get_name() + '/' + str(x.get_arity()) for x in predicates])}])."
         return pyxsb.pyxsb_command_string(command)
 
+    def _call_with_clause(self, predicate_name: str, clause: Union[Atom, Clause]):
+        writer = TermWriter(self._handles)
+        writer.compound(predicate_name, 1)
+        writer.clause(clause)
+
+        return pyxsb.pyxsb_command_terms(writer.num_vars(), writer.ops, writer.atoms, writer.floats)
+
     def asserta(self, clause: Union[Clause, Atom]):
-        if isinstance(clause, Atom):
-            query = f"asserta({clause})."
-            return pyxsb.pyxsb_command_string(query)
-        else:
-            query = f"asserta(({clause}))."
-            return pyxsb.pyxsb_command_string(query)
+        return self._call_with_clause("asserta", clause)
 
     def assertz(self, clause: Union[Atom, Clause]):
-        if isinstance(clause, Atom):
-            query = f"assertz({clause})."
-            return pyxsb.pyxsb_command_string(query)
-        else:
-            query = f"assertz(({clause}))."
-            return pyxsb.pyxsb_command_string(query)
+        return self._call_with_clause("assertz", clause)
+
+    def _assertz_chunk(self, clauses: Sequence[Union[Atom, Clause]]):
+        # the whole chunk is built and asserted in a single call
+        writer = TermWriter(self._handles)
+        for clause in clauses:
+            writer.clause(clause)
+
+        res = pyxsb.pyxsb_assertz_terms(len(clauses), writer.num_vars(), writer.ops, writer.atoms, writer.floats)
+        if res != len(clauses):
+            raise Exception(f"could only assert {res} out of {len(clauses)} clauses of the chunk")
+
+        return res
+
+    def _assertz_table_chunk(self, table: FactTable, start: int, end: int):
+        writer = TermWriter(self._handles)
+        writer.fact_table(table, start, end)
+
+        res = pyxsb.pyxsb_assertz_terms(end - start, writer.num_vars(), writer.ops, writer.atoms, writer.floats)
+        if res != end - start:
+            raise Exception(f"could only assert {res} out of {end - start} facts of the chunk")
+
+        return res
 
     def retract(self, clause: Union[Atom, Clause]):
-        if isinstance(clause, Atom):
-            return pyxsb.pyxsb_command_string(f"retract({clause}).")
-        else:
-            return pyxsb.pyxsb_command_string(f"retract(({clause})).")
+        return self._call_with_clause("retract", clause)
 
-    def has_solution(self, *query: Atom):
-        #assert not all([x.is_ground() for x in query]), "XSB Prolog currently cannot query ground queries"
-        string_repr = ','.join([str(x) for x in query])
-        res = pyxsb.pyxsb_query_string(f"{string_repr}.")
+    def has_solution(self, *query: Union[Atom, Not]):
+        writer = TermWriter(self._handles)
+        writer.conjunction(query)
 
-        if res:
-            pyxsb.pyxsb_close_query()
+        res = pyxsb.pyxsb_open_query(writer.num_vars(), writer.ops, writer.atoms, writer.floats, 0)
+        pyxsb.pyxsb_end_query()
 
-        return True if res else False
+        return True if res == pyxsb.SUCCESS else False
 
     def query(self, *query, **kwargs):
+        return [x for x in self.query_iter(*query, batch_size=QUERY_BATCH_SIZE, **kwargs)]
+
+    def query_iter(self, *query, batch_size=1, **kwargs):
+        """
+        Lazily enumerates the solutions of the query
+
+        The query stays open in the engine while the solutions are consumed.
+        It is closed when the generator is exhausted, closed or garbage collected.
+        XSB allows only one open query at a time: close the generator before posing the next query.
+
+        Arguments:
+            query: literals to query
+            batch_size (int, default 1): number of solutions fetched and decoded in one call to the engine
+            max_solutions (int, optional): maximal number of solutions to enumerate
+            time_limit (int, optional): time limit for the query
+
+        Return:
+            generator of dictionaries mapping the query variables to their values
+        """
         if 'max_solutions' in kwargs:
             max_solutions = kwargs['max_solutions']
         else:
@@ -165,26 +137,78 @@ class XSBProlog(Prolog):
         vars_of_interest = [[y for y in x.get_arguments() if isinstance(y, Variable)] for x in query]
         vars_of_interest = reduce(lambda x, y: x + y, vars_of_interest, [])
         vars_of_interest = reduce(lambda x, y: x + [y] if y not in x else x, vars_of_interest, [])
-
-        string_repr = ','.join([str(x) for x in query])
+        # variables of interest take the first variable slots
+        writer = TermWriter(self._handles, dict([(v, ind) for ind, v in enumerate(vars_of_interest)]))
 
         if time_limit:
-            res = pyxsb.pyxsb_query_string(f"timed_call(({string_repr}),[max({time_limit},fail)]).")
+            # timed_call(Goal, [max(TimeLimit, fail)])
+            writer.compound("timed_call", 2)
+            writer.conjunction(query)
+            writer.list(1)
+            writer.compound("max", 2)
+            writer.term(time_limit)
+            writer.atom("fail")
         else:
-            res = pyxsb.pyxsb_query_string(f"{string_repr}.")
+            writer.conjunction(query)
+
+        try:
+            res = pyxsb.pyxsb_open_query(writer.num_vars(), writer.ops, writer.atoms, writer.floats,
+                                         len(vars_of_interest))
+
+            # the first solution is found by the query itself, the rest is fetched in batches
+            solutions = [pyxsb.pyxsb_read_answer(len(vars_of_interest))] if res == pyxsb.SUCCESS else []
+            to_fetch = 1
+
+            while solutions and max_solutions != 0:
+                for solution in solutions[:max_solutions] if max_solutions > 0 else solutions:
+                    decoded_vars = {}
+                    yield dict([(v, _decode_pyxsb(x, decoded_vars, self._ctx))
+                                for v, x in zip(vars_of_interest, solution)])
+
+                if max_solutions > 0:
+                    max_solutions = max(max_solutions - len(solutions), 0)
 
-        all_solutions = []
-        while res and max_solutions != 0:
-            vals = [x for x in res.strip().split(";")]
-            var_assignments = [_pyxsb_string_to_pylo(x) for x in vals]
-            all_solutions.append(dict([(v, s) for v, s in zip(vars_of_interest, var_assignments)]))
+                if len(solutions) < to_fetch or max_solutions == 0:
+                    # no more solutions in the engine
+                    break
+
+                to_fetch = batch_size if max_solutions < 0 else min(batch_size, max_solutions)
+                solutions = pyxsb.pyxsb_next_solutions(len(vars_of_interest), to_fetch)
+        finally:
+            pyxsb.pyxsb_end_query()
+
+    def _solve_many(self, queries, decode: bool, max_solutions: int):
+        # all goals are built and solved in a single call
+        writer = TermWriter(self._handles)
+        var_starts, variables = writer.goals(queries)
+        var_counts = [len(x) for x in variables] if decode else [0] * len(variables)
+
+        return pyxsb.pyxsb_solve_many(len(variables), writer.num_vars(), writer.ops, writer.atoms, writer.floats,
+                                      var_starts, var_counts, max_solutions), variables
+
+    def has_solution_many(self, queries):
+        results, _ = self._solve_many(queries, False, 1)
+
+        return [len(x) > 0 for x in results]
+
+    def query_many(self, queries, **kwargs):
+        if 'max_solutions' in kwargs:
+            max_solutions = kwargs['max_solutions']
+        else:
+            max_solutions = -1
 
-            res = pyxsb.pyxsb_next_string()
-            max_solutions -= 1
+        results, variables = self._solve_many(queries, True, max_solutions)
 
-        pyxsb.pyxsb_close_query()
+        answers = []
+        for solutions, vars_of_interest in zip(results, variables):
+            answer = []
+            for solution in solutions:
+                decoded_vars = {}
+                answer.append(dict([(v, _decode_pyxsb(x, decoded_vars, self._ctx))
+                                    for v, x in zip(vars_of_interest, solution)]))
+            answers.append(answer)
 
-        return all_solutions
+        return answers
 
     def register_foreign(self, pyfunction, arity):
         raise Exception("support for foreign predicates not supported yet")
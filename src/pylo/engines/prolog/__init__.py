@@ -13,5 +13,5 @@ try:
 except Exception:
     pass
 
-from .prologsolver import Prolog
+from .prologsolver import Prolog, PreparedQuery
 
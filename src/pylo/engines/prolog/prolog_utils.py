@@ -0,0 +1,322 @@
+from typing import Dict, Sequence, Union, Tuple, Callable, List as TList
+from functools import reduce
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from pylo.language.commons import Context
+from pylo.language.lp import Constant, Variable, Structure, List, Pair, Predicate, Literal, Atom, Not, Clause, \
+    FactTable, c_const, c_functor
+
+# Opcodes of the flattened (preorder) description of terms that the bindings build in a single call
+#     (mirrored in binding_swipl.cpp, binding_gprolog.cpp and binding_xsbprolog.cpp)
+OP_ATOM = 0  # OP_ATOM, atom index
+OP_INT = 1  # OP_INT, value
+OP_FLOAT = 2  # OP_FLOAT, float index
+OP_VAR = 3  # OP_VAR, variable index
+OP_COMPOUND = 4  # OP_COMPOUND, atom index, arity, arg_1, ..., arg_N
+OP_LIST = 5  # OP_LIST, length, elem_1, ..., elem_N
+OP_PAIR = 6  # OP_PAIR, head, tail
+
+
+def decoded_var(index: int, decoded_vars: Dict[int, Variable]) -> Variable:
+    if index not in decoded_vars:
+        all_var_names = set([x.get_name() for x in decoded_vars.values()])
+        new_name = [chr(x) for x in range(ord('A'), ord('Z') + 1) if chr(x) not in all_var_names]
+        if len(new_name) == 0:
+            new_name = [f"{chr(x)}{chr(y)}" for x in range(ord('A'), ord('Z') + 1) for y in
+                        range(ord('A'), ord('Z') + 1) if f"{chr(x)}{chr(y)}" not in all_var_names]
+        decoded_vars[index] = Variable(new_name[0])
+
+    return decoded_vars[index]
+
+
+def decode_term(encoded, decoded_vars: Dict[int, Variable], tags, ctx: Context = None):
+    """
+    Turns the compact encoding of a term read by the bindings (swipy_read_term(s), pygp_Read_Term(s),
+        pyxsb_read_answer) into pylo objects
+
+    Constants and functors are created in the context, whose intern table keeps the decoded symbols
+        (with the policy of the context), so there is no cache here.
+
+    Arguments:
+        encoded: encoded term (see binding_swipl.cpp, binding_gprolog.cpp and binding_xsbprolog.cpp)
+        decoded_vars: variables decoded so far, indexed by their position in the encoding
+        tags: module of the binding, with the tags of the encoding (DECODE_COMPOUND, ...)
+        ctx (optional): context of the symbols (global context by default)
+    """
+    if isinstance(encoded, str):
+        return c_const(encoded if encoded and encoded[0].islower() else f"\"{encoded}\"", ctx=ctx)
+    elif isinstance(encoded, (int, float)):
+        return encoded
+
+    tag = encoded[0]
+    if tag == tags.DECODE_COMPOUND:
+        return Structure(c_functor(encoded[1], len(encoded) - 2, ctx=ctx),
+                         [decode_term(x, decoded_vars, tags, ctx) for x in encoded[2:]])
+    elif tag == tags.DECODE_LIST:
+        return List([decode_term(x, decoded_vars, tags, ctx) for x in encoded[1]])
+    elif tag == tags.DECODE_VAR:
+        return decoded_var(encoded[1], decoded_vars)
+    elif tag == tags.DECODE_PAIR:
+        return Pair(decode_term(encoded[1], decoded_vars, tags, ctx), decode_term(encoded[2], decoded_vars, tags, ctx))
+    elif tag == getattr(tags, "DECODE_STRING", None):
+        return c_const(encoded[1], ctx=ctx)
+    else:
+        raise Exception(f"Unknown encoded term {encoded}")
+
+
+class SymbolHandles:
+    """
+    Per-engine cache of the engine handles of symbols (atoms of constants, functors and predicates)
+
+    Handles are looked up by the pylo symbol (constants and predicates) or by name,
+    so that encoding a term does a dictionary lookup instead of a lookup in the engine's atom table.
+
+    Arguments:
+        create: function creating the handle of an atom from its name
+        release (optional): function releasing a handle when the cache is invalidated
+    """
+
+    def __init__(self, create: Callable[[str], int], release: Callable[[int], None] = None):
+        self._create = create
+        self._release = release
+        self._by_name: Dict[str, int] = {}
+        self._by_symbol: Dict[Union[Constant, Predicate], int] = {}
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def name(self, name: str) -> int:
+        handle = self._by_name.get(name)
+        if handle is None:
+            handle = self._create(name)
+            self._by_name[name] = handle
+        return handle
+
+    def symbol(self, symbol: Union[Constant, Predicate]) -> int:
+        handle = self._by_symbol.get(symbol)
+        if handle is None:
+            handle = self.name(symbol.get_name())
+            self._by_symbol[symbol] = handle
+        return handle
+
+    def invalidate(self) -> None:
+        """
+        Forgets (and releases) all handles; needs to be called when the engine is released
+        """
+        if self._release is not None:
+            for handle in self._by_name.values():
+                self._release(handle)
+        self._by_name = {}
+        self._by_symbol = {}
+
+
+class TermWriter:
+    """
+    Flattens pylo terms, literals and clauses into a preorder sequence of opcodes,
+    together with the table of atom handles and floats they refer to.
+    The bindings build all written terms from it in a single call.
+
+    Arguments:
+        handles: engine handles of the atoms
+        var_index (optional): variables with pre-assigned indices
+                              (the variables of interest of a query come first, so that they occupy consecutive slots)
+    """
+
+    def __init__(self, handles: SymbolHandles, var_index: Dict[Variable, int] = None):
+        self.ops = []
+        self.atoms = []
+        self.floats = []
+        self.var_index: Dict[Variable, int] = {} if var_index is None else dict(var_index)
+        self._handles = handles
+        self._atom_index: Dict[int, int] = {}
+        self._num_vars = len(self.var_index)
+
+    def num_vars(self) -> int:
+        """
+        Returns the number of variable slots the written terms need
+        """
+        return self._num_vars
+
+    def _index(self, handle: int) -> int:
+        ind = self._atom_index.get(handle)
+        if ind is None:
+            ind = len(self.atoms)
+            self._atom_index[handle] = ind
+            self.atoms.append(handle)
+        return ind
+
+    def _atom(self, name: str) -> int:
+        return self._index(self._handles.name(name))
+
+    def atom(self, name: str) -> None:
+        self.ops += (OP_ATOM, self._atom(name))
+
+    def compound(self, name: str, arity: int) -> None:
+        """
+        Starts a compound term; its arguments are the next `arity` terms written
+        """
+        self.ops += (OP_COMPOUND, self._atom(name), arity)
+
+    def list(self, length: int) -> None:
+        """
+        Starts a proper list; its elements are the next `length` terms written
+        """
+        self.ops += (OP_LIST, length)
+
+    def fresh_var(self) -> None:
+        """
+        Writes a variable that does not correspond to any pylo variable
+        """
+        self.ops += (OP_VAR, self._num_vars)
+        self._num_vars += 1
+
+    def new_scope(self, variables: Sequence[Variable] = ()) -> int:
+        """
+        Starts a new variable scope: terms written next do not share variables with the terms written before
+
+        Arguments:
+            variables: variables that take consecutive slots at the start of the scope
+
+        Return:
+            the first variable slot of the scope
+        """
+        first = self._num_vars
+        self.var_index = dict([(v, first + ind) for ind, v in enumerate(variables)])
+        self._num_vars += len(variables)
+
+        return first
+
+    def term(self, item: Union[Constant, Variable, Structure, int, float]) -> None:
+        if isinstance(item, Constant):
+            self.ops += (OP_ATOM, self._index(self._handles.symbol(item)))
+        elif isinstance(item, Variable):
+            ind = self.var_index.get(item)
+            if ind is None:
+                ind = self._num_vars
+                self.var_index[item] = ind
+                self._num_vars += 1
+            self.ops += (OP_VAR, ind)
+        elif isinstance(item, int):
+            self.ops += (OP_INT, item)
+        elif isinstance(item, float):
+            self.ops += (OP_FLOAT, len(self.floats))
+            self.floats.append(item)
+        elif isinstance(item, List):
+            args = item.get_arguments()
+            self.ops += (OP_LIST, len(args))
+            for arg in args:
+                self.term(arg)
+        elif isinstance(item, Pair):
+            self.ops.append(OP_PAIR)
+            self.term(item.get_left())
+            self.term(item.get_right())
+        elif isinstance(item, Structure):
+            args = item.get_arguments()
+            self.compound(item.get_functor().get_name(), len(args))
+            for arg in args:
+                self.term(arg)
+        else:
+            raise Exception(f"don't know how to write {item} ({type(item)})")
+
+    def literal(self, item: Union[Atom, Not]) -> None:
+        if isinstance(item, Not):
+            self.compound("\\+", 1)
+            item = item.get_atom()
+
+        predicate = item.get_predicate()
+        if predicate.get_arity() == 0:
+            self.ops += (OP_ATOM, self._index(self._handles.symbol(predicate)))
+        else:
+            self.ops += (OP_COMPOUND, self._index(self._handles.symbol(predicate)), predicate.get_arity())
+            for arg in item.get_arguments():
+                self.term(arg)
+
+    def fact_table(self, table: FactTable, start: int = 0, end: int = None) -> None:
+        """
+        Writes the facts of the table from start to end, directly from its columns of constant ids
+            (every distinct constant of the chunk is looked up once)
+        """
+        end = len(table) if end is None else end
+        predicate = table.get_predicate()
+        arity = predicate.get_arity()
+        pred_index = self._index(self._handles.symbol(predicate))
+
+        if arity == 0:
+            self.ops += (OP_ATOM, pred_index) * (end - start)
+            return
+
+        rows = np.empty((end - start, 3 + 2 * arity), dtype=np.int64)
+        rows[:, 0] = OP_COMPOUND
+        rows[:, 1] = pred_index
+        rows[:, 2] = arity
+        for pos in range(arity):
+            codes, inverse = np.unique(table.column(pos)[start:end], return_inverse=True)
+            atoms = np.asarray([self._atom(x) for x in table.names(pos, codes)], dtype=np.int64)
+            rows[:, 3 + 2 * pos] = OP_ATOM
+            rows[:, 4 + 2 * pos] = atoms[inverse.reshape(-1)]
+
+        self.ops += rows.ravel().tolist()
+
+    def conjunction(self, literals: Sequence[Union[Atom, Not]]) -> None:
+        for lit in literals[:-1]:
+            self.compound(",", 2)
+            self.literal(lit)
+        self.literal(literals[-1])
+
+    def goals(self, queries: Sequence[Union[Literal, Sequence[Literal]]]) -> Tuple[TList[int], TList[TList[Variable]]]:
+        """
+        Writes every query as a single goal, each in its own variable scope
+
+        Arguments:
+            queries: literals or lists of literals (interpreted as conjunctions)
+
+        Return:
+            the first variable slot of every goal,
+            and the variables of interest of every goal (occupying consecutive slots from the first one)
+        """
+        var_starts = []
+        variables = []
+        for query in queries:
+            query = [query] if isinstance(query, Literal) else list(query)
+            vars_of_interest = [[y for y in x.get_arguments() if isinstance(y, Variable)] for x in query]
+            vars_of_interest = reduce(lambda x, y: x + y, vars_of_interest, [])
+            vars_of_interest = reduce(lambda x, y: x + [y] if y not in x else x, vars_of_interest, [])
+
+            var_starts.append(self.new_scope(vars_of_interest))
+            variables.append(vars_of_interest)
+            self.conjunction(query)
+
+        return var_starts, variables
+
+    def clause(self, item: Union[Atom, Clause]) -> None:
+        if isinstance(item, Atom):
+            self.literal(item)
+        elif isinstance(item, Clause):
+            if len(item) == 0:
+                self.literal(item.get_head())
+            else:
+                self.compound(":-", 2)
+                self.literal(item.get_head())
+                self.conjunction(item.get_body().get_literals())
+        else:
+            raise Exception(f"can only write atoms or clauses (got {item})")
+
+    def parameters(self, bindings: Dict[Variable, Union[Constant, Structure, str, int, float]]) -> TList[int]:
+        """
+        Writes the values of the parameters of a prepared query (strings are names of constants)
+
+        Return:
+            the variable slots of the parameters, in the order of the written values
+        """
+        slots = []
+        for var, value in bindings.items():
+            if var not in self.var_index:
+                raise Exception(f"{var} is not a variable of the prepared query")
+            slots.append(self.var_index[var])
+            self.term(c_const(value) if isinstance(value, str) else value)
+
+        return slots
@@ -1,11 +1,78 @@
 from abc import ABC, abstractmethod
+from typing import Iterable, Sequence, Dict, List, Union
+from functools import reduce
+import time
+
+from pylo.language.commons import Context, global_context
+from pylo.language.lp import Variable, Literal, FactTable, c_const
+
+
+class PreparedQuery:
+    """
+    A query prepared once and posed many times with different values of its parameters
+
+    Any variable of the query can act as a parameter: run and exists take the values of (some of) the variables.
+    This generic version substitutes the values into the query and poses it to the solver;
+    engines override it to build the query once and only bind the parameter slots on every call.
+
+    Arguments:
+        solver: engine the query is posed to
+        query: literals of the query
+        kwargs: arguments of the query (max_solutions, time_limit, ...)
+    """
+
+    def __init__(self, solver: "Prolog", *query, **kwargs):
+        self._solver = solver
+        self._query = query
+        self._kwargs = kwargs
+
+        variables = [[y for y in x.get_arguments() if isinstance(y, Variable)] for x in query]
+        variables = reduce(lambda x, y: x + y, variables, [])
+        self._variables: Sequence[Variable] = reduce(lambda x, y: x + [y] if y not in x else x, variables, [])
+
+    def get_variables(self) -> Sequence[Variable]:
+        return self._variables
+
+    def _max_solutions(self, kwargs) -> int:
+        if 'max_solutions' in kwargs:
+            return kwargs['max_solutions']
+        elif 'max_solutions' in self._kwargs:
+            return self._kwargs['max_solutions']
+        else:
+            return -1
+
+    def run(self, bindings: Dict[Variable, object] = None, **kwargs) -> List[Dict]:
+        """
+        Poses the query with the parameters bound to the given values
+
+        Arguments:
+            bindings: values of the parameters (terms, numbers, or names of constants)
+            max_solutions (int, optional): overrides the maximal number of solutions given when preparing
+
+        Return:
+            list of dictionaries mapping the unbound variables of the query to their values
+        """
+        bindings = {} if bindings is None else bindings
+        term_map = dict([(v, c_const(x) if isinstance(x, str) else x) for v, x in bindings.items()])
+        query = [x.substitute(term_map) for x in self._query]
+
+        return self._solver.query(*query, **{**self._kwargs, 'max_solutions': self._max_solutions(kwargs)})
+
+    def exists(self, bindings: Dict[Variable, object] = None) -> bool:
+        """
+        Checks whether the query has a solution with the parameters bound to the given values
+        """
+        return len(self.run(bindings, max_solutions=1)) > 0
+
 
 
 class Prolog(ABC):
 
     @abstractmethod
-    def __init__(self):
+    def __init__(self, ctx: Context = None):
         self.is_released: bool = False
+        # context the symbols of the solutions are created in
+        self._ctx: Context = global_context if ctx is None else ctx
 
     @abstractmethod
     def release(self):
@@ -27,6 +94,99 @@ class Prolog(ABC):
     def assertz(self, clause):
         pass
 
+    def assertz_many(self, clauses: Union[Iterable, FactTable], chunk_size: int = 1000) -> Dict[str, float]:
+        """
+        Asserts many clauses (at the end), passing them to the engine in chunks
+
+        Arguments:
+            clauses: iterable of atoms or clauses; consumed lazily, one chunk at a time
+                     or a fact table, whose facts are written from the columns (without creating atoms)
+            chunk_size: number of clauses passed to the engine at once
+
+        Return:
+            throughput statistics: number of asserted clauses, number of chunks, seconds and clauses per second
+        """
+        start = time.perf_counter()
+        asserted = 0
+        chunks = 0
+        chunk = []
+
+        if isinstance(clauses, FactTable):
+            for ind in range(0, len(clauses), chunk_size):
+                asserted += self._assertz_table_chunk(clauses, ind, min(ind + chunk_size, len(clauses)))
+                chunks += 1
+            clauses = []
+
+        for clause in clauses:
+            chunk.append(clause)
+            if len(chunk) == chunk_size:
+                asserted += self._assertz_chunk(chunk)
+                chunks += 1
+                chunk = []
+
+        if chunk:
+            asserted += self._assertz_chunk(chunk)
+            chunks += 1
+
+        seconds = time.perf_counter() - start
+
+        return {
+            'clauses': asserted,
+            'chunks': chunks,
+            'seconds': seconds,
+            'clauses_per_second': asserted / seconds if seconds > 0 else float('inf')
+        }
+
+    def load_facts(self, predicate, rows: Union[Iterable[Sequence], FactTable], chunk_size: int = 1000) -> Dict[str, float]:
+        """
+        Asserts a fact of the predicate for every row of arguments
+
+        Arguments:
+            predicate: predicate of the facts
+            rows: iterable of argument tuples (constants, numbers, or structures), or a fact table of the predicate
+            chunk_size: number of facts passed to the engine at once
+
+        Return:
+            throughput statistics (see assertz_many)
+        """
+        if isinstance(rows, FactTable):
+            if rows.get_predicate() != predicate:
+                raise Exception(f"the facts of the table are not facts of {predicate}")
+            return self.assertz_many(rows, chunk_size=chunk_size)
+
+        return self.assertz_many((predicate(*row) for row in rows), chunk_size=chunk_size)
+
+    def prepare(self, *query, **kwargs) -> PreparedQuery:
+        """
+        Prepares the query to be posed many times with different values of its variables
+
+        Arguments:
+            query: literals of the query
+            kwargs: arguments of the query, as for query(...)
+
+        Return:
+            prepared query; see PreparedQuery.run and PreparedQuery.exists
+        """
+        return PreparedQuery(self, *query, **kwargs)
+
+    def _assertz_chunk(self, clauses: Sequence) -> int:
+        """
+        Asserts a chunk of clauses; engines override it with their fastest bulk path
+
+        Return:
+            number of asserted clauses
+        """
+        return sum([1 for x in clauses if self.assertz(x)])
+
+    def _assertz_table_chunk(self, table: FactTable, start: int, end: int) -> int:
+        """
+        Asserts the facts of the table from start to end; engines override it to write them from the columns
+
+        Return:
+            number of asserted facts
+        """
+        return self._assertz_chunk([table[x] for x in range(start, end)])
+
     @abstractmethod
     def retract(selfself, clause):
         pass
@@ -39,6 +199,35 @@ class Prolog(ABC):
     def query(self, *query, **kwargs):
         pass
 
+    @abstractmethod
+    def query_iter(self, *query, **kwargs):
+        pass
+
+    def has_solution_many(self, queries: Sequence) -> List[bool]:
+        """
+        Checks many queries at once; engines pose all of them in a single call
+
+        Arguments:
+            queries: literals or lists of literals (interpreted as conjunctions)
+
+        Return:
+            True/False for every query
+        """
+        return [self.has_solution(*([x] if isinstance(x, Literal) else x)) for x in queries]
+
+    def query_many(self, queries: Sequence, **kwargs) -> List[List[Dict]]:
+        """
+        Poses many queries at once; engines pose all of them in a single call
+
+        Arguments:
+            queries: literals or lists of literals (interpreted as conjunctions)
+            max_solutions (int, optional): maximal number of solutions per query
+
+        Return:
+            list of solutions (as in query(...)) for every query
+        """
+        return [self.query(*([x] if isinstance(x, Literal) else x), **kwargs) for x in queries]
+
     @abstractmethod
     def register_foreign(self, pyfunction, arity):
         pass
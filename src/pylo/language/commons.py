@@ -1,7 +1,9 @@
+import weakref
 from abc import ABC
+from collections import OrderedDict, Counter
 from dataclasses import dataclass
 from functools import reduce
-from typing import Dict, Tuple, Sequence, Set, Union
+from typing import Dict, Tuple, Sequence, Set, Union, Iterable
 
 import kanren
 import z3
@@ -13,12 +15,29 @@ LP = 1
 FOL = 2
 KANREN_LOGPY = "logpy"
 
+# interning policies of the Context tables
+INTERN_STRONG = "strong"  # interned objects live as long as the context
+INTERN_WEAK = "weak"  # interned objects live as long as they are used elsewhere
+INTERN_LRU = "lru"  # as weak, but the most recently used objects are kept alive (up to a maximal number)
+
 
 class Type:
-    def __init__(self, name: str):
+    def __init__(self, name: str, weak_elements: bool = False):
         self.name = name
-        self.elements = set()
+        self.elements = weakref.WeakSet() if weak_elements else set()
         self._engine_objects = {}
+        self._num_ids = 0
+        self._sid: int = None
+
+    def new_id(self) -> int:
+        """
+        Returns a new id for an element of the type (ids are never reused)
+        """
+        self._num_ids += 1
+        return self._num_ids - 1
+
+    def set_weak_elements(self, weak: bool) -> None:
+        self.elements = weakref.WeakSet(self.elements) if weak else set(self.elements)
 
     def add(self, elem):
         self.elements.add(elem)
@@ -49,7 +68,8 @@ class Type:
         return self.name
 
     def __len__(self):
-        return len(self.elements)
+        # number of ids given to the elements, so that every id fits
+        return max(self._num_ids, len(self.elements))
 
     def __eq__(self, other):
         if isinstance(self, type(other)):
@@ -64,7 +84,12 @@ class Type:
 class Term:
     """
         Term base class. A common base class for Predicate, Constant, Variable and Functor symbols.
+
+        Terms are created in large numbers, so they keep their attributes in slots;
+        the engine objects are only allocated once the term is added to an engine.
+        Symbols interned by a Context get a dense integer id (None otherwise).
     """
+    __slots__ = ("name", "type", "hash_cache", "_engine_objects", "_sid", "__weakref__")
 
     def __init__(self, name, sym_type: Type = None):
         self.name = name
@@ -73,7 +98,8 @@ class Term:
         else:
             self.type = sym_type
         self.hash_cache = None
-        self._engine_objects = {}
+        self._engine_objects: Dict = None
+        self._sid: int = None
 
     def arity(self) -> int:
         """
@@ -99,6 +125,12 @@ class Term:
         """
         return self.name
 
+    def symbol_id(self) -> int:
+        """
+        Returns the id of the symbol in the context that interned it (None if the symbol is not interned)
+        """
+        return self._sid
+
     def add_engine_object(self, elem) -> None:
         """
         Adds an engine object representing the
@@ -106,24 +138,36 @@ class Term:
         """
         raise NotImplementedError()
 
+    def _set_engine_obj(self, eng, elem) -> None:
+        if self._engine_objects is None:
+            self._engine_objects = {}
+        self._engine_objects[eng] = elem
+
     def as_muz(self):
         """
         Returns the object's representation in Z3 Datalog engine (muZ)
         """
-        return self._engine_objects[MUZ]
+        return self.get_engine_obj(MUZ)
 
     def as_kanren(self):
         """
         Returns the object's representation in the miniKanren engine
         """
-        return self._engine_objects[KANREN_LOGPY]
+        return self.get_engine_obj(KANREN_LOGPY)
 
     def get_engine_obj(self, eng):
         assert eng in [MUZ, KANREN_LOGPY]
+        if self._engine_objects is None:
+            raise KeyError(eng)
         return self._engine_objects[eng]
 
     def __eq__(self, other):
-        if isinstance(self, type(other)):
+        if self is other:
+            return True
+        elif isinstance(self, type(other)):
+            if self._sid is not None and other._sid is not None:
+                # interned symbols are unique within their context
+                return False
             return self.name == other.name and self.type == other.type
         else:
             return False
@@ -142,11 +186,13 @@ class Constant(Term):
     """
     Implements a constant in
     """
+    __slots__ = ("_id",)
 
-    def __init__(self, name, sym_type):
+    def __init__(self, name, sym_type, c_id: int = None):
         assert (name[0].islower() or name[0] in ["'", '"']), f"Constants should be name with lowercase {name}"
         super().__init__(name, sym_type)
-        self._id = len(sym_type)
+        # the id is given when the constant materializes a code of the context's constant dictionary
+        self._id = sym_type.new_id() if c_id is None else c_id
         self.type.add(self)
 
     def arity(self) -> int:
@@ -157,9 +203,9 @@ class Constant(Term):
 
     def add_engine_object(self, elem):
         if z3.is_bv_value(elem):
-            self._engine_objects[MUZ] = elem
+            self._set_engine_obj(MUZ, elem)
         elif isinstance(elem, str):
-            self._engine_objects[KANREN_LOGPY] = elem
+            self._set_engine_obj(KANREN_LOGPY, elem)
         else:
             raise Exception(f"unsupported Constant object {type(elem)}")
 
@@ -171,15 +217,23 @@ class Constant(Term):
             self.hash_cache = hash(self.__repr__())
         return self.hash_cache  # hash(self.__repr__())
 
+    def __eq__(self, other):
+        return Term.__eq__(self, other)
+
+    def __reduce__(self):
+        # constants are interned again when unpickled (e.g., in another process)
+        return c_const, (self.name, self.type.name)
+
 
 @dataclass
 class Variable(Term):
     """
     Implements a Variable functionality
     """
+    __slots__ = ()
 
     def __init__(self, name: str, sym_type: Type = None):
-        assert name[0].isupper(), f"Variables should be name uppercase {name}"
+        assert name[0].isupper() or name[0] == "_", f"Variables should be name uppercase {name}"
         if sym_type is None:
             sym_type = c_type("thing")
         if name[0].islower():
@@ -191,9 +245,9 @@ class Variable(Term):
 
     def add_engine_object(self, elem):
         if z3.is_expr(elem):
-            self._engine_objects[MUZ] = elem
+            self._set_engine_obj(MUZ, elem)
         elif isinstance(elem, kanren.Var):
-            self._engine_objects[KANREN_LOGPY] = elem
+            self._set_engine_obj(KANREN_LOGPY, elem)
         else:
             raise Exception(f"unsupported Variable object: {type(elem)}")
 
@@ -206,17 +260,20 @@ class Variable(Term):
         return self.hash_cache  # hash(self.__repr__() + "/" + str(self.type))
 
     def __eq__(self, other):
-        if isinstance(self, type(other)):
-            return self.name == other.name and self.type == other.type
-        else:
-            return False
+        return Term.__eq__(self, other)
+
+    def __reduce__(self):
+        return c_var, (self.name, self.type.name)
 
 
 class Functor:
+    __slots__ = ("_name", "_arity", "_arg_types", "_sid", "__weakref__")
+
     def __init__(self, name: str, arity: int, types: Sequence[Type] = None):
         self._name: str = name
         self._arity: int = arity
         self._arg_types: Sequence[Type] = types
+        self._sid: int = None
 
     def get_name(self) -> str:
         return self._name
@@ -225,7 +282,9 @@ class Functor:
         return self._arity
 
     def __eq__(self, other):
-        if isinstance(other, Functor):
+        if self is other:
+            return True
+        elif isinstance(other, Functor):
             return self._name == other._name and self._arity == other._arity
         else:
             return False
@@ -265,26 +324,33 @@ class Functor:
 
 @dataclass
 class Structure(Term):
+    __slots__ = ("arguments", "_functor")
+
     def __init__(self, functor: "Functor", arguments: Sequence[Term]):
         super(Structure, self).__init__(functor.get_name())
-        self.arguments: Sequence[Term] = arguments
+        self.arguments: Tuple[Term, ...] = tuple(arguments)
         self._functor: Functor = functor
 
     def __repr__(self):
         return "{}({})".format(self.name, ",".join([str(x) for x in self.arguments]))
 
     def __eq__(self, other):
-        if isinstance(self, type(other)):
+        if self is other:
+            return True
+        elif isinstance(self, type(other)):
             return (
-                    self.name == other.name
-                    and len(self.arguments) == len(other.arguments)
-                    and all([x == y for (x, y) in zip(self.arguments, other.arguments)])
+                    hash(self) == hash(other)
+                    and self.name == other.name
+                    and self.arguments == other.arguments
             )
         else:
             return False
 
     def __hash__(self):
-        return hash(self.__repr__())
+        # structures are immutable, so the hash is computed once from the (cached) hashes of the arguments
+        if self.hash_cache is None:
+            self.hash_cache = hash((self.name, self.arguments))
+        return self.hash_cache
 
     def arity(self):
         return len(self.arguments)
@@ -299,18 +365,14 @@ class Structure(Term):
         if isinstance(elem, tuple):
             # add object as (engine name, object)
             assert elem[0] in [MUZ, KANREN_LOGPY]
-            self._engine_objects[elem[0]] = elem[1]
+            self._set_engine_obj(elem[0], elem[1])
         elif z3.is_func_decl(elem):
-            self._engine_objects[MUZ] = elem
+            self._set_engine_obj(MUZ, elem)
         elif isinstance(elem, kanren.Relation):
-            self._engine_objects[KANREN_LOGPY] = elem
+            self._set_engine_obj(KANREN_LOGPY, elem)
         else:
             raise Exception(f"unsupported Predicate object {type(elem)}")
 
-    def get_engine_obj(self, eng):
-        assert eng in [MUZ, KANREN_LOGPY]
-        return self._engine_objects[eng]
-
 
 list_func = Functor(".", 2)
 
@@ -324,6 +386,8 @@ list_func = Functor(".", 2)
 
 
 class List(Structure):
+    __slots__ = ()
+
     def __init__(self, elements: Sequence[Union[Term, int, float, str]]):
         argsToUse = []
         for elem in elements:
@@ -345,11 +409,15 @@ class List(Structure):
         return f"[{','.join([str(x) for x in self.arguments])}]"
 
     def __hash__(self):
-        return hash(self.__repr__())
+        if self.hash_cache is None:
+            self.hash_cache = hash(("[]", self.arguments))
+        return self.hash_cache
 
     def __eq__(self, other):
-        if isinstance(other, List):
-            return self.arguments == other.arguments
+        if self is other:
+            return True
+        elif isinstance(other, List):
+            return hash(self) == hash(other) and self.arguments == other.arguments
         else:
             return False
 
@@ -358,9 +426,10 @@ pair_functor = Functor("[|]", 2)
 
 
 class Pair(Structure):
+    __slots__ = ("_left", "_right")
 
     def __init__(self, left: Union[Term, int, float, str], right: Union[Term, int, float, str]):
-        if isinstance(left, (Term, Constant, Variable, Structure, 'List', int, float)):
+        if isinstance(left, (Term, int, float)):
             self._left = left
         elif isinstance(left, str) and (left[0].islower() or left[0] in {"'", '"'}):
             self._left = global_context.constant(left)
@@ -369,7 +438,7 @@ class Pair(Structure):
         else:
             raise Exception(f" don't know how to convert {left}")
 
-        if isinstance(right, (Term, Constant, Variable, Structure, 'List', int, float)):
+        if isinstance(right, (Term, int, float)):
             self._right = right
         elif isinstance(right, str) and (right[0].islower() or right[0] in {"'", '"'}):
             self._right = global_context.constant(right)
@@ -384,11 +453,15 @@ class Pair(Structure):
         return f"[{self._left} | {self._right}]"
 
     def __hash__(self):
-        return hash(self.__repr__())
+        if self.hash_cache is None:
+            self.hash_cache = hash(("[|]", self._left, self._right))
+        return self.hash_cache
 
     def __eq__(self, other):
-        if isinstance(other, Pair):
-            return self._left == other._left and self._right == other._right
+        if self is other:
+            return True
+        elif isinstance(other, Pair):
+            return hash(self) == hash(other) and self._left == other._left and self._right == other._right
         else:
             return False
 
@@ -402,14 +475,18 @@ class Pair(Structure):
 
 @dataclass
 class Predicate:
+    __slots__ = ("name", "arity", "argument_types", "hash_cache", "_engine_objects", "_sid", "__weakref__")
+
     def __init__(self, name: str, arity: int, arguments: Sequence[Type] = None):
         self.name = name
         self.arity = arity
         self.argument_types = (
-            arguments if arguments else [Type("thing") for _ in range(arity)]
+            tuple(arguments) if arguments else tuple([Type("thing") for _ in range(arity)])
         )
         self.hash_cache = None
-        self._engine_objects = {}
+        # allocated when the first engine object is added
+        self._engine_objects: Dict = None
+        self._sid: int = None
 
     def get_name(self) -> str:
         return self.name
@@ -423,10 +500,19 @@ class Predicate:
     def signature(self) -> Tuple[str, int]:
         return self.name, self.get_arity()
 
+    def symbol_id(self) -> int:
+        """
+        Returns the id of the predicate in the context that interned it (None if the predicate is not interned)
+        """
+        return self._sid
+
     def as_proposition(self) -> "Atom":
         return Atom(self, [])
 
     def add_engine_object(self, elem):
+        if self._engine_objects is None:
+            self._engine_objects = {}
+
         if isinstance(elem, tuple):
             # add object as (engine name, object)
             assert elem[0] in [MUZ, KANREN_LOGPY]
@@ -440,16 +526,23 @@ class Predicate:
 
     def get_engine_obj(self, eng):
         assert eng in [MUZ, KANREN_LOGPY]
+        if self._engine_objects is None:
+            raise KeyError(eng)
         return self._engine_objects[eng]
 
     def as_muz(self):
-        return self._engine_objects[MUZ]
+        return self.get_engine_obj(MUZ)
 
     def as_kanren(self):
-        return self._engine_objects[KANREN_LOGPY]
+        return self.get_engine_obj(KANREN_LOGPY)
 
     def __eq__(self, other):
-        if isinstance(self, type(other)):
+        if self is other:
+            return True
+        elif isinstance(self, type(other)):
+            if self._sid is not None and other._sid is not None:
+                # interned predicates are unique within their context
+                return False
             return (
                     self.get_name() == other.get_name()
                     and self.get_arity() == other.get_arity()
@@ -474,6 +567,10 @@ class Predicate:
             self.hash_cache = hash(self.__repr__())
         return self.hash_cache
 
+    def __reduce__(self):
+        # predicates are interned again when unpickled (e.g., in another process)
+        return c_pred, (self.name, self.arity, tuple([x.name for x in self.argument_types]))
+
     def _map_to_object(
             self, name: str, arg_position: int
     ) -> Union[Constant, Variable, Structure]:
@@ -502,14 +599,21 @@ class Predicate:
 
 
 class Literal(ABC):
+    __slots__ = ("_properties", "_hash_cache", "__weakref__")
+
     def __init__(self):
-        self._properties: Dict = {}
+        # most literals never get a property, the dict is allocated with the first one
+        self._properties: Dict = None
         self._hash_cache: int = None
 
     def add_property(self, property_name: str, value):
+        if self._properties is None:
+            self._properties = {}
         self._properties[property_name] = value
 
     def get_property(self, property_name: str):
+        if self._properties is None:
+            return None
         return self._properties.get(property_name, None)
 
     def substitute(self, term_map: Dict[Term, Term]):
@@ -527,13 +631,14 @@ class Literal(ABC):
 
 @dataclass
 class Atom(Literal):
+    __slots__ = ("predicate", "arguments")
+
     def __init__(
             self, predicate: Predicate, arguments: Sequence[Union[Term, int, float]]
     ):
         super(Atom, self).__init__()
         self.predicate = predicate
-        self.arguments = arguments
-        self.arg_signature = []
+        self.arguments: Tuple[Union[Term, int, float], ...] = tuple(arguments)
 
     def substitute(self, term_map: Dict[Term, Term]):
         return c_literal(
@@ -572,9 +677,13 @@ class Atom(Literal):
             return f"{self.predicate}"
 
     def __eq__(self, other):
-        if isinstance(self, type(other)):
+        if self is other:
+            return True
+        elif isinstance(self, type(other)):
             return (
-                    self.predicate == other.predicate and self.arguments == other.arguments
+                    hash(self) == hash(other)
+                    and self.predicate == other.predicate
+                    and self.arguments == other.arguments
             )
         else:
             return False
@@ -589,14 +698,17 @@ class Atom(Literal):
             return Clause(self, [other])
 
     def __hash__(self):
+        # computed once from the hashes of the predicate and the arguments (atoms are immutable)
         if self._hash_cache is None:
-            self._hash_cache = hash(self.__repr__())
+            self._hash_cache = hash((self.predicate, self.arguments))
 
         return self._hash_cache
 
 
 @dataclass
 class Not(Literal):
+    __slots__ = ("atom",)
+
     def __init__(self, formula: Atom):
         super(Not, self).__init__()
         self.atom: Atom = formula
@@ -625,15 +737,25 @@ class Not(Literal):
     def __repr__(self):
         return f"\\+ {str(self.atom)}"
 
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif isinstance(other, Not):
+            return self.atom == other.atom
+        else:
+            return False
+
     def __hash__(self):
         if self._hash_cache is None:
-            self._hash_cache = hash(self.__repr__())
+            self._hash_cache = hash(("\\+", self.atom))
 
         return self._hash_cache
 
 
 @dataclass
 class Body:
+    __slots__ = ("_literals", "_hash_cache")
+
     def __init__(self, *literals):
         self._literals: Sequence[Union[Atom, Not]] = list(literals)
         self._hash_cache = None
@@ -730,6 +852,8 @@ class Clause:
         head (Atom): head atom of the clause
         body (List(Atom)): list of atoms in the body of the clause
     """
+    __slots__ = ("_head", "_body", "_repr_cache", "term_signatures", "inverted_term_signatures", "_hash_cache",
+                 "_canonical_key")
 
     def __init__(
             self,
@@ -747,14 +871,11 @@ class Clause:
         else:
             self._body: Body = Body(*body)
         # self._body = self._get_atom_order()
-        self._terms = set()
         self._repr_cache = None
         self.term_signatures = None
         self.inverted_term_signatures = None
         self._hash_cache = None
-
-        for lit in self._body.get_literals():
-            self._terms = self._terms.union(lit.get_terms())
+        self._canonical_key = None
 
     def substitute(self, term_map: Dict[Term, Term]):
         """
@@ -856,6 +977,48 @@ class Clause:
 
         return self.term_signatures
 
+    def canonical_key(self) -> Tuple:
+        """
+        Returns the canonical form of the clause: two clauses have the same key iff they are variants,
+            i.e., equal up to the renaming of variables and the order of the body literals
+
+        Variables are numbered canonically and the body literals are sorted
+            (the body is treated as a multiset of literals).
+
+        Return:
+            hashable key of the clause
+        """
+        if self._canonical_key is None:
+            self._canonical_key = _canonical_key(self._head, self._body.get_literals())
+        return self._canonical_key
+
+    def is_variant(self, other: "Clause") -> bool:
+        """
+        Checks whether the clause is equal to the other one up to the renaming of variables and the order of literals
+        """
+        return hash(self) == hash(other) and self.canonical_key() == other.canonical_key()
+
+    def subsumes(self, other: Union["Clause", Atom]) -> bool:
+        """
+        Checks whether the clause θ-subsumes the other clause, i.e., whether there is a substitution θ of the variables
+            of this clause such that its head becomes the head of the other clause and every body literal becomes
+            a body literal of the other clause (variables of the other clause are treated as constants)
+
+        Solved as a constraint satisfaction problem: the variables of the clause get the terms of the other clause
+            as domains (pre-indexed by predicate and argument position through the term signatures), every body literal
+            constrains its variables to the matching literals of the other clause, and the search keeps the constraints
+            arc consistent.
+
+        Arguments:
+            other: clause (or atom, i.e., a clause with an empty body)
+
+        Return:
+            True/False
+        """
+        if isinstance(other, Atom):
+            other = Clause(other, [])
+        return _theta_subsumes(self, other)
+
     def has_singleton_var(self) -> bool:
         var_count = {}
         for v in self._head.get_variables():
@@ -961,6 +1124,11 @@ class Clause:
     def __and__(self, other: Atom):
         self._body += [other]
         # self._body = self._get_atom_order()
+        self._repr_cache = None
+        self._hash_cache = None
+        self._canonical_key = None
+        self.term_signatures = None
+        self.inverted_term_signatures = None
         return self
 
     # def _get_atom_order(self):
@@ -1006,27 +1174,11 @@ class Clause:
         return self._repr_cache
 
     def __hash__(self):
+        # variants have the same hash (the refined form is enough, the exact key is only needed to compare)
         if self._hash_cache is None:
-            var_map = {}
-            for var in self._head.get_variables():
-                if var not in var_map:
-                    var_map[var] = len(var_map)
-
-            for atm in self._body.get_literals():
-                for v in atm.get_variables():
-                    if v not in var_map:
-                        var_map[v] = len(var_map)
-
-            head_rep = f"{self._head.get_predicate().get_name()}({','.join([str(var_map[x] for x in self._head.get_variables())])})"
-            bodies = [
-                f"{x.get_predicate().get_name()}({','.join([str(var_map[t]) if t in var_map else str(t) for t in x.get_terms()])})"
-                for x in self._body.get_literals()
-            ]
-            bodies = ",".join(bodies)
-
-            self._hash_cache = hash(f"{head_rep} :- {bodies}")
+            self._hash_cache = hash(_canonical_key(self._head, self._body.get_literals(), exact=False))
 
-        return self._hash_cache  # hash(self.__repr__())
+        return self._hash_cache
 
     def __eq__(self, other):
         if isinstance(other, Clause) and len(self) == len(other):
@@ -1099,56 +1251,743 @@ class Recursion(Procedure):
         return hash(";".join([str(x) for x in self.get_clauses()]))
 
 
+class PredicateIndex:
+    """
+    Structural index of the clauses of a program
+
+    Keeps the clauses by the predicate in their head and by the predicates in their body, together with the
+        predicate dependency graph (an edge from the head predicate of a clause to each of its body predicates,
+        counting positive and negative occurrences). All of them are updated as clauses are added or removed,
+        so that structural questions take time proportional to their answer.
+    The strongly connected components and the strata of the dependency graph are computed from the graph
+        when asked for, and kept until an edge or a predicate appears or disappears.
+    Facts (atoms) are indexed as clauses with an empty body; procedures by the clauses they contain.
+
+    Arguments:
+        clauses (optional): clauses to index
+    """
+
+    def __init__(self, clauses: Sequence[Union[Clause, Procedure, Atom]] = ()):
+        self._clauses: Dict[int, Union[Clause, Procedure, Atom]] = {}  # id -> clause, in the order of addition
+        self._by_head: Dict[Predicate, Dict[int, None]] = {}  # predicate -> ids of the clauses defining it
+        self._by_body: Dict[Predicate, Dict[int, None]] = {}  # predicate -> ids of the clauses using it
+        # head predicate -> body predicate -> [number of positive occurrences, number of negative occurrences]
+        self._edges: Dict[Predicate, Dict[Predicate, Sequence[int]]] = {}
+        self._reverse_edges: Dict[Predicate, Dict[Predicate, None]] = {}
+        self._occurrences: Dict[Predicate, int] = {}  # predicate -> number of occurrences (heads and bodies)
+        self._components: Sequence[frozenset] = None
+        self._component_of: Dict[Predicate, int] = None
+        self._strata: Sequence[int] = None
+        self._next_id = 0
+        for cl in clauses:
+            self.add(cl)
+
+    @staticmethod
+    def _structure(item: Union[Clause, Procedure, Atom]) -> Tuple[Sequence[Predicate], Sequence[Tuple[Predicate, Predicate, bool]]]:
+        # head predicates and (head predicate, body predicate, negated) of every body literal
+        if isinstance(item, Atom):
+            return [item.get_predicate()], []
+        elif isinstance(item, Clause):
+            head = item.get_head().get_predicate()
+            return [head], [(head, x.get_predicate(), isinstance(x, Not)) for x in item.get_literals()]
+        elif isinstance(item, Procedure):
+            heads, body = [], []
+            for cl in item.get_clauses():
+                h, b = PredicateIndex._structure(cl)
+                heads += h
+                body += b
+            return heads, body
+        else:
+            raise Exception(f"can only index atoms, clauses and procedures (got {item})")
+
+    def _count(self, predicate: Predicate, delta: int) -> None:
+        count = self._occurrences.get(predicate, 0) + delta
+        if count == 0:
+            del self._occurrences[predicate]
+            self._components = None
+        else:
+            if count == delta:
+                self._components = None
+            self._occurrences[predicate] = count
+
+    def add(self, item: Union[Clause, Procedure, Atom]) -> None:
+        c_id = self._next_id
+        self._next_id += 1
+        heads, body = self._structure(item)
+        self._clauses[c_id] = item
+
+        for p in heads:
+            self._by_head.setdefault(p, {})[c_id] = None
+            self._count(p, 1)
+
+        for head, p, negated in body:
+            self._by_body.setdefault(p, {})[c_id] = None
+            self._count(p, 1)
+            counts = self._edges.setdefault(head, {}).get(p)
+            if counts is None:
+                counts = [0, 0]
+                self._edges[head][p] = counts
+                self._reverse_edges.setdefault(p, {})[head] = None
+                self._components = None
+            if negated and counts[1] == 0:
+                # a new negative edge changes the strata
+                self._components = None
+            counts[1 if negated else 0] += 1
+
+    def _find(self, item: Union[Clause, Procedure, Atom]) -> int:
+        heads, _ = self._structure(item)
+        candidates = self._by_head.get(heads[0], {}) if heads else self._clauses
+        for c_id in candidates:
+            if self._clauses[c_id] is item:
+                return c_id
+        for c_id in candidates:
+            if self._clauses[c_id] == item:
+                return c_id
+        return None
+
+    def remove(self, item: Union[Clause, Procedure, Atom]) -> None:
+        """
+        Removes (the first occurrence of) the clause; looks it up among the clauses with the same head predicate
+        """
+        c_id = self._find(item)
+        if c_id is None:
+            raise Exception(f"{item} is not indexed")
+
+        heads, body = self._structure(self._clauses.pop(c_id))
+        for p in dict.fromkeys(heads):
+            _discard(self._by_head, p, c_id)
+        for p in dict.fromkeys([x[1] for x in body]):
+            _discard(self._by_body, p, c_id)
+
+        for p in heads:
+            self._count(p, -1)
+
+        for head, p, negated in body:
+            self._count(p, -1)
+            counts = self._edges[head][p]
+            counts[1 if negated else 0] -= 1
+            if negated and counts[1] == 0:
+                self._components = None
+            if counts == [0, 0]:
+                _discard(self._edges, head, p)
+                _discard(self._reverse_edges, p, head)
+                self._components = None
+
+    def get_clauses(self) -> Sequence[Union[Clause, Procedure, Atom]]:
+        return list(self._clauses.values())
+
+    def get_predicates(self) -> Set[Predicate]:
+        """
+        Returns all predicates appearing in the heads or in the bodies of the clauses
+        """
+        return set(self._occurrences)
+
+    def defining(self, predicates: Union[Predicate, Iterable[Predicate]]) -> Sequence[Union[Clause, Procedure, Atom]]:
+        """
+        Returns the clauses with (one of) the predicates in the head, in the order they were added
+        """
+        return self._lookup(self._by_head, predicates)
+
+    def using(self, predicates: Union[Predicate, Iterable[Predicate]]) -> Sequence[Union[Clause, Procedure, Atom]]:
+        """
+        Returns the clauses with (one of) the predicates in the body, in the order they were added
+        """
+        return self._lookup(self._by_body, predicates)
+
+    def mentioning(self, predicates: Iterable[Predicate]) -> Sequence[Union[Clause, Procedure, Atom]]:
+        """
+        Returns the clauses with one of the predicates in the body, and the facts of the predicates
+        """
+        predicates = list(predicates)
+        ids = {x for p in predicates for x in self._by_body.get(p, ())}
+        ids.update([x for p in predicates for x in self._by_head.get(p, ()) if isinstance(self._clauses[x], Atom)])
+        return [self._clauses[x] for x in sorted(ids)]
+
+    def _lookup(self, index: Dict[Predicate, Dict[int, None]], predicates) -> Sequence[Union[Clause, Procedure, Atom]]:
+        if isinstance(predicates, Predicate):
+            return [self._clauses[x] for x in index.get(predicates, ())]
+        ids = {x for p in predicates for x in index.get(p, ())}
+        return [self._clauses[x] for x in sorted(ids)]
+
+    def dependencies(self, predicate: Predicate) -> Set[Predicate]:
+        """
+        Returns the predicates in the bodies of the clauses defining the predicate
+        """
+        return set(self._edges.get(predicate, ()))
+
+    def dependents(self, predicate: Predicate) -> Set[Predicate]:
+        """
+        Returns the predicates defined by clauses using the predicate in the body
+        """
+        return set(self._reverse_edges.get(predicate, ()))
+
+    def is_negated(self, predicate: Predicate) -> bool:
+        """
+        Checks whether the predicate appears in a negative literal
+        """
+        return any([self._edges[x][predicate][1] > 0 for x in self._reverse_edges.get(predicate, ())])
+
+    def reachable(self, predicates: Iterable[Predicate]) -> Set[Predicate]:
+        """
+        Returns the predicates the given ones depend on, directly or indirectly (including the given ones)
+        """
+        seen = set(predicates)
+        stack = list(seen)
+        while stack:
+            for p in self._edges.get(stack.pop(), ()):
+                if p not in seen:
+                    seen.add(p)
+                    stack.append(p)
+        return seen
+
+    def _compute_components(self) -> None:
+        # Tarjan's algorithm (iteratively); a component is found after all components it depends on
+        index, low, on_stack = {}, {}, set()
+        stack, components = [], []
+        for root in self._occurrences:
+            if root in index:
+                continue
+            work = [(root, iter(self._edges.get(root, ())))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, successors = work[-1]
+                for succ in successors:
+                    if succ not in index:
+                        index[succ] = low[succ] = len(index)
+                        stack.append(succ)
+                        on_stack.add(succ)
+                        work.append((succ, iter(self._edges.get(succ, ()))))
+                        break
+                    elif succ in on_stack:
+                        low[node] = min(low[node], index[succ])
+                else:
+                    work.pop()
+                    if work:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            p = stack.pop()
+                            on_stack.discard(p)
+                            component.append(p)
+                            if p is node:
+                                break
+                        components.append(frozenset(component))
+
+        self._components = components
+        self._component_of = dict([(p, ind) for ind, comp in enumerate(components) for p in comp])
+        self._strata = None
+
+    def components(self) -> Sequence[frozenset]:
+        """
+        Returns the strongly connected components of the dependency graph,
+            every component after the components it depends on
+        """
+        if self._components is None:
+            self._compute_components()
+        return list(self._components)
+
+    def component(self, predicate: Predicate) -> frozenset:
+        """
+        Returns the strongly connected component of the predicate (the predicates mutually recursive with it)
+        """
+        if self._components is None:
+            self._compute_components()
+        return self._components[self._component_of[predicate]] if predicate in self._component_of \
+            else frozenset([predicate])
+
+    def is_recursive(self, predicate: Predicate) -> bool:
+        """
+        Checks whether the predicate depends on itself (directly or through other predicates)
+        """
+        return predicate in self._edges.get(predicate, ()) or len(self.component(predicate)) > 1
+
+    def strata(self) -> Sequence[Set[Predicate]]:
+        """
+        Returns the strata of the program: the predicates of a stratum depend only on the predicates of the same or
+            lower strata, and only negatively on the predicates of lower strata
+
+        Return:
+            sets of predicates, lowest stratum first
+        """
+        if self._components is None:
+            self._compute_components()
+
+        if self._strata is None:
+            strata = []
+            for ind, comp in enumerate(self._components):
+                level = 0
+                for head in comp:
+                    for p, (_, negative) in self._edges.get(head, {}).items():
+                        if p in comp:
+                            if negative:
+                                raise Exception(f"the program is not stratified: {head} depends negatively on {p} "
+                                                f"through recursion")
+                            continue
+                        level = max(level, strata[self._component_of[p]] + (1 if negative else 0))
+                strata.append(level)
+            self._strata = strata
+
+        by_level = {}
+        for comp, level in zip(self._components, self._strata):
+            by_level.setdefault(level, set()).update(comp)
+        return [by_level[x] for x in sorted(by_level)]
+
+    def __contains__(self, item: Union[Clause, Procedure, Atom]):
+        return self._find(item) is not None
+
+    def __len__(self):
+        return len(self._clauses)
+
+    def __iter__(self):
+        return iter(self._clauses.values())
+
+
 class Program:
+    """
+    Clauses, procedures and facts of a program, indexed by their predicates (see PredicateIndex)
+
+    Arguments:
+        clauses: clauses of the program
+    """
+
     def __init__(self, clauses: Sequence[Union[Clause, Procedure, Atom]]):
-        self._clauses: Sequence[Union[Clause, Procedure, Atom]] = clauses
+        self._index = PredicateIndex(clauses)
+
+    def add_clause(self, clause: Union[Clause, Procedure, Atom]) -> None:
+        self._index.add(clause)
+
+    def remove_clause(self, clause: Union[Clause, Procedure, Atom]) -> None:
+        self._index.remove(clause)
 
     def get_clauses(
             self, predicates: Set[Predicate] = None
     ) -> Sequence[Union[Clause, Procedure, Atom]]:
+        """
+        Returns the clauses, or only the clauses using one of the predicates (in the body, or as a fact)
+        """
         if predicates:
-            return [x for x in self._clauses if any([p for p in x.get_predicates()])]
+            return self._index.mentioning(predicates)
         else:
-            return self._clauses
+            return self._index.get_clauses()
+
+    def get_index(self) -> PredicateIndex:
+        return self._index
+
+    def get_definition(self, predicates: Union[Predicate, Set[Predicate]]) -> Sequence[Union[Clause, Procedure, Atom]]:
+        """
+        Returns the clauses defining the predicates (with one of them in the head)
+        """
+        return self._index.defining(predicates)
+
+    def slice(self, predicates: Set[Predicate]) -> Sequence[Union[Clause, Procedure, Atom]]:
+        """
+        Returns the clauses needed to answer queries of the predicates:
+            the definitions of the predicates and of all predicates they depend on
+        """
+        return self._index.defining(self._index.reachable(predicates))
+
+    def is_recursive(self, predicate: Predicate) -> bool:
+        return self._index.is_recursive(predicate)
+
+    def strata(self) -> Sequence[Set[Predicate]]:
+        return self._index.strata()
 
     def __len__(self):
-        return len(self.get_clauses())
+        return len(self._index)
 
     def num_literals(self) -> int:
-        return sum([len(x) for x in self._clauses])
+        return sum([len(x) for x in self._index])
 
     def get_predicates(self) -> Set[Predicate]:
-        raise Exception("Not implemented yet!")
+        return self._index.get_predicates()
+
+
+class VariantIndex:
+    """
+    Index of clauses up to variants (renaming of variables and reordering of the body literals)
+
+    Answers whether a variant of a clause has been indexed in expected constant time (in the number of indexed
+    clauses), by indexing the clauses by their canonical key. Atoms are indexed as clauses with an empty body.
+
+    Arguments:
+        clauses (optional): clauses to index
+    """
+
+    def __init__(self, clauses: Sequence[Union[Clause, Atom]] = ()):
+        self._index: Dict[Tuple, Union[Clause, Atom]] = {}
+        for cl in clauses:
+            self.add(cl)
+
+    @staticmethod
+    def _key(clause: Union[Clause, Atom]) -> Tuple:
+        if isinstance(clause, Clause):
+            return clause.canonical_key()
+        elif isinstance(clause, Atom):
+            return _canonical_key(clause, ())
+        else:
+            raise Exception(f"can only index clauses and atoms (got {clause})")
+
+    def add(self, clause: Union[Clause, Atom]) -> bool:
+        """
+        Indexes the clause, unless a variant of it is indexed already
+
+        Return:
+            True if the clause was added (no variant of it was indexed before), False otherwise
+        """
+        key = self._key(clause)
+        if key in self._index:
+            return False
+        self._index[key] = clause
+        return True
+
+    def get(self, clause: Union[Clause, Atom]) -> Union[Clause, Atom]:
+        """
+        Returns the indexed variant of the clause (None if there is none)
+        """
+        return self._index.get(self._key(clause))
+
+    def remove(self, clause: Union[Clause, Atom]) -> None:
+        """
+        Removes the indexed variant of the clause
+        """
+        del self._index[self._key(clause)]
+
+    def __contains__(self, clause: Union[Clause, Atom]):
+        return self._key(clause) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index.values())
+
+
+class SubsumptionIndex:
+    """
+    Index of clauses supporting θ-subsumption queries
+
+    A clause can only subsume clauses with the same head predicate that contain all of its body predicates
+        (with the same sign) and all of its constants.
+    The index keeps an inverted index from these features to the clauses, so that the candidates of a query are found
+        from the postings of the features instead of scanning all clauses; the candidates are then checked with
+        Clause.subsumes.
+
+    Arguments:
+        clauses (optional): clauses to index
+    """
+
+    def __init__(self, clauses: Sequence[Clause] = ()):
+        self._clauses: Dict[int, Clause] = {}
+        self._ids: Dict[Clause, int] = {}
+        self._features: Dict[int, frozenset] = {}
+        # (head predicate, feature) -> ids of the clauses with the feature
+        self._postings: Dict[Tuple, Set[int]] = {}
+        # head predicate -> ids of all clauses with the head predicate
+        self._by_head: Dict[Predicate, Set[int]] = {}
+        self._next_id = 0
+        for cl in clauses:
+            self.add(cl)
+
+    def add(self, clause: Clause) -> None:
+        if clause in self._ids:
+            return
+
+        c_id = self._next_id
+        self._next_id += 1
+        head, features = _subsumption_features(clause)
+        self._clauses[c_id] = clause
+        self._ids[clause] = c_id
+        self._features[c_id] = features
+
+        self._by_head.setdefault(head, set()).add(c_id)
+        for f in features:
+            self._postings.setdefault((head, f), set()).add(c_id)
+
+    def remove(self, clause: Clause) -> None:
+        c_id = self._ids.pop(clause)
+        head = clause.get_head().get_predicate()
+        del self._clauses[c_id]
+        self._by_head[head].discard(c_id)
+        for f in self._features.pop(c_id):
+            self._postings[(head, f)].discard(c_id)
+
+    def subsuming(self, clause: Clause) -> Sequence[Clause]:
+        """
+        Returns the indexed clauses that θ-subsume the clause
+        """
+        head, features = _subsumption_features(clause)
+
+        # candidates: clauses whose features are all features of the query
+        counts: Dict[int, int] = {}
+        for f in features:
+            for c_id in self._postings.get((head, f), ()):
+                counts[c_id] = counts.get(c_id, 0) + 1
+        candidates = [x for x, n in counts.items() if n == len(self._features[x])]
+        candidates += [x for x in self._by_head.get(head, ()) if len(self._features[x]) == 0]
+
+        return [self._clauses[x] for x in sorted(candidates) if self._clauses[x].subsumes(clause)]
+
+    def subsumed_by(self, clause: Clause) -> Sequence[Clause]:
+        """
+        Returns the indexed clauses θ-subsumed by the clause
+        """
+        head, features = _subsumption_features(clause)
+
+        # candidates: clauses having all features of the query
+        postings = sorted([self._postings.get((head, f), set()) for f in features], key=len)
+        candidates = set(postings[0]) if postings else set(self._by_head.get(head, ()))
+        for ids in postings[1:]:
+            candidates &= ids
+
+        return [self._clauses[x] for x in sorted(candidates) if clause.subsumes(self._clauses[x])]
+
+    def __contains__(self, clause: Clause):
+        return clause in self._ids
+
+    def __len__(self):
+        return len(self._clauses)
+
+    def __iter__(self):
+        return iter(self._clauses.values())
+
+
+class InternTable:
+    """
+    Table of interned objects with an interning policy
+
+    Arguments:
+        policy: INTERN_STRONG keeps all objects,
+                INTERN_WEAK keeps an object only as long as it is referenced elsewhere,
+                INTERN_LRU additionally keeps the max_size most recently used objects alive
+        max_size (int, optional): number of objects kept alive by the LRU policy
+    """
+    __slots__ = ("policy", "max_size", "hits", "misses", "_table", "_recent")
+
+    def __init__(self, policy: str = INTERN_STRONG, max_size: int = None):
+        assert policy in [INTERN_STRONG, INTERN_WEAK, INTERN_LRU], f"unknown interning policy {policy}"
+        assert policy != INTERN_LRU or max_size is not None, "LRU interning requires the max_size"
+        self.policy = policy
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._table = {} if policy == INTERN_STRONG else weakref.WeakValueDictionary()
+        self._recent = OrderedDict() if policy == INTERN_LRU else None
+
+    def get(self, key):
+        value = self._table.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            if self._recent is not None:
+                self._touch(key, value)
+        return value
+
+    def put(self, key, value):
+        self._table[key] = value
+        if self._recent is not None:
+            self._touch(key, value)
+        return value
+
+    def _touch(self, key, value):
+        self._recent[key] = value
+        self._recent.move_to_end(key)
+        if len(self._recent) > self.max_size:
+            self._recent.popitem(last=False)
+
+    def values(self) -> list:
+        return list(self._table.values())
+
+    def items(self) -> list:
+        return list(self._table.items())
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._table),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __contains__(self, key):
+        return key in self._table
+
+    def __len__(self):
+        return len(self._table)
+
+
+def _intern_table(policy: Union[str, InternTable, None], current: InternTable = None) -> InternTable:
+    if policy is None:
+        return current if current is not None else InternTable()
+    table = policy if isinstance(policy, InternTable) else InternTable(policy)
+    if current is not None:
+        for key, value in current.items():
+            table.put(key, value)
+    return table
 
 
 class Context:
-    def __init__(self):
-        self._predicates = {}  # name/arity -> Predicate
-        self._variables = {}  # domain -> {name -> Variable}
-        self._constants = {}  # domain -> {name -> Constant}
-        self._literals = {}  # Predicate -> { tuple of terms -> Atom}
+    """
+    Interns the symbols (types, predicates, constants, variables and functors) of a program
+
+    Every interned symbol gets a dense integer id at creation; the context keeps the reverse indices
+    (id -> symbol, name -> symbol), so that all lookups are constant time.
+
+    Arguments:
+        literals (optional): interning policy of literals (INTERN_STRONG, INTERN_WEAK or an InternTable for LRU)
+        constants (optional): interning policy of constants
+        variables (optional): interning policy of variables
+    """
+
+    def __init__(self, literals: Union[str, InternTable] = INTERN_STRONG,
+                 constants: Union[str, InternTable] = INTERN_STRONG,
+                 variables: Union[str, InternTable] = INTERN_STRONG):
+        self._predicates = {}  # (name, arity) -> Predicate
+        self._predicates_by_name = {}  # name -> first Predicate with the name
+        self._variables: Dict[str, InternTable] = {}  # domain -> {name -> Variable}
+        self._constants: Dict[str, InternTable] = {}  # domain -> {name -> Constant}
+        self._constant_domains = {}  # name -> domain (str) the constant was first created in
+        self._literals: InternTable = None  # (Predicate, tuple of terms) -> Atom
         self._domains = {"thing": Type("thing"), "number": Type("number")}  # name -> Type
         self._id_to_constant = {}  # domain (str) -> {id -> Constant}
+        self._constant_codes = {}  # domain (str) -> {name -> id}, constants coded in bulk (see encode_constants)
+        self._constant_names = {}  # domain (str) -> {id -> name}
         self._functors = {2: {}}  # arity -> name -> Functor
+        self._functors_by_name = {}  # name -> {arity -> Functor}
+        self._fresh_variables = {}  # domain -> number of fresh variables created
+        self._symbols = []  # symbol id -> symbol
+        self._num_symbols = 0
+        self._policies = {"literals": INTERN_STRONG, "constants": INTERN_STRONG, "variables": INTERN_STRONG}
 
         self._functors[2]["."] = list_func
+        self._functors_by_name["."] = {2: list_func}
+        for t in self._domains.values():
+            self._intern(t)
+
+        self.set_interning(literals=literals, constants=constants, variables=variables)
+
+    def set_interning(self, literals: Union[str, InternTable] = None,
+                      constants: Union[str, InternTable] = None,
+                      variables: Union[str, InternTable] = None) -> None:
+        """
+        Changes the interning policies; objects interned so far are moved to the new tables
+
+        Arguments:
+            literals (optional): INTERN_STRONG, INTERN_WEAK or InternTable(INTERN_LRU, max_size)
+            constants (optional): interning policy of constants
+            variables (optional): interning policy of variables
+        """
+        self._literals = _intern_table(literals, self._literals)
+
+        if constants is not None:
+            for dom in list(self._constants):
+                self._constants[dom] = _intern_table(_copy_policy(constants), self._constants[dom])
+            self._policies["constants"] = constants
+        if variables is not None:
+            for dom in list(self._variables):
+                self._variables[dom] = _intern_table(_copy_policy(variables), self._variables[dom])
+            self._policies["variables"] = variables
+        if literals is not None:
+            self._policies["literals"] = literals
+
+        strong = all([_policy_name(x) == INTERN_STRONG for x in self._policies.values()])
+        weak_constants = _policy_name(self._policies["constants"]) != INTERN_STRONG
+
+        # symbols collected from the tables should not stay alive in the id and type indices
+        if strong and not isinstance(self._symbols, list):
+            symbols = [None] * self._num_symbols
+            for s_id, symbol in self._symbols.items():
+                symbols[s_id] = symbol
+            self._symbols = symbols
+        elif not strong and isinstance(self._symbols, list):
+            self._symbols = weakref.WeakValueDictionary(
+                [(ind, x) for ind, x in enumerate(self._symbols) if x is not None])
+
+        for dom in self._id_to_constant:
+            self._id_to_constant[dom] = weakref.WeakValueDictionary(self._id_to_constant[dom]) if weak_constants \
+                else dict(self._id_to_constant[dom])
+        for t in self._domains.values():
+            t.set_weak_elements(weak_constants)
+
+    def stats(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        """
+        Returns the sizes (and lookup statistics) of the tables of the context
+        """
+        def merged(tables):
+            result = {"size": 0, "hits": 0, "misses": 0}
+            for t in tables:
+                for k, v in t.stats().items():
+                    if k in result:
+                        result[k] += v
+            lookups = result["hits"] + result["misses"]
+            result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+            return result
+
+        return {
+            "literals": self._literals.stats(),
+            "constants": merged(self._constants.values()),
+            "variables": merged(self._variables.values()),
+            "predicates": {"size": len(self._predicates)},
+            "functors": {"size": sum([len(x) for x in self._functors.values()])},
+            "types": {"size": len(self._domains)},
+            "symbols": {"size": len(self._symbols), "ids": self._num_symbols},
+        }
 
     def _predicate_sig(self, name, arity):
-        return f"{name}/{arity}"
+        return name, arity
+
+    def _intern(self, symbol: Union[Type, Term, Predicate, Functor]):
+        symbol._sid = self._num_symbols
+        self._num_symbols += 1
+        if isinstance(self._symbols, list):
+            self._symbols.append(symbol)
+        else:
+            self._symbols[symbol._sid] = symbol
+        return symbol
+
+    def symbol_by_id(self, s_id: int) -> Union[Term, Predicate, Functor]:
+        """
+        Returns the interned symbol with the given id (None if the symbol is no longer interned)
+        """
+        if isinstance(self._symbols, list):
+            return self._symbols[s_id]
+        return self._symbols.get(s_id)
+
+    def num_symbols(self) -> int:
+        return self._num_symbols
+
+    def changes(self, cursor: int = 0) -> Tuple[Sequence[Union[Type, Term, Predicate, Functor]], int]:
+        """
+        Returns the symbols (types, constants, variables, predicates and functors) created since the cursor
+
+        Symbol ids follow the order of creation, so the cursor is the number of symbols seen so far;
+        symbols that are no longer interned (weak or LRU interning) are skipped.
+
+        Arguments:
+            cursor: cursor returned by the previous call (0 to get all symbols)
+
+        Return:
+            symbols in the order of creation and the cursor for the next call
+        """
+        if isinstance(self._symbols, list):
+            symbols = self._symbols[cursor:]
+        else:
+            symbols = [self._symbols.get(x) for x in range(cursor, self._num_symbols)]
+
+        return [x for x in symbols if x is not None], self._num_symbols
 
     def get_predicates(self) -> Sequence[Predicate]:
         return [v for k, v in self._predicates.items()]
 
     def get_constants(self) -> Sequence[Constant]:
-        p = [[v for k, v in self._constants[z].items()] for z in self._constants]
-        return reduce(lambda x, y: x + y, p, [])
+        return [c for dom in self._constants.values() for c in dom.values()]
 
     def get_variables(self) -> Sequence[Variable]:
-        return reduce(
-            lambda x, y: x + y,
-            [[v for k, v in self._variables[z].items()] for z in self._variables],
-            [],
-        )
+        return [v for dom in self._variables.values() for v in dom.values()]
 
     def get_types(self) -> Sequence[Type]:
         return [v for k, v in self._domains.items()]
@@ -1157,26 +1996,103 @@ class Context:
         if isinstance(c_type, Type):
             c_type = c_type.name
 
-        return self._id_to_constant[c_type][c_id]
+        c = self._id_to_constant.get(c_type, {}).get(c_id)
+        if c is None:
+            # a code of the constant dictionary is materialized when first asked for
+            c = self.constant(self._constant_names[c_type][c_id], c_type)
+
+        return c
+
+    def encode_constants(self, names: Iterable[Union[str, Constant, int, float]], domain=None) -> Sequence[int]:
+        """
+        Returns the ids of the constants with the given names, without creating Constant objects
+
+        Names that are not constants yet get a new id of the domain (as if the constant was created) and are
+            kept in the constant dictionary of the context; the Constant is created with the same id when
+            asked for (constant(...) or constant_by_id(...)).
+        Names that are not valid constant names (numbers, capitalized names) are quoted.
+
+        Arguments:
+            names: names of the constants (or constants, or numbers)
+            domain (optional): domain of the constants
+
+        Return:
+            the ids of the constants, in the order of the names
+        """
+        if domain is None:
+            domain = "thing"
+        elif isinstance(domain, Type):
+            domain = domain.name
+
+        codes = self._constant_codes.get(domain)
+        if codes is None:
+            codes = {}
+            self._constant_codes[domain] = codes
+            self._constant_names[domain] = {}
+        names_by_id = self._constant_names[domain]
+        constants = self._constants.get(domain, {})
+        sym_type = self.type(domain)
+
+        ids = []
+        for name in names:
+            c_id = codes.get(name) if isinstance(name, str) else None
+            if c_id is None:
+                if isinstance(name, Constant):
+                    c_id = self.constant(name.get_name(), domain).id()
+                else:
+                    name = _constant_name(name)
+                    c_id = codes.get(name)
+                    if c_id is None:
+                        c = constants.get(name)
+                        c_id = sym_type.new_id() if c is None else c.id()
+                        codes[name] = c_id
+                        names_by_id[c_id] = name
+            ids.append(c_id)
+
+        return ids
+
+    def constant_name(self, c_id: int, domain=None) -> str:
+        """
+        Returns the name of the constant with the given id (the constant is not materialized)
+        """
+        if domain is None:
+            domain = "thing"
+        elif isinstance(domain, Type):
+            domain = domain.name
+
+        name = self._constant_names.get(domain, {}).get(c_id)
+        if name is None:
+            name = self.constant_by_id(c_id, domain).get_name()
+
+        return name
 
     def type(self, name):
         if name not in self._domains:
-            t = Type(name)
+            t = self._intern(Type(name, weak_elements=_policy_name(self._policies["constants"]) != INTERN_STRONG))
             self._domains[name] = t
 
         return self._domains[name]
 
     def predicate(self, name, arity, domains=()) -> Predicate:
+        sig = self._predicate_sig(name, arity)
+        existing = self._predicates.get(sig)
+        if existing is not None and len(domains) == 0:
+            return existing
+
         if len(domains) == 0:
             domains = [self._domains["thing"]] * arity
 
         domains = [d if isinstance(d, Type) else self.type(d) for d in domains]
 
-        if not self._predicate_sig(name, arity) is self._predicates:
-            p = Predicate(name, arity, domains)
-            self._predicates[self._predicate_sig(name, arity)] = p
+        if existing is None or any([x != y for x, y in zip(existing.get_arg_types(), domains)]):
+            # a predicate declared with different domains replaces the existing one
+            p = self._intern(Predicate(name, arity, domains))
+            self._predicates[sig] = p
+            if name not in self._predicates_by_name:
+                self._predicates_by_name[name] = p
+            return p
 
-        return self._predicates[self._predicate_sig(name, arity)]
+        return existing
 
     def variable(self, name, domain=None) -> Variable:
         if domain is None:
@@ -1184,25 +2100,29 @@ class Context:
         elif isinstance(domain, Type):
             domain = domain.name
 
-        if domain not in self._variables:
-            self._variables[domain] = {}
+        variables = self._variables.get(domain)
+        if variables is None:
+            variables = _intern_table(_copy_policy(self._policies["variables"]))
+            self._variables[domain] = variables
 
-        if name not in self._variables[domain]:
-            v = Variable(name, sym_type=self._domains[domain])
-            self._variables[domain][name] = v
+        v = variables.get(name)
+        if v is None:
+            v = variables.put(name, self._intern(Variable(name, sym_type=self.type(domain))))
 
-        return self._variables[domain][name]
+        return v
 
     def fresh_variable(self, domain=None) -> Variable:
         if domain is None:
             domain = "thing"
+        elif isinstance(domain, Type):
+            domain = domain.name
 
-        v_id = 1
-        while True:
-            if f"_V{v_id}" not in self._variables[domain]:
-                break
-            else:
-                v_id += 1
+        # fresh variables are numbered per domain; names taken by other variables are skipped
+        v_id = self._fresh_variables.get(domain, 0) + 1
+        variables = self._variables.get(domain, ())
+        while f"_V{v_id}" in variables:
+            v_id += 1
+        self._fresh_variables[domain] = v_id
 
         return self.variable(f"_V{v_id}", domain)
 
@@ -1212,27 +2132,31 @@ class Context:
         elif isinstance(domain, Type):
             domain = domain.name
 
-        if domain not in self._id_to_constant:
-            self._id_to_constant[domain] = {}
-
-        if domain not in self._constants:
-            self._constants[domain] = {}
-
-        if name not in self._constants[domain]:
-            c = Constant(name, self._domains[domain])
-            self._constants[domain][name] = c
+        constants = self._constants.get(domain)
+        if constants is None:
+            policy = self._policies["constants"]
+            constants = _intern_table(_copy_policy(policy))
+            self._constants[domain] = constants
+            self._id_to_constant[domain] = {} if _policy_name(policy) == INTERN_STRONG \
+                else weakref.WeakValueDictionary()
+
+        c = constants.get(name)
+        if c is None:
+            c_id = self._constant_codes.get(domain, {}).get(name)
+            c = constants.put(name, self._intern(Constant(name, self.type(domain), c_id)))
             self._id_to_constant[domain][c.id()] = c
+            if name not in self._constant_domains:
+                self._constant_domains[name] = domain
 
-        return self._constants[domain][name]
+        return c
 
     def literal(self, predicate: Predicate, arguments: Sequence[Term]) -> "Atom":
-        if predicate not in self._literals:
-            self._literals[predicate] = {}
+        key = (predicate, tuple(arguments))
+        atom = self._literals.get(key)
+        if atom is None:
+            atom = self._literals.put(key, Atom(predicate, key[1]))
 
-        if tuple(arguments) not in self._literals[predicate]:
-            self._literals[predicate][tuple(arguments)] = Atom(predicate, arguments)
-
-        return self._literals[predicate][tuple(arguments)]
+        return atom
 
     def find_domain(self, const: Union[str, Constant]):
         """
@@ -1243,58 +2167,69 @@ class Context:
         if isinstance(const, Constant):
             const = const.get_name()
 
-        for dom in self._constants:
-            if const in self._constants[dom]:
-                return self.type(dom)
-        else:
-            return self.type("thing")
+        return self.type(self._constant_domains.get(const, "thing"))
 
     def functor(self, name: str, arity: int = None, types: Sequence[Type] = None):
         # check if already exists
-        found = []
-        for ar in (
-                [arity]
-                if (arity is not None and arity in self._functors)
-                else self._functors
-        ):
-            if name in self._functors[ar]:
-                found.append(self._functors[ar][name])
-        if len(found) == 1:
-            return found[0]
+        by_arity = self._functors_by_name.get(name, {})
+        if arity is not None and arity in by_arity:
+            return by_arity[arity]
+        elif arity is None and len(by_arity) == 1:
+            return next(iter(by_arity.values()))
         else:
             # if doesn't exist
-            assert (
-                arity is not None or types is not None,
-                "creating new functor requires either arity or argument types",
-            )
+            assert arity is not None or types is not None, \
+                "creating new functor requires either arity or argument types"
             if types is None:
-                if arity not in self._functors:
-                    self._functors[arity] = {}
-                self._functors[arity][name] = Functor(name, arity)
-                return self._functors[arity][name]
+                f = self._intern(Functor(name, arity))
             else:
                 arity = len(types)
-                if arity not in self._functors:
-                    self._functors[arity] = {}
-                self._functors[arity][name] = Functor(name, arity, types)
-                return self._functors[arity][name]
+                f = self._intern(Functor(name, arity, types))
+
+            if arity not in self._functors:
+                self._functors[arity] = {}
+            self._functors[arity][name] = f
+            self._functors_by_name.setdefault(name, {})[arity] = f
+            return f
 
     def symbol(self, name: str, arity: int = None, types: Sequence[Type] = None):
-        for dom in self._constants:
-            if name in self._constants[dom]:
-                return self._constants[dom][name]
-        for ar in self._functors:
-            if name in self._functors[ar]:
-                return self._functors[ar][name]
-        for ar in self._predicates:
-            if f"{name}/{ar}" in self._predicates:
-                return self._predicates[f"{name}/{ar}"]
+        const = self._constants[self._constant_domains[name]].get(name) if name in self._constant_domains else None
+        if const is not None:
+            return const
+        if name in self._functors_by_name:
+            return next(iter(self._functors_by_name[name].values()))
+        if name in self._predicates_by_name:
+            return self._predicates_by_name[name]
 
         assert arity is not None
         # if symbol does not exists, assume predicate
         return self.functor(name, arity, types)
 
 
+def _discard(index: Dict, key, value) -> None:
+    # removes the value from the entry of the key, and the entry once it is empty
+    entry = index[key]
+    del entry[value]
+    if not entry:
+        del index[key]
+
+
+def _constant_name(name: Union[str, int, float]) -> str:
+    name = str(name)
+    if name and (name[0].islower() or name[0] in ["'", '"']):
+        return name
+    return "'" + name.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _policy_name(policy: Union[str, InternTable]) -> str:
+    return policy.policy if isinstance(policy, InternTable) else policy
+
+
+def _copy_policy(policy: Union[str, InternTable]) -> Union[str, InternTable]:
+    # every domain gets its own table with the same policy
+    return InternTable(policy.policy, policy.max_size) if isinstance(policy, InternTable) else policy
+
+
 global_context = Context()
 
 
@@ -1401,6 +2336,343 @@ def _are_two_set_of_literals_identical(
         return len(matches) == max(len(clause1_sig), len(clause2_sig))
 
 
+def _literal_template(literal: Union[Atom, Not], role: int, var_index: Dict[Variable, int]) -> Tuple[Tuple, list, list]:
+    # preorder description of the literal: (role, negation, predicate), the tokens of the arguments,
+    #     and the (token position, variable index) of the variables, whose tokens are replaced by their colour
+    negated = isinstance(literal, Not)
+    atom = literal.get_atom() if negated else literal
+    predicate = atom.get_predicate()
+    tokens = []
+    slots = []
+
+    def _add(term):
+        if isinstance(term, Variable):
+            v_ind = var_index.get(term)
+            if v_ind is None:
+                v_ind = len(var_index)
+                var_index[term] = v_ind
+            slots.append((len(tokens), v_ind))
+            tokens.append(None)
+        elif isinstance(term, Constant):
+            tokens.append((1, term.get_name()))
+        elif isinstance(term, (int, float)):
+            tokens.append((2, term))
+        elif isinstance(term, Pair):
+            tokens.append((5,))
+            _add(term.get_left())
+            _add(term.get_right())
+        elif isinstance(term, List):
+            tokens.append((4, len(term.arguments)))
+            for arg in term.arguments:
+                _add(arg)
+        elif isinstance(term, Structure):
+            tokens.append((3, term.get_name(), len(term.arguments)))
+            for arg in term.arguments:
+                _add(arg)
+        else:
+            tokens.append((6, str(term)))
+
+    for arg in atom.arguments:
+        # most arguments are variables and constants
+        if arg.__class__ is Variable:
+            v_ind = var_index.get(arg)
+            if v_ind is None:
+                v_ind = len(var_index)
+                var_index[arg] = v_ind
+            slots.append((len(tokens), v_ind))
+            tokens.append(None)
+        elif arg.__class__ is Constant:
+            tokens.append((1, arg.name))
+        else:
+            _add(arg)
+
+    return (role, negated, predicate.get_name(), predicate.get_arity()), tokens, slots
+
+
+def _canonical_key(head: Atom, body: Sequence[Union[Atom, Not]], exact: bool = True) -> Tuple:
+    """
+    Canonical form of a clause, invariant to the renaming of variables and the order of the body literals
+
+    Variables are coloured by iterative refinement: the colour of a variable is refined with the literals
+    (described by the colours of their variables) it appears in, and its positions in them.
+    Variables that still share a colour are individualised one by one and the smallest resulting form is taken,
+    so that the key is exact also for symmetric clauses. Two individualisations leading to the same form give an
+    automorphism of the clause (e.g., swapping A1 with A2 and B1 with B2 in p(M) :- q(M,A1),r(A1,B1),q(M,A2),r(A2,B2));
+    the variables it maps onto each other lead to the same forms, so only one of them is individualised.
+
+    Without exact, the form after the refinement is returned: it is the same for variants, but can be the same for
+    clauses that are not variants.
+    """
+    var_index: Dict[Variable, int] = {}
+    templates = [_literal_template(head, 0, var_index)] + [_literal_template(x, 1, var_index) for x in body]
+    num_vars = len(var_index)
+
+    occurrences = [[] for _ in range(num_vars)]
+    for l_ind, (_, _, slots) in enumerate(templates):
+        for t_ind, v_ind in slots:
+            occurrences[v_ind].append((l_ind, t_ind))
+
+    def _literal_keys(colours):
+        keys = []
+        for prefix, tokens, slots in templates:
+            if slots:
+                tokens = list(tokens)
+                for t_ind, v_ind in slots:
+                    tokens[t_ind] = (0, colours[v_ind])
+            keys.append(prefix + tuple(tokens))
+        return keys
+
+    def _refine(colours):
+        num_colours = len(set(colours))
+        while True:
+            keys = _literal_keys(colours)
+            signatures = [(colours[v], tuple(sorted([(keys[l_ind], t_ind) for l_ind, t_ind in occurrences[v]])))
+                          for v in range(num_vars)]
+            ranks = dict([(sig, ind) for ind, sig in enumerate(sorted(set(signatures)))])
+            colours = [ranks[sig] for sig in signatures]
+            if len(ranks) == num_colours:
+                return colours, keys
+            elif len(ranks) == num_vars:
+                # every variable has its own colour, no further refinement possible
+                return colours, _literal_keys(colours)
+            num_colours = len(ranks)
+
+    # leaves of the search: [form, colours, individualised variables] of the first leaf and of the smallest one,
+    #     and the automorphisms found by comparing leaves (variable -> variable)
+    first = []
+    best = []
+    automorphisms = []
+
+    def _orbit_roots(fixed):
+        # orbits of the variables under the automorphisms found that fix the individualised variables
+        parent = list(range(num_vars))
+
+        def _find(v):
+            while parent[v] != v:
+                parent[v] = parent[parent[v]]
+                v = parent[v]
+            return v
+
+        for perm in automorphisms:
+            if all([perm[v] == v for v in fixed]):
+                for v in range(num_vars):
+                    parent[_find(v)] = _find(perm[v])
+        return _find
+
+    def _search(colours, path):
+        # returns the level of the search to go back to when the subtree is equivalent to one already explored
+        colours, keys = _refine(colours)
+        counts = Counter(colours)
+        if len(counts) == num_vars:
+            form = keys[0], tuple(sorted(keys[1:]))
+            if not first:
+                first.extend([form, colours, path])
+                best.extend([form, colours, path])
+                return None
+            for leaf_form, leaf_colours, leaf_path in (first, best):
+                if form == leaf_form:
+                    # same form: mapping the variables of equal colours is an automorphism of the clause, and the
+                    #     subtree since the divergence of the two paths is equivalent to the explored one
+                    by_colour = [0] * num_vars
+                    for v, c in enumerate(leaf_colours):
+                        by_colour[c] = v
+                    automorphisms.append([by_colour[c] for c in colours])
+                    level = 0
+                    while level < len(path) and path[level] == leaf_path[level]:
+                        level += 1
+                    return level
+            if form < best[0]:
+                best[:] = [form, colours, path]
+            return None
+
+        # individualise the variables of the first colour shared by several variables, one per orbit
+        cell_colour = min([c for c, n in counts.items() if n > 1])
+        explored = []
+        for v in range(num_vars):
+            if colours[v] != cell_colour:
+                continue
+            if explored:
+                find = _orbit_roots(path)
+                if find(v) in set([find(u) for u in explored]):
+                    continue
+            explored.append(v)
+            level = _search([2 * c + (1 if c == cell_colour and u != v else 0) for u, c in enumerate(colours)],
+                            path + [v])
+            if level is not None and level < len(path):
+                return level
+        return None
+
+    if not exact:
+        keys = _refine([0] * num_vars)[1]
+        return keys[0], tuple(sorted(keys[1:]))
+    _search([0] * num_vars, [])
+    return best[0]
+
+
+def _match_term(pattern, term, binding: Dict[Variable, Term]) -> bool:
+    # one-way matching: binds the variables of the pattern, the term is left as it is
+    if isinstance(pattern, Variable):
+        bound = binding.get(pattern)
+        if bound is None:
+            binding[pattern] = term
+            return True
+        return bound == term
+    elif isinstance(pattern, Structure):
+        return (
+                pattern.__class__ is term.__class__
+                and pattern.name == term.name
+                and len(pattern.arguments) == len(term.arguments)
+                and all([_match_term(x, y, binding) for x, y in zip(pattern.arguments, term.arguments)])
+        )
+    else:
+        return pattern == term
+
+
+def _literal_variables(literal: Union[Atom, Not]) -> Sequence[Variable]:
+    variables = []
+
+    def _collect(term):
+        if isinstance(term, Variable):
+            if term not in variables:
+                variables.append(term)
+        elif isinstance(term, Structure):
+            for arg in term.arguments:
+                _collect(arg)
+
+    for t in literal.get_terms():
+        _collect(t)
+
+    return variables
+
+
+def _literal_sign(literal: Union[Atom, Not]) -> Tuple[bool, Predicate]:
+    return (True, literal.get_atom().get_predicate()) if isinstance(literal, Not) else (False, literal.get_predicate())
+
+
+def _literal_atom(literal: Union[Atom, Not]) -> Atom:
+    return literal.get_atom() if isinstance(literal, Not) else literal
+
+
+def _theta_subsumes(general: Clause, specific: Clause) -> bool:
+    # the head fixes the values of the head variables
+    binding = {}
+    general_head, specific_head = general.get_head(), specific.get_head()
+    if general_head.get_predicate() != specific_head.get_predicate() \
+            or not all([_match_term(x, y, binding) for x, y in zip(general_head.arguments, specific_head.arguments)]):
+        return False
+
+    domains: Dict[Variable, Set] = dict([(v, {t}) for v, t in binding.items()])
+
+    # initial domains from the term signatures: a variable can only take the terms appearing
+    #     (at least) at all predicates and argument positions the variable appears at
+    general_sigs = general.get_term_signatures()
+    terms_at: Dict[Tuple[str, int], Set] = {}
+    for t, sig in specific.get_term_signatures().items():
+        for key in sig:
+            terms_at.setdefault(key, set()).add(t)
+
+    for v, sig in general_sigs.items():
+        if not isinstance(v, Variable):
+            continue
+        values = None
+        for key in sig:
+            values = set(terms_at.get(key, ())) if values is None else values & terms_at.get(key, set())
+        values = values & domains[v] if v in domains else values
+        if not values:
+            return False
+        domains[v] = values
+
+    # every body literal is a table constraint: the tuples of values of its variables
+    #     for which the literal matches a literal of the other clause
+    specific_literals: Dict[Tuple[bool, Predicate], list] = {}
+    for lit in specific.get_literals():
+        specific_literals.setdefault(_literal_sign(lit), []).append(_literal_atom(lit))
+
+    constraints = []
+    for lit in set(general.get_literals()):
+        variables = _literal_variables(lit)
+        atom = _literal_atom(lit)
+        tuples = set()
+        for candidate in specific_literals.get(_literal_sign(lit), ()):
+            b = {}
+            if all([_match_term(x, y, b) for x, y in zip(atom.arguments, candidate.arguments)]):
+                values = tuple([b[v] for v in variables])
+                if all([v not in domains or x in domains[v] for v, x in zip(variables, values)]):
+                    tuples.add(values)
+        if not tuples:
+            return False
+        elif variables:
+            constraints.append((variables, list(tuples)))
+
+    for variables, tuples in constraints:
+        for ind, v in enumerate(variables):
+            values = set([x[ind] for x in tuples])
+            domains[v] = domains[v] & values if v in domains else values
+
+    return _subsumption_search(domains, constraints)
+
+
+def _propagate(domains: Dict[Variable, Set], constraints: Sequence[Tuple[Sequence[Variable], Sequence[Tuple]]]) -> bool:
+    # generalised arc consistency: removes the values without a supporting tuple in every constraint
+    changed = True
+    while changed:
+        changed = False
+        for variables, tuples in constraints:
+            valid = [t for t in tuples if all([x in domains[v] for v, x in zip(variables, t)])]
+            if not valid:
+                return False
+            for ind, v in enumerate(variables):
+                supported = set([t[ind] for t in valid])
+                if len(supported) < len(domains[v]):
+                    domains[v] = supported
+                    changed = True
+
+    return True
+
+
+def _subsumption_search(domains: Dict[Variable, Set],
+                        constraints: Sequence[Tuple[Sequence[Variable], Sequence[Tuple]]]) -> bool:
+    if not _propagate(domains, constraints):
+        return False
+
+    open_vars = [v for v, d in domains.items() if len(d) > 1]
+    if not open_vars:
+        # every constraint has a tuple consistent with the (single) values of its variables
+        return True
+
+    var = min(open_vars, key=lambda x: len(domains[x]))
+    for value in domains[var]:
+        new_domains = dict(domains)
+        new_domains[var] = {value}
+        if _subsumption_search(new_domains, constraints):
+            return True
+
+    return False
+
+
+def _subsumption_features(clause: Union[Clause, Atom]) -> Tuple[Predicate, frozenset]:
+    # features preserved by θ-subsumption: the signed body predicates and the constants
+    if isinstance(clause, Atom):
+        clause = Clause(clause, [])
+    features = set()
+
+    def _constants(term):
+        if isinstance(term, Structure):
+            for arg in term.arguments:
+                _constants(arg)
+        elif not isinstance(term, Variable):
+            features.add(("c", term))
+
+    for t in clause.get_head().get_terms():
+        _constants(t)
+    for lit in clause.get_literals():
+        features.add(("l",) + _literal_sign(lit))
+        for t in lit.get_terms():
+            _constants(t)
+
+    return clause.get_head().get_predicate(), frozenset(features)
+
+
 def _create_term_signatures(
         literals: Sequence[Union[Atom, Not]]
 ) -> Dict[Term, Dict[Tuple[Predicate], int]]:
@@ -0,0 +1,214 @@
+import csv
+from typing import Iterable, Iterator, Sequence, Union, Dict, TextIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .commons import Context, Predicate, Constant, Atom, _get_proper_context
+
+# constants are coded by their (dense, per type) ids
+CODE_DTYPE = "int32"
+
+
+class FactTable:
+    """
+    Ground facts of a single predicate, stored column-wise
+
+    Every argument is an integer-coded NumPy array: the codes are the ids of the constants in the context
+        (see Context.encode_constants), so no Constant or Atom object is created when the facts are loaded.
+    Atoms are materialized only when asked for (indexing or iterating the table).
+    Engines consume the columns directly (Prolog.assertz_many, LPSolver.assert_facts).
+
+    Needs numpy (pip install pylo[numpy]).
+
+    Arguments:
+        predicate: predicate of the facts
+        columns (optional): one array of constant ids per argument of the predicate (empty table if not given)
+        ctx (optional): context the ids refer to (global context if not given)
+    """
+
+    def __init__(self, predicate: Predicate, columns: Sequence = None, ctx: Context = None):
+        if np is None:
+            raise Exception("FactTable needs numpy (pip install pylo[numpy])")
+
+        if columns is None:
+            columns = [()] * predicate.get_arity()
+        if len(columns) != predicate.get_arity():
+            raise Exception(f"{predicate} needs {predicate.get_arity()} columns (got {len(columns)})")
+
+        self._predicate = predicate
+        self._ctx = _get_proper_context(ctx)
+        self._columns = [np.asarray(x, dtype=CODE_DTYPE) for x in columns]
+
+        if len(set([len(x) for x in self._columns])) > 1:
+            raise Exception("columns of a fact table need to be of the same length")
+
+    @classmethod
+    def from_arrays(cls, predicate: Predicate, arrays: Sequence, ctx: Context = None) -> "FactTable":
+        """
+        Creates the table from one array of constant names per argument
+
+        Every column is coded through its distinct values only (numbers are turned into quoted constants).
+
+        Arguments:
+            predicate: predicate of the facts
+            arrays: arrays (or sequences) of the names of the constants, one per argument
+            ctx (optional): context of the constants
+        """
+        if np is None:
+            raise Exception("FactTable needs numpy (pip install pylo[numpy])")
+
+        ctx = _get_proper_context(ctx)
+        columns = []
+        for values, arg_type in zip(arrays, predicate.get_arg_types()):
+            values, inverse = np.unique(np.asarray(values), return_inverse=True)
+            codes = np.asarray(ctx.encode_constants(values.tolist(), arg_type), dtype=CODE_DTYPE)
+            columns.append(codes[inverse.reshape(-1)])
+
+        return cls(predicate, columns, ctx)
+
+    @classmethod
+    def from_tuples(cls, predicate: Predicate, rows: Iterable[Sequence],
+                    ctx: Context = None, chunk_size: int = 100000) -> "FactTable":
+        """
+        Creates the table from the argument tuples of the facts
+
+        Arguments:
+            predicate: predicate of the facts
+            rows: iterable of argument tuples (names of constants, constants or numbers); consumed one chunk at a time
+            ctx (optional): context of the constants
+            chunk_size: number of rows coded at once
+        """
+        table = cls(predicate, ctx=ctx)
+        table.extend(rows, chunk_size=chunk_size)
+
+        return table
+
+    @classmethod
+    def from_csv(cls, predicate: Predicate, source: Union[str, TextIO], ctx: Context = None,
+                 delimiter: str = ",", header: bool = False, chunk_size: int = 100000) -> "FactTable":
+        """
+        Creates the table from a CSV file with one fact per row (one column per argument)
+
+        Arguments:
+            predicate: predicate of the facts
+            source: path of the file or an opened text stream
+            ctx (optional): context of the constants
+            delimiter: delimiter of the columns
+            header: whether the first row is a header (and skipped)
+            chunk_size: number of rows coded at once
+        """
+        if isinstance(source, str):
+            with open(source, newline="") as f:
+                return cls.from_csv(predicate, f, ctx, delimiter, header, chunk_size)
+
+        reader = csv.reader(source, delimiter=delimiter)
+        if header:
+            next(reader, None)
+
+        return cls.from_tuples(predicate, (x for x in reader if x), ctx, chunk_size)
+
+    def extend(self, rows: Iterable[Sequence], chunk_size: int = 100000) -> None:
+        """
+        Adds the facts with the given argument tuples at the end of the table
+
+        Arguments:
+            rows: iterable of argument tuples (names of constants, constants or numbers)
+            chunk_size: number of rows coded at once
+        """
+        arity = self._predicate.get_arity()
+        arg_types = self._predicate.get_arg_types()
+        columns = [[x] for x in self._columns]
+        chunk = []
+
+        def _code_chunk():
+            for ind, values in enumerate(zip(*chunk)):
+                columns[ind].append(np.asarray(self._ctx.encode_constants(values, arg_types[ind]), dtype=CODE_DTYPE))
+
+        for row in rows:
+            if len(row) != arity:
+                raise Exception(f"{self._predicate} has {arity} arguments, got the row {row}")
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                _code_chunk()
+                chunk = []
+
+        if chunk:
+            _code_chunk()
+
+        self._columns = [np.concatenate(x) for x in columns]
+
+    def get_predicate(self) -> Predicate:
+        return self._predicate
+
+    def get_context(self) -> Context:
+        return self._ctx
+
+    def column(self, position: int):
+        """
+        Returns the (read-only) array of constant ids of the argument at the position
+        """
+        col = self._columns[position].view()
+        col.flags.writeable = False
+        return col
+
+    def codes(self):
+        """
+        Returns the facts as a (number of facts x arity) array of constant ids
+        """
+        return np.stack(self._columns, axis=1) if self._columns else np.zeros((0, 0), dtype=CODE_DTYPE)
+
+    def names(self, position: int, codes: Iterable[int]) -> Sequence[str]:
+        """
+        Returns the names of the constants with the given ids, for the argument at the position
+        """
+        arg_type = self._predicate.get_arg_types()[position]
+        return [self._ctx.constant_name(int(x), arg_type) for x in codes]
+
+    def get_row(self, index: int) -> Sequence[Constant]:
+        """
+        Returns the arguments of the fact at the index (materializing the constants)
+        """
+        return [self._ctx.constant_by_id(int(col[index]), t)
+                for col, t in zip(self._columns, self._predicate.get_arg_types())]
+
+    def select(self, bindings: Dict[int, Union[Constant, str]]) -> "FactTable":
+        """
+        Returns the facts with the given constants at the given positions
+
+        Arguments:
+            bindings: position of the argument -> constant (or its name)
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for position, value in bindings.items():
+            code = self._ctx.encode_constants([value], self._predicate.get_arg_types()[position])[0]
+            mask &= self._columns[position] == code
+
+        return self[mask]
+
+    def unique(self) -> "FactTable":
+        """
+        Returns the table without duplicate facts (in the order of first occurrence)
+        """
+        if len(self) == 0:
+            return self
+        _, first = np.unique(self.codes(), axis=0, return_index=True)
+        return self[np.sort(first)]
+
+    def __len__(self):
+        return len(self._columns[0]) if self._columns else 0
+
+    def __getitem__(self, item) -> Union[Atom, "FactTable"]:
+        # an index gives an atom, a slice (or a mask, or an array of indices) gives a table
+        if isinstance(item, (int, np.integer)):
+            return Atom(self._predicate, self.get_row(item))
+        return FactTable(self._predicate, [x[item] for x in self._columns], self._ctx)
+
+    def __iter__(self) -> Iterator[Atom]:
+        for ind in range(len(self)):
+            yield self[ind]
+
+    def __repr__(self):
+        return f"FactTable({self._predicate}, {len(self)} facts)"
@@ -1,4 +1,6 @@
 from .kanren_utils import construct_recursive_rule
+from ..facttable import FactTable
+from ..magic import MagicSets
 from ..commons import (
     Term,
     Constant,
@@ -23,6 +25,13 @@ from ..commons import (
     Disjunction,
     Recursion,
     Context,
+    InternTable,
+    VariantIndex,
+    SubsumptionIndex,
+    PredicateIndex,
+    INTERN_STRONG,
+    INTERN_WEAK,
+    INTERN_LRU,
     Body
 )
 
@@ -54,5 +63,14 @@ __all__ = [
     "Disjunction",
     "Recursion",
     "Context",
+    "InternTable",
+    "VariantIndex",
+    "SubsumptionIndex",
+    "PredicateIndex",
+    "FactTable",
+    "MagicSets",
+    "INTERN_STRONG",
+    "INTERN_WEAK",
+    "INTERN_LRU",
     "Body"
 ]
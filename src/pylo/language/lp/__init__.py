@@ -1,4 +1,7 @@
 # from .lp import ClausalTheory, parse
+from .reader import read_clauses, parse_clauses
+from ..facttable import FactTable
+from ..magic import MagicSets
 from ..commons import (
     Term,
     Constant,
@@ -31,6 +34,13 @@ from ..commons import (
     list_func,
     List,
     Context,
+    InternTable,
+    VariantIndex,
+    SubsumptionIndex,
+    PredicateIndex,
+    INTERN_STRONG,
+    INTERN_WEAK,
+    INTERN_LRU,
     Body,
     Pair
 )
@@ -73,6 +83,17 @@ __all__ = [
     "list_func",
     "List",
     "Context",
+    "InternTable",
+    "VariantIndex",
+    "SubsumptionIndex",
+    "PredicateIndex",
+    "FactTable",
+    "MagicSets",
+    "read_clauses",
+    "parse_clauses",
+    "INTERN_STRONG",
+    "INTERN_WEAK",
+    "INTERN_LRU",
     "Body",
     "Pair"
 ]
@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from functools import reduce
-from typing import List, Dict, Set, Tuple, Sequence
+import multiprocessing
+from itertools import islice
+from typing import List, Dict, Set, Sequence, Iterator, Union
 
 #import pygraphviz as pgv
 
 # from . import parse
-from ..commons import Predicate, Program, c_var, \
-    c_pred, c_const, c_literal, Clause, _are_two_set_of_literals_identical
+from ..commons import Predicate, Program, Atom, Not, Clause, Literal, Term, Variable, Structure, List as LList, \
+    Pair, Procedure, Context, VariantIndex, PredicateIndex, global_context, _get_proper_context
+from .reader import read_clauses, parse_clauses
 
 
 class ClausalTheory(Program):
@@ -16,63 +18,28 @@ class ClausalTheory(Program):
         assert clauses is not None or read_from_file is not None
 
         if read_from_file:
-            # TODO: fix this for clauses that spread on more than one line
-            clauses = []
-            inf = open(read_from_file)
-
-            for line in inf.readlines():
-                if len(line) > 3 and not line.startswith('#') and not line.startswith('%') and not line.startswith('//') and not line.startswith('true.'):
-                    clauses.append(parse(line.strip().replace('.', '')))
+            clauses = [x for x in read_clauses(read_from_file)
+                       if not (isinstance(x, Atom) and x.get_predicate().get_name() == "true")]
 
         super(ClausalTheory, self).__init__(clauses)
 
-    def get_clauses(self, predicates: Set[Predicate] = None) -> Sequence[Clause]:
-        if predicates:
-            return [x for x in self._formulas if any([p in predicates for p in x.get_predicates()])]
-        else:
-            return self._formulas
-
     def remove_formulas_with_predicates(self, predicates_in_questions: Set[Predicate]):
         """
         Removes all formulas that use at least one of the provided predicates
         """
-        self._formulas = [x for x in self._formulas if not any([p in predicates_in_questions for p in x.get_predicates()])]
-
-    def get_predicates(self) -> Set[Predicate]:
-        return reduce((lambda x, y: x.union(y)), [x.get_predicates().union({x.get_head().get_predicate()}) for x in self._formulas])
+        for cl in self.get_clauses(predicates_in_questions):
+            self.remove_clause(cl)
 
     def remove_duplicates(self):
-        new_forms = []
-
-        frms_per_length = {}
-        for frm in self._formulas:
-            l = len(frm)
-            if l not in frms_per_length:
-                frms_per_length[l] = []
-            frms_per_length[l].append(frm)
-
-        indices_to_remove = {}
-        for l in frms_per_length:
-            indices_to_remove[l] = set()
-            for ind in range(0, len(frms_per_length[l])-1):
-                for ind_i in range(ind+1, len(frms_per_length[l])):
-                    cl1 = frms_per_length[l][ind]
-                    cl2 = frms_per_length[l][ind_i]
-
-                    if cl1.get_predicates() == cl2.get_predicates() \
-                            and _are_two_set_of_literals_identical(cl1.get_term_signatures(), cl2.get_term_signatures()):
-                        indices_to_remove[l].add(ind_i)
-
-        for l in frms_per_length:
-            removed = 0
-            for ind in indices_to_remove[l]:
-                frms_per_length[l].pop(ind - removed)
-                removed += 1
-            new_forms += frms_per_length[l]
-
-        self._formulas = new_forms
-
-    def unfold(self):
+        """
+        Removes the clauses that are variants of a clause appearing before them
+            (equal up to the renaming of variables and the order of the body literals)
+        """
+        index = VariantIndex()
+        self._index = PredicateIndex([x for x in self._index if index.add(x)])
+
+    def unfold(self, max_depth: int = None, max_clauses: int = None, processes: int = 1,
+               ctx: Context = None) -> ClausalTheory:
         """
         Unfolds the theory
 
@@ -82,64 +49,46 @@ class ClausalTheory(Program):
         Would be unfolded into
                 h :- a,b,c,r.
 
+        Arguments: see unfold_iter
+
         Returns:
              unfolded theory [Theory]
         """
+        return ClausalTheory(list(self.unfold_iter(max_depth, max_clauses, processes, ctx)))
 
-        def _unfold_recursively(clause: Clause, clause_index: Dict[Predicate, List[Clause]], forbidden_clauses: Set[
-            Clause]) -> Tuple[List[Clause], Set[Clause]]:
-            cl_predicates = [x.get_predicate() for x in clause.get_literals()]
-            if len(forbidden_clauses) == 0:
-                matching_clauses_for_unfolding = dict([(k, clause_index[k]) for k in cl_predicates if k in clause_index])
-            else:
-                matching_clauses_for_unfolding = dict([(k, [p for p in clause_index[k] if p not in forbidden_clauses]) for k in cl_predicates if k in clause_index])
+    def unfold_iter(self, max_depth: int = None, max_clauses: int = None, processes: int = 1,
+                    ctx: Context = None) -> Iterator[Union[Clause, Atom]]:
+        """
+        Unfolds the theory, yielding the unfolded clauses one at a time
+
+        A body literal is unfolded (resolved with every clause defining its predicate) if its predicate is defined
+            by clauses only, is not recursive (directly or through other predicates; unfolding recursive definitions
+            can remove finite traces) and appears only in positive literals. The definitions of the unfolded
+            predicates are not part of the unfolded theory; facts and all other clauses are, with their body
+            literals unfolded.
+        The unfolded definition of every predicate is computed once and reused by all literals of the predicate.
+
+        Arguments:
+            max_depth (optional): maximal number of nested unfoldings; predicates whose definitions need more are
+                                  kept (and not unfolded)
+            max_clauses (optional): maximal number of clauses to yield (and to keep in the unfolded definition of
+                                    a predicate)
+            processes: number of processes unfolding the top-level clauses (needs the fork start method);
+                       the clauses are sent back pickled, so their symbols are interned in the global context
+            ctx (optional): context of the variables renamed apart (only the global context with processes)
+        """
+        if processes > 1 and ctx is not None and ctx is not global_context:
+            raise Exception("unfolding in processes needs the global context")
 
-            if len(matching_clauses_for_unfolding) == 0:
-                return [clause], set()
-            else:
-                used_clauses = [v for k, v in matching_clauses_for_unfolding.items()]
-                used_clauses = reduce(lambda x, y: x + y, used_clauses)
-                _new_form = clause.unfold_with(used_clauses)
-                # once the recursive clause is used, do not allow another usage again
-                # recursive_clauses = set([x for x in used_clauses if x.is_recursive()])
-                # used_clauses = [x for x in used_clauses if not x.is_recursive()]
-                # NOT NEEDED ANYMORE BECAUSE RECURSIVE PREDICATES ARE REMOVED FROM THE CANDIDATE SET
-                final = [_unfold_recursively(x, clause_index, forbidden_clauses) for x in _new_form]
-
-                final_clauses = reduce(lambda x, y: x + y, [z[0] for z in final])
-                final_exclusion = reduce(lambda x, y: x.union(y), [z[1] for z in final])
-
-                return final_clauses, final_exclusion.union(used_clauses)
-
-        # create clause index
-        clause_index = {}
-        new_set_of_formulas = []
-        recursively_defined_predicates = set()
-
-        for cl in self._formulas:
-            if cl.is_recursive():
-                # detect predicates with recursive definitions
-                # do not use them for unfolding because they can remove finite traces
-                recursively_defined_predicates.add(cl.get_head().get_predicate())
-
-            head_pred = cl.get_head().get_predicate()
-            if head_pred not in clause_index:
-                clause_index[head_pred] = []
-            clause_index[head_pred].append(cl)
-
-        clauses_to_exclude = set()
-        # excluding recursively defined predicates from the candidate set, so that they are not used
-        clause_index = dict([(k, v) for k, v in clause_index.items() if k not in recursively_defined_predicates])
-
-        for cl in self.get_clauses():
-            if cl in clauses_to_exclude:
-                continue
-
-            cls, excls = _unfold_recursively(cl, clause_index, set()) # at the beginning, no forbidden clause (used for recursive ones)
-            new_set_of_formulas += cls
-            clauses_to_exclude = clauses_to_exclude.union(excls)
-
-        return ClausalTheory(new_set_of_formulas)
+        unfolder = _Unfolder(self._index, max_depth, max_clauses, _get_proper_context(ctx))
+        items = [x for x in self._index if unfolder.is_top_level(x)]
+
+        if processes > 1:
+            output = _unfold_in_processes(unfolder, items, processes)
+        else:
+            output = (y for x in items for y in unfolder.unfold(x))
+
+        yield from islice(output, max_clauses)
 
     # def visualize(self, filename: str, only_numbers=False):
     #     predicates_in_bodies_only = set()  # names are the predicate names
@@ -174,33 +123,266 @@ class ClausalTheory(Program):
     #     graph.draw(filename, prog='dot')
 
     def __str__(self):
-        return "\n".join([str(x) for x in self._formulas])
-
-    def __len__(self):
-        return len(self._formulas)
+        return "\n".join([str(x) for x in self._index])
 
     def num_literals(self):
-        return sum([len(x)+1 for x in self._formulas])
+        return sum([len(x)+1 for x in self._index])
 
 
-def _convert_to_atom(string: str):
-    pred, args = string.strip().replace(')', '').split('(')
-    args = args.split(',')
+class _Unfolder:
+    """
+    Unfolds clauses with the memoized unfolded definitions of the predicates of a theory (see ClausalTheory.unfold_iter)
+    """
 
-    pred = c_pred(pred, len(args))
-    args = [c_const(x) if x.islower() else c_var(x) for x in args]
+    def __init__(self, index: PredicateIndex, max_depth: int, max_clauses: int, ctx: Context):
+        self._index = index
+        self._max_depth = max_depth
+        self._max_clauses = max_clauses
+        self._ctx = ctx
+        self._depths: Dict[Predicate, int] = {}  # predicate -> nesting depth of its unfolding (0: not unfolded)
+        self._definitions: Dict[Predicate, List[Clause]] = {}  # predicate -> unfolded definition
+        self._templates: Dict[Predicate, List[_Template]] = {}
 
-    return c_literal(pred, args)
+    def depth(self, predicate: Predicate) -> int:
+        """
+        Returns the number of nested unfoldings the definition of the predicate needs (0 if it is not unfolded)
+        """
+        depth = self._depths.get(predicate)
+        if depth is None:
+            definition = self._index.defining(predicate)
+            if not definition or not self._index.dependents(predicate) or self._index.is_recursive(predicate) \
+                    or self._index.is_negated(predicate) or not all([isinstance(x, Clause) for x in definition]):
+                depth = 0
+            else:
+                depth = 1 + max([self.depth(x) for x in self._index.dependencies(predicate)], default=0)
+                if self._max_depth is not None and depth > self._max_depth:
+                    depth = 0
+            self._depths[predicate] = depth
+        return depth
 
+    def is_top_level(self, item: Union[Clause, Procedure, Atom]) -> bool:
+        return not isinstance(item, Clause) or self.depth(item.get_head().get_predicate()) == 0
 
-def parse(string: str):
-    if ":-" in string:
-        head, body = string.split(":-")
-        head, body = head.strip(), body.strip()
-        body = [x + ")" for x in body.split("),")]
-        head, body = _convert_to_atom(head), [_convert_to_atom(x) for x in body]
-        return Clause(head, body)
-    else:
-        return _convert_to_atom(string)
+    def definition(self, predicate: Predicate) -> Sequence[Clause]:
+        """
+        Returns the unfolded definition of the predicate (None if the predicate is not unfolded)
+        """
+        if self.depth(predicate) == 0:
+            return None
+        if predicate not in self._definitions:
+            unfolded = (y for x in self._index.defining(predicate) for y in self.unfold(x))
+            self._definitions[predicate] = list(islice(unfolded, self._max_clauses))
+            self._templates[predicate] = [_Template(x) for x in self._definitions[predicate]]
+        return self._definitions[predicate]
+
+    def unfold(self, item: Union[Clause, Procedure, Atom]) -> Iterator[Union[Clause, Procedure, Atom]]:
+        if not isinstance(item, Clause):
+            yield item
+            return
+
+        head = item.get_head()
+        literals = list(item.get_literals())
+        taken = {v.get_name() for x in [head] + literals for v in _literal_variables(x)}
+        yield from self._unfold_literals(head, [], literals, 0, taken)
+
+    def _unfold_literals(self, head: Atom, done: List[Literal], todo: List[Literal], position: int,
+                         taken: Set[str]) -> Iterator[Clause]:
+        # the literals in done are unfolded, todo[position] is unfolded next; taken are the names of the variables
+        start = position
+        while position < len(todo) and (isinstance(todo[position], Not)
+                                        or self.definition(todo[position].get_predicate()) is None):
+            position += 1
+        done = done + todo[start:position]
+
+        if position == len(todo):
+            yield Clause(head, done)
+            return
+
+        literal = todo[position]
+        for template in self._templates[literal.get_predicate()]:
+            if template.simple:
+                # the head of the definition has distinct variables as arguments: they are replaced by the arguments
+                #     of the literal, and only the other variables of the definition need new names
+                renaming = dict(zip(template.head_arguments, literal.get_arguments()))
+                new_taken = taken
+                if template.local_variables:
+                    new_taken = set(taken)
+                    for v in template.local_variables:
+                        renaming[v] = _fresh_variable(v, new_taken, self._ctx)
+                body = [_substitute_literal(x, renaming, walk=False) for x in template.body]
+                yield from self._unfold_literals(head, done + body, todo, position + 1, new_taken)
+            else:
+                cl = _rename_apart(template.clause, taken, self._ctx)
+                subst = {}
+                if not all([_unify(x, y, subst) for x, y in zip(literal.get_arguments(),
+                                                                 cl.get_head().get_arguments())]):
+                    continue
 
+                new_head = _substitute_literal(head, subst)
+                new_done = [_substitute_literal(x, subst) for x in done + list(cl.get_literals())]
+                new_todo = [_substitute_literal(x, subst) for x in todo[position + 1:]]
+                new_taken = {v.get_name() for x in [new_head] + new_done + new_todo for v in _literal_variables(x)}
+                yield from self._unfold_literals(new_head, new_done, new_todo, 0, new_taken)
+
+
+class _Template:
+    """
+    Unfolded clause of a definition, prepared for resolving literals with it
+    """
+    __slots__ = ("clause", "head_arguments", "body", "local_variables", "simple")
+
+    def __init__(self, clause: Clause):
+        self.clause = clause
+        self.head_arguments = clause.get_head().get_arguments()
+        self.body = list(clause.get_literals())
+        self.simple = all([isinstance(x, Variable) for x in self.head_arguments]) \
+            and len(set(self.head_arguments)) == len(self.head_arguments)
+        head_variables = set(self.head_arguments)
+        self.local_variables = [v for v in dict.fromkeys([v for x in self.body for v in _literal_variables(x)])
+                                if v not in head_variables]
+
+
+# unfolder of the processes forked by _unfold_in_processes
+_process_unfolder: _Unfolder = None
+
+
+def _unfold_in_process(item: Union[Clause, Atom]) -> List[Union[Clause, Atom]]:
+    return list(_process_unfolder.unfold(item))
+
+
+def _unfold_in_processes(unfolder: _Unfolder, items: Sequence[Union[Clause, Atom]],
+                         processes: int) -> Iterator[Union[Clause, Atom]]:
+    # the unfolded definitions are computed before forking, so that all processes share them;
+    #     the unfolded clauses are pickled back (their symbols are interned again in the global context)
+    global _process_unfolder
+    for p in {x.get_predicate() for item in items if isinstance(item, Clause) for x in item.get_literals()}:
+        unfolder.definition(p)
+    _process_unfolder = unfolder
+
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        for clauses in pool.imap(_unfold_in_process, items):
+            yield from clauses
+
+    _process_unfolder = None
+
+
+def _term_variables(term: Union[Term, int, float], variables: Dict[Variable, None]) -> None:
+    if isinstance(term, Variable):
+        variables[term] = None
+    elif isinstance(term, Structure):
+        for arg in term.get_arguments():
+            _term_variables(arg, variables)
+
+
+def _literal_variables(literal: Literal) -> Sequence[Variable]:
+    variables = {}
+    for arg in (literal.get_atom() if isinstance(literal, Not) else literal).get_arguments():
+        _term_variables(arg, variables)
+    return list(variables)
+
+
+def _fresh_variable(variable: Variable, taken: Set[str], ctx: Context) -> Variable:
+    # the variable, or the variable with the first numeric suffix whose name is not taken (the name is taken then)
+    name = variable.get_name()
+    ind = 0
+    while name in taken:
+        ind += 1
+        name = f"{variable.get_name()}_{ind}"
+    taken.add(name)
+    return variable if ind == 0 else ctx.variable(name, variable.get_type())
+
+
+def _rename_apart(clause: Clause, taken: Set[str], ctx: Context) -> Clause:
+    # renames the variables of the clause whose names are taken
+    taken = set(taken)
+    renaming = {}
+    for literal in [clause.get_head()] + list(clause.get_literals()):
+        for v in _literal_variables(literal):
+            if v not in renaming:
+                renaming[v] = _fresh_variable(v, taken, ctx)
+
+    return Clause(_substitute_literal(clause.get_head(), renaming, walk=False),
+                  [_substitute_literal(x, renaming, walk=False) for x in clause.get_literals()])
+
+
+def _walk(term: Union[Term, int, float], subst: Dict[Variable, Term]) -> Union[Term, int, float]:
+    while isinstance(term, Variable) and term in subst:
+        term = subst[term]
+    return term
+
+
+def _unify(left: Union[Term, int, float], right: Union[Term, int, float], subst: Dict[Variable, Term]) -> bool:
+    """
+    Extends the substitution to a most general unifier of the terms (with the occurs check)
+
+    Return:
+        False if the terms do not unify, or only with a cyclic binding (X = f(X))
+    """
+    stack = [(left, right)]
+    while stack:
+        left, right = stack.pop()
+        left, right = _walk(left, subst), _walk(right, subst)
+        if left is right:
+            continue
+        elif isinstance(right, Variable):
+            # variables of the right term are bound first, so that the variables of the left term are kept
+            if _occurs(right, left, subst):
+                return False
+            subst[right] = left
+        elif isinstance(left, Variable):
+            if _occurs(left, right, subst):
+                return False
+            subst[left] = right
+        elif isinstance(left, Pair) and isinstance(right, Pair):
+            stack += [(left.get_left(), right.get_left()), (left.get_right(), right.get_right())]
+        elif isinstance(left, Structure) and isinstance(right, Structure) and type(left) == type(right) \
+                and left.get_functor() == right.get_functor() and left.arity() == right.arity():
+            stack += list(zip(left.get_arguments(), right.get_arguments()))
+        elif isinstance(left, Structure) or isinstance(right, Structure) or left != right:
+            return False
+    return True
+
+
+def _occurs(variable: Variable, term: Union[Term, int, float], subst: Dict[Variable, Term]) -> bool:
+    # whether the variable occurs in the term, under the substitution
+    stack = [term]
+    while stack:
+        term = _walk(stack.pop(), subst)
+        if term is variable:
+            return True
+        elif isinstance(term, Structure):
+            stack += list(term.get_arguments())
+    return False
+
+
+def _substitute_term(term: Union[Term, int, float], subst: Dict[Variable, Term],
+                     walk: bool = True) -> Union[Term, int, float]:
+    # walk: whether the values of the substitution are substituted as well (False for renamings)
+    if isinstance(term, Variable):
+        if not walk:
+            return subst.get(term, term)
+        term = _walk(term, subst)
+
+    if isinstance(term, Pair):
+        return Pair(_substitute_term(term.get_left(), subst, walk), _substitute_term(term.get_right(), subst, walk))
+    elif isinstance(term, LList):
+        return LList([_substitute_term(x, subst, walk) for x in term.get_arguments()])
+    elif isinstance(term, Structure):
+        return Structure(term.get_functor(), [_substitute_term(x, subst, walk) for x in term.get_arguments()])
+    return term
+
+
+def _substitute_literal(literal: Literal, subst: Dict[Variable, Term], walk: bool = True) -> Literal:
+    if isinstance(literal, Not):
+        return Not(_substitute_literal(literal.get_atom(), subst, walk))
+    return Atom(literal.get_predicate(), [_substitute_term(x, subst, walk) for x in literal.get_arguments()])
 
+def parse(string: str):
+    """
+    Parses a single atom or clause in Prolog syntax (the final dot is optional)
+    """
+    string = string.strip()
+    clauses = parse_clauses(string if string.endswith(".") else string + ".")
+    if len(clauses) != 1:
+        raise Exception(f"expected a single clause, got {len(clauses)}: {string}")
+    return clauses[0]
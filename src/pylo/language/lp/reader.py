@@ -0,0 +1,533 @@
+"""
+Streaming reader of Prolog programs and knowledge bases
+
+The input is read in blocks and split into the texts of clauses (a single regular expression finds the end of
+every clause, skipping quoted atoms, strings and comments), so that memory stays bounded by the size of a block and
+of the largest clause. Every clause is tokenized and parsed (standard operator syntax) into a tree of plain tuples,
+which is turned into pylo objects (Atom or Clause). Parsing can be split over a process pool in chunks of clauses;
+the workers only return the trees, the pylo objects are created in the calling process.
+"""
+import io
+import re
+from collections import deque
+from multiprocessing import Pool
+from typing import Union, Iterator, Sequence, TextIO, Tuple, Dict, List as TList
+
+from ..commons import Atom, Not, Clause, Predicate, Constant, Variable, Structure, List, Pair, Functor, Context, \
+    _get_proper_context
+
+# finds the ends of clauses; quoted atoms, strings, comments and runs of symbol characters (e.g., =..) are matched as
+#     a whole, so that the dots in them are skipped, and the opening of an unterminated one signals that more input is
+#     needed. The end is a dot on its own followed by layout or a comment (the input ends with a newline)
+_CLAUSE_END_RE = re.compile(r"""
+    '(?:[^'\\]|\\.|'')*'
+  | "(?:[^"\\]|\\.|"")*"
+  | %[^\n]*
+  | /\*.*?\*/
+  | 0'(?:\\.|''|[^\\'])
+  | (?P<open>['"]|/\*)
+  | (?P<end>\.(?=[\s%]))
+  | [-+*/\\^<>=~:.?@#&$]+
+""", re.X | re.S)
+
+_TOKEN_RE = re.compile(r"""
+    (?P<layout>\s+|%[^\n]*|/\*.*?\*/)
+  | (?P<end>\.(?=[\s%]|$))
+  | (?P<float>\d+\.\d+(?:[eE][+-]?\d+)?|\d+[eE][+-]?\d+)
+  | (?P<char>0'(?:\\.|''|[^\\']))
+  | (?P<based>0x[0-9a-fA-F]+|0o[0-7]+|0b[01]+)
+  | (?P<int>\d+)
+  | (?P<var>[_A-Z][A-Za-z0-9_]*)
+  | (?P<name>[a-z][A-Za-z0-9_]*)
+  | (?P<qname>'(?:[^'\\]|\\.|'')*')
+  | (?P<string>"(?:[^"\\]|\\.|"")*")
+  | (?P<symbol>[-+*/\\^<>=~:.?@#&$]+)
+  | (?P<solo>[!,;|()\[\]{}])
+  | (?P<error>.)
+""", re.X | re.S)
+
+_PLAIN_NAME_RE = re.compile(r"[a-z][A-Za-z0-9_]*")
+
+# flat facts (atoms, variables, numbers and strings as arguments), by far the most common clauses in large files,
+#     are parsed without the tokenizer
+_SIMPLE_ARG = r"[a-z][A-Za-z0-9_]*|[_A-Z][A-Za-z0-9_]*|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?" \
+              r'''|'(?:[^'\\]|'')*'|"(?:[^"\\]|"")*"'''
+_SIMPLE_ARG_RE = re.compile(_SIMPLE_ARG)
+_FLAT_FACT_RE = re.compile(rf"\s*([a-z][A-Za-z0-9_]*)\(\s*((?:{_SIMPLE_ARG})(?:\s*,\s*(?:{_SIMPLE_ARG}))*)\s*\)\s*\.\s*")
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f", "v": "\v", "0": "\0", "e": "\x1b",
+            "\\": "\\", "'": "'", '"': '"', "`": "`", "\n": ""}
+
+_PREFIX_OPS = {
+    ":-": (1200, "fx"), "?-": (1200, "fx"),
+    "dynamic": (1150, "fx"), "discontiguous": (1150, "fx"), "initialization": (1150, "fx"),
+    "multifile": (1150, "fx"), "table": (1150, "fx"), "module_transparent": (1150, "fx"),
+    "\\+": (900, "fy"), "-": (200, "fy"), "+": (200, "fy"), "\\": (200, "fy"),
+}
+
+_INFIX_OPS = {
+    ":-": (1200, "xfx"), "-->": (1200, "xfx"),
+    ";": (1100, "xfy"), "|": (1100, "xfy"), "->": (1050, "xfy"), "*->": (1050, "xfy"),
+    ",": (1000, "xfy"),
+    "=": (700, "xfx"), "\\=": (700, "xfx"), "==": (700, "xfx"), "\\==": (700, "xfx"),
+    "@<": (700, "xfx"), "@>": (700, "xfx"), "@=<": (700, "xfx"), "@>=": (700, "xfx"),
+    "=..": (700, "xfx"), "is": (700, "xfx"), "=:=": (700, "xfx"), "=\\=": (700, "xfx"),
+    "<": (700, "xfx"), ">": (700, "xfx"), "=<": (700, "xfx"), ">=": (700, "xfx"),
+    ":": (200, "xfy"),
+    "+": (500, "yfx"), "-": (500, "yfx"), "/\\": (500, "yfx"), "\\/": (500, "yfx"), "xor": (500, "yfx"),
+    "*": (400, "yfx"), "/": (400, "yfx"), "//": (400, "yfx"), "rem": (400, "yfx"), "mod": (400, "yfx"),
+    "div": (400, "yfx"), "<<": (400, "yfx"), ">>": (400, "yfx"),
+    "**": (200, "xfx"), "^": (200, "xfy"),
+}
+
+# Parse trees (plain tuples, so that they can be sent between processes)
+#     ('v', name)                   variable
+#     ('a', name)                   atom; ('q', name) for quoted atoms that are not plain names (name without quotes)
+#     ('s', text)                   double-quoted string (with the quotes)
+#     ('c', name, (args))           compound term
+#     ('l', (elements), tail)       list; tail is None for proper lists
+#     int / float                   numbers
+
+
+def _unquote(text: str) -> str:
+    content = text[1:-1]
+    if "\\" not in content:
+        return content.replace(text[0] * 2, text[0])
+
+    chars = []
+    ind = 0
+    while ind < len(content):
+        ch = content[ind]
+        if ch == "\\" and ind + 1 < len(content):
+            chars.append(_ESCAPES.get(content[ind + 1], content[ind + 1]))
+            ind += 2
+        elif ch == text[0] and ind + 1 < len(content) and content[ind + 1] == text[0]:
+            chars.append(ch)
+            ind += 2
+        else:
+            chars.append(ch)
+            ind += 1
+    return "".join(chars)
+
+
+def _tokenize(text: str) -> TList[Tuple[str, Union[str, int, float], bool]]:
+    # tokens as (kind, value, preceded by layout)
+    tokens = []
+    layout = True
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        value = m.group()
+        if kind == "layout":
+            layout = True
+            continue
+        elif kind == "error":
+            raise Exception(f"syntax error: unexpected character {value!r} in {text.strip()}")
+        elif kind == "int":
+            kind, value = "number", int(value)
+        elif kind == "float":
+            kind, value = "number", float(value)
+        elif kind == "based":
+            kind, value = "number", int(value[2:], {"x": 16, "o": 8, "b": 2}[value[1]])
+        elif kind == "char":
+            kind, value = "number", ord("'" if value[2:] == "''" else _unquote("'" + value[2:] + "'"))
+        tokens.append((kind, value, layout))
+        layout = False
+
+    return tokens
+
+
+class _Parser:
+    """
+    Operator precedence parser of the tokens of a single clause
+    """
+
+    def __init__(self, text: str):
+        self._text = text
+        self._tokens = _tokenize(text)
+        self._pos = 0
+
+    def _error(self, message: str):
+        raise Exception(f"syntax error: {message} in {self._text.strip()}")
+
+    def _peek(self, offset: int = 0):
+        ind = self._pos + offset
+        return self._tokens[ind] if ind < len(self._tokens) else ("eof", None, True)
+
+    def _next(self):
+        token = self._peek()
+        self._pos += 1
+        return token
+
+    def _expect(self, value: str):
+        kind, val, _ = self._next()
+        if val != value or kind not in ("solo", "symbol", "name"):
+            self._error(f"expected '{value}', got '{val}'")
+
+    def clause(self):
+        term, _ = self.term(1200)
+        kind, value, _ = self._next()
+        if kind != "end":
+            self._error(f"operator expected, got '{value}'")
+        return term
+
+    @staticmethod
+    def _atom_name(kind: str, value: str):
+        # name of an atom-like token (None if the token cannot be an atom)
+        if kind in ("name", "symbol"):
+            return value
+        elif kind == "solo" and value in ("!", ";", ",", "|"):
+            return value
+        return None
+
+    def _is_term_start(self, token) -> bool:
+        kind, value, _ = token
+        if kind in ("eof", "end"):
+            return False
+        elif kind == "solo":
+            return value in ("(", "[", "{", "!")
+        elif kind in ("name", "symbol"):
+            return value not in _INFIX_OPS or value in _PREFIX_OPS
+        return True
+
+    def _arguments(self, closing: str) -> Tuple:
+        args = [self.term(999)[0]]
+        while self._peek()[1] == "," and self._peek()[0] == "solo":
+            self._next()
+            args.append(self.term(999)[0])
+        self._expect(closing)
+        return tuple(args)
+
+    def _primary(self, max_prec: int):
+        kind, value, _ = self._next()
+
+        if kind == "number":
+            return value, 0
+        elif kind == "var":
+            return ("v", value), 0
+        elif kind == "string":
+            return ("s", value), 0
+        elif kind == "solo" and value == "(":
+            term, _ = self.term(1200)
+            self._expect(")")
+            return term, 0
+        elif kind == "solo" and value == "[":
+            if self._peek()[1] == "]":
+                self._next()
+                return self._after_name("[]", max_prec)
+            elements = self._arguments_list()
+            return elements, 0
+        elif kind == "solo" and value == "{":
+            if self._peek()[1] == "}":
+                self._next()
+                return self._after_name("{}", max_prec)
+            term, _ = self.term(1200)
+            self._expect("}")
+            return ("c", "{}", (term,)), 0
+        elif kind == "qname":
+            name = _unquote(value)
+            return self._after_name(name, max_prec, quoted=True)
+
+        name = self._atom_name(kind, value)
+        if name is None:
+            self._error(f"unexpected '{value}'")
+
+        following = self._peek()
+        # negative numbers
+        if name == "-" and following[0] == "number" and not following[2]:
+            self._next()
+            return -following[1], 0
+
+        # prefix operators
+        if name in _PREFIX_OPS and not (following[0] == "solo" and following[1] == "(" and not following[2]) \
+                and self._is_term_start(following):
+            prec, op_type = _PREFIX_OPS[name]
+            prec = min(prec, max_prec)
+            arg, _ = self.term(prec - 1 if op_type == "fx" else prec)
+            return ("c", name, (arg,)), prec
+
+        return self._after_name(name, max_prec)
+
+    def _after_name(self, name: str, max_prec: int, quoted: bool = False):
+        following = self._peek()
+        if following[0] == "solo" and following[1] == "(" and not following[2]:
+            self._next()
+            return ("c", name, self._arguments(")")), 0
+
+        if quoted and not _PLAIN_NAME_RE.fullmatch(name):
+            return ("q", name), 0
+        prec = _INFIX_OPS.get(name, _PREFIX_OPS.get(name, (0, None)))[0]
+        return ("a", name), (prec if prec <= max_prec else 0)
+
+    def _arguments_list(self):
+        elements = [self.term(999)[0]]
+        tail = None
+        while True:
+            kind, value, _ = self._next()
+            if kind == "solo" and value == ",":
+                elements.append(self.term(999)[0])
+            elif kind == "solo" and value == "|":
+                tail = self.term(999)[0]
+                self._expect("]")
+                break
+            elif kind == "solo" and value == "]":
+                break
+            else:
+                self._error(f"expected ',', '|' or ']' in a list, got '{value}'")
+
+        if isinstance(tail, tuple) and tail[0] == "l":
+            # [a|[b,c]] is [a,b,c]
+            return "l", tuple(elements) + tail[1], tail[2]
+        elif tail == ("a", "[]"):
+            return "l", tuple(elements), None
+        return "l", tuple(elements), tail
+
+    def term(self, max_prec: int):
+        left, left_prec = self._primary(max_prec)
+
+        while True:
+            kind, value, _ = self._peek()
+            name = self._atom_name(kind, value)
+            if name is None or name not in _INFIX_OPS:
+                break
+
+            prec, op_type = _INFIX_OPS[name]
+            left_max = prec if op_type == "yfx" else prec - 1
+            right_max = prec if op_type == "xfy" else prec - 1
+            if prec > max_prec or left_prec > left_max:
+                break
+
+            self._next()
+            right, _ = self.term(right_max)
+            left, left_prec = ("c", ";" if name == "|" else name, (left, right)), prec
+
+        return left, left_prec
+
+
+def _simple_arg(text: str):
+    first = text[0]
+    if first.islower():
+        return "a", text
+    elif first.isupper() or first == "_":
+        return "v", text
+    elif first == "'":
+        name = _unquote(text)
+        return ("a", name) if _PLAIN_NAME_RE.fullmatch(name) else ("q", name)
+    elif first == '"':
+        return "s", text
+    elif "." in text or "e" in text or "E" in text:
+        return float(text)
+    return int(text)
+
+
+def parse_tree(text: str):
+    """
+    Parses the text of a single clause (ending with a dot) into a tree of tuples
+    """
+    m = _FLAT_FACT_RE.fullmatch(text)
+    if m is not None:
+        return "c", m.group(1), tuple([_simple_arg(x) for x in _SIMPLE_ARG_RE.findall(m.group(2))])
+    return _Parser(text).clause()
+
+
+def _parse_chunk(texts: Sequence[str]) -> TList:
+    return [parse_tree(x) for x in texts]
+
+
+def clause_texts(source: Union[str, TextIO], block_size: int = 1 << 20) -> Iterator[str]:
+    """
+    Splits the input into the texts of the clauses (directives included), reading it in blocks
+
+    Arguments:
+        source: file name or text stream
+        block_size: number of characters read at once
+
+    Return:
+        texts of the clauses, each ending with its dot
+    """
+    stream = open(source) if isinstance(source, str) else source
+    try:
+        rest = ""
+        eof = False
+        while not eof:
+            block = stream.read(block_size)
+            eof = len(block) == 0
+            buffer = rest + (block if not eof else "\n")
+
+            start = 0
+            for m in _CLAUSE_END_RE.finditer(buffer):
+                if m.lastgroup == "end":
+                    yield buffer[start:m.end()]
+                    start = m.end()
+                elif m.lastgroup == "open":
+                    if eof:
+                        raise Exception(f"syntax error: unterminated quote or comment in {buffer[start:].strip()}")
+                    # the quoted atom or comment continues in the next block
+                    break
+            rest = buffer[start:]
+
+        if _tokenize(rest):
+            raise Exception(f"syntax error: clause without a final dot: {rest.strip()}")
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+
+class _Builder:
+    """
+    Turns parse trees into atoms and clauses; keeps the symbols created so far
+    """
+
+    def __init__(self, ctx: Context = None):
+        self._ctx = _get_proper_context(ctx)
+        self._constants: Dict[str, Constant] = {}
+        self._predicates: Dict[Tuple[str, int], Predicate] = {}
+        self._functors: Dict[Tuple[str, int], Functor] = {}
+
+    def _constant(self, name: str) -> Constant:
+        c = self._constants.get(name)
+        if c is None:
+            c = self._ctx.constant(name)
+            self._constants[name] = c
+        return c
+
+    def _predicate(self, name: str, arity: int) -> Predicate:
+        p = self._predicates.get((name, arity))
+        if p is None:
+            p = self._ctx.predicate(name, arity)
+            self._predicates[(name, arity)] = p
+        return p
+
+    def term(self, tree) -> Union[Constant, Variable, Structure, int, float]:
+        if not isinstance(tree, tuple):
+            return tree
+
+        tag = tree[0]
+        if tag == "v":
+            return self._ctx.fresh_variable() if tree[1] == "_" else self._ctx.variable(tree[1])
+        elif tag == "a":
+            if tree[1] == "[]":
+                return List([])
+            return self._constant(tree[1] if _PLAIN_NAME_RE.fullmatch(tree[1]) else _quote(tree[1]))
+        elif tag == "q":
+            return self._constant(_quote(tree[1]))
+        elif tag == "s":
+            return self._constant(tree[1])
+        elif tag == "c":
+            functor = self._functors.get((tree[1], len(tree[2])))
+            if functor is None:
+                functor = self._ctx.functor(tree[1], len(tree[2]))
+                self._functors[(tree[1], len(tree[2]))] = functor
+            return Structure(functor, [self.term(x) for x in tree[2]])
+        elif tag == "l":
+            elements = [self.term(x) for x in tree[1]]
+            if tree[2] is None:
+                return List(elements)
+            term = self.term(tree[2])
+            for elem in reversed(elements):
+                term = Pair(elem, term)
+            return term
+        else:
+            raise Exception(f"unknown parse tree {tree}")
+
+    def literal(self, tree) -> Union[Atom, Not]:
+        if isinstance(tree, tuple) and tree[0] == "c" and tree[1] == "\\+" and len(tree[2]) == 1:
+            return Not(self.literal(tree[2][0]))
+        elif isinstance(tree, tuple) and tree[0] in ("a", "q"):
+            return Atom(self._predicate(tree[1], 0), [])
+        elif isinstance(tree, tuple) and tree[0] == "c":
+            if tree[1] in (";", "->", "*->"):
+                raise Exception(f"disjunctions and if-then-else are not supported in clauses: {tree[1]}")
+            return Atom(self._predicate(tree[1], len(tree[2])), [self.term(x) for x in tree[2]])
+        else:
+            raise Exception(f"cannot use {tree} as a literal")
+
+    def _conjunction(self, tree) -> TList[Union[Atom, Not]]:
+        literals = []
+        while isinstance(tree, tuple) and tree[0] == "c" and tree[1] == "," and len(tree[2]) == 2:
+            literals.append(self.literal(tree[2][0]))
+            tree = tree[2][1]
+        literals.append(self.literal(tree))
+        return literals
+
+    def clause(self, tree) -> Union[Atom, Clause, None]:
+        """
+        Returns the atom or clause of the tree (None for directives)
+        """
+        if isinstance(tree, tuple) and tree[0] == "c" and tree[1] in (":-", "?-") and len(tree[2]) == 1:
+            return None
+        elif isinstance(tree, tuple) and tree[0] == "c" and tree[1] == ":-" and len(tree[2]) == 2:
+            head = self.literal(tree[2][0])
+            if isinstance(head, Not):
+                raise Exception(f"the head of a clause cannot be negated: {head}")
+            return Clause(head, self._conjunction(tree[2][1]))
+        elif isinstance(tree, tuple) and tree[0] == "c" and tree[1] == "-->":
+            raise Exception("DCG rules are not supported")
+        return self.literal(tree)
+
+
+def _quote(name: str) -> str:
+    return "'" + name.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n") + "'"
+
+
+def read_clauses(source: Union[str, TextIO],
+                 ctx: Context = None,
+                 processes: int = 1,
+                 chunk_size: int = 10000,
+                 block_size: int = 1 << 20) -> Iterator[Union[Atom, Clause]]:
+    """
+    Reads atoms and clauses in Prolog syntax from a file or a text stream, one at a time
+
+    Directives (:- ...) are skipped. Clause bodies can contain conjunctions and negations (\\+); terms can be
+        numbers, atoms (quoted or not), strings, variables, compound terms (including operator terms) and lists.
+
+    Arguments:
+        source: file name or text stream
+        ctx (optional): context to create the symbols in
+        processes: number of processes parsing the clauses (1: parse in the calling process)
+        chunk_size: number of clauses sent to a process at once
+        block_size: number of characters read at once
+
+    Return:
+        atoms (facts) and clauses, in the order of the input
+    """
+    builder = _Builder(ctx)
+
+    if processes <= 1:
+        for text in clause_texts(source, block_size):
+            item = builder.clause(parse_tree(text))
+            if item is not None:
+                yield item
+        return
+
+    def _chunks():
+        chunk = []
+        for text in clause_texts(source, block_size):
+            chunk.append(text)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # at most two chunks per process are in flight, so that memory stays bounded
+    with Pool(processes) as pool:
+        pending = deque()
+        for chunk in _chunks():
+            pending.append(pool.apply_async(_parse_chunk, (chunk,)))
+            if len(pending) >= 2 * processes:
+                for tree in pending.popleft().get():
+                    item = builder.clause(tree)
+                    if item is not None:
+                        yield item
+        while pending:
+            for tree in pending.popleft().get():
+                item = builder.clause(tree)
+                if item is not None:
+                    yield item
+
+
+def parse_clauses(text: str, ctx: Context = None) -> TList[Union[Atom, Clause]]:
+    """
+    Reads all atoms and clauses of a string in Prolog syntax
+    """
+    return list(read_clauses(io.StringIO(text), ctx))
@@ -0,0 +1,183 @@
+import weakref
+from typing import Union, Sequence, Dict, Tuple, List, Optional
+
+from .commons import (
+    Context,
+    Predicate,
+    Constant,
+    Variable,
+    Atom,
+    Not,
+    Clause,
+    Program,
+    PredicateIndex,
+    _get_proper_context
+)
+
+
+class MagicSets:
+    """
+    Magic-sets rewriting of a datalog program, for queries with bound arguments
+
+    A query binds some arguments of its predicate (its adornment, e.g., 'bf' for reach(a, X)). The rewritten program
+        defines an adorned copy of every predicate the query needs (reach_bf), restricted to the tuples demanded by
+        the query: every rule gets a magic literal (magic_reach_bf(X)) holding the values of the bound arguments
+        the rule is asked for, and magic rules pass the bindings on from the head to the body literals, left to
+        right (sideways information passing). A bottom-up engine evaluating the rewritten program with the seed
+        fact of the query (magic_reach_bf(a)) derives only the facts relevant to the query.
+
+    The rewriting depends on the adornment only: it is done once per predicate and adornment, the seed carries the
+        constants of the query. Predicates used in negative literals are not rewritten, their original rules are
+        kept (so that a stratified program stays stratified).
+
+    Arguments:
+        program: program (or clauses and facts) to rewrite; later changes to the program are not seen
+        ctx (optional): context to create the adorned and magic predicates in
+    """
+
+    def __init__(self, program: Union[Program, Sequence[Union[Clause, Atom]]], ctx: Context = None):
+        clauses = program.get_clauses() if isinstance(program, Program) else program
+        self._index = PredicateIndex(clauses)
+        self._ctx = _get_proper_context(ctx)
+        # (predicate, adornment) -> (rewritten clauses, adorned predicate, magic predicate)
+        self._rewritten: Dict[Tuple[Predicate, str], Tuple[List[Union[Clause, Atom]], Predicate,
+                                                          Optional[Predicate]]] = {}
+        # engine -> ids of the rewritten clauses asserted in it
+        self._loaded = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def adornment(query: Atom, bound: Sequence[Variable] = ()) -> str:
+        """
+        Returns the adornment of the atom: 'b' for every argument that is a constant or a bound variable, 'f' otherwise
+        """
+        return "".join(["b" if isinstance(x, Constant) or x in bound else "f" for x in query.get_arguments()])
+
+    def rewrite(self, query: Atom) -> Tuple[Sequence[Union[Clause, Atom]], Optional[Atom], Atom]:
+        """
+        Rewrites the program for the query
+
+        Arguments:
+            query: atom to answer
+
+        Return:
+            the rewritten clauses (and facts), the seed fact (None if the query binds no argument), and the atom to
+                ask instead of the query (the query itself if its predicate is not defined by the program)
+        """
+        predicate = query.get_predicate()
+        if not self._index.defining(predicate):
+            return [], None, query
+
+        adornment = self.adornment(query)
+        clauses, adorned, magic = self._rewrite(predicate, adornment)
+        seed = magic(*_bound_arguments(query, adornment)) if magic is not None else None
+        return clauses, seed, adorned(*query.get_arguments())
+
+    def _adorned_predicate(self, predicate: Predicate, adornment: str) -> Predicate:
+        return self._ctx.predicate(f"{predicate.get_name()}_{adornment}", predicate.get_arity(),
+                                   predicate.get_arg_types())
+
+    def _magic_predicate(self, predicate: Predicate, adornment: str) -> Optional[Predicate]:
+        # a predicate with no bound argument is always demanded, it has no magic predicate
+        if "b" not in adornment:
+            return None
+        types = [t for t, a in zip(predicate.get_arg_types(), adornment) if a == "b"]
+        return self._ctx.predicate(f"magic_{predicate.get_name()}_{adornment}", len(types), types)
+
+    def _rewrite(self, predicate: Predicate, adornment: str) -> Tuple[List[Union[Clause, Atom]], Predicate,
+                                                                      Optional[Predicate]]:
+        if (predicate, adornment) in self._rewritten:
+            return self._rewritten[(predicate, adornment)]
+
+        clauses = []
+        negated = set()
+        seen = {(predicate, adornment)}
+        todo = [(predicate, adornment)]
+        while todo:
+            p, p_adornment = todo.pop()
+            magic = self._magic_predicate(p, p_adornment)
+            for item in self._index.defining(p):
+                if isinstance(item, Atom):
+                    head, body = item, []
+                elif isinstance(item, Clause):
+                    head, body = item.get_head(), item.get_literals()
+                else:
+                    raise Exception(f"magic sets support clauses and facts only: {item}")
+
+                bound = set([x for x, a in zip(head.get_arguments(), p_adornment)
+                             if a == "b" and isinstance(x, Variable)])
+                new_body = [magic(*_bound_arguments(head, p_adornment))] if magic is not None else []
+                for lit in body:
+                    if isinstance(lit, Not):
+                        if self._index.defining(lit.get_atom().get_predicate()):
+                            negated.add(lit.get_atom().get_predicate())
+                        new_body.append(lit)
+                        continue
+
+                    q = lit.get_predicate()
+                    if self._index.defining(q):
+                        q_adornment = self.adornment(lit, bound)
+                        q_magic = self._magic_predicate(q, q_adornment)
+                        if q_magic is not None:
+                            # the bindings of the literal, given the head and the literals before it
+                            demand = q_magic(*_bound_arguments(lit, q_adornment))
+                            clauses.append(Clause(demand, list(new_body)) if new_body else demand)
+                        if (q, q_adornment) not in seen:
+                            seen.add((q, q_adornment))
+                            todo.append((q, q_adornment))
+                        new_body.append(self._adorned_predicate(q, q_adornment)(*lit.get_arguments()))
+                    else:
+                        new_body.append(lit)
+                    bound.update(lit.get_variables())
+
+                new_head = self._adorned_predicate(p, p_adornment)(*head.get_arguments())
+                clauses.append(Clause(new_head, new_body) if new_body else new_head)
+
+        # negated predicates keep their rules (and the rules of the predicates they depend on)
+        clauses += list(self._index.defining(self._index.reachable(negated)))
+
+        result = (clauses, self._adorned_predicate(predicate, adornment), self._magic_predicate(predicate, adornment))
+        self._rewritten[(predicate, adornment)] = result
+        return result
+
+    def _load(self, solver, query: Atom) -> Atom:
+        # asserts the rewritten clauses the engine does not have yet, and the seed of the query
+        clauses, seed, adorned = self.rewrite(query)
+        loaded = self._loaded.setdefault(solver, set())
+        for cl in clauses:
+            if id(cl) not in loaded:
+                if isinstance(cl, Atom):
+                    solver.assert_fact(cl)
+                else:
+                    solver.assert_rule(cl)
+                loaded.add(id(cl))
+        if seed is not None:
+            solver.assert_fact(seed)
+        return adorned
+
+    def query(self, solver, query: Atom, **kwargs):
+        """
+        Answers the query with the rewritten program
+
+        The engine holds the facts of the program (the rules of the program are not needed in it): the rewritten
+            clauses for the adornment of the query are asserted in it the first time, and the seed of the query
+            every time.
+
+        Arguments:
+            solver: datalog engine (LPSolver)
+            query: atom to answer
+            kwargs: arguments of query(...), e.g., max_solutions
+
+        Return:
+            the solutions, as solver.query(query, ...)
+        """
+        return solver.query(self._load(solver, query), **kwargs)
+
+    def has_solution(self, solver, query: Atom) -> bool:
+        """
+        Checks whether the query has a solution, with the rewritten program (see query(...))
+        """
+        return solver.has_solution(self._load(solver, query))
+
+
+def _bound_arguments(atom: Atom, adornment: str) -> List:
+    return [x for x, a in zip(atom.get_arguments(), adornment) if a == "b"]
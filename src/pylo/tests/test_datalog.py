@@ -1,5 +1,7 @@
-from pylo.language.lp import c_const, c_var, c_pred
-from pylo.engines.datalog import MuZ
+import pytest
+
+from pylo.language.lp import c_const, c_var, c_pred, Context, FactTable, Not, MagicSets, Program
+from pylo.engines.datalog import MuZ, SemiNaive
 
 
 class DatalogTests:
@@ -75,6 +77,12 @@ class DatalogTests:
         assert ans[v1] == p1 and ans[v3] == p3
         assert len(solver.query(*cl.get_literals())) == 1
 
+        assert solver.has_solution_many([parent(p1, p2), parent(p2, p1), grandparent(p1, p3),
+                                         [parent(v1, v2), parent(v2, v3)]]) == [True, False, True, True]
+        answers = solver.query_many([parent(p1, v1), grandparent(v1, v2)])
+        assert len(answers) == 2
+        assert answers[0][0][v1] == p2 and answers[1][0][v2] == p3
+
     def graph_connectivity(self):
         v1 = c_const("v1")
         v2 = c_const("v2")
@@ -126,13 +134,211 @@ class DatalogTests:
         assert len(solver.query(path(v1, X))) == 3
         assert len(solver.query(path(X, Y))) == 4
 
+    def lazy_declarations(self):
+        ctx = Context()
+        solver = MuZ(ctx=ctx)
+
+        # symbols created after the solver are declared when first used
+        person = ctx.type("person")
+        ann = ctx.constant("ann", person)
+        likes = ctx.predicate("likes", 2, [person, person])
+        X = ctx.variable("X", person)
+
+        solver.assert_fact(likes(ann, ann))
+        assert solver.query(likes(ann, X)) == [{X: ann}]
+
+        bob = ctx.constant("bob", person)
+        solver.assert_fact(likes(bob, ann))
+        assert len(solver.query(likes(X, ann))) == 2
+
+        symbols, cursor = ctx.changes(0)
+        assert cursor == ctx.num_symbols() and person in symbols and bob in symbols
+        assert ctx.changes(cursor) == ([], cursor)
+        solver.sync()
+        assert solver.has_solution(likes(bob, ann))
+
+        # constants beyond the size of the sort of the type: the engine is built again with a larger sort
+        fans = [ctx.constant(f"fan{i}", person) for i in range(20)]
+        for x in fans:
+            solver.assert_fact(likes(x, bob))
+        assert len(solver.query(likes(X, bob))) == 20 and len(solver.query(likes(X, ann))) == 2
+        assert solver.has_solution(likes(fans[-1], bob))
+
+        # another engine on the same context, with sorts of its own
+        first = MuZ(ctx=ctx)
+        first.assert_fact(likes(ann, bob))
+        second = MuZ(ctx=ctx)
+        for x in [ctx.constant(f"other_fan{i}", person) for i in range(100)]:
+            second.assert_fact(likes(x, ann))
+        assert first.query(likes(ann, X)) == [{X: bob}]
+        assert len(second.query(likes(X, ann))) == 100 and len(solver.query(likes(X, bob))) == 20
+
+    def fact_tables(self):
+        pytest.importorskip("numpy")
+
+        ctx = Context()
+        edge = ctx.predicate("edge", 2, ["node", "node"])
+        path = ctx.predicate("path", 2, ["node", "node"])
+        X, Y, Z = [ctx.variable(x, "node") for x in ["X", "Y", "Z"]]
+
+        # the facts are added from the columns of ids
+        table = FactTable.from_tuples(edge, [(f"v{i}", f"v{i + 1}") for i in range(50)], ctx=ctx)
+        solver = MuZ(ctx=ctx)
+        solver.assert_facts(table)
+        solver.assert_rule(path(X, Y) <= edge(X, Y))
+        solver.assert_rule(path(X, Y) <= edge(X, Z) & path(Z, Y))
+
+        assert len(solver.query(path(ctx.constant("v0", "node"), Y))) == 50
+        assert solver.query(edge(X, ctx.constant("v50", "node"))) == [{X: ctx.constant("v49", "node")}]
+
+    def seminaive(self):
+        pytest.importorskip("numpy")
+
+        ctx = Context()
+        edge = ctx.predicate("edge", 2, ["node", "node"])
+        path = ctx.predicate("path", 2, ["node", "node"])
+        node = ctx.predicate("node", 1, ["node"])
+        unreachable = ctx.predicate("unreachable", 2, ["node", "node"])
+        X, Y, Z = [ctx.variable(x, "node") for x in ["X", "Y", "Z"]]
+        v = [ctx.constant(f"v{i}", "node") for i in range(6)]
+
+        # a cycle v1 -> v2 -> v3 -> v1 reachable from v0, and a separate edge v4 -> v5
+        solver = SemiNaive(ctx=ctx)
+        solver.assert_facts(FactTable.from_tuples(edge, [("v0", "v1"), ("v1", "v2"), ("v2", "v3"), ("v3", "v1")],
+                                                  ctx=ctx))
+        solver.assert_fact(edge(v[4], v[5]))
+        for x in v:
+            solver.assert_fact(node(x))
+        solver.assert_rule(path(X, Y) <= edge(X, Y))
+        solver.assert_rule(path(X, Y) <= path(X, Z) & edge(Z, Y))
+        solver.assert_rule(unreachable(X, Y) <= node(X) & node(Y) & Not(path(X, Y)))
+
+        assert len(solver.query(path(X, Y))) == 13
+        assert len(solver.query(path(X, Y), max_solutions=2)) == 2
+        assert sorted([x[X].name for x in solver.query(path(v[0], X))]) == ["v1", "v2", "v3"]
+        assert solver.query(path(v[0], v[3])) == [{}]
+        assert not solver.has_solution(path(v[4], v[1]))
+        assert len(solver.query(path(X, X))) == 3
+        assert len(solver.query(unreachable(X, Y))) == 36 - 13
+        assert solver.query(path(X, Y), Not(path(Y, X)), Not(path(X, X))) == [{X: v[0], Y: v[1]}, {X: v[0], Y: v[2]},
+                                                                         {X: v[0], Y: v[3]}, {X: v[4], Y: v[5]}]
+
+        # the model is computed again after an assert
+        solver.assert_fact(edge(v[5], v[0]))
+        assert solver.has_solution(path(v[4], v[1]))
+        assert solver.query(unreachable(v[4], X)) == [{X: v[4]}]
+
+        # the same answers as muz
+        muz = MuZ(ctx=ctx)
+        for a, b in [(0, 1), (1, 2), (2, 3), (3, 1), (4, 5), (5, 0)]:
+            muz.assert_fact(edge(v[a], v[b]))
+        muz.assert_rule(path(X, Y) <= edge(X, Y))
+        muz.assert_rule(path(X, Y) <= path(X, Z) & edge(Z, Y))
+        for q in [path(X, Y), path(v[4], X), path(X, v[0])]:
+            assert sorted([str(x) for x in solver.query(q)]) == sorted([str(x) for x in muz.query(q)])
+
+        for rule in [path(X, Y) <= edge(X, Z), path(X, Y) <= edge(X, Y) & Not(path(Y, X))]:
+            try:
+                solver.assert_rule(rule)
+                solver.has_solution(path(X, Y))
+                assert False
+            except Exception as e:
+                assert "positive literal" in str(e) or "stratified" in str(e)
+
+        # a join with no solution before the literal binding a head variable
+        a, c = ctx.predicate("a", 1, ["node"]), ctx.predicate("c", 1, ["node"])
+        b, h = ctx.predicate("b", 2, ["node", "node"]), ctx.predicate("h", 2, ["node", "node"])
+        solver = SemiNaive(ctx=ctx)
+        solver.assert_fact(a(v[1]))
+        solver.assert_fact(c(v[2]))
+        solver.assert_fact(b(v[2], v[3]))
+        solver.assert_rule(h(X, Y) <= a(X) & c(X) & b(X, Y))
+        assert solver.query(h(X, Y)) == [] and solver.query(a(X), c(X), b(X, Y)) == []
+
+        # predicates of arity 0, from a rule and from a fact
+        q, r, done = ctx.predicate("q", 0), ctx.predicate("r", 1, ["node"]), ctx.predicate("done", 0)
+        for engine in [SemiNaive(ctx=ctx), MuZ(ctx=ctx)]:
+            engine.assert_fact(a(v[1]))
+            engine.assert_rule(q() <= a(X))
+            engine.assert_rule(r(X) <= a(X) & q())
+            assert engine.has_solution(q()) and engine.query(r(X)) == [{X: v[1]}]
+            assert not engine.has_solution(done())
+        solver = SemiNaive(ctx=ctx)
+        solver.assert_fact(done())
+        solver.assert_fact(a(v[2]))
+        solver.assert_rule(r(X) <= a(X) & done())
+        assert solver.query(done()) == [{}] and solver.query(r(X)) == [{X: v[2]}]
+
+    def magic_sets(self):
+        pytest.importorskip("numpy")
+
+        ctx = Context()
+        edge = ctx.predicate("edge", 2, ["node", "node"])
+        reach = ctx.predicate("reach", 2, ["node", "node"])
+        X, Y, Z = [ctx.variable(x, "node") for x in ["X", "Y", "Z"]]
+        v = [ctx.constant(f"v{i}", "node") for i in range(7)]
+        program = Program([reach(X, Y) <= edge(X, Y), reach(X, Y) <= edge(X, Z) & reach(Z, Y)])
+        magic = MagicSets(program, ctx=ctx)
+
+        # the engines hold the facts, the rewritten rules are added when a query needs them
+        for engine in [SemiNaive, MuZ]:
+            solver = engine(ctx=ctx)
+            for a, b in [(0, 1), (1, 2), (2, 3), (3, 1), (4, 5), (5, 6)]:
+                solver.assert_fact(edge(v[a], v[b]))
+
+            assert sorted([x[X].name for x in magic.query(solver, reach(v[0], X))]) == ["v1", "v2", "v3"]
+            assert sorted([x[X].name for x in magic.query(solver, reach(v[4], X))]) == ["v5", "v6"]
+            assert sorted([x[X].name for x in magic.query(solver, reach(X, v[6]))]) == ["v4", "v5"]
+            assert not magic.has_solution(solver, reach(v[6], X))
+            assert magic.has_solution(solver, reach(v[2], v[2]))
+            assert len(magic.query(solver, reach(X, Y))) == 15
+
+    def parallel(self):
+        pytest.importorskip("numpy")
+
+        ctx = Context()
+        edge = ctx.predicate("edge", 2, ["node", "node"])
+        blocked = ctx.predicate("blocked", 1, ["node"])
+        path = ctx.predicate("path", 2, ["node", "node"])
+        open_path = ctx.predicate("open_path", 2, ["node", "node"])
+        X, Y, Z = [ctx.variable(x, "node") for x in ["X", "Y", "Z"]]
+        table = FactTable.from_tuples(edge, [(f"v{i}", f"v{(i * 7 + 3) % 60}") for i in range(60)] +
+                                      [(f"v{i}", f"v{i + 1}") for i in range(0, 60, 3)], ctx=ctx)
+
+        # a linear rule with negation of a lower component, and a non-linear one
+        models = []
+        for processes in [1, 3]:
+            solver = SemiNaive(ctx=ctx, processes=processes)
+            solver.assert_facts(table)
+            for i in range(0, 60, 11):
+                solver.assert_fact(blocked(ctx.constant(f"v{i}", "node")))
+            solver.assert_rule(path(X, Y) <= edge(X, Y))
+            solver.assert_rule(path(X, Y) <= path(X, Z) & edge(Z, Y) & Not(blocked(Z)))
+            solver.assert_rule(open_path(X, Y) <= path(X, Y))
+            solver.assert_rule(open_path(X, Y) <= open_path(X, Z) & open_path(Z, Y))
+
+            models.append([sorted([str(x) for x in solver.query(q)]) for q in [path(X, Y), open_path(X, Y)]])
+
+        assert models[0] == models[1] and len(models[0][0]) > 60 and len(models[0][1]) > len(models[0][0])
+
 
 def test_datalog():
     dtest = DatalogTests()
 
     dtest.simple_grandparent()
     dtest.graph_connectivity()
+    dtest.lazy_declarations()
 
     print("all tests done!")
 
+
+def test_datalog_numpy():
+    # the engines and fact tables over numpy arrays (skipped without numpy)
+    dtest = DatalogTests()
+
+    dtest.fact_tables()
+    dtest.seminaive()
+    dtest.magic_sets()
+    dtest.parallel()
+
 test_datalog()
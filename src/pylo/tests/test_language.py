@@ -1,4 +1,13 @@
-from pylo.language.lp import c_var, c_pred, c_const, Predicate, Constant, Variable, Clause, Atom, Disjunction
+import pytest
+
+from pylo.language.lp import c_var, c_pred, c_const, c_functor, Predicate, Constant, Variable, Clause, Atom, List, \
+    Pair, Not, VariantIndex, SubsumptionIndex, FactTable, MagicSets, Program
+from pylo.language.lp.lp import ClausalTheory, parse
+from pylo.language.lp import read_clauses, parse_clauses
+import io
+import time
+from pylo.language.commons import Context, InternTable, INTERN_WEAK, INTERN_LRU, c_literal
+import gc
 
 
 
@@ -56,6 +65,282 @@ class LanguageTest:
         assert isinstance(f1.arguments[1], Constant)
         assert isinstance(f3.arguments[1], Variable)
 
+    def compact_representation(self):
+        # a predicate no engine has seen
+        parent = c_pred("compact_parent", 2)
+        f1 = parent("a", "X")
+        cl = parent("X", "Y") <= parent("X", "Z") & parent("Z", "Y")
+
+        # terms, literals and clauses keep their attributes in slots
+        for obj in [f1, f1.get_arguments()[0], f1.get_arguments()[1], parent, cl, cl.get_body()]:
+            assert not hasattr(obj, "__dict__")
+        assert isinstance(f1.arguments, tuple)
+        assert f1 == parent("a", "X") and hash(f1) == hash(parent("a", "X"))
+
+        # properties and engine objects are allocated on demand
+        assert f1.get_property("weight") is None
+        f1.add_property("weight", 0.5)
+        assert f1.get_property("weight") == 0.5
+
+        try:
+            parent.as_muz()
+            assert False, "parent has no muz object"
+        except KeyError:
+            pass
+
+    def symbol_table(self):
+        ctx = Context()
+        a = c_const("a", ctx=ctx)
+        b = c_const("b", domain="node", ctx=ctx)
+        X = c_var("X", ctx=ctx)
+        p = c_pred("p", 2, ctx=ctx)
+
+        # symbols are interned with dense ids
+        assert c_const("a", ctx=ctx) is a and c_var("X", ctx=ctx) is X and c_pred("p", 2, ctx=ctx) is p
+        assert [ctx.symbol_by_id(x.symbol_id()) for x in [a, b, X, p]] == [a, b, X, p]
+        assert a != b and a == Constant("a", ctx.type("thing"))
+
+        assert ctx.find_domain("b") == ctx.type("node")
+        assert ctx.find_domain("unknown") == ctx.type("thing")
+        assert ctx.symbol("a") is a and ctx.symbol("p") is p
+
+        c_var("_V2", ctx=ctx)
+        fresh = [ctx.fresh_variable() for _ in range(3)]
+        assert [x.get_name() for x in fresh] == ["_V1", "_V3", "_V4"]
+        assert len(ctx.get_variables()) == 5 and len(ctx.get_constants()) == 2
+
+    def interning(self):
+        ctx = Context(literals=INTERN_WEAK, constants=InternTable(INTERN_LRU, 10))
+        p = c_pred("p", 1, ctx=ctx)
+
+        atoms = [c_literal(p, [c_const(f"c{i}", ctx=ctx)], ctx=ctx) for i in range(100)]
+        assert c_literal(p, [c_const("c5", ctx=ctx)], ctx=ctx) is atoms[5]
+        assert ctx.stats()["literals"]["size"] == 100 and ctx.stats()["literals"]["hits"] == 1
+
+        # literals live as long as they are used, constants that are not used are bounded by the LRU table
+        kept = atoms[5]
+        del atoms
+        gc.collect()
+        assert ctx.stats()["literals"]["size"] == 1
+        assert ctx.stats()["constants"]["size"] <= 11
+        assert c_literal(p, [c_const("c5", ctx=ctx)], ctx=ctx) is kept
+
+    def structural_hashing(self):
+        f = c_functor("f", 2)
+        p = c_pred("p", 2)
+        s1 = f(List(["a", Pair("b", "X")]), 1)
+        s2 = f(List(["a", Pair("b", "X")]), 1)
+        s3 = f(List(["a", Pair("b", "Y")]), 1)
+
+        assert s1 is not s2 and s1 == s2 and hash(s1) == hash(s2)
+        assert s1 != s3 and List(["a", "b"]) != List(["b", "a"]) and Pair("a", "b") != List(["a", "b"])
+        assert len({p(s1, "c"), p(s2, "c"), p(s3, "c")}) == 2
+        assert Not(p(s1, "c")) == Not(p(s2, "c")) and Not(p(s1, "c")) != p(s1, "c")
+        assert len({Not(p(s1, "c")), Not(p(s2, "c")), p(s1, "c")}) == 2
+
+    def variants(self):
+        e = c_pred("e", 2)
+        h = c_pred("h", 0)
+        A, B, C, D, E, F = [c_var(x) for x in "ABCDEF"]
+
+        # two triangles and a hexagon cannot be told apart by refinement alone
+        triangles = Clause(h, [e(A, B), e(B, C), e(C, A), e(D, E), e(E, F), e(F, D)])
+        hexagon = Clause(h, [e(A, B), e(B, C), e(C, D), e(D, E), e(E, F), e(F, A)])
+        hexagon_renamed = Clause(h, [e(E, F), e(A, B), e(C, D), e(B, C), e(F, A), e(D, E)])
+        assert triangles.canonical_key() != hexagon.canonical_key()
+        assert hexagon.is_variant(hexagon_renamed) and hash(hexagon) == hash(hexagon_renamed)
+
+        cl1 = Clause(e(A, B), [e(A, C), Not(e(C, B)), e(C, "a")])
+        cl2 = Clause(e(D, E), [Not(e(F, E)), e(F, "a"), e(D, F)])
+        cl3 = Clause(e(D, E), [Not(e(F, E)), e(F, "b"), e(D, F)])
+        assert cl1.is_variant(cl2) and not cl1.is_variant(cl3)
+
+        index = VariantIndex([cl1, cl3])
+        assert len(index) == 2 and cl2 in index and index.get(cl2) is cl1 and not index.add(cl2)
+
+        # variables mapped onto each other by an automorphism are individualised once (the search would try all
+        #     12! and 8! orders otherwise), also when they only map together with other variables
+        atm = c_pred("atm", 2)
+        M = c_var("M")
+        atoms = [c_var(f"A{i}") for i in range(12)]
+        many = Clause(h, [atm(M, x) for x in atoms] + [e(atoms[0], atoms[1])])
+        many_renamed = Clause(h, [e(atoms[5], atoms[2])] + [atm(M, x) for x in reversed(atoms)])
+        assert many.is_variant(many_renamed) and hash(many) == hash(many_renamed)
+        assert not many.is_variant(Clause(h, [atm(M, x) for x in atoms] + [e(atoms[0], atoms[0])]))
+        ends = [c_var(f"X{i}") for i in range(16)]
+        pairs = [e(ends[2 * i], ends[2 * i + 1]) for i in range(8)]
+        start = time.perf_counter()
+        assert Clause(h, pairs).is_variant(Clause(h, list(reversed(pairs))))
+        assert not Clause(h, pairs).is_variant(Clause(h, pairs[:-1] + [e(ends[15], ends[15])]))
+        assert time.perf_counter() - start < 1
+
+        theory = ClausalTheory([cl1, cl3, cl2, hexagon, triangles, hexagon_renamed])
+        theory.remove_duplicates()
+        assert theory.get_clauses() == [cl1, cl3, hexagon, triangles]
+
+    def subsumption(self):
+        p = c_pred("p", 2)
+        q = c_pred("q", 2)
+        r = c_pred("r", 1)
+        e = c_pred("e", 2)
+        h = c_pred("h", 0)
+        f = c_functor("f", 1)
+        X, Y, Z, W = [c_var(x) for x in "XYZW"]
+        V = [c_var(f"V{i}") for i in range(6)]
+
+        general = Clause(p(X, Y), [q(X, Z)])
+        specific = Clause(p("a", "b"), [q("a", "c"), r("c")])
+        assert general.subsumes(specific) and not specific.subsumes(general)
+        assert not Clause(p(X, Y), [q(X, X)]).subsumes(specific)
+        assert Clause(p(X, Y), [q(f(X), Y), Not(r(Y))]).subsumes(Clause(p("a", W), [Not(r(W)), q(f("a"), W), r(W)]))
+        assert not Clause(p(X, Y), [q(f(X), Y)]).subsumes(Clause(p("a", W), [q(f("b"), W)]))
+
+        # a chain maps onto a cycle, but not the other way around
+        chain = Clause(h, [e(V[i], V[i + 1]) for i in range(5)])
+        cycle = Clause(h, [e(V[i], V[(i + 1) % 3]) for i in range(3)])
+        assert chain.subsumes(cycle) and not cycle.subsumes(chain)
+
+        index = SubsumptionIndex([general, Clause(p(X, Y), [q(X, X)]), Clause(p(X, Y), [q(X, Y), r(Y)]), chain])
+        assert index.subsuming(specific) == [general]
+        assert index.subsumed_by(Clause(p(X, Y), [q(X, W)])) == index.subsumed_by(general)
+        assert len(index.subsumed_by(general)) == 3 and index.subsuming(cycle) == [chain]
+        index.remove(general)
+        assert index.subsuming(specific) == [] and len(index) == 3
+
+    def reader(self):
+        text = """
+        % a comment. with a dot
+        :- dynamic edge/2.
+        edge(a, b). edge('hello, world', "a. string").
+        /* a block. comment */
+        path(X, Y) :- edge(X, Z), \\+ blocked(Z),
+            path(Z, Y).
+        num(1, -2, 3.5, 0'a, 0x1F, f(- 1)).
+        lists([1, 2|T], [a|[b, c]], [], g('Foo', X * 2)).
+        """
+        items = parse_clauses(text)
+        assert [str(x) for x in items] == [
+            "edge(a,b)", "edge('hello, world',\"a. string\")",
+            "path(X,Y) :- edge(X,Z),\\+ blocked(Z),path(Z,Y)",
+            "num(1,-2,3.5,97,31,f(-(1)))",
+            "lists([1 | [2 | T]],[a,b,c],[],g('Foo',*(X,2)))"
+        ]
+        assert isinstance(items[2], Clause) and isinstance(items[2].get_literals()[1], Not)
+        assert items[0].get_predicate() is c_pred("edge", 2) and items[0].get_arguments()[0] is c_const("a")
+
+        # clauses, quoted atoms and comments spread over blocks
+        assert [str(x) for x in read_clauses(io.StringIO(text), block_size=5)] == [str(x) for x in items]
+        assert parse("p(X) :- q(X, 'a b')") == parse("p(X) :- q(X, 'a b').")
+
+        # a dot ending a symbol atom does not end the clause, quoted names are written back with their escapes
+        univ = "p(X, L) :- X =.. L.\nq('a\\nb', 'c\\\\d')."
+        items = parse_clauses(univ)
+        assert [str(x) for x in items] == ["p(X,L) :- =..(X,L)", "q('a\\nb','c\\\\d')"]
+        assert [str(x) for x in read_clauses(io.StringIO(univ), block_size=3)] == [str(x) for x in items]
+        assert parse_clauses(str(items[1]) + ".") == [items[1]]
+
+    def fact_tables(self):
+        pytest.importorskip("numpy")
+
+        ctx = Context()
+        edge = ctx.predicate("edge", 2, ["node", "node"])
+        table = FactTable.from_tuples(edge, [("a", "b"), ("b", "c"), ("a", "b")], ctx=ctx)
+        assert len(table) == 3 and len(ctx.get_constants()) == 0
+        assert table.codes().tolist() == [[0, 1], [1, 2], [0, 1]]
+
+        # atoms are materialized when asked for, constants keep the ids of their codes
+        assert table[1] == edge(ctx.constant("b", "node"), ctx.constant("c", "node"))
+        assert ctx.constant("c", "node").id() == 2 and len(ctx.get_constants()) == 2
+        assert [str(x) for x in table.unique()] == ["edge(a,b)", "edge(b,c)"]
+        assert len(table.select({0: "a"})) == 2
+
+        same = FactTable.from_arrays(edge, [["a", "c"], ["b", "d"]], ctx=ctx)
+        assert same.column(0).tolist() == [0, 2] and same.column(1).tolist() == [1, 3]
+
+        csv_table = FactTable.from_csv(edge, io.StringIO("src,dst\nd,E\n1,a\n"), ctx=ctx, header=True)
+        assert [str(x) for x in csv_table] == ["edge(d,'E')", "edge('1',a)"]
+
+    def predicate_index(self):
+        ctx = Context()
+        edge, path, alias, closed = [ctx.predicate(x, 2) for x in ["edge", "path", "alias", "closed"]]
+        X, Y, Z = [ctx.variable(x) for x in ["X", "Y", "Z"]]
+        fact = edge(ctx.constant("a"), ctx.constant("b"))
+        step = path(X, Z) <= edge(X, Y) & alias(Y, Z)
+        clauses = [fact, path(X, Y) <= edge(X, Y), step, alias(X, Y) <= path(X, Y),
+                   Clause(closed(X, Y), [path(X, Y), Not(alias(Y, X))])]
+        theory = ClausalTheory(clauses)
+
+        assert theory.get_clauses({alias}) == [step, clauses[4]]
+        assert theory.get_clauses({edge}) == clauses[:3]
+        assert theory.get_predicates() == {edge, path, alias, closed}
+        assert theory.slice({alias}) == clauses[:4]
+
+        # path and alias are mutually recursive, closed depends negatively on them
+        assert theory.is_recursive(alias) and not theory.is_recursive(closed)
+        assert theory.get_index().component(path) == {path, alias}
+        assert theory.strata() == [{edge, path, alias}, {closed}]
+
+        theory.remove_clause(step)
+        assert not theory.is_recursive(path) and theory.get_index().component(path) == {path}
+        assert theory.get_index().dependents(alias) == {closed}
+
+        theory.add_clause(Clause(alias(X, Y), [Not(closed(X, Y))]))
+        try:
+            theory.strata()
+            assert False
+        except Exception as e:
+            assert "not stratified" in str(e)
+
+    def unfolding(self):
+        theory = ClausalTheory([parse("h(X) :- d(X, Y), c(Y), \\+ n(X)"), parse("d(X, Z) :- a(X), b(X, Z)"),
+                                parse("d(X, f(X)) :- e(X, Y), g(Y)"), parse("g(Y) :- k(Y, Z), m(Z)"),
+                                parse("n(X) :- o(X)"), parse("c(f(W)) :- w(W)"), parse("r(X) :- r(Y), d(Y, X)"),
+                                parse("e(a, b)")])
+
+        # d, c and g are unfolded; n is used negatively, r is recursive and e is defined by a fact
+        assert [str(x) for x in theory.unfold_iter()] == [
+            "h(X) :- a(X),b(X,f(W)),w(W),\\+ n(X)",
+            "h(X) :- e(X,Y_1),k(Y_1,Z),m(Z),w(X),\\+ n(X)",
+            "n(X) :- o(X)",
+            "r(X) :- r(Y),a(Y),b(Y,X)",
+            "r(f(Y)) :- r(Y),e(Y,Y_1),k(Y_1,Z),m(Z)",
+            "e(a,b)"
+        ]
+
+        # d needs two nested unfoldings (through g), so it is kept with a depth of one
+        shallow = theory.unfold(max_depth=1)
+        assert parse("d(X, Z) :- a(X), b(X, Z)") in shallow.get_clauses() and len(shallow) == 6
+        assert len(list(theory.unfold_iter(max_clauses=3))) == 3
+
+        # a resolvent needing a cyclic binding (X = f(X)) is skipped
+        cyclic = ClausalTheory([parse("h2(X) :- a(X, X)"), parse("a(X, f(X)) :- d(X)"), parse("a(Y, Y) :- e(Y)")])
+        assert [str(x) for x in cyclic.unfold_iter()] == ["h2(X) :- e(X)"]
+
+    def magic_sets(self):
+        program = Program([parse("reach(X, Y) :- edge(X, Y)"), parse("reach(X, Y) :- edge(X, Z), reach(Z, Y)"),
+                           parse("far(X, Y) :- reach(X, Y), \\+ near(X, Y)"), parse("near(X, Y) :- edge(X, Y)")])
+        magic = MagicSets(program)
+
+        clauses, seed, query = magic.rewrite(parse("reach(a, X)"))
+        assert str(seed) == "magic_reach_bf(a)" and str(query) == "reach_bf(a,X)"
+        assert sorted([str(x) for x in clauses]) == [
+            "magic_reach_bf(Z) :- magic_reach_bf(X),edge(X,Z)",
+            "reach_bf(X,Y) :- magic_reach_bf(X),edge(X,Y)",
+            "reach_bf(X,Y) :- magic_reach_bf(X),edge(X,Z),reach_bf(Z,Y)"
+        ]
+        # the rewriting is done once per adornment
+        assert magic.rewrite(parse("reach(b, Y)"))[0] is clauses
+        assert MagicSets.adornment(parse("reach(X, a)")) == "fb"
+
+        # negated predicates keep their rules, queries without bound arguments have no seed
+        clauses, seed, query = magic.rewrite(parse("far(X, Y)"))
+        assert seed is None and str(query) == "far_ff(X,Y)"
+        assert "near(X,Y) :- edge(X,Y)" in [str(x) for x in clauses]
+        assert "far_ff(X,Y) :- reach_ff(X,Y),\\+ near(X,Y)" in [str(x) for x in clauses]
+
+        # predicates the program does not define are asked as they are
+        assert magic.rewrite(parse("edge(a, X)")) == ([], None, parse("edge(a, X)"))
+
 
 def test_language():
     test = LanguageTest()
@@ -63,4 +348,31 @@ def test_language():
 
     test.shorthand_constructs()
 
+    test.compact_representation()
+
+    test.symbol_table()
+
+    test.interning()
+
+    test.structural_hashing()
+
+    test.variants()
+
+    test.subsumption()
+
+    test.reader()
+
+    test.predicate_index()
+
+    test.unfolding()
+
+    test.magic_sets()
+
+
+def test_language_numpy():
+    # fact tables are numpy arrays (skipped without numpy)
+    test = LanguageTest()
+
+    test.fact_tables()
+
 test_language()
\ No newline at end of file
@@ -0,0 +1,241 @@
+import sys
+
+from pylo.language.lp import c_var, c_pred, c_const, c_functor, Not, Clause, List, Pair
+from pylo.engines.native import FactEngine, SLDEngine
+
+
+class NativeTest:
+
+    def simple_grandparent(self):
+        p1 = c_const("p1")
+        p2 = c_const("p2")
+        p3 = c_const("p3")
+        p4 = c_const("p4")
+
+        parent = c_pred("parent", 2)
+        grandparent = c_pred("grandparent", 2)
+
+        X = c_var("X")
+        Y = c_var("Y")
+        Z = c_var("Z")
+
+        solver = FactEngine()
+
+        solver.assertz(parent(p1, p2))
+        solver.assertz(parent(p2, p3))
+        solver.assertz(parent(p3, p4))
+        solver.assertz(parent(p3, p4))
+        solver.assertz(grandparent(X, Z) <= parent(X, Y) & parent(Y, Z))
+
+        assert solver.has_solution(parent(X, Y))
+        assert not solver.has_solution(parent(X, X))
+        assert len(solver.query(parent(X, Y))) == 3
+        assert solver.query(parent(p1, X)) == [{X: p2}]
+        assert solver.query(parent(p1, p2)) == [{}]
+        assert solver.query(parent(p2, p1)) == []
+
+        assert len(solver.query(grandparent(X, Y))) == 2
+        assert solver.query(grandparent(p1, X)) == [{X: p3}]
+        assert len(solver.query(grandparent(X, Y), max_solutions=1)) == 1
+
+        # the derived relation follows the facts
+        assert solver.retract(parent(p2, p3))
+        assert not solver.retract(parent(p2, p3))
+        assert not solver.has_solution(grandparent(X, Y))
+        solver.assertz(parent(p2, p3))
+        assert len(solver.query(grandparent(X, Y))) == 2
+
+        # retracting a pattern removes the first matching fact
+        assert solver.retract(parent(p3, X))
+        assert not solver.has_solution(parent(p3, X))
+
+    def joins(self):
+        edge = c_pred("edge", 2)
+        colour = c_pred("colour", 2)
+        red = c_const("red")
+        blue = c_const("blue")
+        f = c_functor("f", 1)
+
+        X = c_var("X")
+        Y = c_var("Y")
+        Z = c_var("Z")
+
+        nodes = [c_const(f"n{i}") for i in range(20)]
+
+        solver = FactEngine()
+        for i in range(19):
+            solver.assert_fact(edge(nodes[i], nodes[i + 1]))
+        for i in range(20):
+            solver.assert_fact(colour(nodes[i], red if i % 2 == 0 else blue))
+
+        # the order of the literals does not change the answers
+        answers = solver.query(edge(X, Y), edge(Y, Z), colour(X, blue))
+        assert len(answers) == 9
+        reordered = solver.query(colour(X, blue), edge(Y, Z), edge(X, Y))
+        assert len(reordered) == 9 and all([x in answers for x in reordered])
+
+        # repeated variables and negation
+        assert solver.query(colour(X, Y), edge(X, X)) == []
+        assert len(solver.query(edge(X, Y), Not(colour(Y, red)))) == 10
+        assert len(solver.query(colour(X, red), Not(edge(X, Y)), colour(Y, blue))) == 10 * 10 - 10
+
+        # structures are matched argument by argument
+        wrap = c_pred("wrap", 2)
+        solver.assert_fact(wrap(nodes[0], f(nodes[1])))
+        assert solver.query(wrap(X, f(Y))) == [{X: nodes[0], Y: nodes[1]}]
+        assert solver.query(wrap(X, f(X))) == []
+
+        # indexes follow later changes
+        assert len(solver.query(edge(nodes[0], X))) == 1
+        solver.assert_fact(edge(nodes[0], nodes[2]))
+        assert len(solver.query(edge(nodes[0], X))) == 2
+
+        try:
+            solver.assert_fact(edge(X, nodes[0]))
+            assert False
+        except Exception as e:
+            assert "ground" in str(e)
+
+        try:
+            solver.query(Not(edge(X, Y)))
+            assert False
+        except Exception as e:
+            assert "negative" in str(e)
+
+    def recursive_rules(self):
+        edge = c_pred("edge", 2)
+        path = c_pred("path", 2)
+        X = c_var("X")
+        Y = c_var("Y")
+        Z = c_var("Z")
+
+        solver = FactEngine()
+        solver.assert_rule(path(X, Y) <= edge(X, Y))
+        try:
+            solver.assert_rule(path(X, Y) <= edge(X, Z) & path(Z, Y))
+            assert False
+        except Exception as e:
+            assert "recursive" in str(e)
+
+        # the rejected rule is not kept
+        solver.assert_fact(edge(c_const("a"), c_const("b")))
+        assert len(solver.query(path(X, Y))) == 1
+        assert solver.retract(Clause(path(X, Y), [edge(X, Y)]))
+        assert not solver.has_solution(path(X, Y))
+
+    def sld_resolution(self):
+        parent = c_pred("parent", 2)
+        ancestor = c_pred("ancestor", 2)
+        app = c_pred("app", 3)
+        f = c_functor("f", 2)
+        X, Y, Z = c_var("X"), c_var("Y"), c_var("Z")
+        H, T, L, R = c_var("H"), c_var("T"), c_var("L"), c_var("R")
+        people = [c_const(f"p{i}") for i in range(30)]
+
+        solver = SLDEngine()
+        # enough clauses to be indexed; a clause with a variable first argument matches every call
+        for i in range(29):
+            solver.assertz(parent(people[i], people[i + 1]))
+        solver.assertz(parent(X, people[0]) <= parent(people[29], X))
+        solver.assertz(ancestor(X, Y) <= parent(X, Y))
+        solver.assertz(ancestor(X, Y) <= parent(X, Z) & ancestor(Z, Y))
+
+        assert solver.query(parent(people[3], X)) == [{X: people[4]}]
+        assert solver.query(parent(X, people[4])) == [{X: people[3]}]
+        assert len(solver.query(ancestor(people[0], X))) == 29
+        assert solver.query(ancestor(people[29], X)) == []
+        assert solver.has_solution(ancestor(people[1], people[20]))
+        assert not solver.has_solution(ancestor(people[20], people[1]))
+        assert len(solver.query(ancestor(X, Y), max_solutions=5)) == 5
+        assert len(solver.query(ancestor(people[25], X), Not(parent(X, people[29])))) == 3
+
+        # asserta puts the clause first, retract removes the first matching fact
+        solver.asserta(parent(people[29], people[0]))
+        assert solver.query(parent(people[29], X))[0] == {X: people[0]}
+        assert solver.retract(parent(people[29], X))
+        assert not solver.retract(parent(people[29], X))
+        assert solver.retract(Clause(parent(X, people[0]), [parent(people[29], X)]))
+
+        # structures, lists and answers with variables
+        solver.assertz(app(List([]), L, L))
+        solver.assertz(app(Pair(H, T), L, Pair(H, R)) <= app(T, L, R))
+        assert solver.query(app(List([people[0]]), List([people[1]]), X)) == [{X: List([people[0], people[1]])}]
+        assert len(solver.query(app(X, Y, List(people[:3])))) == 4
+        answer = solver.query(app(List([people[0]]), X, Y))[0]
+        assert answer[Y] == Pair(people[0], answer[X])
+        solver.assertz(parent(f(X, X), X))
+        assert solver.query(parent(f(people[0], Y), Z)) == [{Y: people[0], Z: people[0]}]
+        assert solver.query(parent(f(people[0], people[1]), Z)) == []
+
+        # deep recursion does not use the Python stack
+        chain = [c_const(f"c{i}") for i in range(5000)]
+        for i in range(4999):
+            solver.assertz(parent(chain[i], chain[i + 1]))
+        assert solver.has_solution(ancestor(chain[0], chain[4999]))
+
+    def tabling(self):
+        edge = c_pred("edge", 2)
+        path = c_pred("path", 2)
+        even = c_pred("even", 1)
+        odd = c_pred("odd", 1)
+        unreachable = c_pred("unreachable", 2)
+        X, Y, Z = c_var("X"), c_var("Y"), c_var("Z")
+        nodes = [c_const(f"v{i}") for i in range(12)]
+
+        solver = SLDEngine()
+        solver.table(path, even, odd)
+        # a cycle of 10 nodes, and two nodes outside of it
+        for i in range(10):
+            solver.assert_fact(edge(nodes[i], nodes[(i + 1) % 10]))
+        solver.assert_fact(edge(nodes[10], nodes[0]))
+        # left recursion, which does not terminate without tabling
+        solver.assert_rule(path(X, Y) <= path(X, Z) & edge(Z, Y))
+        solver.assert_rule(path(X, Y) <= edge(X, Y))
+
+        assert len(solver.query(path(nodes[0], X))) == 10
+        assert len(solver.query(path(nodes[10], X))) == 10
+        assert len(solver.query(path(X, nodes[0]))) == 11
+        assert len(solver.query(path(X, Y))) == 10 * 10 + 10
+        assert not solver.has_solution(path(nodes[0], nodes[10]))
+
+        # mutual recursion through the cycle
+        solver.assert_fact(even(nodes[0]))
+        solver.assert_rule(odd(Y) <= even(X) & edge(X, Y))
+        solver.assert_rule(even(Y) <= odd(X) & edge(X, Y))
+        assert len(solver.query(even(X))) == 5
+        assert solver.query(odd(nodes[3])) == [{}]
+
+        # negation of a completed table
+        solver.assert_rule(unreachable(X, Y) <= edge(X, Z) & edge(Y, Z) & Not(path(X, Y)))
+        assert solver.query(unreachable(nodes[9], X)) == [{X: nodes[10]}]
+
+        # tables follow the changes of the program
+        assert solver.retract(edge(nodes[4], nodes[5]))
+        assert len(solver.query(path(nodes[0], X))) == 4
+        assert len(solver.query(even(X))) == 3
+
+        # nested tables (one per call of the right recursion) do not use the Python stack
+        reach = c_pred("reach", 2)
+        chain = [c_const(f"r{i}") for i in range(3000)]
+        limit = sys.getrecursionlimit()
+        solver.table(reach)
+        for i in range(2999):
+            solver.assert_fact(edge(chain[i], chain[i + 1]))
+        solver.assert_rule(reach(X, Y) <= edge(X, Y))
+        solver.assert_rule(reach(X, Y) <= edge(X, Z) & reach(Z, Y))
+        assert solver.has_solution(reach(chain[0], chain[2999]))
+        assert sys.getrecursionlimit() == limit
+
+
+def test_native():
+    test = NativeTest()
+
+    test.simple_grandparent()
+    test.joins()
+    test.recursive_rules()
+    test.sld_resolution()
+    test.tabling()
+
+    print("all tests done!")
+
+test_native()
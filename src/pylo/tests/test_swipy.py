@@ -199,6 +199,97 @@ def swipl_test5():
     del solver
 
 
+def swipl_test6():
+    solver = SWIProlog()
+
+    edge = c_pred("edge", 2)
+
+    X = c_var("X")
+    Y = c_var("Y")
+
+    for i in range(10):
+        solver.assertz(edge(f"v{i}", f"v{i+1}"))
+
+    solutions = solver.query_iter(edge(X, Y))
+    first = next(solutions)
+    assert len(first) == 2
+    # closing the generator early has to close the query in the engine
+    solutions.close()
+
+    assert len([x for x in solver.query_iter(edge(X, Y))]) == 10
+    assert len([x for x in solver.query_iter(edge(X, Y), max_solutions=3)]) == 3
+    assert len(solver.query(edge("v0", X))) == 1
+
+    del solver
+
+
+def swipl_test7():
+    solver = SWIProlog()
+
+    edge = c_pred("edge", 2)
+    path = c_pred("path", 2)
+
+    X = c_var("X")
+    Y = c_var("Y")
+    Z = c_var("Z")
+
+    stats = solver.load_facts(edge, [(f"v{i}", f"v{i+1}") for i in range(2500)], chunk_size=1000)
+    assert stats['clauses'] == 2500
+    assert stats['chunks'] == 3
+
+    stats = solver.assertz_many([path(X, Y) <= edge(X, Y), path(X, Y) <= edge(X, Z) & path(Z, Y)])
+    assert stats['clauses'] == 2
+
+    assert len(solver.query(edge(X, Y))) == 2500
+    assert solver.has_solution(path("v0", "v10"))
+
+    del solver
+
+
+def swipl_test8():
+    solver = SWIProlog()
+
+    covers = c_pred("covers", 2)
+
+    X = c_var("X")
+    Y = c_var("Y")
+
+    solver.load_facts(covers, [(f"ex{i}", f"r{j}") for i in range(10) for j in range(i)])
+
+    prepared = solver.prepare(covers(X, Y))
+    for i in range(10):
+        assert len(prepared.run({X: f"ex{i}"})) == i
+        assert all([Y in x and X not in x for x in prepared.run({X: f"ex{i}"})])
+        assert prepared.exists({X: f"ex{i}"}) == (i > 0)
+        assert prepared.exists({X: f"ex{i}", Y: "r0"}) == (i > 0)
+
+    assert len(prepared.run({X: "ex9"}, max_solutions=2)) == 2
+    # the goal is restored after every call
+    assert len(prepared.run()) == 45
+
+    del solver
+
+
+def swipl_test9():
+    solver = SWIProlog()
+
+    edge = c_pred("edge", 2)
+
+    X = c_var("X")
+    Y = c_var("Y")
+
+    solver.load_facts(edge, [(f"v{i}", f"v{i+1}") for i in range(10)])
+
+    assert solver.has_solution_many([edge("v0", "v1"), edge("v1", "v0"), [edge("v0", X), edge(X, "v2")]]) == [True, False, True]
+
+    answers = solver.query_many([edge("v0", X), edge(X, Y), [edge(X, Y), edge(Y, "v0")]])
+    assert [len(x) for x in answers] == [1, 10, 0]
+    assert str(answers[0][0][X]) == "v1"
+    assert [len(x) for x in solver.query_many([edge(X, Y), edge(X, Y)], max_solutions=3)] == [3, 3]
+
+    del solver
+
+
 def all_swipl_tests():
     print("## TEST 1:")
     swipl_test1()
@@ -208,6 +299,14 @@ def all_swipl_tests():
     swipl_test4()
     print("## TEST 4: ")
     swipl_test5()
+    print("## TEST 5: ")
+    swipl_test6()
+    print("## TEST 6: ")
+    swipl_test7()
+    print("## TEST 7: ")
+    swipl_test8()
+    print("## TEST 8: ")
+    swipl_test9()
 
 #all_swipl_tests()
 
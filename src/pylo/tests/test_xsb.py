@@ -194,11 +194,38 @@ def xsb_test5(path):
     del solver
 
 
+def xsb_test6(path):
+    # terms are built and read structurally: nested terms, lists and atoms with commas survive the round trip
+    solver = XSBProlog(path)
+
+    p = c_pred("p", 2)
+    f = c_functor("f", 2)
+    X = c_var("X")
+    Y = c_var("Y")
+
+    solver.assertz(p("a", f(List([1, 2, f("b", "c")]), "hello, world")))
+    solver.assertz(p("b", 2.5))
+
+    res = solver.query(p("a", X))
+    assert len(res) == 1
+    assert res[0][X] == f(List([1, 2, f("b", "c")]), "hello, world")
+
+    res = solver.query(p(X, Y))
+    assert len(res) == 2
+    assert res[1][Y] == 2.5
+
+    assert not solver.has_solution(p("c", X))
+    assert solver.has_solution_many([p("a", X), p("c", X)]) == [True, False]
+
+    del solver
+
+
 def all_xsb_tests(path):
     xsb_test1(path)
     xsb_test2(path)
     xsb_test3(path)
     xsb_test5(path)
+    xsb_test6(path)
 
 
 #all_xsb_tests("/Users/seb/Documents/programs/XSB")
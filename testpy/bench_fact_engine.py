@@ -0,0 +1,46 @@
+"""
+Conjunctive queries with the native fact engine
+
+Loads a random graph with labelled nodes and times a selective join written in the worst order (the large relations
+first): the engine reorders the literals by the expected number of matches and joins through the argument indexes,
+which are built at the first query that binds them.
+
+usage: python bench_fact_engine.py [number of nodes] [edges per node]
+"""
+import random
+import sys
+import time
+
+from pylo.language.lp import c_pred, c_const, c_var
+from pylo.engines.native import FactEngine
+
+
+def bench_fact_engine(num_nodes, degree):
+    random.seed(42)
+    edge = c_pred("edge", 2)
+    label = c_pred("label", 2)
+    nodes = [c_const(f"n{i}") for i in range(num_nodes)]
+    rare = c_const("rare")
+    common = c_const("common")
+
+    solver = FactEngine()
+    start = time.perf_counter()
+    for n in nodes:
+        for m in random.sample(nodes, degree):
+            solver.assert_fact(edge(n, m))
+        solver.assert_fact(label(n, rare if random.random() < 0.001 else common))
+    print(f"loaded {num_nodes * (degree + 1)} facts in {time.perf_counter() - start:.2f} s")
+
+    X, Y, Z = c_var("X"), c_var("Y"), c_var("Z")
+    query = [edge(X, Y), edge(Y, Z), label(X, rare)]
+    for attempt in ("first (builds the indexes)", "second"):
+        start = time.perf_counter()
+        answers = solver.query(*query)
+        print(f"{attempt}: {len(answers)} answers in {1000 * (time.perf_counter() - start):.1f} ms")
+
+
+if __name__ == '__main__':
+    n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    n_degree = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    bench_fact_engine(n_nodes, n_degree)
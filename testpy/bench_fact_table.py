@@ -0,0 +1,73 @@
+"""
+Storing many ground facts as fact tables
+
+Creates the facts of a binary predicate over a number of constants as atoms, and as fact tables
+(from arrays of names and from tuples), and reports the time and the memory they take.
+Then loads the facts into MuZ, atom by atom and from the columns of the table.
+
+usage: python bench_fact_table.py [number of facts] [number of constants]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from pylo.language.datalog import Context, FactTable
+from pylo.engines.datalog import MuZ
+
+
+def _measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, memory / (1024 * 1024)
+
+
+def bench_fact_table(num_facts, num_constants):
+    random.seed(42)
+    rows = [(f"c{random.randrange(num_constants)}", f"c{random.randrange(num_constants)}") for _ in range(num_facts)]
+    arrays = [np.array([x[0] for x in rows]), np.array([x[1] for x in rows])]
+
+    def _atoms():
+        ctx = Context()
+        edge = ctx.predicate("edge", 2, ["node", "node"])
+        return ctx, [edge(ctx.constant(x, "node"), ctx.constant(y, "node")) for x, y in rows]
+
+    def _from_arrays():
+        ctx = Context()
+        return FactTable.from_arrays(ctx.predicate("edge", 2, ["node", "node"]), arrays, ctx=ctx)
+
+    def _from_tuples():
+        ctx = Context()
+        return FactTable.from_tuples(ctx.predicate("edge", 2, ["node", "node"]), rows, ctx=ctx)
+
+    print(f"facts: {num_facts} over {num_constants} constants")
+    (atoms_ctx, atoms), elapsed, memory = _measure(_atoms)
+    print(f"atoms:                    {elapsed:6.2f} s  {memory:8.1f} MB")
+    table, elapsed, memory = _measure(_from_arrays)
+    print(f"fact table (arrays):      {elapsed:6.2f} s  {memory:8.1f} MB")
+    _, elapsed, memory = _measure(_from_tuples)
+    print(f"fact table (tuples):      {elapsed:6.2f} s  {memory:8.1f} MB")
+
+    solver = MuZ(ctx=atoms_ctx)
+    start = time.perf_counter()
+    for atom in atoms:
+        solver.assert_fact(atom)
+    print(f"MuZ, atom by atom:        {time.perf_counter() - start:6.2f} s")
+
+    solver = MuZ(ctx=table.get_context())
+    start = time.perf_counter()
+    solver.assert_facts(table)
+    print(f"MuZ, from the columns:    {time.perf_counter() - start:6.2f} s")
+
+
+if __name__ == '__main__':
+    n_facts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_constants = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    bench_fact_table(n_facts, n_constants)
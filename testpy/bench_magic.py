@@ -0,0 +1,63 @@
+"""
+Point queries with and without the magic-sets rewriting
+
+The graph is made of many disjoint chains, reach/2 is its transitive closure. A point query reach(a, X) asks for the
+nodes reachable from one node: evaluated bottom-up on the whole program it needs the closure of every chain, on the
+rewritten program (MagicSets) only the closure of the chain of the node. Reports the time of a few point queries
+(with different start nodes) on the semi-naive engine and on MuZ (skip MuZ with a third argument 0).
+
+usage: python bench_magic.py [number of chains] [length of a chain] [run muz (1/0)]
+"""
+import sys
+import time
+
+import numpy as np
+
+from pylo.language.datalog import Context, FactTable, MagicSets, Program
+from pylo.engines.datalog import MuZ, SemiNaive
+
+
+def _program(num_chains, length):
+    ctx = Context()
+    edge = ctx.predicate("edge", 2, ["node", "node"])
+    reach = ctx.predicate("reach", 2, ["node", "node"])
+    X, Y, Z = [ctx.variable(x, "node") for x in ["X", "Y", "Z"]]
+
+    nodes = np.arange(num_chains * (length + 1)).reshape(num_chains, length + 1)
+    names = np.array([f"n{i}" for i in range(nodes.size)])
+    table = FactTable.from_arrays(edge, [names[nodes[:, :-1].reshape(-1)], names[nodes[:, 1:].reshape(-1)]], ctx=ctx)
+    program = Program([reach(X, Y) <= edge(X, Y), reach(X, Y) <= edge(X, Z) & reach(Z, Y)])
+    starts = [ctx.constant(names[nodes[i, 0]], "node") for i in range(0, num_chains, max(num_chains // 5, 1))]
+    return ctx, table, program, reach, starts, Y
+
+
+def _run(engine, num_chains, length):
+    for demand in (False, True):
+        ctx, table, program, reach, starts, Y = _program(num_chains, length)
+        solver = engine(ctx=ctx)
+        solver.assert_facts(table)
+        magic = MagicSets(program, ctx=ctx)
+        if not demand:
+            for cl in program.get_clauses():
+                solver.assert_rule(cl)
+
+        start = time.perf_counter()
+        answers = [len(magic.query(solver, reach(x, Y)) if demand else solver.query(reach(x, Y))) for x in starts]
+        elapsed = time.perf_counter() - start
+        print(f"{solver.get_name():>10}  {'magic sets' if demand else 'whole model':>11}  "
+              f"{len(starts)} point queries ({sum(answers)} answers): {elapsed:.2f} s")
+
+
+def bench_magic(num_chains, length, with_muz):
+    print(f"graph: {num_chains} chains of {length} edges")
+    _run(SemiNaive, num_chains, length)
+    if with_muz:
+        _run(MuZ, num_chains, length)
+
+
+if __name__ == '__main__':
+    n_chains = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_length = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    run_muz = bool(int(sys.argv[3])) if len(sys.argv) > 3 else True
+
+    bench_magic(n_chains, n_length, run_muz)
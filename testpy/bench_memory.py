@@ -0,0 +1,64 @@
+"""
+Long-running benchmark of the memory used by the Prolog engines
+
+Asserts and queries millions of facts and reports the resident memory after every round.
+With term refs scoped in foreign frames (SWIPL) and the heap recovered after every query (GNU),
+memory should stay flat once the database stops growing.
+
+usage: python bench_memory.py [swipl|gnu] [number of rounds] [operations per round]
+"""
+import resource
+import sys
+import time
+
+from pylo.language.lp import c_pred, c_var
+
+
+def _rss_mb():
+    # peak resident set size; in KB on linux, in bytes on mac
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _engine(name):
+    if name == 'swipl':
+        from pylo.engines.prolog import SWIProlog
+        return SWIProlog()
+    elif name == 'gnu':
+        from pylo.engines.prolog import GNUProlog
+        return GNUProlog()
+    else:
+        raise Exception(f"unknown engine {name}")
+
+
+def bench_memory(engine_name, rounds, operations):
+    solver = _engine(engine_name)
+
+    edge = c_pred("edge", 2)
+    X = c_var("X")
+
+    print(f"{'round':>6} {'asserts':>10} {'queries':>10} {'seconds':>10} {'max rss (MB)':>14}")
+    for r in range(rounds):
+        start = time.perf_counter()
+
+        # the same facts are asserted and retracted in every round, so the database does not grow
+        for i in range(operations):
+            solver.assertz(edge(f"v{i}", f"v{i + 1}"))
+        for i in range(operations):
+            solver.has_solution(edge(f"v{i}", X))
+            solver.query(edge(f"v{i}", X))
+        for i in range(operations):
+            solver.retract(edge(f"v{i}", f"v{i + 1}"))
+
+        print(f"{r:>6} {(r + 1) * operations:>10} {2 * (r + 1) * operations:>10} "
+              f"{time.perf_counter() - start:>10.2f} {_rss_mb():>14.1f}")
+
+    solver.release()
+
+
+if __name__ == '__main__':
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'swipl'
+    num_rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    num_operations = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+
+    bench_memory(engine, num_rounds, num_operations)
@@ -0,0 +1,55 @@
+"""
+Reading large fact files with the streaming Prolog reader
+
+Writes a file of facts (atoms, numbers and strings as arguments, plus a share of facts with nested terms)
+and reads it with read_clauses in the calling process and with a process pool.
+Reports the facts read per second and the peak resident memory, which stays bounded by the block and chunk sizes.
+
+usage: python bench_reader.py [number of facts] [number of processes]
+"""
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from pylo.language.lp import read_clauses
+
+
+def _rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def _write_facts(path, num_facts):
+    random.seed(42)
+    with open(path, "w") as f:
+        for i in range(num_facts):
+            if i % 10 == 0:
+                f.write(f"tree(n{i}, node(leaf({i}), [n{i + 1}, n{i + 2}]), 'label {i % 100}').\n")
+            else:
+                f.write(f"edge(v{i % 100000}, v{random.randint(0, 100000)}, {random.random():.4f}, \"e{i}\").\n")
+
+
+def bench_reader(num_facts, processes):
+    path = os.path.join(tempfile.mkdtemp(), "facts.pl")
+    _write_facts(path, num_facts)
+    print(f"file: {os.path.getsize(path) / (1024 * 1024):.1f} MB, {num_facts} facts")
+
+    for procs in sorted({1, processes}):
+        start = time.perf_counter()
+        count = 0
+        for _ in read_clauses(path, processes=procs):
+            count += 1
+        elapsed = time.perf_counter() - start
+        print(f"processes: {procs:>3}  facts/s: {count / elapsed:>10.0f}  max rss (MB): {_rss_mb():.1f}")
+
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    n_facts = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+
+    bench_reader(n_facts, n_processes)
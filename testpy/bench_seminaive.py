@@ -0,0 +1,73 @@
+"""
+Transitive closure with the semi-naive engine and with MuZ
+
+Loads the edges of a random graph (as a fact table) and computes path/2, the transitive closure of edge/2, with a
+linear recursive rule; reports the time to the first query (which computes the model), the time to get all
+derived facts as answers, and the time of a point query on the computed model. MuZ is run on the same program (skip it with
+a third argument 0, it is slow on large graphs). With a number of processes, the semi-naive engine is also run in
+parallel (on hash partitions of the relations, in that many processes).
+
+usage: python bench_seminaive.py [number of nodes] [number of edges] [run muz (1/0)] [processes]
+"""
+import sys
+import time
+
+import numpy as np
+
+from pylo.language.datalog import Context, FactTable
+from pylo.engines.datalog import MuZ, SemiNaive
+
+
+def _program(num_nodes, num_edges):
+    ctx = Context()
+    edge = ctx.predicate("edge", 2, ["node", "node"])
+    path = ctx.predicate("path", 2, ["node", "node"])
+    X, Y, Z = [ctx.variable(x, "node") for x in ["X", "Y", "Z"]]
+
+    rng = np.random.default_rng(42)
+    names = np.array([f"n{i}" for i in range(num_nodes)])
+    table = FactTable.from_arrays(edge, [names[rng.integers(num_nodes, size=num_edges)],
+                                         names[rng.integers(num_nodes, size=num_edges)]], ctx=ctx)
+    rules = [path(X, Y) <= edge(X, Y), path(X, Y) <= edge(X, Z) & path(Z, Y)]
+    return ctx, table, rules, path, X, Y, table.get_row(0)[0]
+
+
+def _run(engine, num_nodes, num_edges, **kwargs):
+    ctx, table, rules, path, X, Y, source = _program(num_nodes, num_edges)
+    solver = engine(ctx=ctx, **kwargs)
+    solver.assert_facts(table)
+    for r in rules:
+        solver.assert_rule(r)
+
+    start = time.perf_counter()
+    solver.has_solution(path(X, Y))
+    model = time.perf_counter() - start
+
+    start = time.perf_counter()
+    size = len(solver.query(path(X, Y)))
+    answers = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reached = len(solver.query(path(source, Y)))
+    point = time.perf_counter() - start
+    name = solver.get_name() + (f" ({kwargs['processes']} processes)" if kwargs else "")
+    print(f"{name:>10}  model: {model:.2f} s  all {size} path facts: {answers:.2f} s  "
+          f"point query ({reached} answers): {1000 * point:.1f} ms")
+
+
+def bench_seminaive(num_nodes, num_edges, with_muz, processes):
+    print(f"graph: {num_nodes} nodes, {num_edges} edges")
+    _run(SemiNaive, num_nodes, num_edges)
+    if processes > 1:
+        _run(SemiNaive, num_nodes, num_edges, processes=processes)
+    if with_muz:
+        _run(MuZ, num_nodes, num_edges)
+
+
+if __name__ == '__main__':
+    n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_edges = int(sys.argv[2]) if len(sys.argv) > 2 else 2400
+    run_muz = bool(int(sys.argv[3])) if len(sys.argv) > 3 else True
+    n_processes = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    bench_seminaive(n_nodes, n_edges, run_muz, n_processes)
@@ -0,0 +1,70 @@
+"""
+Recursive programs with the native SLD engine
+
+Times the right-recursive ancestor program on a chain (deep recursion) with SLDEngine and miniKanren, and the
+left-recursive path program on a graph with cycles, which only terminates with tabling.
+
+usage: python bench_sld.py [length of the chain] [number of nodes of the graph] [run miniKanren: yes/no]
+"""
+import random
+import sys
+import time
+
+from pylo.language.lp import c_pred, c_const, c_var
+from pylo.engines.native import SLDEngine
+from pylo.engines.kanren import MiniKanren
+
+
+def bench_chain(solver, length):
+    parent = c_pred("parent", 2)
+    ancestor = c_pred("ancestor", 2)
+    X, Y, Z = c_var("X"), c_var("Y"), c_var("Z")
+    people = [c_const(f"p{i}") for i in range(length)]
+
+    for i in range(length - 1):
+        solver.assert_fact(parent(people[i], people[i + 1]))
+    # miniKanren needs the recursive rule together with the base case
+    solver.assert_rule([ancestor(X, Y) <= parent(X, Y), ancestor(X, Y) <= parent(X, Z) & ancestor(Z, Y)])
+
+    start = time.perf_counter()
+    answers = solver.query(ancestor(people[0], X))
+    print(f"{type(solver).__name__}: {len(answers)} ancestors in {time.perf_counter() - start:.2f} s")
+
+
+def bench_tabled_graph(num_nodes):
+    random.seed(42)
+    edge = c_pred("edge", 2)
+    path = c_pred("path", 2)
+    X, Y, Z = c_var("X"), c_var("Y"), c_var("Z")
+    nodes = [c_const(f"n{i}") for i in range(num_nodes)]
+
+    solver = SLDEngine()
+    solver.table(path)
+    for n in nodes:
+        for m in random.sample(nodes, 2):
+            solver.assert_fact(edge(n, m))
+    solver.assert_rule(path(X, Y) <= path(X, Z) & edge(Z, Y))
+    solver.assert_rule(path(X, Y) <= edge(X, Y))
+
+    for attempt in ("first (evaluates the table)", "second"):
+        start = time.perf_counter()
+        answers = solver.query(path(nodes[0], X))
+        print(f"tabled path, {attempt}: {len(answers)} answers in {1000 * (time.perf_counter() - start):.1f} ms")
+
+    start = time.perf_counter()
+    answers = solver.query(path(X, Y))
+    print(f"tabled path, all pairs: {len(answers)} answers in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == '__main__':
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    num_nodes = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    run_kanren = sys.argv[3] != "no" if len(sys.argv) > 3 else True
+
+    bench_chain(SLDEngine(), length)
+    if run_kanren:
+        try:
+            bench_chain(MiniKanren(), length)
+        except RecursionError:
+            print(f"MiniKanren: exceeds the Python recursion limit on a chain of {length}")
+    bench_tabled_graph(num_nodes)
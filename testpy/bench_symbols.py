@@ -0,0 +1,54 @@
+"""
+Throughput of creating symbols in a Context
+
+Creates constants and fresh variables and reports the time per symbol at regular checkpoints.
+With constant time lookups in the symbol table, the time per symbol should not grow with the number of symbols.
+
+usage: python bench_symbols.py [number of constants] [number of fresh variables]
+"""
+import sys
+import time
+
+from pylo.language.commons import Context
+
+
+def _report(what, created, start, last):
+    now = time.perf_counter()
+    print(f"{what:>10} {created:>12} {now - start:>10.2f} {1e6 * (now - last[0]) / last[1]:>14.2f}")
+    last[0] = now
+
+
+def bench_symbols(num_constants, num_variables):
+    ctx = Context()
+    step_c = max(num_constants // 10, 1)
+    step_v = max(num_variables // 10, 1)
+
+    print(f"{'symbols':>10} {'created':>12} {'seconds':>10} {'us per symbol':>14}")
+
+    start = time.perf_counter()
+    last = [start, step_c]
+    for i in range(num_constants):
+        ctx.constant(f"c{i}", "node" if i % 2 else None)
+        if (i + 1) % step_c == 0:
+            _report("constants", i + 1, start, last)
+
+    start = time.perf_counter()
+    last = [start, step_v]
+    for i in range(num_variables):
+        ctx.fresh_variable()
+        if (i + 1) % step_v == 0:
+            _report("variables", i + 1, start, last)
+
+    start = time.perf_counter()
+    for i in range(0, num_constants, max(num_constants // 1000, 1)):
+        ctx.find_domain(f"c{i}")
+        ctx.symbol(f"c{i}")
+    print(f"lookups: {time.perf_counter() - start:.2f}s, "
+          f"{len(ctx.get_constants())} constants, {len(ctx.get_variables())} variables")
+
+
+if __name__ == '__main__':
+    n_constants = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    n_variables = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    bench_symbols(n_constants, n_variables)
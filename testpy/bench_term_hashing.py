@@ -0,0 +1,60 @@
+"""
+Hashing and equality of deep terms
+
+Builds atoms over nested structures, lists and pairs, and inserts them into a set twice:
+once the atoms themselves and once structurally equal copies (which hit the equality test).
+Reports the time per insertion; hashes are cached, so only the first hash of a term walks its arguments.
+
+usage: python bench_term_hashing.py [number of atoms] [depth of the terms]
+"""
+import sys
+import time
+
+from pylo.language.lp import c_pred, c_const, c_functor, List, Pair
+
+
+def _deep_term(i, depth, f, g):
+    term = c_const(f"c{i}")
+    for d in range(depth):
+        if d % 3 == 0:
+            term = f(term, c_const(f"c{d}"))
+        elif d % 3 == 1:
+            term = List([term, c_const(f"c{i % 7}")])
+        else:
+            term = g(Pair(term, c_const("nil")))
+    return term
+
+
+def _insert(atoms):
+    start = time.perf_counter()
+    table = set()
+    for atom in atoms:
+        table.add(atom)
+    return table, time.perf_counter() - start
+
+
+def bench_term_hashing(num_atoms, depth):
+    p = c_pred("p", 2)
+    f = c_functor("f", 2)
+    g = c_functor("g", 1)
+
+    atoms = [p(_deep_term(i, depth, f, g), c_const("a")) for i in range(num_atoms)]
+    copies = [p(_deep_term(i, depth, f, g), c_const("a")) for i in range(num_atoms)]
+
+    table, first = _insert(atoms)
+    _, again = _insert(atoms)
+    start = time.perf_counter()
+    hits = sum([1 for x in copies if x in table])
+    lookups = time.perf_counter() - start
+
+    print(f"atoms:                           {num_atoms} (terms of depth {depth})")
+    print(f"set insertion, first (us/atom):  {1e6 * first / num_atoms:.2f}")
+    print(f"set insertion, again (us/atom):  {1e6 * again / num_atoms:.2f}")
+    print(f"lookup of equal copies (us/atom): {1e6 * lookups / num_atoms:.2f} ({hits} found)")
+
+
+if __name__ == '__main__':
+    n_atoms = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    term_depth = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    bench_term_hashing(n_atoms, term_depth)
@@ -0,0 +1,69 @@
+"""
+Memory used by the language layer per ground atom
+
+Creates ground atoms over a fixed set of constants and reports the bytes allocated per atom
+(measured with tracemalloc), together with the size of a single atom, constant and clause.
+Constants are shared between atoms, so the bytes per atom are dominated by the atom objects themselves.
+
+usage: python bench_term_memory.py [number of atoms] [number of constants]
+"""
+import sys
+import time
+import tracemalloc
+
+from pylo.language.lp import c_pred, c_const, c_var
+
+
+def _deep_size(obj, seen=None):
+    # size of the object and of the containers it owns (symbols it points to are not counted)
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += _deep_size(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, '__slots__', ()):
+            value = getattr(obj, slot, None)
+            size += _deep_size(value, seen) if isinstance(value, (dict, list, tuple, set)) else 0
+    if isinstance(obj, dict):
+        size += sum([_deep_size(v, seen) for v in obj.values() if isinstance(v, (dict, list, tuple, set))])
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum([_deep_size(v, seen) for v in obj if isinstance(v, (dict, list, tuple, set))])
+
+    return size
+
+
+def bench_term_memory(num_atoms, num_constants):
+    p = c_pred("p", 3)
+    constants = [c_const(f"c{i}") for i in range(num_constants)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    before, _ = tracemalloc.get_traced_memory()
+
+    atoms = [p(constants[i % num_constants], constants[(7 * i) % num_constants], constants[(13 * i) % num_constants])
+             for i in range(num_atoms)]
+
+    after, peak = tracemalloc.get_traced_memory()
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    clause = p("X", "Y", "Z") <= p("X", "Y", "a") & p("Y", "Z", "b")
+
+    print(f"atoms created:            {len(atoms)} in {elapsed:.2f}s")
+    print(f"bytes per atom (traced):  {(after - before) / num_atoms:.1f}")
+    print(f"size of an atom:          {_deep_size(atoms[0])}")
+    print(f"size of a constant:       {_deep_size(constants[0])}")
+    print(f"size of a variable:       {_deep_size(c_var('X'))}")
+    print(f"size of a clause:         {_deep_size(clause)}")
+
+
+if __name__ == '__main__':
+    n_atoms = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_constants = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    bench_term_memory(n_atoms, n_constants)
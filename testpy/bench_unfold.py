@@ -0,0 +1,67 @@
+"""
+Unfolding layered theories
+
+Generates a theory whose predicates are arranged in layers: every predicate of a layer is defined by a few clauses
+whose bodies use predicates of the next layer, the predicates of the last layer are extensional, and the target
+clauses use predicates of the first layer. Unfolding replaces all intermediate predicates, so the number of unfolded
+clauses grows with the product of the number of definitions along the layers.
+
+Reports the time to the first unfolded clause and the throughput of the streaming unfolding (with the definitions
+of the predicates unfolded once), and the number of clauses yielded within the limit on the output size.
+
+usage: python bench_unfold.py [number of layers] [predicates per layer] [target clauses] [max clauses] [processes]
+"""
+import random
+import sys
+import time
+
+from pylo.language.lp import c_pred, c_var, Clause
+from pylo.language.lp.lp import ClausalTheory
+
+
+def _layered_theory(num_layers, width, num_targets, definitions=2, body_length=2):
+    random.seed(42)
+    X, Y, Z = c_var("X"), c_var("Y"), c_var("Z")
+    layers = [[c_pred(f"l{layer}_{i}", 2) for i in range(width)] for layer in range(num_layers + 1)]
+    target = c_pred("target", 2)
+
+    def _body(predicates):
+        # a chain X -> Z -> ... -> Y through the predicates
+        chain = [X] + [c_var(f"V{i}") for i in range(body_length - 1)] + [Y]
+        return [random.choice(predicates)(chain[i], chain[i + 1]) for i in range(body_length)]
+
+    clauses = [Clause(target(X, Y), _body(layers[0])) for _ in range(num_targets)]
+    for layer in range(num_layers):
+        for p in layers[layer]:
+            clauses += [Clause(p(X, Y), _body(layers[layer + 1])) for _ in range(definitions)]
+
+    return ClausalTheory(clauses)
+
+
+def bench_unfold(num_layers, width, num_targets, max_clauses, processes):
+    theory = _layered_theory(num_layers, width, num_targets)
+    print(f"theory: {len(theory)} clauses, {num_layers} layers of {width} predicates, {num_targets} target clauses")
+
+    for procs in sorted({1, processes}):
+        start = time.perf_counter()
+        first = None
+        count = 0
+        literals = 0
+        for cl in theory.unfold_iter(max_clauses=max_clauses, processes=procs):
+            if first is None:
+                first = time.perf_counter() - start
+            count += 1
+            literals += len(cl)
+        elapsed = time.perf_counter() - start
+        print(f"processes: {procs:>3}  unfolded clauses: {count}  (avg. body length {literals / max(count, 1):.1f})  "
+              f"first after: {1000 * first:.1f} ms  clauses/s: {count / elapsed:.0f}")
+
+
+if __name__ == '__main__':
+    n_layers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    n_width = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    n_targets = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    n_max = int(sys.argv[4]) if len(sys.argv) > 4 else 200000
+    n_processes = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+
+    bench_unfold(n_layers, n_width, n_targets, n_max, n_processes)
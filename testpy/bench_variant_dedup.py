@@ -0,0 +1,65 @@
+"""
+Removing variants from a set of hypothesis clauses
+
+Generates random clauses over a few predicates and variables, half of them variants of the others
+(variables renamed and body literals shuffled), and removes the duplicates with ClausalTheory.remove_duplicates,
+which indexes the clauses by their canonical form.
+For comparison, the pairwise check on term signatures (which remove_duplicates used before) is timed
+on a sample and extrapolated to all clauses.
+
+usage: python bench_variant_dedup.py [number of clauses] [body length]
+"""
+import random
+import sys
+import time
+
+from pylo.language.lp import c_pred, c_var, Clause
+from pylo.language.lp.lp import ClausalTheory
+from pylo.language.commons import _are_two_set_of_literals_identical
+
+
+def _random_clause(head, predicates, variables, length):
+    body = [random.choice(predicates)(random.choice(variables), random.choice(variables)) for _ in range(length)]
+    return Clause(head(variables[0], variables[1]), body)
+
+
+def _variant(clause, variables):
+    renaming = dict(zip(variables, random.sample(variables, len(variables))))
+    body = [x.substitute(renaming) for x in clause.get_literals()]
+    random.shuffle(body)
+    return Clause(clause.get_head().substitute(renaming), body)
+
+
+def bench_variant_dedup(num_clauses, length):
+    random.seed(42)
+    head = c_pred("target", 2)
+    predicates = [c_pred(f"p{i}", 2) for i in range(8)]
+    variables = [c_var(f"V{i}") for i in range(length + 2)]
+
+    originals = [_random_clause(head, predicates, variables, length) for _ in range(num_clauses // 2)]
+    clauses = originals + [_variant(x, variables) for x in originals]
+    random.shuffle(clauses)
+
+    theory = ClausalTheory(clauses)
+    start = time.perf_counter()
+    theory.remove_duplicates()
+    elapsed = time.perf_counter() - start
+
+    sample = clauses[:min(len(clauses), 2000)]
+    start = time.perf_counter()
+    for ind in range(len(sample) - 1):
+        for ind_i in range(ind + 1, len(sample)):
+            _are_two_set_of_literals_identical(sample[ind].get_term_signatures(), sample[ind_i].get_term_signatures())
+    pairwise = (time.perf_counter() - start) * (len(clauses) / len(sample)) ** 2
+
+    print(f"clauses:                        {len(clauses)} (body length {length})")
+    print(f"after removing variants:        {len(theory)}")
+    print(f"variant index (s):              {elapsed:.2f} ({1e6 * elapsed / len(clauses):.1f} us/clause)")
+    print(f"pairwise, extrapolated (s):     {pairwise:.0f}")
+
+
+if __name__ == '__main__':
+    n_clauses = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    body_length = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    bench_variant_dedup(n_clauses, body_length)